@@ -0,0 +1,133 @@
+"""
+Framework de funciones de agregación enchufables para el aggregator.
+
+Cada AggregateSpec indica qué sketch usar, de qué campo del evento leer el valor
+(ruta con puntos, p. ej. "payload.respondent_age") y, opcionalmente, a qué
+`source` aplica. Un AggregateSet mantiene el estado de todas las agregaciones de
+un grupo (una región en una ventana) y se puede serializar y combinar, de modo
+que shards y rollups sumen ventanas sin ver eventos crudos.
+
+Nuevos tipos de sketch se registran con `register_sketch(kind, cls)`.
+"""
+import json
+
+from sketches import FrequencyCounter, HyperLogLog, KLLSketch, SpaceSaving
+
+SKETCH_TYPES = {
+    HyperLogLog.kind: HyperLogLog,
+    KLLSketch.kind: KLLSketch,
+    SpaceSaving.kind: SpaceSaving,
+    FrequencyCounter.kind: FrequencyCounter,
+}
+
+
+def register_sketch(kind, sketch_cls):
+    """Registra un nuevo tipo de sketch (debe implementar add/merge/result/to_dict/from_dict)."""
+    SKETCH_TYPES[kind] = sketch_cls
+
+
+def sketch_from_dict(data):
+    try:
+        sketch_cls = SKETCH_TYPES[data["kind"]]
+    except KeyError:
+        raise ValueError(f"Tipo de sketch desconocido: {data.get('kind')}")
+    return sketch_cls.from_dict(data)
+
+
+class AggregateSpec:
+    """Definición de una función de agregación."""
+
+    def __init__(self, name, kind, field, source=None, params=None):
+        if kind not in SKETCH_TYPES:
+            raise ValueError(f"Tipo de sketch desconocido: {kind}")
+        self.name = name
+        self.kind = kind
+        self.field = field
+        self.source = source
+        self.params = params or {}
+        self._path = field.split(".")
+
+    def extract(self, event):
+        """Devuelve el valor del campo en el evento, o None si no aplica."""
+        if self.source and event.get("source") != self.source:
+            return None
+        value = event
+        for key in self._path:
+            if not isinstance(value, dict):
+                return None
+            value = value.get(key)
+        return value
+
+    def new_state(self):
+        return SKETCH_TYPES[self.kind](**self.params)
+
+
+DEFAULT_AGGREGATES = [
+    AggregateSpec("distinct_correlation_ids", "hll", "correlation_id"),
+    AggregateSpec("respondent_age_quantiles", "kll", "payload.respondent_age", source="survey.victimization"),
+    AggregateSpec("top_crime_types", "topk", "payload.crime_type", source="security.incident"),
+    AggregateSpec("migration_status_mix", "counter", "payload.status", source="migration.case"),
+]
+
+
+def parse_specs(config):
+    """
+    Construye las especificaciones desde JSON, p. ej.:
+    [{"name": "top_case_types", "kind": "topk", "field": "payload.case_type",
+      "source": "migration.case", "params": {"k": 5}}]
+    Sin configuración se usan DEFAULT_AGGREGATES.
+    """
+    if not config:
+        return list(DEFAULT_AGGREGATES)
+    return [
+        AggregateSpec(
+            entry["name"],
+            entry["kind"],
+            entry["field"],
+            source=entry.get("source"),
+            params=entry.get("params"),
+        )
+        for entry in json.loads(config)
+    ]
+
+
+class AggregateSet:
+    """Estado de todas las agregaciones de un grupo (p. ej. una región en una ventana)."""
+
+    def __init__(self, specs):
+        self.specs = specs
+        self.states = {}
+
+    def update(self, event):
+        for spec in self.specs:
+            value = spec.extract(event)
+            if value is None:
+                continue
+            state = self.states.get(spec.name)
+            if state is None:
+                state = self.states[spec.name] = spec.new_state()
+            try:
+                state.add(value)
+            except (TypeError, ValueError):
+                # Valor no compatible con el sketch (p. ej. texto en un campo numérico)
+                continue
+
+    def merge(self, other):
+        for name, other_state in other.states.items():
+            state = self.states.get(name)
+            if state is None:
+                self.states[name] = sketch_from_dict(other_state.to_dict())
+            else:
+                state.merge(other_state)
+
+    def results(self):
+        return {name: state.result() for name, state in self.states.items()}
+
+    def to_dict(self):
+        return {name: state.to_dict() for name, state in self.states.items()}
+
+    @classmethod
+    def from_dict(cls, data, specs=None):
+        aggregate_set = cls(specs or [])
+        aggregate_set.states = {name: sketch_from_dict(state) for name, state in data.items()}
+        return aggregate_set
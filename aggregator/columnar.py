@@ -0,0 +1,216 @@
+"""
+Buffer columnar por micro-lotes para el aggregator (AGGREGATION_MODE=columnar).
+
+En vez de actualizar diccionarios anidados evento a evento, cada evento se
+decodifica al llegar a columnas de tipo fijo (código de región, código de
+source, timestamp y campos numéricos del payload) y su event_id entra en la
+IdTable de su región. Cuando el micro-lote se llena, o al cerrar la ventana,
+las agregaciones se calculan de una vez con reducciones group-by (NumPy si está
+instalado, Python puro por lotes si no) y se acumulan en totales por región.
+Ningún evento queda retenido como diccionario hasta el cierre.
+"""
+import math
+from array import array
+from collections import Counter
+from datetime import datetime
+
+from idtable import IdTable
+
+try:
+    import numpy as np
+except ImportError:  # NumPy es opcional
+    np = None
+
+DEFAULT_NUMERIC_FIELDS = (
+    "payload.respondent_age",
+    "payload.location.latitude",
+    "payload.location.longitude",
+)
+
+NAN = float("nan")
+
+
+def parse_timestamp(value):
+    """ISO-8601 (con 'Z' opcional) -> epoch en segundos, o NaN si no se puede leer."""
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except (AttributeError, TypeError, ValueError):
+        return NAN
+
+
+class ColumnarBuffer:
+    """Columnas de tipo fijo de una ventana, reducidas por micro-lotes."""
+
+    def __init__(self, numeric_fields=DEFAULT_NUMERIC_FIELDS, batch_size=4096):
+        self.numeric_fields = tuple(numeric_fields)
+        self._numeric_paths = [field.split(".") for field in self.numeric_fields]
+        self.batch_size = batch_size
+
+        # Diccionarios de códigos (texto <-> entero) para region y source
+        self.region_names = []
+        self.source_names = []
+        self._region_codes = {}
+        self._source_codes = {}
+
+        self._reset_batch()
+        self.total_events = 0
+        self.event_ids_by_region = {}  # código de región -> IdTable
+        self._counts = Counter()  # (código región, código source) -> n
+        self._numeric_totals = {}  # (código región, campo) -> [n, suma, mín, máx]
+
+    def _reset_batch(self):
+        self.region_col = array("H")
+        self.source_col = array("H")
+        self.timestamp_col = array("d")
+        self.numeric_cols = {field: array("d") for field in self.numeric_fields}
+        self._numeric_targets = list(zip(self._numeric_paths, (self.numeric_cols[field] for field in self.numeric_fields)))
+        self._timestamps = {}  # Texto -> epoch de los timestamps del lote (suelen repetirse)
+
+    def __len__(self):
+        return self.total_events
+
+    @staticmethod
+    def _code(codes, names, value):
+        """Código entero de un texto, ampliando el diccionario si hace falta."""
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(names)
+            names.append(value)
+        return code
+
+    def append(self, event):
+        """Decodifica un evento a las columnas del micro-lote y guarda su event_id en la IdTable de su región."""
+        get = event.get
+        region = get("region", "unknown")
+        region_code = self._region_codes.get(region)
+        if region_code is None:
+            region_code = self._code(self._region_codes, self.region_names, region)
+        source = get("source", "unknown")
+        source_code = self._source_codes.get(source)
+        if source_code is None:
+            source_code = self._code(self._source_codes, self.source_names, source)
+        self.region_col.append(region_code)
+        self.source_col.append(source_code)
+
+        raw = get("timestamp")
+        timestamp = self._timestamps.get(raw) if type(raw) is str else NAN
+        if timestamp is None:
+            timestamp = self._timestamps[raw] = parse_timestamp(raw)
+        self.timestamp_col.append(timestamp)
+
+        for path, column in self._numeric_targets:
+            value = event
+            try:
+                for key in path:
+                    value = value[key]
+            except (KeyError, TypeError, IndexError):
+                column.append(NAN)
+                continue
+            column.append(value if type(value) is float else float(value) if type(value) is int else NAN)
+
+        event_id = get("event_id")
+        if event_id:
+            ids = self.event_ids_by_region.get(region_code)
+            if ids is None:
+                ids = self.event_ids_by_region[region_code] = IdTable()
+            ids.add(event_id)
+
+        self.total_events += 1
+        if len(self.region_col) >= self.batch_size:
+            self.reduce_batch()
+
+    def _merge_numeric(self, region_code, field, count, total, low, high):
+        current = self._numeric_totals.get((region_code, field))
+        if current is None:
+            self._numeric_totals[(region_code, field)] = [count, total, low, high]
+        else:
+            current[0] += count
+            current[1] += total
+            current[2] = min(current[2], low)
+            current[3] = max(current[3], high)
+
+    def _reduce_numpy(self):
+        regions = np.frombuffer(self.region_col, dtype=np.uint16).astype(np.int64)
+        sources = np.frombuffer(self.source_col, dtype=np.uint16).astype(np.int64)
+        n_regions = len(self.region_names)
+        n_sources = len(self.source_names)
+
+        counts = np.bincount(regions * n_sources + sources, minlength=n_regions * n_sources)
+        for cell in np.flatnonzero(counts).tolist():
+            self._counts[divmod(cell, n_sources)] += int(counts[cell])
+
+        columns = dict(self.numeric_cols, timestamp=self.timestamp_col)
+        for field, column in columns.items():
+            values = np.frombuffer(column, dtype=np.float64)
+            valid = ~np.isnan(values)
+            if not valid.any():
+                continue
+            codes = regions[valid]
+            values = values[valid]
+            field_counts = np.bincount(codes, minlength=n_regions)
+            sums = np.bincount(codes, weights=values, minlength=n_regions)
+            mins = np.full(n_regions, np.inf)
+            maxs = np.full(n_regions, -np.inf)
+            np.minimum.at(mins, codes, values)
+            np.maximum.at(maxs, codes, values)
+            for code in np.flatnonzero(field_counts).tolist():
+                self._merge_numeric(code, field, int(field_counts[code]), float(sums[code]),
+                                    float(mins[code]), float(maxs[code]))
+
+    def _reduce_python(self):
+        self._counts.update(zip(self.region_col, self.source_col))
+
+        columns = dict(self.numeric_cols, timestamp=self.timestamp_col)
+        for field, column in columns.items():
+            partial = {}
+            for code, value in zip(self.region_col, column):
+                if math.isnan(value):
+                    continue
+                stats = partial.get(code)
+                if stats is None:
+                    partial[code] = [1, value, value, value]
+                else:
+                    stats[0] += 1
+                    stats[1] += value
+                    if value < stats[2]:
+                        stats[2] = value
+                    if value > stats[3]:
+                        stats[3] = value
+            for code, stats in partial.items():
+                self._merge_numeric(code, field, *stats)
+
+    def reduce_batch(self):
+        """Aplica las reducciones group-by al micro-lote actual y lo vacía."""
+        if not self.region_col:
+            return
+        if np is not None:
+            self._reduce_numpy()
+        else:
+            self._reduce_python()
+        self._reset_batch()
+
+    def stats_by_region(self):
+        """Recuentos {región: {source: n}} (mismo formato que stats_buffer)."""
+        self.reduce_batch()
+        stats = {}
+        for (region_code, source_code), count in self._counts.items():
+            stats.setdefault(self.region_names[region_code], {})[self.source_names[source_code]] = count
+        return stats
+
+    def ids_by_region(self):
+        """event_ids por región como IdTable (mismo formato que event_ids_by_region)."""
+        return {self.region_names[code]: ids for code, ids in self.event_ids_by_region.items()}
+
+    def numeric_stats_by_region(self):
+        """{región: {campo: {count, sum, min, max, mean}}} de los campos numéricos."""
+        self.reduce_batch()
+        result = {}
+        for (region_code, field), (count, total, low, high) in self._numeric_totals.items():
+            result.setdefault(self.region_names[region_code], {})[field] = {
+                "count": count,
+                "sum": total,
+                "min": low,
+                "max": high,
+                "mean": total / count,
+            }
+        return result
@@ -0,0 +1,79 @@
+"""
+Publicación incremental (solo deltas) de los resúmenes de ventana.
+
+En modo delta, `analytics.window` solo lleva las celdas que cambiaron respecto
+al último resumen emitido (diff recursivo de diccionarios; las claves que
+desaparecen viajan aparte, como rutas en "removed", porque null también es un
+valor válido, p. ej. un cuantil de un sketch vacío). Cada `keyframe_interval` ventanas se emite el
+estado completo para que un consumidor que se conecta tarde (o que perdió un
+mensaje) pueda resincronizarse. Los consumidores reconstruyen el estado con
+`WindowState` (dashboard/window_state.py).
+
+Formato:
+  keyframe: {..., "delta": {"mode": "keyframe", "sequence": n}, <campos completos>}
+  delta:    {..., "delta": {"mode": "delta", "sequence": n, "base_sequence": n - 1},
+             "changes": {<campo>: <diff>}, "removed": [[<campo>, <clave>, ...], ...]}
+"""
+
+# Campos del resumen que se mantienen como estado entre ventanas
+STATE_FIELDS = (
+    "stats_by_region",
+    "aggregates_by_region",
+    "numeric_stats_by_region",
+    "geo_grid",
+)
+
+
+def diff(previous, current, path=()):
+    """
+    Diff recursivo. Retorna (cambios, eliminadas): las claves nuevas o cambiadas
+    con su valor (None incluido) y la ruta (lista de claves) de las eliminadas.
+    """
+    changes = {}
+    removed = []
+    for key, value in current.items():
+        old = previous.get(key)
+        if isinstance(value, dict) and isinstance(old, dict):
+            nested, nested_removed = diff(old, value, path + (key,))
+            if nested:
+                changes[key] = nested
+            removed.extend(nested_removed)
+        elif key not in previous or old != value:
+            changes[key] = value
+    for key in previous:
+        if key not in current:
+            removed.append(list(path + (key,)))
+    return changes, removed
+
+
+class DeltaEncoder:
+    """Convierte resúmenes completos en keyframes o deltas según la secuencia."""
+
+    def __init__(self, keyframe_interval=10):
+        if keyframe_interval < 1:
+            raise ValueError("keyframe_interval debe ser >= 1")
+        self.keyframe_interval = keyframe_interval
+        self.sequence = 0
+        self.previous = None  # Estado completo del último mensaje emitido
+
+    def encode(self, summary):
+        """Retorna el mensaje a publicar para `summary` (no lo modifica)."""
+        state = {field: summary[field] for field in STATE_FIELDS if field in summary}
+        self.sequence += 1
+
+        if self.previous is None or (self.sequence - 1) % self.keyframe_interval == 0:
+            message = dict(summary)
+            message["delta"] = {"mode": "keyframe", "sequence": self.sequence}
+        else:
+            message = {key: value for key, value in summary.items() if key not in STATE_FIELDS}
+            message["delta"] = {
+                "mode": "delta",
+                "sequence": self.sequence,
+                "base_sequence": self.sequence - 1,
+            }
+            message["changes"], removed = diff(self.previous, state)
+            if removed:
+                message["removed"] = removed
+
+        self.previous = state
+        return message
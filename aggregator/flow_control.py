@@ -0,0 +1,110 @@
+"""
+Control de flujo adaptativo (AIMD) del prefetch de RabbitMQ.
+
+El consumidor registra cuánto tarda en procesar cada mensaje y, cada
+`adjust_interval` segundos, se recalcula el prefetch a partir de la latencia
+media del período y de la profundidad de la cola:
+
+  - latencia media > objetivo      -> decremento multiplicativo (x decrease_factor)
+  - cola con más mensajes listos
+    que el prefetch actual         -> incremento aditivo (+increase_step)
+  - en otro caso                   -> se mantiene
+
+Además el prefetch nunca supera lo que se procesa en `max_buffered_seconds`
+(ley de Little: prefetch x latencia), así los mensajes sin ack no crecen sin
+límite cuando el disco o la CPU se vuelven lentos.
+
+El módulo no depende de pika: el servicio consulta la cola y aplica el valor
+con basic_qos. Copia idéntica en aggregator/ y audit/ (cada servicio se
+construye con su propio contexto de Docker).
+"""
+import time
+
+
+class AdaptivePrefetch:
+    """Calcula el prefetch a usar; `status()` reporta el valor actual y las últimas mediciones."""
+
+    def __init__(
+        self,
+        initial=10,
+        minimum=1,
+        maximum=500,
+        target_latency=0.05,
+        max_buffered_seconds=2.0,
+        adjust_interval=2.0,
+        increase_step=None,
+        decrease_factor=0.5,
+    ):
+        if not 1 <= minimum <= maximum:
+            raise ValueError("Se requiere 1 <= minimum <= maximum")
+        if not 0 < decrease_factor < 1:
+            raise ValueError("decrease_factor debe estar entre 0 y 1")
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.max_buffered_seconds = max_buffered_seconds
+        self.adjust_interval = adjust_interval
+        self.increase_step = increase_step or max(1, minimum)
+        self.decrease_factor = decrease_factor
+        self.prefetch = min(max(initial, minimum), maximum)
+
+        self._latency_sum = 0.0
+        self._latency_count = 0
+        self._last_adjust = time.monotonic()
+        self.last_mean_latency = None
+        self.last_queue_depth = None
+        self.adjustments = 0
+
+    def record(self, latency_seconds):
+        """Registra el tiempo de procesamiento de un mensaje."""
+        self._latency_sum += latency_seconds
+        self._latency_count += 1
+
+    def due(self, now=None):
+        """True si ya pasó `adjust_interval` desde el último ajuste y hay mediciones."""
+        now = time.monotonic() if now is None else now
+        return self._latency_count > 0 and now - self._last_adjust >= self.adjust_interval
+
+    def adjust(self, queue_depth=None, now=None):
+        """
+        Recalcula el prefetch con las mediciones acumuladas.
+        Retorna el nuevo valor si cambió, o None si se mantiene.
+        """
+        self._last_adjust = time.monotonic() if now is None else now
+        if self._latency_count == 0:
+            return None
+
+        mean_latency = self._latency_sum / self._latency_count
+        self._latency_sum = 0.0
+        self._latency_count = 0
+        self.last_mean_latency = mean_latency
+        self.last_queue_depth = queue_depth
+
+        if mean_latency > self.target_latency:
+            proposed = int(self.prefetch * self.decrease_factor)
+        elif queue_depth is None or queue_depth > self.prefetch:
+            proposed = self.prefetch + self.increase_step
+        else:
+            proposed = self.prefetch
+
+        # Tope por backlog: no retener más mensajes sin ack de los que se procesan en max_buffered_seconds
+        if mean_latency > 0:
+            proposed = min(proposed, int(self.max_buffered_seconds / mean_latency))
+        proposed = min(max(proposed, self.minimum), self.maximum)
+
+        if proposed == self.prefetch:
+            return None
+        self.prefetch = proposed
+        self.adjustments += 1
+        return proposed
+
+    def status(self):
+        return {
+            "prefetch": self.prefetch,
+            "minimum": self.minimum,
+            "maximum": self.maximum,
+            "target_latency_ms": round(self.target_latency * 1000, 3),
+            "mean_latency_ms": None if self.last_mean_latency is None else round(self.last_mean_latency * 1000, 3),
+            "queue_depth": self.last_queue_depth,
+            "adjustments": self.adjustments,
+        }
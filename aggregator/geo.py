@@ -0,0 +1,172 @@
+"""
+Binning espacial de incidentes de seguridad (`security.incident`).
+
+Durante la ventana solo se guardan las coordenadas en arreglos compactos por
+severidad; al cerrar la ventana se agrupan todas juntas en celdas de una grilla
+fija (lat/long en grados) o de geohash. Si NumPy está disponible el binning es
+vectorizado; si no, se usa un camino en Python puro por lotes.
+
+Solo se publican las celdas con incidentes (conteos dispersos), con su centro,
+para que el dashboard dibuje un mapa de calor sin ver eventos individuales.
+"""
+import math
+from array import array
+from collections import Counter
+
+try:
+    import numpy as np
+except ImportError:  # NumPy es opcional
+    np = None
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def _spread_bits(value):
+    """Separa los bits de un entero de hasta 32 bits (b -> 0b0b0b...)."""
+    value = (value | (value << 16)) & 0x0000FFFF0000FFFF
+    value = (value | (value << 8)) & 0x00FF00FF00FF00FF
+    value = (value | (value << 4)) & 0x0F0F0F0F0F0F0F0F
+    value = (value | (value << 2)) & 0x3333333333333333
+    value = (value | (value << 1)) & 0x5555555555555555
+    return value
+
+
+def _interleave(lat_q, lon_q, lat_bits, lon_bits):
+    """Intercala bits de longitud y latitud (longitud primero, como geohash)."""
+    if lon_bits == lat_bits:
+        return (_spread_bits(lon_q) << 1) | _spread_bits(lat_q)
+    return _spread_bits(lon_q) | (_spread_bits(lat_q) << 1)
+
+
+def geohash_from_cell(lat_q, lon_q, precision):
+    """Convierte una celda cuantizada a su geohash de `precision` caracteres."""
+    total_bits = 5 * precision
+    lat_bits, lon_bits = total_bits // 2, total_bits - total_bits // 2
+    code = _interleave(lat_q, lon_q, lat_bits, lon_bits)
+    chars = []
+    for shift in range(total_bits - 5, -1, -5):
+        chars.append(GEOHASH_ALPHABET[(code >> shift) & 31])
+    return "".join(chars)
+
+
+class GeoGrid:
+    """Acumula coordenadas de una ventana y las agrupa en celdas por severidad."""
+
+    def __init__(self, mode="grid", cell_deg=0.5, geohash_precision=4):
+        if mode not in ("grid", "geohash"):
+            raise ValueError(f"Modo de grilla desconocido: {mode}")
+        if mode == "grid" and cell_deg <= 0:
+            raise ValueError("El tamaño de celda debe ser positivo")
+        if mode == "geohash" and not 1 <= geohash_precision <= 12:
+            raise ValueError("La precisión de geohash debe estar entre 1 y 12")
+        self.mode = mode
+        self.cell_deg = cell_deg
+        self.geohash_precision = geohash_precision
+        self._lats = {}  # severidad -> array('d')
+        self._lons = {}
+
+    def __len__(self):
+        return sum(len(lats) for lats in self._lats.values())
+
+    def add(self, latitude, longitude, severity="unknown"):
+        latitude = float(latitude)
+        longitude = float(longitude)
+        if not (-90.0 <= latitude <= 90.0 and -180.0 <= longitude <= 180.0):
+            raise ValueError("Coordenadas fuera de rango")
+        if severity not in self._lats:
+            self._lats[severity] = array("d")
+            self._lons[severity] = array("d")
+        self._lats[severity].append(latitude)
+        self._lons[severity].append(longitude)
+
+    def add_many(self, latitudes, longitudes, severity="unknown"):
+        """Agrega un lote de coordenadas ya validadas."""
+        if severity not in self._lats:
+            self._lats[severity] = array("d")
+            self._lons[severity] = array("d")
+        self._lats[severity].extend(latitudes)
+        self._lons[severity].extend(longitudes)
+
+    def _quantizers(self):
+        """Devuelve (escala_lat, escala_lon, offset_lat, offset_lon, max_lat_q, max_lon_q)."""
+        if self.mode == "grid":
+            inverse = 1.0 / self.cell_deg
+            return inverse, inverse, 0.0, 0.0, None, None
+        total_bits = 5 * self.geohash_precision
+        lat_bits, lon_bits = total_bits // 2, total_bits - total_bits // 2
+        return (
+            (1 << lat_bits) / 180.0,
+            (1 << lon_bits) / 360.0,
+            90.0,
+            180.0,
+            (1 << lat_bits) - 1,
+            (1 << lon_bits) - 1,
+        )
+
+    def _bin_arrays(self, lats, lons):
+        """Cuenta coordenadas por celda cuantizada: {(lat_q, lon_q): n}."""
+        if not lats:
+            return {}
+        lat_scale, lon_scale, lat_offset, lon_offset, lat_max, lon_max = self._quantizers()
+
+        if np is not None:
+            lat_q = np.floor((np.frombuffer(lats, dtype=np.float64) + lat_offset) * lat_scale).astype(np.int64)
+            lon_q = np.floor((np.frombuffer(lons, dtype=np.float64) + lon_offset) * lon_scale).astype(np.int64)
+            if lat_max is not None:
+                np.minimum(lat_q, lat_max, out=lat_q)
+                np.minimum(lon_q, lon_max, out=lon_q)
+            # Una sola clave entera por celda para agrupar con un unique 1D
+            lon_base = int(lon_q.min())
+            lon_span = int(lon_q.max()) - lon_base + 1
+            keys, counts = np.unique(lat_q * lon_span + (lon_q - lon_base), return_counts=True)
+            lat_cells, lon_cells = np.divmod(keys, lon_span)
+            return dict(zip(zip(lat_cells.tolist(), (lon_cells + lon_base).tolist()), counts.tolist()))
+
+        floor = math.floor
+        lat_cells = [floor((lat + lat_offset) * lat_scale) for lat in lats]
+        lon_cells = [floor((lon + lon_offset) * lon_scale) for lon in lons]
+        if lat_max is not None:
+            lat_cells = [min(q, lat_max) for q in lat_cells]
+            lon_cells = [min(q, lon_max) for q in lon_cells]
+        return Counter(zip(lat_cells, lon_cells))
+
+    def _describe_cell(self, lat_q, lon_q):
+        """Devuelve (id_celda, lat_centro, lon_centro)."""
+        lat_scale, lon_scale, lat_offset, lon_offset, _, _ = self._quantizers()
+        center_lat = round((lat_q + 0.5) / lat_scale - lat_offset, 6)
+        center_lon = round((lon_q + 0.5) / lon_scale - lon_offset, 6)
+        if self.mode == "grid":
+            return f"{lat_q}:{lon_q}", center_lat, center_lon
+        return geohash_from_cell(lat_q, lon_q, self.geohash_precision), center_lat, center_lon
+
+    def bin(self):
+        """Agrupa todas las coordenadas acumuladas: {severidad: {celda: n}}."""
+        return {
+            severity: {
+                self._describe_cell(lat_q, lon_q)[0]: count
+                for (lat_q, lon_q), count in self._bin_arrays(self._lats[severity], self._lons[severity]).items()
+            }
+            for severity in self._lats
+        }
+
+    def to_message(self):
+        """Resumen disperso listo para publicar (solo celdas con incidentes)."""
+        cells = []
+        for severity in sorted(self._lats):
+            binned = self._bin_arrays(self._lats[severity], self._lons[severity])
+            for (lat_q, lon_q), count in sorted(binned.items()):
+                cell_id, center_lat, center_lon = self._describe_cell(lat_q, lon_q)
+                cells.append({
+                    "severity": severity,
+                    "cell": cell_id,
+                    "lat": center_lat,
+                    "lon": center_lon,
+                    "count": count,
+                })
+
+        message = {"mode": self.mode, "total": len(self), "cells": cells}
+        if self.mode == "grid":
+            message["cell_deg"] = self.cell_deg
+        else:
+            message["precision"] = self.geohash_precision
+        return message
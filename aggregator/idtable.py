@@ -0,0 +1,229 @@
+"""
+Tablas compactas de event_ids para la deduplicación y el linaje del aggregator.
+
+Un event_id UUID canónico se guarda como un entero de 128 bits repartido en dos
+arreglos `array('Q')` (parte alta y baja) de una tabla hash de direccionamiento
+abierto (sondeo lineal). El timestamp opcional se guarda en un `array('i')` en
+décimas de segundo relativas a la creación de la tabla (±6 años). Cada entrada
+ocupa ~20 bytes por slot (~30-40 bytes con el factor de carga), frente a más de
+150 bytes de un `str` de 36 caracteres más un float dentro de un dict.
+
+Los IDs que no son UUID canónicos (p. ej. "event-1" en pruebas) se guardan en
+un diccionario auxiliar, así que la tabla acepta cualquier clave.
+"""
+import re
+import sys
+import time
+import uuid
+from array import array
+
+_UUID_RE = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}")
+_LOW_MASK = 0xFFFFFFFFFFFFFFFF
+_MAX_TICKS = 0x7FFFFFFF
+_MAX_LOAD = 0.7
+
+
+def split_uuid(event_id):
+    """(alto, bajo) de 64 bits para UUIDs canónicos; None para cualquier otra clave."""
+    if type(event_id) is not str or not _UUID_RE.fullmatch(event_id):
+        return None
+    value = int(event_id.replace("-", ""), 16)
+    if value == 0:
+        return None  # (0, 0) marca los slots vacíos
+    return value >> 64, value & _LOW_MASK
+
+
+def join_uuid(high, low):
+    return str(uuid.UUID(int=(high << 64) | low))
+
+
+class IdTable:
+    """Conjunto (o mapa id -> timestamp) de event_ids sobre arreglos de tipo fijo."""
+
+    def __init__(self, capacity=1024, with_timestamps=False):
+        size = 16
+        while size < capacity / _MAX_LOAD:
+            size <<= 1
+        self.with_timestamps = with_timestamps
+        self._base_time = time.time()
+        self._other = {}  # Claves no UUID -> timestamp (o None)
+        self._count = 0
+        self._allocate(size)
+
+    def _allocate(self, size):
+        self._mask = size - 1
+        self._high = array("Q", bytes(8 * size))
+        self._low = array("Q", bytes(8 * size))
+        self._ticks = array("i", bytes(4 * size)) if self.with_timestamps else None
+
+    def __len__(self):
+        return self._count + len(self._other)
+
+    def capacity(self):
+        return self._mask + 1
+
+    # --- Conversión de timestamps a décimas de segundo relativas ---
+
+    def _to_ticks(self, timestamp):
+        ticks = int((timestamp - self._base_time) * 10)
+        return min(max(ticks, -_MAX_TICKS), _MAX_TICKS)
+
+    def _from_ticks(self, ticks):
+        return self._base_time + ticks / 10.0
+
+    # --- Sondeo lineal ---
+
+    def _find(self, high, low):
+        """Índice del slot con la clave, o ~índice del primer slot vacío."""
+        mask = self._mask
+        highs, lows = self._high, self._low
+        index = low & mask
+        while True:
+            slot_low = lows[index]
+            slot_high = highs[index]
+            if slot_low == low and slot_high == high:
+                return index
+            if slot_low == 0 and slot_high == 0:
+                return ~index
+            index = (index + 1) & mask
+
+    def _grow(self):
+        old_high, old_low, old_ticks = self._high, self._low, self._ticks
+        self._allocate(2 * (self._mask + 1))
+        for position in range(len(old_high)):
+            high, low = old_high[position], old_low[position]
+            if high or low:
+                index = ~self._find(high, low)
+                self._high[index] = high
+                self._low[index] = low
+                if old_ticks is not None:
+                    self._ticks[index] = old_ticks[position]
+
+    def _delete_slot(self, index):
+        """Borrado con desplazamiento hacia atrás (sin tombstones)."""
+        mask = self._mask
+        highs, lows, ticks = self._high, self._low, self._ticks
+        hole = index
+        probe = index
+        while True:
+            probe = (probe + 1) & mask
+            if highs[probe] == 0 and lows[probe] == 0:
+                break
+            home = lows[probe] & mask
+            # Si el slot "home" del elemento está cíclicamente en (hole, probe], se queda
+            if hole <= probe:
+                stays = hole < home <= probe
+            else:
+                stays = home > hole or home <= probe
+            if stays:
+                continue
+            highs[hole] = highs[probe]
+            lows[hole] = lows[probe]
+            if ticks is not None:
+                ticks[hole] = ticks[probe]
+            hole = probe
+        highs[hole] = 0
+        lows[hole] = 0
+        if ticks is not None:
+            ticks[hole] = 0
+        self._count -= 1
+
+    # --- API tipo dict / set ---
+
+    def add(self, event_id, timestamp=None):
+        """Inserta (o actualiza el timestamp de) un event_id."""
+        key = split_uuid(event_id)
+        if key is None:
+            self._other[event_id] = timestamp
+            return
+        high, low = key
+        index = self._find(high, low)
+        if index < 0:
+            if (self._count + 1) > _MAX_LOAD * (self._mask + 1):
+                self._grow()
+                index = self._find(high, low)
+            index = ~index
+            self._high[index] = high
+            self._low[index] = low
+            self._count += 1
+        if self._ticks is not None and timestamp is not None:
+            self._ticks[index] = self._to_ticks(timestamp)
+
+    def __setitem__(self, event_id, timestamp):
+        self.add(event_id, timestamp)
+
+    def __contains__(self, event_id):
+        key = split_uuid(event_id)
+        if key is None:
+            return event_id in self._other
+        return self._find(*key) >= 0
+
+    def get(self, event_id, default=None):
+        key = split_uuid(event_id)
+        if key is None:
+            return self._other.get(event_id, default)
+        index = self._find(*key)
+        if index < 0:
+            return default
+        if self._ticks is None:
+            return None
+        return self._from_ticks(self._ticks[index])
+
+    def __getitem__(self, event_id):
+        if event_id not in self:
+            raise KeyError(event_id)
+        return self.get(event_id)
+
+    def discard(self, event_id):
+        key = split_uuid(event_id)
+        if key is None:
+            self._other.pop(event_id, None)
+            return
+        index = self._find(*key)
+        if index >= 0:
+            self._delete_slot(index)
+
+    def __iter__(self):
+        highs, lows = self._high, self._low
+        for index in range(len(highs)):
+            high, low = highs[index], lows[index]
+            if high or low:
+                yield join_uuid(high, low)
+        yield from list(self._other)
+
+    def remove_older_than(self, cutoff):
+        """Elimina las entradas con timestamp < cutoff. Retorna cuántas se eliminaron."""
+        if self._ticks is None:
+            raise ValueError("La tabla no guarda timestamps")
+        cutoff_ticks = int((cutoff - self._base_time) * 10)
+        highs, lows, ticks = self._high, self._low, self._ticks
+        expired = [
+            (highs[index], lows[index])
+            for index in range(len(highs))
+            if (highs[index] or lows[index]) and ticks[index] < cutoff_ticks
+        ]
+        for high, low in expired:
+            self._delete_slot(self._find(high, low))
+
+        old_other = [key for key, timestamp in self._other.items() if timestamp is not None and timestamp < cutoff]
+        for key in old_other:
+            del self._other[key]
+        return len(expired) + len(old_other)
+
+    def packed_sorted(self):
+        """(bytes de los UUIDs ordenados, 16 por ID; lista ordenada de IDs no UUID)."""
+        highs, lows = self._high, self._low
+        values = sorted(
+            (highs[index] << 64) | lows[index]
+            for index in range(len(highs))
+            if highs[index] or lows[index]
+        )
+        packed = b"".join(value.to_bytes(16, "big") for value in values)
+        return packed, sorted(key for key in self._other if key is not None)
+
+    def memory_bytes(self):
+        """Bytes ocupados por los arreglos y el diccionario auxiliar."""
+        total = self._high.itemsize * len(self._high) + self._low.itemsize * len(self._low)
+        if self._ticks is not None:
+            total += self._ticks.itemsize * len(self._ticks)
+        return total + sys.getsizeof(self._other)
@@ -0,0 +1,66 @@
+"""
+Codificación compacta del linaje (input_event_ids) de las métricas.
+
+En lugar de una lista JSON de UUIDs en texto (~40 bytes por evento), los IDs se
+empaquetan como 16 bytes binarios, ordenados y codificados en base64 (~22 bytes
+por evento). Los IDs que no tienen forma de UUID canónico viajan aparte en
+`extra_ids` para no perder trazabilidad.
+"""
+import base64
+import uuid
+
+ENCODING_UUID16 = "uuid16-b64"
+
+
+def pack_event_id(event_id):
+    """Devuelve los 16 bytes del UUID o None si el ID no es un UUID canónico."""
+    try:
+        parsed = uuid.UUID(event_id)
+    except (ValueError, TypeError, AttributeError):
+        return None
+    # Solo empaquetamos si el texto original se puede reconstruir exactamente
+    if str(parsed) != event_id:
+        return None
+    return parsed.bytes
+
+
+def encode_packed(packed, extra_ids=()):
+    """Construye el bloque `input_lineage` a partir de UUIDs ya empaquetados y ordenados."""
+    if len(packed) % 16:
+        raise ValueError("Los UUIDs empaquetados deben ocupar 16 bytes cada uno")
+    lineage = {
+        "encoding": ENCODING_UUID16,
+        "count": len(packed) // 16 + len(extra_ids),
+        "data": base64.b64encode(packed).decode("ascii"),
+    }
+    if extra_ids:
+        lineage["extra_ids"] = sorted(extra_ids)
+    return lineage
+
+
+def encode_event_ids(event_ids):
+    """Construye el bloque `input_lineage` a partir de un iterable de event_ids."""
+    packed = []
+    extra_ids = []
+    for event_id in event_ids:
+        raw = pack_event_id(event_id)
+        if raw is None:
+            extra_ids.append(event_id)
+        else:
+            packed.append(raw)
+    packed.sort()
+    return encode_packed(b"".join(packed), extra_ids)
+
+
+def iter_event_ids(lineage):
+    """Expande un bloque `input_lineage` a event_ids en texto (perezoso)."""
+    if lineage.get("encoding") != ENCODING_UUID16:
+        raise ValueError(f"Codificación de linaje desconocida: {lineage.get('encoding')}")
+
+    raw = base64.b64decode(lineage.get("data", ""))
+    if len(raw) % 16:
+        raise ValueError("Linaje corrupto: el tamaño no es múltiplo de 16 bytes")
+
+    for offset in range(0, len(raw), 16):
+        yield str(uuid.UUID(bytes=raw[offset:offset + 16]))
+    yield from lineage.get("extra_ids", [])
@@ -1,18 +1,84 @@
 import json
 import time
 import uuid
-from datetime import datetime
+from datetime import datetime, timezone
 
 import pika
 
+import aggregates
+import columnar
+import delta
+import flow_control
+import geo
+import idtable
+import lineage
+import rollups
+import run_windows
 import settings
 
 # --- ESTADO EN MEMORIA --
 # En un sistema real distribuido, esto debería estar en Redis
-current_window_start = time.time()
-processed_ids = {}     # Para Deduplicación: {event_id: timestamp_procesado}
-stats_buffer = {}         # Estructura: { "norte": { "theft": 5, "assault": 1 }, ... }
-event_ids_by_region = {}  # Estructura: { "norte": {"id1", "id2"} }
+last_processed_cleanup = time.time()
+
+AGGREGATE_SPECS = aggregates.parse_specs(settings.AGGREGATE_SPECS)
+
+
+def new_geo_grid():
+    return geo.GeoGrid(
+        mode=settings.GEO_GRID_MODE,
+        cell_deg=settings.GEO_CELL_DEG,
+        geohash_precision=settings.GEO_GEOHASH_PRECISION,
+    )
+
+
+def new_columnar_buffer():
+    if settings.AGGREGATION_MODE != "columnar":
+        return None
+    return columnar.ColumnarBuffer(
+        numeric_fields=settings.COLUMNAR_NUMERIC_FIELDS,
+        batch_size=settings.COLUMNAR_BATCH_SIZE,
+    )
+
+
+def new_window(run_id, start, now):
+    return run_windows.RunWindow(run_id, start, now, geo_grid=new_geo_grid(), columnar_buffer=new_columnar_buffer())
+
+
+# Ventana abierta y deduplicación por run_id: el tráfico en vivo es "default" y cada backfill
+# (replay.py --backfill) acumula aparte. Para deduplicar: {event_id: timestamp_procesado} por run,
+# con IDs de 128 bits en arreglos compactos
+windows = run_windows.RunWindows(
+    settings.AGGREGATION_WINDOW,
+    new_window,
+    lambda: idtable.IdTable(capacity=65536, with_timestamps=True),
+    clock_start=time.time(),
+    allowed_lateness=settings.BACKFILL_ALLOWED_LATENESS,
+)
+
+rollup_manager = (
+    rollups.RollupManager(levels=settings.ROLLUP_LEVELS, grace_seconds=settings.ROLLUP_GRACE_SECONDS)
+    if settings.ENABLE_ROLLUPS else None
+)
+
+# Prefetch adaptativo: se reajusta con basic_qos según latencia y profundidad de la cola
+prefetch_control = (
+    flow_control.AdaptivePrefetch(
+        initial=settings.PREFETCH_INITIAL,
+        minimum=settings.PREFETCH_MIN,
+        maximum=settings.PREFETCH_MAX,
+        target_latency=settings.PREFETCH_TARGET_LATENCY_MS / 1000.0,
+        max_buffered_seconds=settings.PREFETCH_MAX_BUFFERED_SECONDS,
+        adjust_interval=settings.PREFETCH_ADJUST_INTERVAL,
+        increase_step=settings.PREFETCH_INCREASE_STEP,
+    )
+    if settings.ENABLE_ADAPTIVE_PREFETCH else None
+)
+
+# Solo en WINDOW_PUBLISH_MODE=delta: recuerda el último estado publicado en analytics.window
+delta_encoder = (
+    delta.DeltaEncoder(keyframe_interval=settings.DELTA_KEYFRAME_INTERVAL)
+    if settings.WINDOW_PUBLISH_MODE == "delta" else None
+)
 
 def connect_rabbitmq():
     while True:
@@ -43,58 +109,125 @@ def connect_rabbitmq():
 
 def cleanup_old_processed_ids():
     """Limpia IDs procesados antiguos para evitar fugas de memoria"""
-    global processed_ids
+    global last_processed_cleanup
     current_time = time.time()
-    # Eliminar IDs procesados hace más de 1 hora (3600 segundos)
+    # Recorrer la tabla completa es O(n): lo hacemos como máximo cada PROCESSED_IDS_CLEANUP_INTERVAL
+    if current_time - last_processed_cleanup < settings.PROCESSED_IDS_CLEANUP_INTERVAL:
+        return
+    last_processed_cleanup = current_time
+
+    # Eliminar IDs procesados hace más de 1 hora (3600 segundos), en todos los runs
     cutoff_time = current_time - 3600
-    
-    old_ids = [event_id for event_id, timestamp in processed_ids.items() if timestamp < cutoff_time]
-    for old_id in old_ids:
-        del processed_ids[old_id]
-    
-    # Asignación explícita para satisfacer Flake8
-    processed_ids = processed_ids
-    
-    if old_ids:
-        print(f" [c] Limpiados {len(old_ids)} IDs antiguos de deduplicación")
+    removed = windows.cleanup(cutoff_time)
+
+    if removed:
+        print(f" [c] Limpiados {removed} IDs antiguos de deduplicación")
 
-def flush_window(channel):
-    """Publica los resultados acumulados y reinicia el buffer"""
-    global current_window_start, stats_buffer, event_ids_by_region
+def apply_prefetch_control(channel):
+    """Reajusta el prefetch (AIMD) si toca, consultando la profundidad de la cola"""
+    if prefetch_control is None or not prefetch_control.due():
+        return
+    queue_depth = channel.queue_declare(queue=settings.QUEUE_NAME, durable=True, passive=True).method.message_count
+    new_prefetch = prefetch_control.adjust(queue_depth)
+    if new_prefetch is not None:
+        # global_qos: el límite es del canal y el cambio aplica de inmediato al consumidor activo
+        channel.basic_qos(prefetch_count=new_prefetch, global_qos=True)
+        print(f" [q] Prefetch ajustado: {prefetch_control.status()}")
+
+def publish_closed_rollups(channel):
+    """Publica los rollups cuyos buckets cerraron (o cambiaron por datos tardíos)"""
+    if rollup_manager is None:
+        return
+    for rollup_msg in rollup_manager.collect(time.time()):
+        channel.basic_publish(
+            exchange=settings.OUTPUT_EXCHANGE,
+            routing_key=f"metrics.rollup.{rollup_msg['level']}",
+            body=json.dumps(rollup_msg),
+            properties=pika.BasicProperties(delivery_mode=2),
+        )
+        print(f" [U] Rollup {rollup_msg['level']} {rollup_msg['bucket_start']} {rollup_msg['region']} v{rollup_msg['version']}")
+
+def flush_window(channel, window):
+    """Publica los resultados acumulados de una ventana cerrada (el llamador ya abrió la siguiente)"""
+    stats_buffer = window.stats
+    event_ids_by_region = window.event_ids
+    aggregates_by_region = window.aggregates
+    numeric_stats = None
+    if window.columnar is not None and len(window.columnar):
+        # Modo columnar: los recuentos salen de las reducciones por micro-lote
+        stats_buffer = window.columnar.stats_by_region()
+        event_ids_by_region = window.columnar.ids_by_region()
+        numeric_stats = window.columnar.numeric_stats_by_region()
 
     if not stats_buffer:
-        # Si no hubo datos, solo actualizamos el tiempo
-        current_window_start = time.time()
+        # Si no hubo datos no hay nada que publicar (salvo rollups que hayan cerrado)
+        publish_closed_rollups(channel)
         return
 
     # Crear mensaje de resumen
     total_events_in_window = sum(len(event_ids) for event_ids in event_ids_by_region.values())
-    summary = {
-        "type": "window_summary",
-        "window_start_iso": datetime.fromtimestamp(current_window_start).isoformat(),
-        "window_end_iso": datetime.now().isoformat(),
-        "total_processed": total_events_in_window,
-        "stats_by_region": stats_buffer
-    }
-
-    # Publicar al exchange de analytics
+    if window.live:
+        summary = {
+            "type": "window_summary",
+            "window_start_iso": datetime.fromtimestamp(window.start).isoformat(),
+            "window_end_iso": datetime.now().isoformat(),
+            "total_processed": total_events_in_window,
+            "stats_by_region": stats_buffer
+        }
+    else:
+        # Backfill: la ventana es de tiempo del evento (UTC)
+        start = datetime.fromtimestamp(window.start, timezone.utc)
+        summary = {
+            "type": "window_summary",
+            "run_id": window.run_id,
+            "window_start_iso": start.isoformat(),
+            "window_end_iso": datetime.fromtimestamp(window.start + settings.AGGREGATION_WINDOW, timezone.utc).isoformat(),
+            "total_processed": total_events_in_window,
+            "stats_by_region": stats_buffer
+        }
+    if aggregates_by_region:
+        summary["aggregates_by_region"] = {
+            region: region_aggregates.results() for region, region_aggregates in aggregates_by_region.items()
+        }
+    if numeric_stats:
+        summary["numeric_stats_by_region"] = numeric_stats
+    if prefetch_control is not None:
+        summary["flow_control"] = prefetch_control.status()
+    if len(window.geo_grid):
+        # Conteos dispersos por celda y severidad para el mapa de calor
+        summary["geo_grid"] = window.geo_grid.to_message()
+
+    if window.live and delta_encoder is not None:
+        # Solo las celdas que cambiaron desde la última ventana (con keyframes periódicos)
+        summary = delta_encoder.encode(summary)
+
+    # Publicar al exchange de analytics (los backfills no llegan al dashboard en vivo)
     channel.basic_publish(
         exchange=settings.OUTPUT_EXCHANGE,
-        routing_key="analytics.window",
+        routing_key="analytics.window" if window.live else f"analytics.backfill.{window.run_id}",
         body=json.dumps(summary),
         properties=pika.BasicProperties(delivery_mode=2)
     )
 
-    # Publicar métricas diarias por región con trazabilidad
+    # Publicar métricas diarias por región con trazabilidad (audit las guarda por run_id)
+    metric_date = datetime.now().date() if window.live else start.date()
     for region, region_stats in stats_buffer.items():
         metric_msg = {
             "metric_id": str(uuid.uuid4()),
-            "date": datetime.now().date().isoformat(),
+            "date": metric_date.isoformat(),
             "region": region,
-            "run_id": "default",
+            "run_id": window.run_id,
             "metrics": region_stats,
-            "input_event_ids": sorted(event_ids_by_region.get(region, set())),
         }
+        if region in aggregates_by_region:
+            # Estado serializado para que shards y rollups puedan combinarlo
+            metric_msg["sketches"] = aggregates_by_region[region].to_dict()
+            metric_msg["aggregates"] = aggregates_by_region[region].results()
+        region_event_ids = event_ids_by_region.get(region) or idtable.IdTable(capacity=0)
+        if settings.LINEAGE_ENCODING == "uuid16":
+            metric_msg["input_lineage"] = lineage.encode_packed(*region_event_ids.packed_sorted())
+        else:
+            metric_msg["input_event_ids"] = sorted(region_event_ids)
         channel.basic_publish(
             exchange=settings.OUTPUT_EXCHANGE,
             routing_key="metrics.daily",
@@ -102,15 +235,25 @@ def flush_window(channel):
             properties=pika.BasicProperties(delivery_mode=2),
         )
 
-    print(f" [S] Ventana cerrada. Publicado resumen de {len(event_ids_by_region)} eventos únicos.")
-    
+    # Combinar la ventana en los rollups minuto/hora/día. Solo el run en vivo: los buckets se
+    # cierran con el reloj, y los de un backfill (tiempo histórico) se descartarían al llegar
+    if rollup_manager is not None and window.live:
+        window_id = str(uuid.uuid4())
+        for region, region_stats in stats_buffer.items():
+            rollup_manager.add_window(
+                window_id,
+                window.start,
+                region,
+                region_stats,
+                aggregates=aggregates_by_region.get(region),
+                run_id=window.run_id,
+            )
+        publish_closed_rollups(channel)
+
+    print(f" [S] Ventana cerrada ({window.run_id}). Publicado resumen de {total_events_in_window} eventos únicos.")
+
     # Limpiar IDs antiguos periódicamente
     cleanup_old_processed_ids()
-    
-    # Reiniciar estado de ventana (mantenemos processed_ids)
-    stats_buffer = {}
-    event_ids_by_region = {}
-    current_window_start = time.time()
 
 def log_deadletter_event(event_id, error_msg, routing_key):
     """Loguea eventos que irían a deadletter.processing (implementación simplificada)"""
@@ -174,28 +317,54 @@ def send_to_deadletter_processing(ch, method, body, event_id, error_msg):
     except Exception as e:
         print(f" [!] Error procesando deadletter: {e}")
 
-def process_event(event):
+def process_event(event, window):
     """Lógica de agregación pura"""
     region = event.get("region", "unknown")
     source = event.get("source", "unknown")
     event_id = event.get("event_id")
-    
-    # Inicializar contadores si no existen
-    if region not in stats_buffer:
-        stats_buffer[region] = {}
-    if source not in stats_buffer[region]:
-        stats_buffer[region][source] = 0
-        
-    stats_buffer[region][source] += 1
 
-    if event_id:
-        event_ids_by_region.setdefault(region, set()).add(event_id)
+    stats_buffer = window.stats
+    event_ids_by_region = window.event_ids
+    aggregates_by_region = window.aggregates
+
+    if window.columnar is not None:
+        # Modo columnar: solo se agregan columnas; los recuentos se calculan por lote
+        window.columnar.append(event)
+    else:
+        # Inicializar contadores si no existen
+        if region not in stats_buffer:
+            stats_buffer[region] = {}
+        if source not in stats_buffer[region]:
+            stats_buffer[region][source] = 0
+
+        stats_buffer[region][source] += 1
+
+        if event_id:
+            if region not in event_ids_by_region:
+                event_ids_by_region[region] = idtable.IdTable()
+            event_ids_by_region[region].add(event_id)
+
+    if settings.ENABLE_SKETCHES:
+        if region not in aggregates_by_region:
+            aggregates_by_region[region] = aggregates.AggregateSet(AGGREGATE_SPECS)
+        aggregates_by_region[region].update(event)
+
+    if settings.ENABLE_GEO_BINNING and source == "security.incident":
+        try:
+            payload = event["payload"]
+            location = payload["location"]
+            window.geo_grid.add(location["latitude"], location["longitude"], payload.get("severity", "unknown"))
+        except (AttributeError, KeyError, TypeError, ValueError):
+            pass  # Sin coordenadas válidas no aporta al mapa de calor
 
 def callback(ch, method, properties, body):
-    
+    started = time.perf_counter()
     try:
         event = json.loads(body)
         event_id = event.get("event_id")
+        # Cada run (en vivo o backfill) deduplica y agrega por separado
+        run_id = run_windows.run_id_of(properties, event)
+        processed_ids = windows.processed_ids(run_id)
 
         # 1. DEDUPLICACIÓN (Idempotencia)
         current_time = time.time()
@@ -213,14 +382,15 @@ def callback(ch, method, properties, body):
                 # Evento antiguo que se vuelve a procesar, actualizamos timestamp
                 print(f" [r] Re-procesando evento antiguo: {event_id}")
 
-        # 2. PROCESAMIENTO
-        process_event(event)
+        # 2. PROCESAMIENTO (en un backfill, en la ventana del tramo de tiempo del evento)
+        window = windows.window_for(run_id, event, current_time, run_windows.part_of(properties))
+        process_event(event, window)
         processed_ids[event_id] = current_time
 
-        # 3. VERIFICAR SI CERRAMOS VENTANA
-        # verificamos el tiempo en cada mensaje. Si no llegan mensajes, la ventana no se cierra.
-        if time.time() - current_window_start >= settings.AGGREGATION_WINDOW:
-            flush_window(ch)
+        # 3. VERIFICAR SI CERRAMOS VENTANAS
+        # verificamos el tiempo en cada mensaje. Si no llegan mensajes, las ventanas no se cierran.
+        for due_window in windows.due(time.time()):
+            flush_window(ch, due_window)
 
     except Exception as e:
         print(f" [!] Error agregando: {e}")
@@ -229,12 +399,19 @@ def callback(ch, method, properties, body):
     
     finally:
         ch.basic_ack(delivery_tag=method.delivery_tag)
+        if prefetch_control is not None:
+            prefetch_control.record(time.perf_counter() - started)
+            apply_prefetch_control(ch)
 
 def main():
     while True:
         try:
             connection, channel = connect_rabbitmq()
-            channel.basic_qos(prefetch_count=10) # Traer varios mensajes para ser eficiente
+            if prefetch_control is not None:
+                # Retomamos el último prefetch calculado (también tras reconectar)
+                channel.basic_qos(prefetch_count=prefetch_control.prefetch, global_qos=True)
+            else:
+                channel.basic_qos(prefetch_count=10) # Traer varios mensajes para ser eficiente
             channel.basic_consume(queue=settings.QUEUE_NAME, on_message_callback=callback)
             
             print(' [*] Aggregator corriendo...')
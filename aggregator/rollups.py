@@ -0,0 +1,136 @@
+"""
+Rollups jerárquicos de ventanas a minuto / hora / día.
+
+Cada ventana cerrada se combina de forma incremental en los buckets de cada
+nivel (por región y run_id): recuentos por source y sketches serializables.
+Un bucket se emite cuando cierra (fin del bucket + período de gracia) y se
+vuelve a emitir con una versión mayor si llegan ventanas tardías mientras se
+conserva en memoria. Como cada ventana tiene un window_id, aplicar dos veces la
+misma ventana no cambia el bucket, y el rollup_id es determinista, así que los
+consumidores pueden hacer upsert por (rollup_id, version).
+"""
+import uuid
+from datetime import datetime, timezone
+
+from aggregates import AggregateSet
+
+LEVEL_SECONDS = {
+    "minute": 60,
+    "hour": 3600,
+    "day": 86400,
+}
+
+ROLLUP_NAMESPACE = uuid.UUID("6f1c2d1e-8a4b-4c59-9d57-3f0e7a1b2c3d")
+
+
+def bucket_start(timestamp, level):
+    size = LEVEL_SECONDS[level]
+    return int(timestamp // size) * size
+
+
+def rollup_id(level, start, region, run_id):
+    """ID determinista: el mismo bucket siempre tiene el mismo rollup_id."""
+    return str(uuid.uuid5(ROLLUP_NAMESPACE, f"{run_id}|{level}|{start}|{region}"))
+
+
+class RollupBucket:
+    """Acumulado de un nivel para (inicio, región, run_id)."""
+
+    def __init__(self, level, start, region, run_id):
+        self.level = level
+        self.start = start
+        self.region = region
+        self.run_id = run_id
+        self.counts = {}
+        self.aggregates = AggregateSet([])
+        self.window_ids = set()
+        self.version = 0
+        self.closed = False
+        self.dirty = False
+
+    @property
+    def end(self):
+        return self.start + LEVEL_SECONDS[self.level]
+
+    def merge_window(self, window_id, counts, aggregates=None):
+        if window_id in self.window_ids:
+            return False  # Idempotencia: la ventana ya está incluida
+        for source, count in counts.items():
+            self.counts[source] = self.counts.get(source, 0) + count
+        if aggregates is not None:
+            self.aggregates.merge(aggregates)
+        self.window_ids.add(window_id)
+        self.dirty = True
+        return True
+
+    def to_message(self):
+        return {
+            "type": "rollup",
+            "rollup_id": rollup_id(self.level, self.start, self.region, self.run_id),
+            "level": self.level,
+            "bucket_start": datetime.fromtimestamp(self.start, tz=timezone.utc).isoformat(),
+            "bucket_end": datetime.fromtimestamp(self.end, tz=timezone.utc).isoformat(),
+            "region": self.region,
+            "run_id": self.run_id,
+            "version": self.version,
+            "window_count": len(self.window_ids),
+            "total_events": sum(self.counts.values()),
+            "metrics": self.counts,
+            "sketches": self.aggregates.to_dict(),
+            "aggregates": self.aggregates.results(),
+        }
+
+
+class RollupManager:
+    """Mantiene los buckets abiertos (y los cerrados recientes) de todos los niveles."""
+
+    def __init__(self, levels=("minute", "hour", "day"), grace_seconds=30.0):
+        for level in levels:
+            if level not in LEVEL_SECONDS:
+                raise ValueError(f"Nivel de rollup desconocido: {level}")
+        self.levels = tuple(levels)
+        self.grace_seconds = grace_seconds
+        self.buckets = {}  # (level, inicio, run_id, región) -> RollupBucket
+        self.dropped_windows = 0
+        self._last_collect = 0.0
+
+    def add_window(self, window_id, window_start, region, counts, aggregates=None, run_id="default"):
+        """Combina una ventana en todos los niveles. Retorna los niveles actualizados."""
+        updated = []
+        for level in self.levels:
+            start = bucket_start(window_start, level)
+            key = (level, start, run_id, region)
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                if self._evicted(level, start):
+                    # El bucket ya se emitió y se liberó: no podemos actualizarlo sin perder datos
+                    self.dropped_windows += 1
+                    continue
+                bucket = self.buckets[key] = RollupBucket(level, start, region, run_id)
+            if bucket.merge_window(window_id, counts, aggregates):
+                updated.append(level)
+        return updated
+
+    def _evicted(self, level, start):
+        # Mismo criterio que collect() usa para liberar buckets cerrados
+        return start + 2 * LEVEL_SECONDS[level] + self.grace_seconds <= self._last_collect
+
+    def collect(self, now):
+        """
+        Devuelve los mensajes de los buckets que cerraron (o que cambiaron tras
+        cerrar) y libera los buckets cerrados que ya no pueden recibir datos.
+        """
+        self._last_collect = now
+        messages = []
+        for key, bucket in list(self.buckets.items()):
+            if bucket.end + self.grace_seconds > now:
+                continue  # Sigue abierto
+            if bucket.dirty:
+                bucket.closed = True
+                bucket.dirty = False
+                bucket.version += 1
+                messages.append(bucket.to_message())
+            # Conservamos un nivel completo extra para absorber ventanas tardías
+            if bucket.end + LEVEL_SECONDS[bucket.level] + self.grace_seconds <= now:
+                del self.buckets[key]
+        return messages
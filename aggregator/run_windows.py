@@ -0,0 +1,178 @@
+"""
+Ventanas del aggregator separadas por run_id.
+
+El tráfico en vivo es el run "default", con la ventana de reloj de siempre
+(AGGREGATION_WINDOW segundos de procesamiento). Un backfill (replay.py
+--backfill) llega con otro run_id en los headers y acumula en sus propias
+ventanas y con su propia deduplicación: un recálculo histórico a toda
+velocidad no se mezcla con los números en vivo, y los eventos que reenvía no
+cuentan como duplicados de los que el run en vivo ya procesó.
+
+Las ventanas de un backfill son de tiempo del evento: tramos alineados de
+`window_seconds`, varios abiertos a la vez por run, y cada evento va al de su
+timestamp. Un replay paralelo intercala tramos de tiempo (cada proceso lee su
+parte), así que el avance del run es la marca de agua del proceso más atrasado
+(el máximo timestamp visto de cada `x-replay-part`, el mínimo entre ellos). Una
+ventana se cierra cuando esa marca supera su fin más `allowed_lateness`, o tras
+`window_seconds` de reloj sin eventos. Un evento que llega aún más tarde abre
+otra ventana del mismo tramo: sus métricas salen aparte pero con la misma fecha,
+y los totales por fecha y región (audit: queries.py compare) no cambian.
+"""
+
+import heapq
+from datetime import datetime, timezone
+
+LIVE_RUN_ID = "default"
+
+
+def run_id_of(properties, event):
+    """run_id del mensaje: header `run_id`, el del evento o "default" (mismo criterio que audit)."""
+    headers = getattr(properties, "headers", None) or {}
+    run_id = headers.get("run_id") or (event.get("run_id") if isinstance(event, dict) else None)
+    return run_id if isinstance(run_id, str) and run_id else LIVE_RUN_ID
+
+
+def part_of(properties):
+    """Proceso del replay que publicó el mensaje (header `x-replay-part`; 0 sin replay paralelo)."""
+    headers = getattr(properties, "headers", None) or {}
+    return headers.get("x-replay-part", 0)
+
+
+def event_epoch(event):
+    """Epoch del timestamp ISO del evento (sin zona = UTC); None si no se puede leer."""
+    value = event.get("timestamp") if isinstance(event, dict) else None
+    if not isinstance(value, str):
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+class RunWindow:
+    """Acumulado de una ventana abierta de un run (lo que main.flush_window publica al cerrarla)."""
+
+    def __init__(self, run_id, start, touched, geo_grid=None, columnar_buffer=None):
+        self.run_id = run_id
+        self.start = start  # Reloj en el run en vivo; tiempo del evento en un backfill
+        self.touched = touched  # Reloj del último evento recibido
+        self.stats = {}  # { "norte": { "theft": 5, "assault": 1 }, ... }
+        self.event_ids = {}  # { "norte": IdTable("id1", "id2") }
+        self.aggregates = {}  # { "norte": AggregateSet } (sketches de la ventana)
+        self.geo_grid = geo_grid  # Coordenadas de security.incident de la ventana
+        self.columnar = columnar_buffer  # Solo en AGGREGATION_MODE=columnar
+
+    @property
+    def live(self):
+        return self.run_id == LIVE_RUN_ID
+
+
+class RunWindows:
+    """
+    Ventanas abiertas y tablas de IDs procesados por run_id.
+    `new_window(run_id, start, now)` crea una ventana vacía y `new_ids()` una
+    tabla de deduplicación (main.py les da la configuración del aggregator).
+    """
+
+    def __init__(self, window_seconds, new_window, new_ids, clock_start=None, allowed_lateness=0.0):
+        self.window_seconds = window_seconds
+        self.allowed_lateness = allowed_lateness
+        self.new_window = new_window
+        self.new_ids = new_ids
+        self.processed = {}
+        # El run en vivo siempre tiene su ventana, aunque no lleguen eventos
+        self.live = new_window(LIVE_RUN_ID, clock_start, clock_start)
+        self.backfills = {}  # run_id -> {inicio alineado: RunWindow}
+        self.watermarks = {}  # run_id -> {parte: máximo timestamp visto}
+        self._by_start = []  # heap de (inicio, run_id) de las ventanas de backfill abiertas
+        self._next_idle_check = 0.0
+
+    def processed_ids(self, run_id):
+        table = self.processed.get(run_id)
+        if table is None:
+            table = self.processed[run_id] = self.new_ids()
+        return table
+
+    def window_for(self, run_id, event, now, part=0):
+        """Ventana del run que recibe `event` (en un backfill, la del tramo de su timestamp)."""
+        if run_id == LIVE_RUN_ID:
+            window = self.live
+        else:
+            event_time = event_epoch(event)
+            parts = self.watermarks.setdefault(run_id, {})
+            if event_time is None:
+                event_time = max(parts.values()) if parts else now  # Sin timestamp: con lo último del run
+            elif event_time > parts.get(part, float("-inf")):
+                parts[part] = event_time
+            start = event_time - event_time % self.window_seconds
+            opened = self.backfills.setdefault(run_id, {})
+            window = opened.get(start)
+            if window is None:
+                window = opened[start] = self.new_window(run_id, start, now)
+                heapq.heappush(self._by_start, (start, run_id))
+        window.touched = now
+        return window
+
+    def watermark(self, run_id):
+        """Avance del run: el máximo timestamp del proceso de replay más atrasado (None sin eventos)."""
+        parts = self.watermarks.get(run_id)
+        return min(parts.values()) if parts else None
+
+    def due(self, now):
+        """
+        Saca y retorna las ventanas a cerrar: la del run en vivo tras
+        `window_seconds` de reloj (y abre la siguiente), y las de backfill que la
+        marca de agua de su run dejó atrás o que llevan `window_seconds` sin eventos.
+        """
+        closing = []
+        if now - self.live.start >= self.window_seconds:
+            closing.append(self.live)
+            self.live = self.new_window(LIVE_RUN_ID, now, now)
+
+        # Por marca de agua: el heap da las ventanas de inicio más antiguo primero
+        while self._by_start:
+            start, run_id = self._by_start[0]
+            watermark = self.watermark(run_id)
+            window = self.backfills.get(run_id, {}).get(start)
+            if window is None:
+                heapq.heappop(self._by_start)  # Ya cerrada por inactividad
+            elif watermark is not None and start + self.window_seconds + self.allowed_lateness <= watermark:
+                heapq.heappop(self._by_start)
+                closing.append(self._pop(run_id, start))
+            else:
+                break  # Su run no avanzó lo suficiente; las demás se revisan por inactividad
+
+        # Por inactividad (recorre todas las abiertas: a lo sumo una vez por segundo)
+        if now >= self._next_idle_check:
+            self._next_idle_check = now + min(1.0, self.window_seconds)
+            for run_id, opened in list(self.backfills.items()):
+                watermark = self.watermark(run_id)
+                for start, window in sorted(opened.items()):
+                    if now - window.touched >= self.window_seconds or (
+                            watermark is not None
+                            and start + self.window_seconds + self.allowed_lateness <= watermark):
+                        closing.append(self._pop(run_id, start))
+        return closing
+
+    def _pop(self, run_id, start):
+        opened = self.backfills[run_id]
+        window = opened.pop(start)
+        if not opened:
+            del self.backfills[run_id]
+        return window
+
+    def cleanup(self, cutoff):
+        """
+        Expira los IDs procesados antes de `cutoff` y suelta las tablas vacías y las
+        marcas de agua de backfills terminados (sin ventanas abiertas).
+        """
+        removed = 0
+        for run_id, table in list(self.processed.items()):
+            removed += table.remove_older_than(cutoff)
+            if not len(table) and run_id != LIVE_RUN_ID and run_id not in self.backfills:
+                del self.processed[run_id]
+                self.watermarks.pop(run_id, None)
+        return removed
@@ -12,4 +12,50 @@ OUTPUT_EXCHANGE = 'analytics_exchange'  # Resultados agregados
 QUEUE_NAME = 'aggregator_queue'
 
 # Configuración de Agregación
-AGGREGATION_WINDOW = float(os.getenv('AGGREGATION_WINDOW', 5.0)) # Segundos
\ No newline at end of file
+AGGREGATION_WINDOW = float(os.getenv('AGGREGATION_WINDOW', 5.0)) # Segundos
+# Backfills (replay.py --backfill): segundos de tiempo del evento que una ventana espera eventos
+# desordenados tras el avance del proceso de replay más atrasado antes de cerrarse
+BACKFILL_ALLOWED_LATENESS = float(os.getenv('BACKFILL_ALLOWED_LATENESS', 60.0))
+# Linaje de métricas: "uuid16" (UUIDs empaquetados en binario) o "list" (lista JSON clásica)
+LINEAGE_ENCODING = os.getenv('LINEAGE_ENCODING', 'uuid16')
+
+# Sketches de agregación (distintos, cuantiles, top-K); ver aggregates.py
+ENABLE_SKETCHES = os.getenv('ENABLE_SKETCHES', 'true').lower() == 'true'
+# JSON opcional con la lista de agregaciones; vacío = DEFAULT_AGGREGATES
+AGGREGATE_SPECS = os.getenv('AGGREGATE_SPECS', '')
+
+# Binning espacial de security.incident (mapa de calor); ver geo.py
+ENABLE_GEO_BINNING = os.getenv('ENABLE_GEO_BINNING', 'true').lower() == 'true'
+GEO_GRID_MODE = os.getenv('GEO_GRID_MODE', 'grid')  # "grid" (celdas lat/long) o "geohash"
+GEO_CELL_DEG = float(os.getenv('GEO_CELL_DEG', 0.5))  # Tamaño de celda en grados (modo grid)
+GEO_GEOHASH_PRECISION = int(os.getenv('GEO_GEOHASH_PRECISION', 4))  # Caracteres de geohash (modo geohash)
+
+# Modo de agregación: "dict" (diccionarios evento a evento) o "columnar" (micro-lotes); ver columnar.py
+AGGREGATION_MODE = os.getenv('AGGREGATION_MODE', 'dict')
+COLUMNAR_BATCH_SIZE = int(os.getenv('COLUMNAR_BATCH_SIZE', 4096))
+COLUMNAR_NUMERIC_FIELDS = os.getenv(
+    'COLUMNAR_NUMERIC_FIELDS',
+    'payload.respondent_age,payload.location.latitude,payload.location.longitude'
+).split(',')
+
+# Rollups jerárquicos (minuto/hora/día) publicados como metrics.rollup.<nivel>; ver rollups.py
+ENABLE_ROLLUPS = os.getenv('ENABLE_ROLLUPS', 'true').lower() == 'true'
+ROLLUP_LEVELS = os.getenv('ROLLUP_LEVELS', 'minute,hour,day').split(',')
+ROLLUP_GRACE_SECONDS = float(os.getenv('ROLLUP_GRACE_SECONDS', 30.0))  # Espera por ventanas tardías antes de emitir
+
+# Cada cuántos segundos, como máximo, se recorre processed_ids para expirar IDs de más de 1 hora
+PROCESSED_IDS_CLEANUP_INTERVAL = float(os.getenv('PROCESSED_IDS_CLEANUP_INTERVAL', 60.0))
+
+# Publicación de analytics.window: "full" (snapshot completo) o "delta" (solo cambios + keyframes)
+WINDOW_PUBLISH_MODE = os.getenv('WINDOW_PUBLISH_MODE', 'full')
+DELTA_KEYFRAME_INTERVAL = int(os.getenv('DELTA_KEYFRAME_INTERVAL', 10))  # Ventanas entre snapshots completos
+
+# Prefetch adaptativo (AIMD) según latencia de procesamiento y profundidad de la cola; ver flow_control.py
+ENABLE_ADAPTIVE_PREFETCH = os.getenv('ENABLE_ADAPTIVE_PREFETCH', 'true').lower() == 'true'
+PREFETCH_INITIAL = int(os.getenv('PREFETCH_INITIAL', 10))
+PREFETCH_MIN = int(os.getenv('PREFETCH_MIN', 1))
+PREFETCH_MAX = int(os.getenv('PREFETCH_MAX', 500))
+PREFETCH_TARGET_LATENCY_MS = float(os.getenv('PREFETCH_TARGET_LATENCY_MS', 20.0))  # Latencia media por mensaje
+PREFETCH_MAX_BUFFERED_SECONDS = float(os.getenv('PREFETCH_MAX_BUFFERED_SECONDS', 2.0))  # Trabajo máximo sin ack
+PREFETCH_ADJUST_INTERVAL = float(os.getenv('PREFETCH_ADJUST_INTERVAL', 2.0))  # Segundos entre ajustes
+PREFETCH_INCREASE_STEP = int(os.getenv('PREFETCH_INCREASE_STEP', 5))  # Incremento aditivo por ajuste
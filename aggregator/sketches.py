@@ -0,0 +1,254 @@
+"""
+Sketches de streaming combinables (mergeable) para el aggregator.
+
+Todos comparten la misma interfaz:
+  - add(value):      incorpora un valor
+  - merge(other):    combina otro sketch del mismo tipo (shards, rollups)
+  - result():        resumen legible (estimación)
+  - to_dict() / from_dict(data): estado serializable a JSON
+"""
+import base64
+import hashlib
+import math
+import random
+import zlib
+
+
+def _hash64(value):
+    """Hash estable de 64 bits (no depende de PYTHONHASHSEED)."""
+    digest = hashlib.blake2b(str(value).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+class HyperLogLog:
+    """Conteo aproximado de valores distintos (error típico ~1.04/sqrt(2^p))."""
+
+    kind = "hll"
+
+    def __init__(self, precision=12):
+        if not 4 <= precision <= 16:
+            raise ValueError("La precisión de HyperLogLog debe estar entre 4 y 16")
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, value):
+        x = _hash64(value)
+        index = x >> (64 - self.precision)
+        rest = (x << self.precision) & 0xFFFFFFFFFFFFFFFF
+        rank = 64 - self.precision + 1 if rest == 0 else 64 - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError("No se pueden combinar HyperLogLog de distinta precisión")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def estimate(self):
+        m = len(self.registers)
+        if m >= 128:
+            alpha = 0.7213 / (1 + 1.079 / m)
+        else:
+            alpha = {16: 0.673, 32: 0.697, 64: 0.709}[m]
+        raw = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * m and zeros:
+            # Corrección para rangos pequeños (linear counting)
+            return int(round(m * math.log(m / zeros)))
+        return int(round(raw))
+
+    def result(self):
+        return self.estimate()
+
+    def to_dict(self):
+        return {
+            "kind": self.kind,
+            "precision": self.precision,
+            "registers": base64.b64encode(zlib.compress(bytes(self.registers))).decode("ascii"),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(precision=data["precision"])
+        sketch.registers = bytearray(zlib.decompress(base64.b64decode(data["registers"])))
+        return sketch
+
+
+class KLLSketch:
+    """Cuantiles aproximados con memoria acotada (sketch KLL simplificado)."""
+
+    kind = "kll"
+
+    def __init__(self, k=200):
+        self.k = k
+        self.levels = [[]]
+        self.count = 0
+        self.min_value = None
+        self.max_value = None
+        self._rng = random.Random()
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(2, int(math.ceil(self.k * (2.0 / 3.0) ** depth)))
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            if len(self.levels[level]) >= self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append([])
+                items = sorted(self.levels[level])
+                leftover = [items.pop()] if len(items) % 2 else []
+                # Cada elemento promovido pesa el doble; elegimos pares o impares al azar
+                offset = self._rng.randint(0, 1)
+                self.levels[level + 1].extend(items[offset::2])
+                self.levels[level] = leftover
+            level += 1
+
+    def _track_bounds(self, low, high):
+        self.min_value = low if self.min_value is None else min(self.min_value, low)
+        self.max_value = high if self.max_value is None else max(self.max_value, high)
+
+    def add(self, value):
+        value = float(value)
+        self.levels[0].append(value)
+        self.count += 1
+        self._track_bounds(value, value)
+        self._compress()
+
+    def merge(self, other):
+        if other.count == 0:
+            return
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for level, items in enumerate(other.levels):
+            self.levels[level].extend(items)
+        self.count += other.count
+        self._track_bounds(other.min_value, other.max_value)
+        self._compress()
+
+    def quantile(self, q):
+        if self.count == 0:
+            return None
+        weighted = sorted(
+            (value, 1 << level) for level, items in enumerate(self.levels) for value in items
+        )
+        total = sum(weight for _, weight in weighted)
+        target = q * total
+        cumulative = 0
+        for value, weight in weighted:
+            cumulative += weight
+            if cumulative >= target:
+                return value
+        return weighted[-1][0]
+
+    def result(self):
+        return {
+            "count": self.count,
+            "min": self.min_value,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            "max": self.max_value,
+        }
+
+    def to_dict(self):
+        return {
+            "kind": self.kind,
+            "k": self.k,
+            "count": self.count,
+            "min": self.min_value,
+            "max": self.max_value,
+            "levels": self.levels,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(k=data["k"])
+        sketch.count = data["count"]
+        sketch.min_value = data["min"]
+        sketch.max_value = data["max"]
+        sketch.levels = [list(items) for items in data["levels"]] or [[]]
+        return sketch
+
+
+class SpaceSaving:
+    """Top-K aproximado (algoritmo Space-Saving); cada contador lleva su cota de error."""
+
+    kind = "topk"
+
+    def __init__(self, k=10):
+        self.k = k
+        self.counters = {}  # item -> [conteo, error]
+
+    def _min_count(self):
+        if len(self.counters) < self.k:
+            return 0
+        return min(count for count, _ in self.counters.values())
+
+    def add(self, value, weight=1):
+        item = str(value)
+        if item in self.counters:
+            self.counters[item][0] += weight
+        elif len(self.counters) < self.k:
+            self.counters[item] = [weight, 0]
+        else:
+            victim = min(self.counters, key=lambda key: self.counters[key][0])
+            floor = self.counters.pop(victim)[0]
+            self.counters[item] = [floor + weight, floor]
+
+    def merge(self, other):
+        own_floor = self._min_count()
+        other_floor = other._min_count()
+        merged = {}
+        for item in set(self.counters) | set(other.counters):
+            count_a, error_a = self.counters.get(item, (own_floor, own_floor))
+            count_b, error_b = other.counters.get(item, (other_floor, other_floor))
+            merged[item] = [count_a + count_b, error_a + error_b]
+        top = sorted(merged.items(), key=lambda entry: entry[1][0], reverse=True)[: self.k]
+        self.counters = dict(top)
+
+    def top(self, n=None):
+        ranked = sorted(self.counters.items(), key=lambda entry: entry[1][0], reverse=True)
+        return [[item, count, error] for item, (count, error) in ranked[:n]]
+
+    def result(self):
+        return self.top()
+
+    def to_dict(self):
+        return {"kind": self.kind, "k": self.k, "counters": self.counters}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(k=data["k"])
+        sketch.counters = {item: list(entry) for item, entry in data["counters"].items()}
+        return sketch
+
+
+class FrequencyCounter:
+    """Conteo exacto por valor, para dominios pequeños (p. ej. mezcla de estados)."""
+
+    kind = "counter"
+
+    def __init__(self):
+        self.counts = {}
+
+    def add(self, value, weight=1):
+        item = str(value)
+        self.counts[item] = self.counts.get(item, 0) + weight
+
+    def merge(self, other):
+        for item, count in other.counts.items():
+            self.counts[item] = self.counts.get(item, 0) + count
+
+    def result(self):
+        return dict(self.counts)
+
+    def to_dict(self):
+        return {"kind": self.kind, "counts": self.counts}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls()
+        sketch.counts = dict(data["counts"])
+        return sketch
@@ -0,0 +1,173 @@
+"""
+Archivo comprimido por bloques para los datos fríos de auditoría.
+
+Un `.arc` guarda registros (líneas en bytes) en bloques comprimidos de forma
+independiente con zlib o lzma (stdlib), de ~`block_bytes` sin comprimir cada
+uno, y al final un índice con el resumen de cada bloque:
+
+    MAGIC | bloque 0 | bloque 1 | ... | índice (JSON con zlib) | TRAILER
+
+El índice lleva, por bloque, su posición, el ordinal relativo del primer
+registro, la cantidad, los min/max de cada campo de tiempo y las regiones y
+run_ids que contiene. Los lectores eligen bloques con `select()` y solo
+descomprimen esos; el resto del archivo no se lee.
+
+Lo usan segments.py (segmentos sellados del log) y partitions.py (events_in de
+particiones viejas). El módulo solo conoce el formato, no el contenido.
+"""
+import json
+import lzma
+import os
+import struct
+import zlib
+from collections import OrderedDict
+
+SUFFIX = ".arc"
+MAGIC = b"AUDARC1\n"
+TRAILER = struct.Struct("<QQ8s")  # posición del índice, largo del índice, MAGIC
+CODECS = {
+    "zlib": (lambda data: zlib.compress(data, 6), zlib.decompress),
+    "lzma": (lzma.compress, lzma.decompress),
+}
+
+
+class ArchiveWriter:
+    """Escribe un .arc en `path + ".tmp"` y lo renombra al cerrar (un lector nunca ve uno a medias)."""
+
+    def __init__(self, path, codec="zlib", block_bytes=256 << 10, meta=None):
+        if codec not in CODECS:
+            raise ValueError(f"Codec de archivo desconocido: {codec}")
+        self.path = path
+        self.codec = codec
+        self.block_bytes = block_bytes
+        self.meta = dict(meta or {})
+        self.blocks = []
+        self.records = 0
+        self._compress = CODECS[codec][0]
+        self._file = open(path + ".tmp", "wb")
+        self._file.write(MAGIC)
+        self._lines = []
+        self._size = 0
+        self._summary = None
+
+    def add(self, line: bytes, times=None, region=None, run_id=None) -> None:
+        """Agrega un registro; `times` es {campo: valor comparable} (epoch o texto ISO)."""
+        if self._summary is None:
+            self._summary = {"first": self.records, "count": 0, "regions": set(), "run_ids": set()}
+        summary = self._summary
+        for field, value in (times or {}).items():
+            if value is None:
+                continue
+            low, high = summary.get(f"min_{field}"), summary.get(f"max_{field}")
+            summary[f"min_{field}"] = value if low is None or value < low else low
+            summary[f"max_{field}"] = value if high is None or value > high else high
+        if region is not None:
+            summary["regions"].add(region)
+        if run_id is not None:
+            summary["run_ids"].add(run_id)
+        summary["count"] += 1
+        self._lines.append(line)
+        self._size += len(line)
+        self.records += 1
+        if self._size >= self.block_bytes:
+            self._flush_block()
+
+    def _flush_block(self):
+        if not self._lines:
+            return
+        data = self._compress(b"".join(self._lines))
+        summary = self._summary
+        summary.update(offset=self._file.tell(), length=len(data), raw=self._size,
+                       regions=sorted(summary["regions"]), run_ids=sorted(summary["run_ids"]))
+        self._file.write(data)
+        self.blocks.append(summary)
+        self._lines, self._size, self._summary = [], 0, None
+
+    def close(self) -> None:
+        self._flush_block()
+        index = zlib.compress(json.dumps(
+            {"codec": self.codec, "records": self.records, "meta": self.meta, "blocks": self.blocks}
+        ).encode("utf-8"))
+        position = self._file.tell()
+        self._file.write(index)
+        self._file.write(TRAILER.pack(position, len(index), MAGIC))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self.path + ".tmp", self.path)
+
+    def abort(self) -> None:
+        self._file.close()
+        os.remove(self.path + ".tmp")
+
+
+class Archive:
+    """Lector de un .arc: lee solo el índice al abrir y descomprime bloques a pedido."""
+
+    def __init__(self, path, cache_blocks=4):
+        self.path = path
+        with open(path, "rb") as f:
+            f.seek(-TRAILER.size, os.SEEK_END)
+            position, length, magic = TRAILER.unpack(f.read(TRAILER.size))
+            if magic != MAGIC:
+                raise ValueError(f"Archivo comprimido inválido: {path}")
+            f.seek(position)
+            index = json.loads(zlib.decompress(f.read(length)))
+        self.codec = index["codec"]
+        self.records = index["records"]
+        self.meta = index["meta"]
+        self.blocks = index["blocks"]
+        self._decompress = CODECS[self.codec][1]
+        self._cache = OrderedDict()  # número de bloque -> líneas (LRU)
+        self._cache_blocks = cache_blocks
+
+    def time_range(self, field):
+        """(mínimo, máximo) del campo en todo el archivo; (None, None) si ningún registro lo tiene."""
+        lows = [block[f"min_{field}"] for block in self.blocks if f"min_{field}" in block]
+        highs = [block[f"max_{field}"] for block in self.blocks if f"max_{field}" in block]
+        return (min(lows), max(highs)) if lows else (None, None)
+
+    def select(self, field=None, start=None, end=None, region=None, run_id=None):
+        """
+        Números de bloque que pueden contener registros con `field` en [start, end]
+        y de esa región / run_id. Un bloque sin el campo no se descarta por tiempo
+        (igual que replay, que envía los registros sin timestamp legible).
+        """
+        chosen = []
+        for number, block in enumerate(self.blocks):
+            low, high = block.get(f"min_{field}"), block.get(f"max_{field}")
+            if low is not None and ((start is not None and high < start) or (end is not None and low > end)):
+                continue
+            if region is not None and region not in block["regions"]:
+                continue
+            if run_id is not None and run_id not in block["run_ids"]:
+                continue
+            chosen.append(number)
+        return chosen
+
+    def read_block(self, number):
+        """Líneas (bytes, con su salto de línea) del bloque."""
+        lines = self._cache.get(number)
+        if lines is not None:
+            self._cache.move_to_end(number)
+            return lines
+        block = self.blocks[number]
+        with open(self.path, "rb") as f:
+            f.seek(block["offset"])
+            data = self._decompress(f.read(block["length"]))
+        # Solo "\n" separa registros (splitlines también cortaría en "\r" u otros separadores)
+        lines = [line + b"\n" for line in data.split(b"\n")[:-1]]
+        self._cache[number] = lines
+        if len(self._cache) > self._cache_blocks:
+            self._cache.popitem(last=False)
+        return lines
+
+    def iter_lines(self, blocks=None, start_ordinal=0):
+        """Genera (ordinal relativo, línea) de los bloques indicados (todos por defecto) desde `start_ordinal`."""
+        for number in range(len(self.blocks)) if blocks is None else blocks:
+            block = self.blocks[number]
+            if block["first"] + block["count"] <= start_ordinal:
+                continue
+            for ordinal, line in enumerate(self.read_block(number), block["first"]):
+                if ordinal >= start_ordinal:
+                    yield ordinal, line
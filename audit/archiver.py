@@ -0,0 +1,64 @@
+"""
+Archivado manual de los datos fríos de auditoría (el servicio también lo hace
+solo con LOG_ARCHIVE_KEEP_RAW y AUDIT_ARCHIVE_AFTER_DAYS).
+
+Uso:
+  python archiver.py log [--dir /data/audit_log.d] [--keep-raw 1]
+  python archiver.py partitions [--dir /data/audit_partitions] --older-than 7
+
+`log` comprime los segmentos sellados salvo los `--keep-raw` más recientes;
+`partitions` mueve events_in de las particiones con al menos `--older-than`
+días a su archivo comprimido y compacta la base.
+"""
+import argparse
+import os
+from datetime import date
+
+import archive
+import partitions
+import segments
+import settings
+
+
+def archive_log(directory, keep_raw, codec, block_bytes):
+    before = sum(os.path.getsize(path) for _, path in segments.list_segments(directory))
+    archived = segments.archive_segments(directory, keep_raw, codec, block_bytes)
+    after = sum(os.path.getsize(path) for _, path in segments.list_segments(directory))
+    print(f"[*] {archived} segmentos archivados ({before / 1e6:,.1f} MB -> {after / 1e6:,.1f} MB)")
+
+
+def archive_partitions(directory, older_than, codec, block_bytes):
+    today = date.fromisoformat(partitions.today())
+    for day, path in partitions.list_partitions(directory):
+        if (today - date.fromisoformat(day)).days < older_than:
+            continue
+        records = partitions.compact_partition(path, partitions.ARCHIVED_VERSION, codec, block_bytes)
+        if records is None:
+            print(f"    {day}: ya estaba archivada")
+        else:
+            print(f"    {day}: {records} eventos archivados")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archivo comprimido de datos fríos de audit")
+    parser.add_argument("--codec", choices=sorted(archive.CODECS), default=settings.ARCHIVE_CODEC)
+    parser.add_argument("--block-bytes", type=int, default=settings.ARCHIVE_BLOCK_BYTES)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    log = commands.add_parser("log", help="Segmentos sellados del log JSONL")
+    log.add_argument("--dir", default=settings.LOG_SEGMENT_DIR)
+    log.add_argument("--keep-raw", type=int, default=max(1, settings.LOG_ARCHIVE_KEEP_RAW),
+                     help="Segmentos sellados más recientes que quedan sin comprimir")
+    days = commands.add_parser("partitions", help="events_in de las particiones diarias viejas")
+    days.add_argument("--dir", default=settings.AUDIT_PARTITION_DIR)
+    days.add_argument("--older-than", type=int, required=True, help="Edad mínima en días")
+
+    args = parser.parse_args()
+    if args.command == "log":
+        archive_log(args.dir, args.keep_raw, args.codec, args.block_bytes)
+    else:
+        archive_partitions(args.dir, args.older_than, args.codec, args.block_bytes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,484 @@
+"""
+Exportación masiva de audit.db (y sus particiones) a archivos para análisis.
+
+Uso:
+  python exporter.py events  --format jsonl.gz --out events.jsonl.gz [--from 2026-01-01] [--to 2026-01-31]
+                             [--region sur] [--source security.incident] [--run-id R]
+  python exporter.py metrics --format csv --out metrics.csv [--from ...] [--to ...] [--region ...] [--run-id ...]
+  python exporter.py lineage --format columnar --out lineage.d [filtros]
+
+Las filas se leen con un cursor de SQLite que avanza de a `--chunk` filas
+(fetchmany) y cada bloque se escribe antes de pedir el siguiente: la memoria
+no depende de la cantidad exportada. Un cursor abierto mantiene su snapshot
+del WAL, así que durante una exportación larga el checkpoint no puede
+reciclar el WAL (crece y se recupera al terminar).
+
+Tablas:
+  - events:  events_in (y los eventos archivados de las particiones)
+  - metrics: metrics_out
+  - lineage: una fila por (métrica, evento) de `trace` y del linaje compacto,
+             con el timestamp y la fuente del evento (vacíos si audit no lo guardó)
+
+Formatos (`-` como salida escribe jsonl/csv sin comprimir a stdout):
+  - jsonl, jsonl.gz, jsonl.xz: un objeto por línea; payload/metrics van como JSON anidado
+  - csv, csv.gz: con encabezado; payload_json/metrics_json como texto
+  - columnar: un directorio con un archivo binario por columna y `manifest.json`
+      text  -> <col>.offsets (int64, fin de cada valor), <col>.data (UTF-8), <col>.valid (uint8, 0 = NULL)
+      dict  -> <col>.codes (int32, -1 = NULL); los valores van en el manifest
+      time  -> <col>.f8 (float64, epoch en segundos; NaN si falta o no se puede leer)
+    Se leen sin copiar con numpy.fromfile / numpy.memmap (byteorder en el manifest).
+
+Los filtros de fecha comparan el timestamp del evento o la fecha de la
+métrica (en lineage, la de la métrica); `--to` con solo la fecha incluye el día
+completo. Al terminar informa filas, segundos y filas/s.
+"""
+import argparse
+import csv
+import gzip
+import io
+import json
+import lzma
+import math
+import os
+import shutil
+import sys
+import time
+from array import array
+from json.encoder import encode_basestring as _encode_string
+
+import lineage_store
+import partitions
+import queries
+import segments
+import settings
+
+FORMATS = ("jsonl", "jsonl.gz", "jsonl.xz", "csv", "csv.gz", "columnar")
+
+# (nombre, tipo columnar); los "*_json" se anidan como JSON en jsonl
+EVENT_COLUMNS = (
+    ("event_id", "text"), ("timestamp", "time"), ("region", "dict"), ("source", "dict"),
+    ("schema_version", "dict"), ("correlation_id", "text"), ("run_id", "dict"), ("payload_json", "text"),
+)
+METRIC_COLUMNS = (
+    ("metric_id", "text"), ("date", "dict"), ("region", "dict"), ("run_id", "dict"), ("metrics_json", "text"),
+)
+LINEAGE_COLUMNS = (
+    ("metric_id", "text"), ("date", "dict"), ("region", "dict"), ("run_id", "dict"),
+    ("event_id", "text"), ("timestamp", "time"), ("source", "dict"), ("contribution_type", "dict"),
+)
+TABLE_COLUMNS = {"events": EVENT_COLUMNS, "metrics": METRIC_COLUMNS, "lineage": LINEAGE_COLUMNS}
+
+EXPORT_EVENTS_SQL = """
+    SELECT event_id, timestamp, region, source, schema_version, correlation_id, run_id, payload_json
+    FROM {schema}.events_in {where}
+"""
+EXPORT_METRICS_SQL = "SELECT metric_id, date, region, run_id, metrics_json FROM {schema}.metrics_out m {where}"
+EXPORT_TRACE_SQL = """
+    SELECT m.metric_id, m.date, m.region, m.run_id, t.event_id, e.timestamp, e.source, t.contribution_type
+    FROM {schema}.metrics_out m
+    JOIN {schema}.trace t ON t.metric_id = m.metric_id
+    LEFT JOIN {schema}.events_in e ON e.event_id = t.event_id
+    {where}
+"""
+# Métricas con linaje compacto (las que además tienen `trace` materializado ya salen arriba)
+EXPORT_COMPACT_SQL = """
+    SELECT m.metric_id, m.date, m.region, m.run_id
+    FROM {schema}.metrics_out m JOIN {schema}.metric_lineage l ON l.metric_id = m.metric_id
+    WHERE NOT EXISTS (SELECT 1 FROM {schema}.trace t WHERE t.metric_id = m.metric_id) {also}
+"""
+
+
+class Filters:
+    """Filtros de la exportación; `start`/`end` son timestamps ISO o fechas (inclusive)."""
+
+    def __init__(self, start=None, end=None, region=None, source=None, run_id=None):
+        self.start = start or None
+        self.end = end or None
+        if self.end is not None and len(self.end) == 10:
+            self.end += queries._MAX_TEXT  # Solo la fecha: el día completo
+        self.region = region
+        self.source = source
+        self.run_id = run_id
+
+    def days(self):
+        """Rango de días de las particiones a recorrer."""
+        return partitions.day_of(self.start), partitions.day_of(self.end)
+
+    def event_where(self):
+        clauses, params = [], []
+        for clause, value in (("timestamp >= ?", self.start), ("timestamp <= ?", self.end),
+                              ("region = ?", self.region), ("source = ?", self.source), ("run_id = ?", self.run_id)):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        return " AND ".join(clauses), params
+
+    def metric_where(self):
+        first, last = self.days()
+        clauses, params = [], []
+        for clause, value in (("m.date >= ?", first), ("m.date <= ?", last),
+                              ("m.region = ?", self.region), ("m.run_id = ?", self.run_id)):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        return " AND ".join(clauses), params
+
+    def matches_event(self, row):
+        return ((self.start is None or row[1] >= self.start) and (self.end is None or row[1] <= self.end)
+                and (self.region is None or row[2] == self.region)
+                and (self.source is None or row[3] == self.source)
+                and (self.run_id is None or row[6] == self.run_id))
+
+    def as_dict(self):
+        found = {key: value for key, value in vars(self).items() if value is not None}
+        if "end" in found:
+            found["end"] = found["end"].rstrip(queries._MAX_TEXT)
+        return found
+
+
+def _where(clauses):
+    return f"WHERE {clauses}" if clauses else ""
+
+
+def _chunks(cursor, chunk_rows):
+    while True:
+        rows = cursor.fetchmany(chunk_rows)
+        if not rows:
+            return
+        yield rows
+
+
+def event_chunks(conn, filters, chunk_rows):
+    """Bloques de filas de events_in (audit.db, particiones y sus archivos) que cumplen los filtros."""
+    clauses, params = filters.event_where()
+    first, last = filters.days()
+    for day, schema in queries._sources(conn, first, last):
+        yield from _chunks(conn.execute(EXPORT_EVENTS_SQL.format(schema=schema, where=_where(clauses)), params),
+                           chunk_rows)
+        events_archive = conn.partitions.archive(day, schema) if day is not None else None
+        if events_archive is not None:
+            blocks = events_archive.select("timestamp", filters.start, filters.end, filters.region, filters.run_id)
+            rows = []
+            for _, line in events_archive.iter_lines(blocks):
+                row = tuple(json.loads(line))
+                if filters.matches_event(row):
+                    rows.append(row)
+                    if len(rows) >= chunk_rows:
+                        yield rows
+                        rows = []
+            if rows:
+                yield rows
+
+
+def metric_chunks(conn, filters, chunk_rows):
+    """Bloques de filas de metrics_out que cumplen los filtros."""
+    if filters.source is not None:
+        raise ValueError("metrics_out no tiene fuente: --source solo aplica a events y lineage")
+    clauses, params = filters.metric_where()
+    first, last = filters.days()
+    for _, schema in queries._sources(conn, first, last):
+        yield from _chunks(conn.execute(EXPORT_METRICS_SQL.format(schema=schema, where=_where(clauses)), params),
+                           chunk_rows)
+
+
+def _resolve(lookup, rows, day, source):
+    """Completa timestamp/source de los eventos que no están en el esquema de la métrica y filtra por fuente."""
+    missing = [row[4] for row in rows if row[5] is None]
+    if missing:
+        # Otra conexión: adjuntar particiones en la del cursor abierto podría desadjuntar su esquema
+        found = queries._load_events(lookup, missing, day)
+        rows = [
+            row[:5] + (found[row[4]][1], found[row[4]][3], row[7]) if row[5] is None and row[4] in found else row
+            for row in rows
+        ]
+    if source is not None:
+        rows = [row for row in rows if row[6] == source]
+    return rows
+
+
+def lineage_chunks(conn, lookup, filters, chunk_rows):
+    """Bloques de filas (métrica, evento) de `trace` y del linaje compacto."""
+    clauses, params = filters.metric_where()
+    first, last = filters.days()
+    for day, schema in queries._sources(conn, first, last):
+        sql = EXPORT_TRACE_SQL.format(schema=schema, where=_where(clauses))
+        for rows in _chunks(conn.execute(sql, params), chunk_rows):
+            yield _resolve(lookup, rows, day, filters.source)
+        sql = EXPORT_COMPACT_SQL.format(schema=schema, also=f"AND {clauses}" if clauses else "")
+        for metric_id, date, region, run_id in conn.execute(sql, params).fetchall():  # Una fila por métrica
+            rows = []
+            for event_id in lineage_store.expand_lineage(conn, metric_id, schema):
+                rows.append((metric_id, date, region, run_id, event_id, None, None, "window_member"))
+                if len(rows) >= chunk_rows:
+                    yield _resolve(lookup, rows, day, filters.source)
+                    rows = []
+            if rows:
+                yield _resolve(lookup, rows, day, filters.source)
+
+
+def _open_text(path, compression):
+    """Archivo de texto de salida, comprimido con gzip/xz según el formato; `-` es stdout."""
+    if path == "-":
+        return io.TextIOWrapper(sys.stdout.buffer, encoding="utf-8", newline="")
+    if compression == "gz":
+        return gzip.open(path, "wt", encoding="utf-8", newline="", compresslevel=6)
+    if compression == "xz":
+        return lzma.open(path, "wt", encoding="utf-8", newline="", preset=1)
+    return open(path, "w", encoding="utf-8", newline="")
+
+
+def _close_text(file, path):
+    if path == "-":
+        file.flush()
+        file.detach()  # Sin cerrar stdout
+    else:
+        file.close()
+
+
+def _remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+class JsonlWriter:
+    """Un objeto JSON por línea; las columnas *_json se copian tal cual como JSON anidado."""
+
+    def __init__(self, path, columns, compression=None):
+        self.path = path
+        self.file = _open_text(path, compression)
+        # Todas las columnas son TEXT: cada valor se escapa como string JSON sin armar un dict por fila
+        self.keys = []
+        for name, _ in columns:
+            raw = name.endswith("_json")
+            self.keys.append((json.dumps(name[:-len("_json")] if raw else name), raw))
+
+    def write(self, rows):
+        keys = self.keys
+        lines = []
+        for row in rows:
+            fields = []
+            for (key, raw), value in zip(keys, row):
+                if value is None:
+                    value = "null"
+                elif not raw:
+                    value = _encode_string(value)
+                fields.append(f"{key}: {value}")  # *_json ya es JSON válido (lo generó json.dumps al ingerir)
+            lines.append("{" + ", ".join(fields) + "}\n")
+        self.file.write("".join(lines))
+
+    def close(self):
+        _close_text(self.file, self.path)
+
+
+class CsvWriter:
+    """CSV con encabezado; NULL se escribe como campo vacío."""
+
+    def __init__(self, path, columns, compression=None):
+        self.path = path
+        self.file = _open_text(path, compression)
+        self.writer = csv.writer(self.file)
+        self.writer.writerow([name for name, _ in columns])
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        _close_text(self.file, self.path)
+
+
+class ColumnarWriter:
+    """Un archivo binario por columna (ver el docstring del módulo) y manifest.json al cerrar."""
+
+    def __init__(self, directory, columns, meta=None):
+        os.makedirs(directory)
+        self.directory = directory
+        self.columns = columns
+        self.meta = dict(meta or {})
+        self.rows = 0
+        self.files = {}
+        self.dictionaries = {}  # columna dict -> {valor: código}
+        self._data_end = {}  # columna text -> bytes escritos en .data
+        self._time_cache = {}
+        for name, kind in columns:
+            suffixes = {"text": ("offsets", "data", "valid"), "dict": ("codes",), "time": ("f8",)}[kind]
+            for suffix in suffixes:
+                self.files[f"{name}.{suffix}"] = open(os.path.join(directory, f"{name}.{suffix}"), "wb")
+            if kind == "dict":
+                self.dictionaries[name] = {}
+            elif kind == "text":
+                self._data_end[name] = 0
+
+    def _epoch(self, value):
+        cached = self._time_cache.get(value)
+        if cached is None:
+            parsed = segments.parse_time(value)
+            cached = math.nan if parsed is None else parsed
+            if len(self._time_cache) < 100_000:  # Los timestamps se repiten por segundo
+                self._time_cache[value] = cached
+        return cached
+
+    def write(self, rows):
+        for index, (name, kind) in enumerate(self.columns):
+            values = [row[index] for row in rows]
+            if kind == "text":
+                encoded = [b"" if value is None else value.encode("utf-8") for value in values]
+                offsets = array("q")
+                end = self._data_end[name]
+                for item in encoded:
+                    end += len(item)
+                    offsets.append(end)
+                self._data_end[name] = end
+                offsets.tofile(self.files[f"{name}.offsets"])
+                self.files[f"{name}.data"].write(b"".join(encoded))
+                self.files[f"{name}.valid"].write(bytes(value is not None for value in values))
+            elif kind == "dict":
+                codes = self.dictionaries[name]
+                array("i", (
+                    -1 if value is None else codes.setdefault(value, len(codes)) for value in values
+                )).tofile(self.files[f"{name}.codes"])
+            else:
+                array("d", (self._epoch(value) for value in values)).tofile(self.files[f"{name}.f8"])
+        self.rows += len(rows)
+
+    def close(self):
+        for file in self.files.values():
+            file.close()
+        manifest = dict(self.meta, rows=self.rows, byteorder=sys.byteorder, columns=[
+            dict({"name": name, "kind": kind},
+                 **({"dictionary": list(self.dictionaries[name])} if kind == "dict" else {}))
+            for name, kind in self.columns
+        ])
+        with open(os.path.join(self.directory, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+
+
+def read_columnar(directory):
+    """(manifest, {columna: lista de valores}) de un volcado columnar (carga todo: para volcados chicos)."""
+    with open(os.path.join(directory, "manifest.json"), encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    def load(name, typecode):
+        values = array(typecode)
+        with open(os.path.join(directory, name), "rb") as f:
+            values.frombytes(f.read())
+        if manifest["byteorder"] != sys.byteorder:
+            values.byteswap()
+        return values
+
+    columns = {}
+    for column in manifest["columns"]:
+        name, kind = column["name"], column["kind"]
+        if kind == "text":
+            with open(os.path.join(directory, f"{name}.data"), "rb") as f:
+                data = f.read()
+            with open(os.path.join(directory, f"{name}.valid"), "rb") as f:
+                valid = f.read()
+            start, values = 0, []
+            for end, present in zip(load(f"{name}.offsets", "q"), valid):
+                values.append(data[start:end].decode("utf-8") if present else None)
+                start = end
+        elif kind == "dict":
+            dictionary = column["dictionary"]
+            values = [None if code < 0 else dictionary[code] for code in load(f"{name}.codes", "i")]
+        else:
+            values = list(load(f"{name}.f8", "d"))
+        columns[name] = values
+    return manifest, columns
+
+
+def _writer(fmt, path, columns, meta):
+    if fmt == "columnar":
+        return ColumnarWriter(path, columns, meta)
+    kind, _, compression = fmt.partition(".")
+    return (JsonlWriter if kind == "jsonl" else CsvWriter)(path, columns, compression or None)
+
+
+def export(db_path, table, fmt, out, filters=None, chunk_rows=None, partition_dir=None,
+           progress=None, progress_interval=5.0):
+    """
+    Exporta `table` (events, metrics o lineage) a `out` en el formato pedido. Escribe en
+    `out + ".tmp"` y renombra al terminar (salvo a stdout), así nunca queda una
+    exportación a medias con el nombre final. Retorna (filas, segundos).
+    """
+    if table not in TABLE_COLUMNS:
+        raise ValueError(f"Tabla desconocida: {table}")
+    if fmt not in FORMATS:
+        raise ValueError(f"Formato desconocido: {fmt}")
+    if out == "-" and fmt not in ("jsonl", "csv"):
+        raise ValueError("A stdout solo se exporta jsonl o csv sin comprimir")
+    filters = filters or Filters()
+    chunk_rows = chunk_rows or settings.EXPORT_CHUNK_ROWS
+    columns = TABLE_COLUMNS[table]
+
+    conn = queries.connect(db_path, partition_dir)
+    lookup = queries.connect(db_path, partition_dir) if table == "lineage" else None
+    target = out if out == "-" else out + ".tmp"
+    writer = None
+    started = last_report = time.perf_counter()
+    rows = 0
+    try:
+        if table == "events":
+            chunks = event_chunks(conn, filters, chunk_rows)
+        elif table == "metrics":
+            chunks = metric_chunks(conn, filters, chunk_rows)
+        else:
+            chunks = lineage_chunks(conn, lookup, filters, chunk_rows)
+        writer = _writer(fmt, target, columns, {"table": table, "filters": filters.as_dict()})
+        for chunk in chunks:
+            writer.write(chunk)
+            rows += len(chunk)
+            now = time.perf_counter()
+            if progress is not None and now - last_report >= progress_interval:
+                last_report = now
+                print(f"    {rows:,} filas ({rows / (now - started):,.0f} filas/s)", file=progress, flush=True)
+        writer.close()
+        writer = None
+    except BaseException:
+        if writer is not None:
+            writer.close()
+        if target != "-":
+            _remove(target)
+        raise
+    finally:
+        conn.close()
+        if lookup is not None:
+            lookup.close()
+    if target != "-":
+        if os.path.isdir(out):
+            shutil.rmtree(out)  # os.replace no reemplaza un directorio con contenido
+        os.replace(target, out)
+    return rows, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exportación masiva de audit.db")
+    parser.add_argument("table", choices=sorted(TABLE_COLUMNS))
+    parser.add_argument("--db", default=settings.AUDIT_DB_PATH, help="Ruta de audit.db")
+    parser.add_argument("--partitions", default=None,
+                        help="Directorio de particiones diarias (por defecto según AUDIT_PARTITIONING)")
+    parser.add_argument("--format", choices=FORMATS, default="jsonl.gz")
+    parser.add_argument("--out", required=True, help="Archivo (o directorio si es columnar); - = stdout")
+    parser.add_argument("--chunk", type=int, default=settings.EXPORT_CHUNK_ROWS, help="Filas por bloque")
+    parser.add_argument("--from", dest="start", default=None, help="Fecha o timestamp ISO inicial (inclusive)")
+    parser.add_argument("--to", dest="end", default=None, help="Fecha o timestamp ISO final (inclusive)")
+    parser.add_argument("--region", default=None)
+    parser.add_argument("--source", default=None)
+    parser.add_argument("--run-id", default=None)
+    args = parser.parse_args()
+
+    filters = Filters(args.start, args.end, args.region, args.source, args.run_id)
+    try:
+        rows, seconds = export(args.db, args.table, args.format, args.out, filters, args.chunk, args.partitions,
+                               progress=sys.stderr)
+    except ValueError as e:
+        parser.error(str(e))
+    except BrokenPipeError:
+        return  # p. ej. `| head`
+    print(f"[*] {rows:,} filas de {args.table} en {seconds:,.1f} s ({rows / max(seconds, 1e-9):,.0f} filas/s)",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
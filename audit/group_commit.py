@@ -0,0 +1,164 @@
+"""
+Group commit de las escrituras del servicio de auditoría.
+
+En lugar de abrir una transacción, hacer COMMIT y ack por cada mensaje, los
+mensajes se acumulan y se escriben juntos: los eventos con un solo
+`executemany` y las métricas/rollups a continuación, todo en UNA transacción.
+El servicio usa un writer por flujo (eventos y métricas, cada uno con su
+tamaño de lote; ver writer_thread.Lane). Después del COMMIT se confirma el lote con un único
+`basic_ack(multiple=True)` por canal (el delivery_tag más alto del lote).
+
+El lote se escribe al llegar a `max_rows` mensajes o cuando el mensaje más
+antiguo lleva `max_delay` segundos esperando (lo controla writer_thread.py).
+Si la transacción del lote falla, se revierte y cada mensaje se reintenta en su
+propia transacción con el mismo criterio de siempre: ack si se guardó, nack con
+requeue si no.
+
+Con `partitions` (partitions.DayPartitions) eventos y métricas van a la
+partición de su día: las particiones del lote se adjuntan antes de abrir la
+transacción y `maintain()` aplica retención y compactación entre lotes.
+
+El módulo no depende de pika: solo usa basic_ack / basic_nack del canal.
+"""
+import sqlite3
+from collections import namedtuple
+
+import partitions as day_partitions
+import storage
+
+KIND_EVENT = "event"
+KIND_METRIC = "metric"
+KIND_ROLLUP = "rollup"
+
+PendingWrite = namedtuple("PendingWrite", "kind record channel delivery_tag routing_key")
+
+
+class GroupCommitWriter:
+    """Acumula escrituras pendientes de audit y las confirma por lotes."""
+
+    def __init__(self, conn: sqlite3.Connection, max_rows: int = 500, max_delay: float = 0.05,
+                 trace_mode: str = "rows", defer_foreign_keys: bool = False, partitions=None):
+        if max_rows < 1:
+            raise ValueError("max_rows debe ser >= 1")
+        if trace_mode not in storage.TRACE_MODES:
+            raise ValueError(f"Modo de trace desconocido: {trace_mode}")
+        self.conn = conn
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.trace_mode = trace_mode  # Ver storage.store_metric_and_trace
+        self.defer_foreign_keys = defer_foreign_keys
+        self.partitions = partitions  # None = todo en audit.db
+        self._today = None  # Partición de eventos/métricas con fecha ilegible
+        self.pending = []
+        self.batches = 0
+        self.fallbacks = 0
+
+    def __len__(self):
+        return len(self.pending)
+
+    def add(self, kind, record, channel, delivery_tag, routing_key="") -> bool:
+        """Encola una escritura. Retorna True si el lote se llenó y hay que hacer flush()."""
+        self.pending.append(PendingWrite(kind, record, channel, delivery_tag, routing_key))
+        return len(self.pending) >= self.max_rows
+
+    def discard(self) -> int:
+        """
+        Olvida el lote sin escribir ni confirmar (p. ej. al perder la conexión:
+        RabbitMQ reentregará esos mensajes). Retorna cuántos se descartaron.
+        """
+        dropped = len(self.pending)
+        self.pending = []
+        return dropped
+
+    def _day(self, item):
+        """Día de la partición de un evento (su timestamp) o de una métrica (su `date`)."""
+        if item.kind == KIND_EVENT:
+            return day_partitions.day_of(item.record[1], self._today)
+        if item.kind == KIND_METRIC:
+            return day_partitions.day_of(item.record.get("date"), self._today)
+        return None  # Los rollups quedan en audit.db
+
+    def _prepare(self, batch) -> None:
+        """Adjunta las particiones del lote (ATTACH no se puede dentro de una transacción)."""
+        if self.partitions is None:
+            return
+        self._today = day_partitions.today()
+        self.partitions.prepare({self._day(item) for item in batch} - {None})
+
+    def _schema(self, item):
+        return "main" if self.partitions is None else self.partitions.schema(self._day(item))
+
+    def _write(self, batch) -> None:
+        # Eventos primero: las trazas de una métrica del mismo lote referencian esos eventos (FK)
+        event_rows = {}
+        for item in batch:
+            if item.kind == KIND_EVENT:
+                event_rows.setdefault(self._schema(item), []).append(item.record)
+        for schema, rows in event_rows.items():
+            storage.store_event_rows(self.conn, rows, schema)
+        for item in batch:
+            if item.kind == KIND_METRIC:
+                storage.store_metric_and_trace(
+                    self.conn, item.record, self.trace_mode, self.defer_foreign_keys, self._schema(item)
+                )
+            elif item.kind == KIND_ROLLUP:
+                storage.store_rollup(self.conn, item.record)
+
+    def maintain(self) -> None:
+        """Retención y compactación de particiones (entre lotes, fuera de transacción)."""
+        if self.partitions is not None:
+            self.partitions.maintain()
+
+    def flush(self):
+        """Escribe el lote pendiente. Retorna (mensajes confirmados, mensajes devueltos a la cola)."""
+        if not self.pending:
+            return 0, 0
+        batch = self.pending
+        self.pending = []
+
+        try:
+            self._prepare(batch)
+            with self.conn:  # Todo el lote en una transacción
+                self._write(batch)
+        except Exception as e:
+            print(f"[!] Error DB guardando lote de {len(batch)} mensajes, reintento uno por uno: {e}")
+            self.fallbacks += 1
+            return self._write_one_by_one(batch)
+
+        # Un ack múltiple por canal con el delivery_tag más alto del lote
+        last_tags = {}
+        for item in batch:
+            channel_id = id(item.channel)
+            if channel_id not in last_tags or item.delivery_tag > last_tags[channel_id][1]:
+                last_tags[channel_id] = (item.channel, item.delivery_tag)
+        for channel, delivery_tag in last_tags.values():
+            channel.basic_ack(delivery_tag=delivery_tag, multiple=True)
+
+        self.batches += 1
+        counts = {kind: 0 for kind in (KIND_EVENT, KIND_METRIC, KIND_ROLLUP)}
+        for item in batch:
+            counts[item.kind] += 1
+        print(
+            f" [A] Lote auditado: {counts[KIND_EVENT]} eventos, "
+            f"{counts[KIND_METRIC]} métricas, {counts[KIND_ROLLUP]} rollups"
+        )
+        return len(batch), 0
+
+    def _write_one_by_one(self, batch):
+        acked = requeued = 0
+        for item in batch:
+            try:
+                self._prepare([item])
+                with self.conn:
+                    self._write([item])
+                item.channel.basic_ack(delivery_tag=item.delivery_tag)
+                acked += 1
+            except (sqlite3.OperationalError, sqlite3.IntegrityError) as e:
+                print(f"[!] Error DB guardando {item.kind} con RK {item.routing_key} (requeue): {e}")
+                item.channel.basic_nack(delivery_tag=item.delivery_tag, requeue=True)
+                requeued += 1
+            except Exception as e:
+                print(f"[!] Error inesperado guardando {item.kind} con RK {item.routing_key} (requeue): {e}")
+                item.channel.basic_nack(delivery_tag=item.delivery_tag, requeue=True)
+                requeued += 1
+        return acked, requeued
@@ -0,0 +1,236 @@
+"""
+Almacenamiento compacto del linaje de métricas en SQLite.
+
+Las métricas que llegan con `input_lineage` guardan sus event_ids como un único
+BLOB (16 bytes por UUID) en la tabla `metric_lineage`, en vez de una fila por
+evento en `trace`. La expansión a event_ids se hace de forma perezosa al
+consultar, y `materialize_trace` permite volcarla a `trace` cuando se necesite.
+
+`store_event_ids` aplica la misma codificación a una lista de event_ids en texto
+(métricas que llegan con `input_event_ids`), para ingerir ventanas grandes como
+una sola fila en vez de una fila de `trace` por evento.
+
+El sentido inverso (evento -> métricas, queries.py metrics-of) usa el índice
+`metric_lineage_events`, que se llena al guardar el linaje: una fila por evento
+con los 16 bytes del UUID (o el id en texto si va en extra_ids_json) y la métrica.
+"""
+import base64
+import itertools
+import json
+import sqlite3
+import uuid
+
+ENCODING_UUID16 = "uuid16-b64"
+
+LINEAGE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS {schema}.metric_lineage (
+  metric_id TEXT PRIMARY KEY,
+  encoding TEXT NOT NULL,
+  event_count INTEGER NOT NULL,
+  event_ids_blob BLOB NOT NULL,
+  extra_ids_json TEXT,
+  FOREIGN KEY (metric_id) REFERENCES metrics_out(metric_id)
+);
+"""
+# Índice inverso del linaje compacto. `event_key` no declara tipo: guarda BLOB (UUID de
+# 16 bytes) o TEXT (ids de extra_ids_json), y en SQLite un BLOB nunca es igual a un TEXT
+LINEAGE_EVENTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS {schema}.metric_lineage_events (
+  event_key NOT NULL,
+  metric_id TEXT NOT NULL,
+  PRIMARY KEY (event_key, metric_id)
+) WITHOUT ROWID;
+"""
+
+
+def init_lineage_schema(conn: sqlite3.Connection, schema: str = "main") -> None:
+    """
+    Crea metric_lineage y su índice inverso. En una base previa al índice lo llena
+    con el linaje ya guardado (una sola vez; el COMMIT lo hace el caller).
+    """
+    conn.execute(LINEAGE_SCHEMA.format(schema=schema))
+    indexed = conn.execute(
+        f"SELECT 1 FROM {schema}.sqlite_master WHERE type = 'table' AND name = 'metric_lineage_events'"
+    ).fetchone()
+    conn.execute(LINEAGE_EVENTS_SCHEMA.format(schema=schema))
+    if not indexed:
+        rows = conn.execute(f"SELECT metric_id, event_ids_blob, extra_ids_json FROM {schema}.metric_lineage")
+        for metric_id, blob, extra_ids_json in rows.fetchall():
+            _index_lineage(conn, metric_id, bytes(blob), json.loads(extra_ids_json) if extra_ids_json else [], schema)
+
+
+def store_lineage(conn: sqlite3.Connection, metric_id: str, lineage: dict, schema: str = "main") -> None:
+    """
+    Guarda el bloque `input_lineage` de una métrica como una sola fila.
+    Solo ejecuta INSERT; el COMMIT lo hace el caller.
+    """
+    if lineage.get("encoding") != ENCODING_UUID16:
+        raise ValueError(f"Codificación de linaje desconocida: {lineage.get('encoding')}")
+
+    blob = base64.b64decode(lineage.get("data", ""))
+    if len(blob) % 16:
+        raise ValueError("Linaje corrupto: el tamaño no es múltiplo de 16 bytes")
+    _insert_lineage(conn, metric_id, blob, lineage.get("extra_ids") or [], schema)
+
+
+def _insert_lineage(conn, metric_id, blob, extra_ids, schema):
+    conn.execute(
+        f"""
+        INSERT OR REPLACE INTO {schema}.metric_lineage(metric_id, encoding, event_count, event_ids_blob, extra_ids_json)
+        VALUES (?, ?, ?, ?, ?)
+        """,
+        (
+            metric_id,
+            ENCODING_UUID16,
+            len(blob) // 16 + len(extra_ids),
+            blob,
+            json.dumps(extra_ids) if extra_ids else None,
+        ),
+    )
+    _index_lineage(conn, metric_id, blob, extra_ids, schema)
+
+
+def _index_lineage(conn, metric_id, blob, extra_ids, schema):
+    """Filas del índice inverso (el BLOB viene ordenado: entran en orden de la PK)."""
+    conn.executemany(
+        f"INSERT OR IGNORE INTO {schema}.metric_lineage_events(event_key, metric_id) VALUES (?, ?)",
+        itertools.chain(
+            ((blob[offset:offset + 16], metric_id) for offset in range(0, len(blob), 16)),
+            ((event_id, metric_id) for event_id in extra_ids),
+        ),
+    )
+
+
+def pack_event_ids(event_ids):
+    """
+    (BLOB de UUIDs de 16 bytes ordenados, ids que no son UUID canónico).
+    Mismo formato que aggregator/lineage.py (el contenedor de audit no lo importa).
+    """
+    event_ids = list(event_ids)
+    raw = _pack_all_canonical(event_ids)
+    if raw is not None:
+        return b"".join(sorted({raw[i:i + 16] for i in range(0, len(raw), 16)})), []
+
+    packed = set()
+    extra_ids = set()
+    for event_id in event_ids:
+        raw = _pack_canonical(event_id)
+        if raw is None:
+            extra_ids.add(event_id)
+        else:
+            packed.add(raw)
+    return b"".join(sorted(packed)), sorted(extra_ids)
+
+
+def _pack_all_canonical(event_ids):
+    """
+    Camino rápido de pack_event_ids: si TODOS los ids son UUID canónicos, los
+    convierte con un solo bytes.fromhex sobre el texto concatenado. Si no, None.
+    """
+    count = len(event_ids)
+    try:
+        text = "".join(event_ids)
+    except TypeError:
+        return None
+    if len(text) != 36 * count or text != text.lower():
+        return None
+    for position in (8, 13, 18, 23):
+        if text[position::36] != "-" * count:
+            return None
+    try:
+        raw = bytes.fromhex(text.replace("-", ""))
+    except ValueError:
+        return None
+    return raw if len(raw) == 16 * count else None
+
+
+def _pack_canonical(event_id):
+    """
+    16 bytes de un UUID en forma canónica (minúsculas, 8-4-4-4-12) o None.
+    Equivale a `str(uuid.UUID(x)) == x` sin construir el objeto UUID (~5x más rápido).
+    """
+    if (
+        not isinstance(event_id, str) or len(event_id) != 36
+        or event_id[8] != "-" or event_id[13] != "-" or event_id[18] != "-" or event_id[23] != "-"
+        or event_id != event_id.lower()
+    ):
+        return None
+    try:
+        raw = bytes.fromhex(event_id.replace("-", ""))
+    except ValueError:
+        return None
+    return raw if len(raw) == 16 else None  # fromhex tolera espacios entre pares
+
+
+def store_event_ids(conn: sqlite3.Connection, metric_id: str, event_ids, schema: str = "main") -> None:
+    """Guarda una lista de event_ids en texto como linaje compacto. El COMMIT lo hace el caller."""
+    blob, extra_ids = pack_event_ids(event_ids)
+    _insert_lineage(conn, metric_id, blob, extra_ids, schema)
+
+
+def expand_lineage(conn: sqlite3.Connection, metric_id: str, schema: str = "main"):
+    """
+    Devuelve (perezosamente) los event_ids que aportaron a una métrica.
+    Usa el BLOB compacto si existe; si no, las filas clásicas de `trace`.
+    """
+    row = conn.execute(
+        f"SELECT event_ids_blob, extra_ids_json FROM {schema}.metric_lineage WHERE metric_id = ?",
+        (metric_id,),
+    ).fetchone()
+
+    if row is None:
+        cursor = conn.execute(f"SELECT event_id FROM {schema}.trace WHERE metric_id = ? ORDER BY event_id", (metric_id,))
+        for (event_id,) in cursor:
+            yield event_id
+        return
+
+    blob, extra_ids_json = row
+    for offset in range(0, len(blob), 16):
+        yield str(uuid.UUID(bytes=bytes(blob[offset:offset + 16])))
+    if extra_ids_json:
+        yield from json.loads(extra_ids_json)
+
+
+def event_key(event_id):
+    """Clave del event_id en metric_lineage_events: los 16 bytes del UUID, o el texto si va en extra_ids_json."""
+    key = _pack_canonical(event_id)
+    return event_id if key is None else key
+
+
+def lineage_contains(blob, extra_ids_json, event_id) -> bool:
+    """True si el linaje compacto (BLOB + extra_ids_json) incluye el event_id."""
+    key = _pack_canonical(event_id)
+    if key is None:
+        return bool(extra_ids_json) and event_id in json.loads(extra_ids_json)
+    blob = bytes(blob)
+    position = blob.find(key)
+    while position >= 0:
+        if position % 16 == 0:  # Solo cuentan los calces alineados a un UUID completo
+            return True
+        position = blob.find(key, position + 1)
+    return False
+
+
+def materialize_trace(conn: sqlite3.Connection, metric_id: str, schema: str = "main") -> int:
+    """
+    Expande el linaje compacto de una métrica a filas de `trace`
+    (p. ej. para herramientas que consultan `trace` directamente).
+    Retorna la cantidad de filas procesadas. El COMMIT lo hace el caller.
+    """
+    event_ids = sorted(expand_lineage(conn, metric_id, schema))
+    insert_trace_rows(conn, metric_id, event_ids, schema)
+    return len(event_ids)
+
+
+def insert_trace_rows(conn: sqlite3.Connection, metric_id: str, event_ids, schema: str = "main") -> None:
+    """
+    INSERT masivo en `trace` con executemany. Conviene pasar los event_ids
+    ordenados: las filas entran en orden de la PK (event_id, metric_id).
+    """
+    conn.executemany(
+        f"""
+        INSERT OR IGNORE INTO {schema}.trace(event_id, metric_id, contribution_type)
+        VALUES (?, ?, 'window_member')
+        """,
+        ((event_id, metric_id) for event_id in event_ids),
+    )
@@ -0,0 +1,231 @@
+"""
+Escritor persistente y con buffer del log JSONL de auditoría.
+
+Mantiene el archivo abierto en modo binario y escribe el cuerpo crudo del
+mensaje (los bytes que llegaron de RabbitMQ, sin volver a serializar) dentro de
+la misma envoltura de siempre, así replay.py y cualquier lector JSONL siguen
+funcionando:
+
+    {"audit_timestamp": "<iso>", "event_content": <cuerpo crudo>}\\n
+
+Políticas de fsync (`fsync_policy`):
+  - "never":    solo se vacía el buffer cuando se llena o al cerrar
+  - "interval": flush + fsync si pasaron `fsync_interval_ms` desde el último
+                (se revisa en cada registro y en cada COMMIT del lote)
+  - "records":  flush + fsync cada `fsync_every_records` registros
+  - "commit":   flush + fsync antes de cada COMMIT del lote en SQLite
+                (el hilo escritor llama a `on_commit()` antes de confirmar)
+"""
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+import segments
+
+FSYNC_POLICIES = ("never", "interval", "records", "commit")
+
+_PREFIX = b'{"audit_timestamp": "'
+_MIDDLE = b'", "event_content": '
+_SUFFIX = b"}\n"
+
+
+class AuditLogWriter:
+    """Append-only del log de auditoría con buffer y fsync configurable."""
+
+    def __init__(self, path, fsync_policy="interval", fsync_interval_ms=1000, fsync_every_records=1000,
+                 buffer_size=1 << 20):
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"Política de fsync desconocida: {fsync_policy}")
+        self.path = path
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval_ms / 1000.0
+        self.fsync_every_records = max(1, fsync_every_records)
+        self.buffer_size = buffer_size
+        self._file = self._open()
+        # append() corre en el hilo de pika y on_commit() en el hilo escritor
+        self._lock = threading.Lock()
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self.records = 0
+        self.syncs = 0
+
+    def append(self, body: bytes, event_time=None) -> None:
+        """
+        Agrega un registro con el cuerpo crudo (debe ser JSON válido).
+        `event_time` es el timestamp ISO del evento, si el caller ya lo tiene (índice de tiempo).
+        """
+        if b"\n" in body:
+            # Dentro de un JSON los saltos de línea reales solo pueden ser espacio en blanco
+            body = body.replace(b"\r\n", b" ").replace(b"\n", b" ")
+        now = time.time()
+        timestamp = datetime.fromtimestamp(now).isoformat().encode("ascii")
+        with self._lock:
+            self._write_line(_PREFIX + timestamp + _MIDDLE + body + _SUFFIX, now, event_time)
+            self.records += 1
+            self._unsynced += 1
+            if self.fsync_policy == "records" and self._unsynced >= self.fsync_every_records:
+                self._sync()
+            elif self.fsync_policy == "interval" and time.monotonic() - self._last_sync >= self.fsync_interval:
+                self._sync()
+
+    def _open(self):
+        return open(self.path, "ab", buffering=self.buffer_size)
+
+    def _write_line(self, line: bytes, audit_time, event_time) -> None:
+        self._file.write(line)
+
+    def on_commit(self) -> None:
+        """
+        Hook del group commit: con la política "commit" el log queda en disco antes
+        del ack; con "interval" también sincroniza la cola del log si no llegan más eventos.
+        """
+        with self._lock:
+            if self.fsync_policy == "commit":
+                self._sync()
+            elif self.fsync_policy == "interval" and time.monotonic() - self._last_sync >= self.fsync_interval:
+                self._sync()
+
+    def _sync(self):
+        if not self._unsynced:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self.syncs += 1
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file.closed:
+                return
+            if self.fsync_policy != "never":
+                self._sync()
+            self._file.close()
+
+
+class SegmentedLogWriter(AuditLogWriter):
+    """
+    Log dividido en segmentos (ver segments.py) de hasta `segment_max_bytes` o
+    `segment_max_seconds`, cada uno con su índice disperso ordinal -> byte y su
+    índice de tiempo (resumen por bloque + .meta del segmento al sellarlo).
+    Al rotar, el segmento nuevo se abre de inmediato y el cierre del anterior
+    (flush, fsync, retención y archivo comprimido) corre en un hilo aparte para
+    no frenar append(). Con `archive_keep_raw` > 0 los segmentos sellados, salvo
+    los últimos `archive_keep_raw`, se comprimen en `.arc` (segments.archive_segment).
+    """
+
+    def __init__(self, directory, segment_max_bytes=64 << 20, segment_max_seconds=3600.0, index_interval=256,
+                 retention_segments=0, archive_keep_raw=0, archive_codec="zlib", archive_block_bytes=256 << 10,
+                 **kwargs):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.segment_max_seconds = segment_max_seconds
+        self.index_interval = max(1, index_interval)
+        self.retention_segments = retention_segments  # 0 = conservar todos
+        self.archive_keep_raw = archive_keep_raw  # 0 = no archivar
+        self.archive_codec = archive_codec
+        self.archive_block_bytes = archive_block_bytes
+        self._archive_lock = threading.Lock()  # Dos sellados seguidos no archivan el mismo segmento
+        self.next_ordinal = segments.next_ordinal(directory)
+        self._sealers = []
+        super().__init__(directory, **kwargs)
+
+    def _open(self):
+        # Siempre un segmento nuevo: al reiniciar no se reescribe el último
+        self._segment_first = self.next_ordinal
+        self._segment_records = 0
+        self._segment_bytes = 0
+        self._segment_opened = time.monotonic()
+        self._segment_path = segments.segment_path(self.directory, self._segment_first)
+        self._index = open(segments.index_path(self._segment_path), "ab")
+        self._time_index = open(segments.time_index_path(self._segment_path), "ab")
+        self._block = None
+        self._summary = segments.TimeBlock(0, 0)
+        return open(self._segment_path, "ab", buffering=self.buffer_size)
+
+    def _write_line(self, line: bytes, audit_time, event_time) -> None:
+        if self._segment_records and (
+            self._segment_bytes >= self.segment_max_bytes
+            or time.monotonic() - self._segment_opened >= self.segment_max_seconds
+        ):
+            self._rotate()
+        if self._segment_records % self.index_interval == 0:
+            self._close_block()
+            self._index.write(segments.INDEX_ENTRY.pack(self._segment_records, self._segment_bytes))
+            self._block = segments.TimeBlock(self._segment_records, self._segment_bytes)
+        self._file.write(line)
+        self._block.add(len(line), audit_time, segments.parse_time(event_time))
+        self._segment_bytes += len(line)
+        self._segment_records += 1
+        self.next_ordinal += 1
+
+    def _close_block(self):
+        if self._block is not None and self._block.count:
+            self._time_index.write(self._block.pack())
+            self._summary.merge(self._block)
+        self._block = None
+
+    def _rotate(self):
+        self._close_block()
+        handles = (self._file, self._index, self._time_index)
+        sealed = (self._segment_path, self._summary.meta())
+        self._file = self._open()
+        self._unsynced = 0  # Lo pendiente lo sincroniza el hilo que sella el segmento viejo
+        sealer = threading.Thread(target=self._seal, args=(handles, sealed), name="audit-log-sealer", daemon=True)
+        self._sealers = [thread for thread in self._sealers if thread.is_alive()] + [sealer]
+        sealer.start()
+
+    def _seal(self, handles, sealed):
+        try:
+            for handle in handles:
+                handle.flush()
+                if self.fsync_policy != "never":
+                    os.fsync(handle.fileno())
+                handle.close()
+            # El .meta marca el segmento como cerrado: replay ya no lee su cola
+            path, meta = sealed
+            with open(segments.meta_path(path), "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            self._apply_retention()
+            self._apply_archiving()
+        except Exception as e:
+            print(f"[!] Error cerrando segmento del log: {e}")
+
+    def _apply_retention(self):
+        if self.retention_segments <= 0:
+            return
+        closed = [path for first, path in segments.list_segments(self.directory) if first < self._segment_first]
+        for path in closed[:-self.retention_segments]:
+            for stale in segments.segment_files(path):
+                try:
+                    os.remove(stale)
+                except FileNotFoundError:
+                    pass
+
+    def _apply_archiving(self):
+        if self.archive_keep_raw <= 0:
+            return
+        with self._archive_lock:
+            archived = segments.archive_segments(
+                self.directory, self.archive_keep_raw, self.archive_codec, self.archive_block_bytes
+            )
+        if archived:
+            print(f" [L] {archived} segmento(s) del log archivados ({self.archive_codec})")
+
+    def _sync(self):
+        if self._unsynced:
+            self._index.flush()
+            self._time_index.flush()
+        super()._sync()
+
+    def close(self) -> None:
+        for sealer in self._sealers:
+            sealer.join()
+        with self._lock:
+            if self._file.closed:
+                return
+            self._close_block()
+            self._seal((self._file, self._index, self._time_index), (self._segment_path, self._summary.meta()))
@@ -1,13 +1,56 @@
 import json
 import os
-import sqlite3
 import time
-import uuid
-from datetime import datetime
 
 import pika
 
+import flow_control
+import group_commit
+import log_writer
+import partitions
 import settings
+import storage
+import writer_thread
+
+
+# Log JSONL de auditoría (se abre en main() con la política de fsync configurada)
+audit_log = None
+
+
+def make_prefetch_control(initial, minimum, maximum):
+    """Prefetch adaptativo de un canal: se reajusta con basic_qos según latencia de escritura y profundidad de su cola."""
+    if not settings.ENABLE_ADAPTIVE_PREFETCH:
+        return None
+    return flow_control.AdaptivePrefetch(
+        initial=initial,
+        minimum=minimum,
+        maximum=maximum,
+        target_latency=settings.PREFETCH_TARGET_LATENCY_MS / 1000.0,
+        max_buffered_seconds=settings.PREFETCH_MAX_BUFFERED_SECONDS,
+        adjust_interval=settings.PREFETCH_ADJUST_INTERVAL,
+        increase_step=settings.PREFETCH_INCREASE_STEP,
+    )
+
+
+# Cada flujo tiene su canal, su prefetch y su carril en el hilo escritor: un mensaje
+# de métricas grande no frena la auditoría de eventos (ni al revés)
+prefetch_controls = {
+    "events": make_prefetch_control(settings.PREFETCH_INITIAL, settings.PREFETCH_MIN, settings.PREFETCH_MAX),
+    "metrics": make_prefetch_control(
+        settings.METRICS_PREFETCH_INITIAL, settings.METRICS_PREFETCH_MIN, settings.METRICS_PREFETCH_MAX
+    ),
+}
+# Prefetch fijo (sin control adaptativo): el tamaño del lote, para que el group commit pueda llenarse
+FIXED_PREFETCH = {"events": settings.GROUP_COMMIT_MAX_ROWS, "metrics": settings.METRICS_GROUP_COMMIT_MAX_ROWS}
+
+
+def batch_rows(max_rows, control):
+    """
+    Tamaño de lote del flujo: nunca mayor que su techo de prefetch. El broker no
+    entrega más mensajes sin ack que el prefetch, así que un lote más grande
+    nunca se llena y cada COMMIT esperaría al temporizador.
+    """
+    return min(max_rows, control.maximum) if control is not None else max_rows
 
 
 def connect_rabbitmq():
@@ -39,8 +82,14 @@ def connect_rabbitmq():
                 queue=settings.METRICS_QUEUE_NAME,
                 routing_key=settings.METRICS_ROUTING_KEY,
             )
+            channel.queue_bind(
+                exchange=settings.METRICS_EXCHANGE,
+                queue=settings.METRICS_QUEUE_NAME,
+                routing_key=settings.ROLLUP_ROUTING_KEY,
+            )
 
-            print(f"[*] Audit Service conectado. Guardando en {settings.LOG_FILE_PATH}")
+            log_target = settings.LOG_SEGMENT_DIR if settings.LOG_SEGMENTS_ENABLED else settings.LOG_FILE_PATH
+            print(f"[*] Audit Service conectado. Guardando en {log_target}")
             return connection, channel
 
         except pika.exceptions.AMQPConnectionError:
@@ -48,138 +97,26 @@ def connect_rabbitmq():
             time.sleep(5)
 
 
-def append_to_log(event_body: bytes) -> None:
-    """Escribe el evento en un archivo (JSON Lines). Best-effort."""
+def append_to_log(event_body: bytes, event_time=None) -> None:
+    """
+    Escribe el evento en el log JSON Lines (archivo abierto y con buffer, cuerpo
+    crudo sin re-serializar). El caller ya validó que el cuerpo es JSON; su
+    timestamp alimenta el índice de tiempo del log segmentado. Best-effort.
+    """
     try:
-        data = json.loads(event_body)
-
-        audit_entry = {
-            "audit_timestamp": datetime.now().isoformat(),
-            "event_content": data,
-        }
-
-        with open(settings.LOG_FILE_PATH, "a", encoding="utf-8") as f:
-            f.write(json.dumps(audit_entry, ensure_ascii=False) + "\n")
+        audit_log.append(event_body, event_time)
 
     except Exception as e:
         # No abortamos la auditoría DB por falla de archivo, pero lo reportamos.
         print(f"[!] Error escribiendo log en disco: {e}")
 
 
-def init_db(db_path: str) -> sqlite3.Connection:
-    conn = sqlite3.connect(db_path, check_same_thread=False, timeout=5)
-
-    # Pragmas: concurrencia y consistencia
-    conn.execute("PRAGMA journal_mode=WAL;")
-    conn.execute("PRAGMA synchronous=NORMAL;")
-    conn.execute("PRAGMA foreign_keys=ON;")
-    conn.execute("PRAGMA busy_timeout=5000;")  # ms
-
-    # Schema
-    conn.execute(
-        """
-        CREATE TABLE IF NOT EXISTS events_in (
-          event_id TEXT PRIMARY KEY,
-          timestamp TEXT NOT NULL,
-          region TEXT NOT NULL,
-          source TEXT NOT NULL,
-          schema_version TEXT,
-          correlation_id TEXT,
-          payload_json TEXT NOT NULL,
-          run_id TEXT DEFAULT 'default',
-          inserted_at TEXT DEFAULT (datetime('now'))
-        );
-        """
-    )
-    conn.execute(
-        """
-        CREATE TABLE IF NOT EXISTS metrics_out (
-          metric_id TEXT PRIMARY KEY,
-          date TEXT NOT NULL,
-          region TEXT NOT NULL,
-          run_id TEXT DEFAULT 'default',
-          metrics_json TEXT NOT NULL,
-          created_at TEXT DEFAULT (datetime('now'))
-        );
-        """
-    )
-    conn.execute(
-        """
-        CREATE TABLE IF NOT EXISTS trace (
-          event_id TEXT NOT NULL,
-          metric_id TEXT NOT NULL,
-          contribution_type TEXT DEFAULT 'window_member',
-          PRIMARY KEY (event_id, metric_id),
-          FOREIGN KEY (event_id) REFERENCES events_in(event_id),
-          FOREIGN KEY (metric_id) REFERENCES metrics_out(metric_id)
-        );
-        """
-    )
-    conn.commit()
-    return conn
-
-
-def get_run_id(properties, payload: dict) -> str:
-    headers = getattr(properties, "headers", None) or {}
-    return headers.get("run_id") or payload.get("run_id") or "default"
-
-
-def store_event(conn: sqlite3.Connection, event: dict, run_id: str) -> None:
-    """
-    Solo ejecuta INSERT. El COMMIT lo hace el caller (transacción en handle_event).
-    """
-    if not event.get("event_id") or not event.get("timestamp") or not event.get("region") or not event.get("source"):
-        raise ValueError("Evento inválido: faltan campos requeridos (event_id, timestamp, region, source)")
-
-    conn.execute(
-        """
-        INSERT OR IGNORE INTO events_in
-        (event_id, timestamp, region, source, schema_version, correlation_id, payload_json, run_id)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """,
-        (
-            event.get("event_id"),
-            event.get("timestamp"),
-            event.get("region"),
-            event.get("source"),
-            event.get("schema_version"),
-            event.get("correlation_id"),
-            json.dumps(event.get("payload", {}), ensure_ascii=False),
-            run_id,
-        ),
-    )
-
-
-def store_metric_and_trace(conn: sqlite3.Connection, metric_msg: dict) -> None:
-    """
-    Inserta metrics_out + trace en UNA sola transacción (caller).
-    Si falla un trace por FK, se revierte TODO (métrica incluida).
-    """
-    metric_id = metric_msg.get("metric_id") or str(uuid.uuid4())
-    date = metric_msg["date"]
-    region = metric_msg["region"]
-    run_id = metric_msg.get("run_id", "default")
-    metrics_json = json.dumps(metric_msg["metrics"], ensure_ascii=False)
-
-    conn.execute(
-        """
-        INSERT OR REPLACE INTO metrics_out(metric_id, date, region, run_id, metrics_json)
-        VALUES (?, ?, ?, ?, ?)
-        """,
-        (metric_id, date, region, run_id, metrics_json),
-    )
+def submit(lane: writer_thread.Lane, ch, kind: str, record, method) -> None:
+    """Encola la escritura en el carril del flujo; el ack llega después del COMMIT de su lote."""
+    lane.submit(kind, record, ch, method.delivery_tag, method.routing_key)
 
-    for event_id in metric_msg.get("input_event_ids", []):
-        conn.execute(
-            """
-            INSERT OR IGNORE INTO trace(event_id, metric_id, contribution_type)
-            VALUES (?, ?, 'window_member')
-            """,
-            (event_id, metric_id),
-        )
 
-
-def handle_event(conn: sqlite3.Connection, ch, method, properties, body: bytes):
+def handle_event(lane: writer_thread.Lane, ch, method, properties, body: bytes):
     # Skip replayed events to prevent infinite loop
     headers = getattr(properties, "headers", None) or {}
     if headers.get("x-replay") == "true":
@@ -187,85 +124,194 @@ def handle_event(conn: sqlite3.Connection, ch, method, properties, body: bytes):
         ch.basic_ack(delivery_tag=method.delivery_tag)
         return
     
-    append_to_log(body)
-
     try:
         event = json.loads(body)
-        run_id = get_run_id(properties, event)
-
-        with conn:  # transacción atómica
-            store_event(conn, event, run_id)
-
-        print(f" [A] Auditado evento con RK: {method.routing_key}")
-        ch.basic_ack(delivery_tag=method.delivery_tag)
-
     except json.JSONDecodeError as e:
         print(f"[!] Evento no es JSON válido. Se descarta. Error: {e}")
         ch.basic_ack(delivery_tag=method.delivery_tag)
+        return
 
-    except (sqlite3.OperationalError, sqlite3.IntegrityError) as e:
-        print(f"[!] Error DB guardando evento (requeue): {e}")
-        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+    # Un solo json.loads por mensaje: el log guarda los bytes crudos
+    append_to_log(body, event.get("timestamp") if isinstance(event, dict) else None)
+
+    try:
+        run_id = storage.get_run_id(properties, event)
+        row = storage.event_row(event, run_id)
 
     except Exception as e:
-        print(f"[!] Error inesperado guardando evento (requeue): {e}")
+        print(f"[!] Error inesperado preparando evento (requeue): {e}")
         ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+        return
 
+    # El INSERT, el COMMIT y el ack se hacen con el lote (group commit en el hilo escritor)
+    submit(lane, ch, group_commit.KIND_EVENT, row, method)
 
-def handle_metric(conn: sqlite3.Connection, ch, method, properties, body: bytes):
+
+def handle_metric(lane: writer_thread.Lane, ch, method, properties, body: bytes):
     try:
         metric_msg = json.loads(body)
-
-        with conn:  # métrica + trazas juntas o nada
-            store_metric_and_trace(conn, metric_msg)
-
-        print(f" [M] Métrica auditada con RK: {method.routing_key}")
-        ch.basic_ack(delivery_tag=method.delivery_tag)
-
     except json.JSONDecodeError as e:
         print(f"[!] Métrica no es JSON válido. Se descarta. Error: {e}")
         ch.basic_ack(delivery_tag=method.delivery_tag)
+        return
 
-    except (sqlite3.OperationalError, sqlite3.IntegrityError) as e:
-        print(f"[!] Error DB guardando métrica/trace (requeue): {e}")
-        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+    if method.routing_key.startswith("metrics.rollup."):
+        submit(lane, ch, group_commit.KIND_ROLLUP, metric_msg, method)
+    else:
+        # Métrica + trazas van juntas en la transacción del lote
+        submit(lane, ch, group_commit.KIND_METRIC, metric_msg, method)
 
-    except Exception as e:
-        print(f"[!] Error inesperado guardando métrica (requeue): {e}")
-        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+
+def apply_prefetch_control(channel, control, queue_name, stream) -> None:
+    """Reajusta el prefetch (AIMD) del canal de un flujo si toca, según la profundidad de su cola."""
+    if control is None or not control.due():
+        return
+    queue_depth = channel.queue_declare(queue=queue_name, durable=True, passive=True).method.message_count
+    new_prefetch = control.adjust(queue_depth)
+    if new_prefetch is not None:
+        # global_qos: el límite es del canal y el cambio aplica de inmediato al consumidor activo
+        # (el por consumidor solo afecta a los que se crean después). Un consumidor por canal,
+        # así que sigue siendo solo de este flujo
+        channel.basic_qos(prefetch_count=new_prefetch, global_qos=True)
+        print(f" [q] Prefetch de {stream} ajustado: {control.status()}")
+
+
+def measured(handler, lane: writer_thread.Lane, channel_proxy: writer_thread.ThreadsafeChannel, queue_name: str):
+    """
+    Envuelve un handler: le pasa el carril y el canal seguro entre hilos de su flujo
+    y alimenta el control de prefetch del flujo con la latencia del handler más el
+    costo de COMMIT por mensaje de su carril.
+    """
+    control = prefetch_controls[lane.name]
+
+    def on_message(ch, method, properties, body):
+        started = time.perf_counter()
+        handler(lane, channel_proxy, method, properties, body)
+        if control is not None:
+            control.record(time.perf_counter() - started + lane.write_cost)
+            apply_prefetch_control(ch, control, queue_name, lane.name)
+    return on_message
 
 
 def main():
+    global audit_log
     os.makedirs(os.path.dirname(settings.LOG_FILE_PATH), exist_ok=True)
     os.makedirs(os.path.dirname(settings.AUDIT_DB_PATH), exist_ok=True)
 
-    conn = init_db(settings.AUDIT_DB_PATH)
+    log_options = dict(
+        fsync_policy=settings.LOG_FSYNC_POLICY,
+        fsync_interval_ms=settings.LOG_FSYNC_INTERVAL_MS,
+        fsync_every_records=settings.LOG_FSYNC_EVERY_RECORDS,
+        buffer_size=settings.LOG_BUFFER_BYTES,
+    )
+    if settings.LOG_SEGMENTS_ENABLED:
+        audit_log = log_writer.SegmentedLogWriter(
+            settings.LOG_SEGMENT_DIR,
+            segment_max_bytes=settings.LOG_SEGMENT_MAX_BYTES,
+            segment_max_seconds=settings.LOG_SEGMENT_MAX_SECONDS,
+            index_interval=settings.LOG_INDEX_INTERVAL,
+            retention_segments=settings.LOG_SEGMENT_RETENTION,
+            archive_keep_raw=settings.LOG_ARCHIVE_KEEP_RAW,
+            archive_codec=settings.ARCHIVE_CODEC,
+            archive_block_bytes=settings.ARCHIVE_BLOCK_BYTES,
+            **log_options,
+        )
+    else:
+        audit_log = log_writer.AuditLogWriter(settings.LOG_FILE_PATH, **log_options)
+
+    # La conexión SQLite la usa solo el hilo escritor (check_same_thread=False en init_db)
+    payload_fields = storage.parse_payload_fields(settings.PAYLOAD_INDEX_FIELDS)
+    conn = storage.init_db(settings.AUDIT_DB_PATH, payload_fields)
+    day_partitions = None
+    if settings.AUDIT_PARTITIONING == "day":
+        day_partitions = partitions.DayPartitions(
+            conn,
+            settings.AUDIT_PARTITION_DIR,
+            retention_days=settings.AUDIT_RETENTION_DAYS,
+            cold_after_days=settings.AUDIT_COLD_AFTER_DAYS,
+            max_attached=settings.AUDIT_MAX_ATTACHED,
+            archive_after_days=settings.AUDIT_ARCHIVE_AFTER_DAYS,
+            archive_codec=settings.ARCHIVE_CODEC,
+            archive_block_bytes=settings.ARCHIVE_BLOCK_BYTES,
+            payload_fields=payload_fields,
+        )
+    writer = group_commit.GroupCommitWriter(
+        conn,
+        max_rows=batch_rows(settings.GROUP_COMMIT_MAX_ROWS, prefetch_controls["events"]),
+        max_delay=settings.GROUP_COMMIT_MAX_DELAY_MS / 1000.0,
+        trace_mode=settings.TRACE_INGEST_MODE,
+        defer_foreign_keys=settings.TRACE_DEFER_FOREIGN_KEYS,
+        partitions=day_partitions,
+    )
+    pipeline = writer_thread.WriterThread(
+        writer,
+        max_queue=settings.WRITER_QUEUE_SIZE,
+        status_interval=settings.WRITER_STATUS_INTERVAL,
+        before_commit=audit_log.on_commit,  # El log JSONL solo guarda eventos
+        maintenance_interval=settings.AUDIT_MAINTENANCE_INTERVAL,
+        name="events",
+    )
+    # Carril de métricas: misma conexión SQLite y particiones (un solo escritor), lote propio y menor prioridad
+    metrics_writer = group_commit.GroupCommitWriter(
+        conn,
+        max_rows=batch_rows(settings.METRICS_GROUP_COMMIT_MAX_ROWS, prefetch_controls["metrics"]),
+        max_delay=settings.METRICS_GROUP_COMMIT_MAX_DELAY_MS / 1000.0,
+        trace_mode=settings.TRACE_INGEST_MODE,
+        defer_foreign_keys=settings.TRACE_DEFER_FOREIGN_KEYS,
+        partitions=day_partitions,
+    )
+    pipeline.add_lane("metrics", metrics_writer, max_queue=settings.METRICS_WRITER_QUEUE_SIZE)
+    pipeline.start()
+    streams = (
+        ("events", settings.QUEUE_NAME, handle_event),
+        ("metrics", settings.METRICS_QUEUE_NAME, handle_metric),
+    )
+    channel_proxies = []
+
+    def close_proxies():
+        # Los delivery_tags pendientes ya no sirven: RabbitMQ reentregará esos mensajes
+        for proxy in channel_proxies:
+            proxy.close()
+        channel_proxies.clear()
 
     while True:
         try:
             connection, channel = connect_rabbitmq()
-
-            channel.basic_qos(prefetch_count=1)
-            channel.basic_consume(
-                queue=settings.QUEUE_NAME,
-                on_message_callback=lambda ch, method, properties, body: handle_event(conn, ch, method, properties, body),
-            )
-            channel.basic_consume(
-                queue=settings.METRICS_QUEUE_NAME,
-                on_message_callback=lambda ch, method, properties, body: handle_metric(conn, ch, method, properties, body),
-            )
+            channels = {"events": channel, "metrics": connection.channel()}
+
+            for stream, queue_name, handler in streams:
+                stream_channel = channels[stream]
+                channel_proxy = writer_thread.ThreadsafeChannel(connection, stream_channel)
+                channel_proxies.append(channel_proxy)
+                control = prefetch_controls[stream]
+                # Retomamos el último prefetch calculado (también tras reconectar)
+                stream_channel.basic_qos(prefetch_count=control.prefetch if control else FIXED_PREFETCH[stream],
+                                         global_qos=True)
+                stream_channel.basic_consume(
+                    queue=queue_name,
+                    on_message_callback=measured(handler, pipeline.lane(stream), channel_proxy, queue_name),
+                )
 
             print(" [*] Audit Service grabando eventos...")
             try:
+                # Procesa los dos canales: los callbacks se despachan por conexión
                 channel.start_consuming()
             except KeyboardInterrupt:
                 print(' [!] Deteniendo audit service...')
-                channel.stop_consuming()
+                for stream_channel in channels.values():
+                    stream_channel.stop_consuming()
+                pipeline.stop()
+                # Entregamos los ack que el hilo escritor dejó pendientes antes de cerrar
+                connection.process_data_events(time_limit=0)
+                for lane in pipeline.lanes:
+                    print(f" [W] Escritor audit ({lane.name}): {lane.status()}")
+                audit_log.close()
                 connection.close()
                 break
                 
         except (pika.exceptions.AMQPConnectionError, pika.exceptions.ConnectionClosedByBroker) as e:
             print(f' [!] Conexión perdida: {e}. Reintentando en 5 segundos...')
+            close_proxies()
             try:
                 connection.close()
             except:
@@ -273,6 +319,7 @@ def main():
             time.sleep(5)
         except (pika.exceptions.AMQPChannelError, pika.exceptions.ChannelClosedByBroker) as e:
             print(f' [!] Error de canal: {e}. Reintentando en 5 segundos...')
+            close_proxies()
             try:
                 connection.close()
             except:
@@ -280,6 +327,7 @@ def main():
             time.sleep(5)
         except Exception as e:
             print(f' [!] Error inesperado: {e}. Reintentando en 5 segundos...')
+            close_proxies()
             try:
                 connection.close()
             except:
@@ -0,0 +1,408 @@
+"""
+Particiones diarias de la base de auditoría.
+
+Con AUDIT_PARTITIONING=day los eventos, las métricas y su linaje se guardan en
+un archivo SQLite por día (`<dir>/audit-YYYY-MM-DD.db`). El día de un evento es
+el de su `timestamp` y el de una métrica su `date`; los rollups (pocos y con
+upsert por versión) siguen en audit.db.
+
+Escritura: el hilo escritor adjunta con ATTACH (alias `pYYYYMMDD`) las
+particiones que necesita el lote ANTES de abrir la transacción (SQLite no
+permite ATTACH dentro de una) y escribe con sentencias calificadas por esquema.
+SQLite limita las bases adjuntas (10 por defecto), así que se mantienen a lo
+sumo `max_attached` y se desadjunta la usada hace más tiempo.
+
+Retención: una partición vencida se borra con DETACH + os.remove, O(1) sin
+importar cuántas filas tenga (nada de DELETE ni de VACUUM posterior).
+
+Compactación: las particiones frías (más de `cold_after_days` días) se
+desadjuntan y un hilo aparte hace checkpoint del WAL, ANALYZE y VACUUM, y las
+deja en journal_mode=DELETE marcadas con `user_version`. Si llega un evento
+tardío, la partición se vuelve a adjuntar y se compacta de nuevo más adelante.
+
+Archivo frío: con `archive_after_days` las filas de events_in (la mayor parte
+del espacio, por payload_json) pasan a `audit-YYYY-MM-DD.events.<gen>.arc`,
+comprimido por bloques ordenados por (timestamp, event_id) con min/max de
+timestamp, regiones y run_ids por bloque (ver archive.py). En la base quedan
+`events_archived` (event_id -> bloque) y `events_archive` (generación vigente);
+métricas y linaje no se tocan. Cada archivado escribe una generación nueva y
+la registra en la misma transacción que vacía events_in, así un corte a mitad
+de camino nunca deja el mapa apuntando a otro archivo.
+
+Lectura: `PartitionReader` adjunta las particiones en solo lectura a la conexión
+de queries.py a medida que las consultas las recorren, y abre sus archivos.
+"""
+import glob
+import heapq
+import json
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timezone
+
+import archive
+import storage
+
+PARTITION_PREFIX = "audit-"
+PARTITION_SUFFIX = ".db"
+COMPACTED_VERSION = 1
+ARCHIVED_VERSION = 2
+ARCHIVE_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS events_archive (generation INTEGER NOT NULL, records INTEGER NOT NULL);",
+    "CREATE TABLE IF NOT EXISTS events_archived (event_id TEXT PRIMARY KEY, block INTEGER NOT NULL) WITHOUT ROWID;",
+)
+ARCHIVED_EVENT_COLUMNS = "event_id, timestamp, region, source, schema_version, correlation_id, run_id, payload_json"
+_DAY_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+
+def partition_path(directory, day):
+    return os.path.join(directory, f"{PARTITION_PREFIX}{day}{PARTITION_SUFFIX}")
+
+
+def events_archive_path(directory, day, generation):
+    return os.path.join(directory, f"{PARTITION_PREFIX}{day}.events.{generation}{archive.SUFFIX}")
+
+
+def partition_files(directory, day):
+    """La base de la partición, su WAL/SHM y sus archivos comprimidos."""
+    path = partition_path(directory, day)
+    return [path, path + "-wal", path + "-shm"] + glob.glob(events_archive_path(directory, day, "*"))
+
+
+def alias(day):
+    return "p" + day.replace("-", "")
+
+
+def today():
+    return datetime.now(timezone.utc).date().isoformat()
+
+
+def day_of(timestamp, default=None):
+    """Día (YYYY-MM-DD) de un timestamp ISO o de una fecha; `default` si no se puede leer."""
+    day = timestamp[:10] if isinstance(timestamp, str) else ""
+    if not _DAY_PATTERN.match(day):
+        return default
+    try:
+        date.fromisoformat(day)
+    except ValueError:
+        return default
+    return day
+
+
+def list_partitions(directory):
+    """[(día, ruta)] ordenados por día; lista vacía si el directorio no existe."""
+    if not os.path.isdir(directory):
+        return []
+    found = []
+    for name in os.listdir(directory):
+        if name.startswith(PARTITION_PREFIX) and name.endswith(PARTITION_SUFFIX):
+            day = name[len(PARTITION_PREFIX):-len(PARTITION_SUFFIX)]
+            if day_of(day) == day:
+                found.append((day, os.path.join(directory, name)))
+    found.sort()
+    return found
+
+
+def _age_in_days(day, reference):
+    return (date.fromisoformat(reference) - date.fromisoformat(day)).days
+
+
+def archive_generation(conn, schema="main"):
+    """Generación vigente del archivo de eventos de la partición (None si no se archivó)."""
+    if not conn.execute(
+        f"SELECT 1 FROM {schema}.sqlite_master WHERE type = 'table' AND name = 'events_archive'"
+    ).fetchone():
+        return None
+    row = conn.execute(f"SELECT generation FROM {schema}.events_archive").fetchone()
+    return row[0] if row else None
+
+
+def _archived_rows(path):
+    for _, line in archive.Archive(path).iter_lines():
+        yield tuple(json.loads(line))
+
+
+def archive_partition(path, codec="zlib", block_bytes=256 << 10):
+    """
+    Mueve events_in de la partición a un archivo comprimido (generación nueva,
+    que incluye la anterior si ya había una) y retorna cuántos eventos contiene.
+    Las filas insertadas después de leer events_in quedan en la tabla.
+    """
+    directory, name = os.path.split(path)
+    day = name[len(PARTITION_PREFIX):-len(PARTITION_SUFFIX)]
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        for statement in ARCHIVE_SCHEMA:
+            conn.execute(statement)
+        previous = archive_generation(conn)
+        generation = (previous or 0) + 1
+        target = events_archive_path(directory, day, generation)
+
+        # Ambas fuentes vienen ordenadas por (timestamp, event_id); los ids ya archivados no se duplican
+        fresh = (
+            row for row in conn.execute(
+                f"SELECT {ARCHIVED_EVENT_COLUMNS} FROM events_in ORDER BY timestamp, event_id"
+            )
+            if previous is None or not conn.execute(
+                "SELECT 1 FROM events_archived WHERE event_id = ?", (row[0],)
+            ).fetchone()
+        )
+        sources = [fresh]
+        if previous is not None:
+            sources.append(_archived_rows(events_archive_path(directory, day, previous)))
+
+        writer = archive.ArchiveWriter(target, codec, block_bytes, meta={"day": day})
+        mapping = []
+        try:
+            for row in heapq.merge(*sources, key=lambda row: (row[1], row[0])):
+                mapping.append((row[0], len(writer.blocks)))
+                writer.add(
+                    json.dumps(row, ensure_ascii=False).encode("utf-8") + b"\n",
+                    {"timestamp": row[1]}, row[2], row[6],
+                )
+        except BaseException:
+            writer.abort()
+            raise
+        writer.close()
+
+        with conn:
+            conn.execute("DELETE FROM events_archived")
+            conn.executemany("INSERT INTO events_archived(event_id, block) VALUES (?, ?)", mapping)
+            conn.execute("DELETE FROM events_archive")
+            conn.execute("INSERT INTO events_archive(generation, records) VALUES (?, ?)", (generation, len(mapping)))
+            # Solo lo que quedó en el archivo: el escritor puede haber readjuntado el día e insertado
+            # eventos tardíos mientras se armaba; esos siguen en events_in hasta la próxima generación
+            conn.execute("DELETE FROM events_in WHERE event_id IN (SELECT event_id FROM events_archived)")
+    finally:
+        conn.close()
+    # Generaciones viejas (o huérfanas de un archivado interrumpido)
+    for stale in glob.glob(events_archive_path(directory, day, "*")):
+        if stale != target:
+            os.remove(stale)
+    return len(mapping)
+
+
+def compact_partition(path, target=COMPACTED_VERSION, codec="zlib", block_bytes=256 << 10):
+    """
+    Lleva una partición fría a `target` (COMPACTED_VERSION o ARCHIVED_VERSION):
+    archiva events_in si corresponde, checkpoint, ANALYZE y VACUUM. Retorna los
+    eventos archivados (0 si solo se compactó) o None si ya estaba en ese estado.
+    Si el escritor la readjunta mientras tanto, DayPartitions la devuelve a 0
+    con reopen_partition() y la reintenta.
+    """
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        if conn.execute("PRAGMA user_version;").fetchone()[0] >= target:
+            return None
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+        records = archive_partition(path, codec, block_bytes) if target == ARCHIVED_VERSION else 0
+        conn.execute("ANALYZE;")
+        conn.execute("VACUUM;")
+        conn.execute("PRAGMA journal_mode=DELETE;")
+        conn.execute(f"PRAGMA user_version={target};")
+        return records
+    finally:
+        conn.close()
+
+
+def reopen_partition(path):
+    """Deja la partición como no compactada (user_version 0) para que maintain() la vuelva a procesar."""
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        conn.execute("PRAGMA user_version=0;")
+    finally:
+        conn.close()
+
+
+class DayPartitions:
+    """Particiones diarias adjuntadas a la conexión del hilo escritor."""
+
+    def __init__(self, conn, directory, retention_days=0, cold_after_days=2, max_attached=8,
+                 archive_after_days=0, archive_codec="zlib", archive_block_bytes=256 << 10, payload_fields=None):
+        if max_attached < 1:
+            raise ValueError("max_attached debe ser >= 1")
+        os.makedirs(directory, exist_ok=True)
+        self.conn = conn
+        self.directory = directory
+        self.retention_days = retention_days  # 0 = conservar todas
+        self.cold_after_days = cold_after_days  # 0 = no compactar
+        self.archive_after_days = archive_after_days  # 0 = no archivar
+        self.archive_codec = archive_codec
+        self.archive_block_bytes = archive_block_bytes
+        self.payload_fields = payload_fields  # Columnas indexadas del payload (ver storage.init_payload_columns)
+        self.max_attached = max_attached
+        self.attached = OrderedDict()  # día -> alias, del menos al más usado
+        self._done = {}  # día -> user_version alcanzado (compactada / archivada)
+        self._attaches = {}  # día -> veces adjuntada (detecta si el escritor la reabrió durante la compactación)
+        self._lock = threading.Lock()  # Entre el hilo escritor (_attach) y el compactador (_done)
+        self._compactor = None
+        self.dropped = 0
+        self.compacted = 0
+        self.archived = 0
+
+    def prepare(self, days) -> None:
+        """Adjunta (y crea si hace falta) las particiones de `days`. Llamar fuera de una transacción."""
+        days = set(days)
+        if len(days) > self.max_attached:
+            raise ValueError(f"El lote abarca {len(days)} días y solo se pueden adjuntar {self.max_attached}")
+        for day in sorted(days):
+            if day in self.attached:
+                self.attached.move_to_end(day)
+                continue
+            while len(self.attached) >= self.max_attached:
+                self._detach(next(old for old in self.attached if old not in days))
+            self._attach(day)
+
+    def schema(self, day) -> str:
+        """Alias de la partición del día (debe estar preparada con prepare())."""
+        return self.attached[day]
+
+    def _attach(self, day):
+        name = alias(day)
+        self.conn.execute(f"ATTACH DATABASE ? AS {name}", (partition_path(self.directory, day),))
+        self.conn.execute(f"PRAGMA {name}.journal_mode=WAL;")
+        self.conn.execute(f"PRAGMA {name}.synchronous=NORMAL;")
+        with self._lock:
+            self._attaches[day] = self._attaches.get(day, 0) + 1
+            if self.conn.execute(f"PRAGMA {name}.user_version;").fetchone()[0]:
+                self.conn.execute(f"PRAGMA {name}.user_version=0;")  # Vuelve a recibir escrituras
+                self._done.pop(day, None)
+        storage.create_schema(self.conn, name, event_foreign_key=False, payload_fields=self.payload_fields)
+        self.conn.commit()
+        self.attached[day] = name
+
+    def _detach(self, day):
+        self.conn.execute(f"DETACH DATABASE {self.attached.pop(day)}")
+
+    def maintain(self, reference_day=None) -> None:
+        """Retención y compactación de particiones frías. Llamar entre lotes (fuera de transacción)."""
+        reference_day = reference_day or today()
+        cold = []
+        for day, path in list_partitions(self.directory):
+            age = _age_in_days(day, reference_day)
+            if self.retention_days and age >= self.retention_days:
+                self._drop(day)
+                continue
+            target = 0
+            if self.archive_after_days and age >= self.archive_after_days:
+                target = ARCHIVED_VERSION
+            elif self.cold_after_days and age >= self.cold_after_days:
+                target = COMPACTED_VERSION
+            if target > self._done.get(day, 0):
+                cold.append((day, path, target))
+
+        if cold and (self._compactor is None or not self._compactor.is_alive()):
+            for day, _, _ in cold:
+                if day in self.attached:
+                    self._detach(day)
+            # Desde acá, un _attach del día significa que el escritor la reabrió
+            cold = [(day, path, target, self._attaches.get(day, 0)) for day, path, target in cold]
+            self._compactor = threading.Thread(
+                target=self._compact, args=(cold,), name="audit-compactor", daemon=True
+            )
+            self._compactor.start()
+
+    def _drop(self, day):
+        if day in self.attached:
+            self._detach(day)
+        for stale in partition_files(self.directory, day):
+            try:
+                os.remove(stale)
+            except FileNotFoundError:
+                pass
+        self._done.pop(day, None)
+        self.dropped += 1
+        print(f" [P] Partición {day} eliminada por retención")
+
+    def _compact(self, cold):
+        for day, path, target, attaches in cold:
+            try:
+                records = compact_partition(path, target, self.archive_codec, self.archive_block_bytes)
+                with self._lock:
+                    reopened = self._attaches.get(day, 0) != attaches
+                    if not reopened:
+                        self._done[day] = target
+                if reopened:
+                    # Recibió escrituras durante la compactación: vuelve a quedar pendiente
+                    reopen_partition(path)
+                    print(f" [P] Partición {day} reabierta durante la compactación; se reintenta")
+                    continue
+                if records is not None:
+                    self.compacted += 1
+                    detail = ""
+                    if target == ARCHIVED_VERSION:
+                        self.archived += 1
+                        detail = f", {records} eventos archivados"
+                    print(f" [P] Partición {day} compactada{detail}")
+            except (sqlite3.Error, OSError, ValueError) as e:
+                # Se reintenta en el próximo maintain() (p. ej. si llegó un evento tardío)
+                print(f"[!] Error compactando partición {day}: {e}")
+
+    def wait_for_compaction(self, timeout=None) -> None:
+        if self._compactor is not None:
+            self._compactor.join(timeout)
+
+    def status(self):
+        return {
+            "attached": list(self.attached),
+            "partitions": len(list_partitions(self.directory)),
+            "dropped": self.dropped,
+            "compacted": self.compacted,
+            "archived": self.archived,
+        }
+
+
+class PartitionReader:
+    """Adjunta particiones en solo lectura a una conexión de consultas (abierta con uri=True)."""
+
+    def __init__(self, conn, directory, max_attached=8):
+        self.conn = conn
+        self.directory = directory
+        self.max_attached = max_attached
+        self.attached = OrderedDict()  # día -> alias
+        self._archives = {}  # día -> (generación, archive.Archive)
+
+    def archive(self, day, schema):
+        """Archivo de eventos vigente de una partición adjuntada (None si no se archivó)."""
+        generation = archive_generation(self.conn, schema)
+        if generation is None:
+            return None
+        cached = self._archives.get(day)
+        if cached is None or cached[0] != generation:
+            cached = self._archives[day] = (
+                generation, archive.Archive(events_archive_path(self.directory, day, generation))
+            )
+        return cached[1]
+
+    def days(self, first=None, last=None, newest_first=False):
+        """Días con partición en disco dentro de [first, last] (None = sin límite)."""
+        found = [
+            day for day, _ in list_partitions(self.directory)
+            if (first is None or day >= first) and (last is None or day <= last)
+        ]
+        return found[::-1] if newest_first else found
+
+    def schema(self, day):
+        """Alias de la partición del día, adjuntándola si hace falta (None si no existe)."""
+        if day in self.attached:
+            self.attached.move_to_end(day)
+            return self.attached[day]
+        path = partition_path(self.directory, day)
+        if not os.path.exists(path):
+            return None
+        while len(self.attached) >= self.max_attached:
+            _, old = self.attached.popitem(last=False)
+            self.conn.execute(f"DETACH DATABASE {old}")
+        name = alias(day)
+        self.conn.execute(f"ATTACH DATABASE ? AS {name}", (f"file:{path}?mode=ro",))
+        self.attached[day] = name
+        return name
+
+    def schemas(self, days):
+        """Genera (día, alias) adjuntando de a una; usar cada alias antes de pedir el siguiente."""
+        for day in days:
+            name = self.schema(day)
+            if name is not None:
+                yield day, name
@@ -0,0 +1,652 @@
+"""
+Consultas de linaje y búsqueda sobre audit.db (CLI y endpoint HTTP de solo lectura).
+
+  - eventos que produjeron una métrica (linaje compacto o filas de `trace`)
+  - métricas que usaron un evento (`trace` y el índice inverso del linaje compacto)
+  - métricas de una región en una fecha (opcionalmente de un run_id)
+  - eventos de un run_id en un rango de tiempo
+  - eventos de una fuente por un campo del payload (crime_type, severity, ...)
+  - métricas de un run (p. ej. un backfill) comparadas con las de otro, por fecha y región
+
+Todas paginan por keyset: cada página retorna `next`, un cursor opaco con la
+última clave vista, y la siguiente consulta sigue con `(clave) > (cursor)` sobre
+el índice (ver storage.QUERY_INDEXES) en vez de usar OFFSET. Las sentencias son
+constantes con parámetros, así sqlite3 las prepara una vez y las reutiliza desde
+su caché de sentencias.
+
+Uso:
+  python queries.py lineage <metric_id>
+  python queries.py metrics-of <event_id>
+  python queries.py metrics --region sur --date 2026-01-30 [--run-id R]
+  python queries.py events --run-id R [--from 2026-01-30T16:00:00] [--to 2026-01-30T17:00:00] [--region sur]
+  python queries.py payload --source security.incident --field severity --value high [--from ...] [--to ...]
+  python queries.py compare <run_id> [--baseline default] [--from 2026-01-30] [--to 2026-01-31] [--region sur]
+  python queries.py serve [--port 8081]
+
+Con particiones diarias (partitions.py) cada consulta recorre audit.db y las
+particiones de los días que le corresponden, y mezcla sus páginas por la clave.
+En las particiones archivadas los eventos se leen del archivo comprimido, y
+solo se descomprimen los bloques que pueden coincidir con el filtro de tiempo,
+región y run_id (o los que contienen los event_id pedidos).
+
+Los timestamps se comparan como texto ISO (el mismo formato UTC que guardan los eventos).
+"""
+import argparse
+import base64
+import bisect
+import itertools
+import json
+import sqlite3
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+import lineage_store
+import partitions
+import settings
+import storage
+
+SELECT_EVENT_SQL = """
+    SELECT event_id, timestamp, region, source, schema_version, correlation_id, run_id, payload_json
+    FROM {schema}.events_in WHERE event_id = ?
+"""
+HAS_METRIC_SQL = "SELECT 1 FROM {schema}.metrics_out WHERE metric_id = ?"
+HAS_COMPACT_LINEAGE_SQL = "SELECT 1 FROM {schema}.metric_lineage WHERE metric_id = ?"
+TRACE_EVENTS_SQL = """
+    SELECT event_id FROM {schema}.trace
+    WHERE metric_id = ? AND event_id > ?
+    ORDER BY event_id LIMIT ?
+"""
+EVENT_METRICS_SQL = """
+    SELECT m.metric_id, m.date, m.region, m.run_id, m.metrics_json
+    FROM {schema}.trace t JOIN {schema}.metrics_out m ON m.metric_id = t.metric_id
+    WHERE t.event_id = ? AND t.metric_id > ?
+    ORDER BY t.metric_id LIMIT ?
+"""
+# Linaje compacto por su índice inverso (lineage_store.metric_lineage_events)
+COMPACT_EVENT_METRICS_SQL = """
+    SELECT m.metric_id, m.date, m.region, m.run_id, m.metrics_json
+    FROM {schema}.metric_lineage_events l JOIN {schema}.metrics_out m ON m.metric_id = l.metric_id
+    WHERE l.event_key = ? AND l.metric_id > ?
+    ORDER BY l.metric_id LIMIT ?
+"""
+# Bases sin el índice inverso (solo lectura, nunca reabiertas por el escritor): instr() busca
+# el UUID empaquetado en cada BLOB y lineage_contains() (registrada en connect) descarta los
+# calces entre dos UUID antes del LIMIT
+SCAN_EVENT_METRICS_SQL = """
+    SELECT m.metric_id, m.date, m.region, m.run_id, m.metrics_json
+    FROM {schema}.metric_lineage l JOIN {schema}.metrics_out m ON m.metric_id = l.metric_id
+    WHERE (instr(l.event_ids_blob, ?) > 0 OR instr(l.extra_ids_json, ?) > 0)
+      AND lineage_contains(l.event_ids_blob, l.extra_ids_json, ?) AND l.metric_id > ?
+    ORDER BY l.metric_id LIMIT ?
+"""
+HAS_LINEAGE_INDEX_SQL = "SELECT 1 FROM {schema}.sqlite_master WHERE type = 'table' AND name = 'metric_lineage_events'"
+REGION_DATE_METRICS_SQL = """
+    SELECT metric_id, date, region, run_id, metrics_json
+    FROM {schema}.metrics_out
+    WHERE region = ? AND date = ? AND (run_id, metric_id) > (?, ?)
+    ORDER BY run_id, metric_id LIMIT ?
+"""
+REGION_DATE_RUN_METRICS_SQL = """
+    SELECT metric_id, date, region, run_id, metrics_json
+    FROM {schema}.metrics_out
+    WHERE region = ? AND date = ? AND run_id = ? AND metric_id > ?
+    ORDER BY metric_id LIMIT ?
+"""
+RUN_EVENTS_SQL = """
+    SELECT event_id, timestamp, region, source, schema_version, correlation_id, run_id, payload_json
+    FROM {schema}.events_in
+    WHERE run_id = ? AND timestamp >= ? AND timestamp <= ? AND (timestamp, event_id) > (?, ?)
+    ORDER BY timestamp, event_id LIMIT ?
+"""
+RUN_REGION_EVENTS_SQL = """
+    SELECT event_id, timestamp, region, source, schema_version, correlation_id, run_id, payload_json
+    FROM {schema}.events_in
+    WHERE run_id = ? AND region = ? AND timestamp >= ? AND timestamp <= ? AND (timestamp, event_id) > (?, ?)
+    ORDER BY timestamp, event_id LIMIT ?
+"""
+PAYLOAD_EVENTS_SQL = """
+    SELECT event_id, timestamp, region, source, schema_version, correlation_id, run_id, payload_json
+    FROM {{schema}}.events_in INDEXED BY idx_{column}
+    WHERE source = ? AND {column} = ? AND timestamp >= ? AND timestamp <= ? AND (timestamp, event_id) > (?, ?)
+    ORDER BY timestamp, event_id LIMIT ?
+"""
+RUN_METRICS_SQL = """
+    SELECT date, region, metrics_json
+    FROM {schema}.metrics_out
+    WHERE run_id = ? AND date >= ? AND date <= ?
+"""
+ARCHIVED_BLOCK_SQL = "SELECT block FROM {schema}.events_archived WHERE event_id = ?"
+
+# Cota superior de texto para los rangos abiertos (mantiene una sola sentencia preparada)
+_MAX_TEXT = "\uffff"
+
+
+class AuditConnection(sqlite3.Connection):
+    """Conexión de consultas; `partitions` es un partitions.PartitionReader o None."""
+
+    partitions = None
+
+
+def connect(db_path: str, partition_dir: str = None) -> sqlite3.Connection:
+    """
+    Conexión de solo lectura (en WAL no bloquea al escritor de audit). Con
+    AUDIT_PARTITIONING=day (o `partition_dir`) las consultas recorren además las
+    particiones diarias, adjuntadas en solo lectura a medida que se necesitan.
+    """
+    conn = sqlite3.connect(
+        f"file:{db_path}?mode=ro", uri=True, check_same_thread=False, timeout=5, factory=AuditConnection
+    )
+    conn.execute("PRAGMA busy_timeout=5000;")
+    conn.create_function("lineage_contains", 3, lineage_store.lineage_contains, deterministic=True)
+    if partition_dir is None and settings.AUDIT_PARTITIONING == "day":
+        partition_dir = settings.AUDIT_PARTITION_DIR
+    if partition_dir is not None:
+        conn.partitions = partitions.PartitionReader(conn, partition_dir, settings.AUDIT_MAX_ATTACHED)
+    return conn
+
+
+def _sources(conn, first_day=None, last_day=None, newest_first=False):
+    """
+    Esquemas a consultar: "main" y, si la conexión tiene particiones, las de los
+    días en [first_day, last_day]. Genera (día, esquema); main tiene día None.
+    """
+    yield None, "main"
+    reader = getattr(conn, "partitions", None)
+    if reader is not None:
+        yield from reader.schemas(reader.days(first_day, last_day, newest_first))
+
+
+def _merged_page(conn, sql, params, key, limit, archived=None, **days):
+    """
+    Primera página en orden de `key` sobre todos los esquemas: cada uno aporta
+    hasta limit + 1 filas (ya filtradas por el cursor) y se mezclan. Con una sola
+    base es exactamente la consulta de siempre. `archived(archivo)` aporta las
+    filas de las particiones cuyo events_in está en un archivo comprimido.
+    """
+    rows = []
+    for day, schema in _sources(conn, **days):
+        rows.extend(conn.execute(sql.format(schema=schema), params))
+        events_archive = conn.partitions.archive(day, schema) if archived and day is not None else None
+        if events_archive is not None:
+            rows.extend(archived(events_archive))
+    rows.sort(key=key)  # Con una sola base ya vienen ordenadas (timsort es lineal)
+    return rows[:limit + 1]
+
+
+def encode_cursor(*key) -> str:
+    return base64.urlsafe_b64encode(json.dumps(key).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor, size):
+    """Clave del cursor (tupla de `size` textos); sin cursor, la clave mínima."""
+    if not cursor:
+        return ("",) * size
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, UnicodeError):
+        raise ValueError("Cursor inválido")
+    if not isinstance(key, list) or len(key) != size or not all(isinstance(part, str) for part in key):
+        raise ValueError("Cursor inválido")
+    return tuple(key)
+
+
+def _page_limit(limit):
+    if limit < 1:
+        raise ValueError("limit debe ser >= 1")
+    return min(limit, settings.QUERY_MAX_PAGE_SIZE)
+
+
+def _event_dict(row):
+    event_id, timestamp, region, source, schema_version, correlation_id, run_id, payload_json = row
+    return {
+        "event_id": event_id,
+        "timestamp": timestamp,
+        "region": region,
+        "source": source,
+        "schema_version": schema_version,
+        "correlation_id": correlation_id,
+        "run_id": run_id,
+        "payload": json.loads(payload_json),
+    }
+
+
+def _metric_dict(row):
+    metric_id, date, region, run_id, metrics_json = row
+    return {"metric_id": metric_id, "date": date, "region": region, "run_id": run_id,
+            "metrics": json.loads(metrics_json)}
+
+
+def _metric_schema(conn, metric_id):
+    """(día, esquema) donde está guardada la métrica; (None, "main") si no se encuentra."""
+    if getattr(conn, "partitions", None) is None:
+        return None, "main"
+    for day, schema in _sources(conn, newest_first=True):
+        if conn.execute(HAS_METRIC_SQL.format(schema=schema), (metric_id,)).fetchone():
+            return day, schema
+    return None, "main"
+
+
+def _load_events(conn, event_ids, metric_day):
+    """Filas de events_in por id; en particiones se busca primero desde el día de la métrica hacia atrás."""
+    found = {}
+    reader = getattr(conn, "partitions", None)
+    schemas = [(None, "main")]
+    if reader is not None:
+        days = reader.days()
+        if metric_day is not None:
+            days = [day for day in days if day <= metric_day][::-1] + [day for day in days if day > metric_day]
+        schemas = itertools.chain(schemas, reader.schemas(days))  # Se adjuntan de a una
+    for day, schema in schemas:
+        sql = SELECT_EVENT_SQL.format(schema=schema)
+        for event_id in event_ids:
+            if event_id not in found:
+                row = conn.execute(sql, (event_id,)).fetchone()
+                if row:
+                    found[event_id] = row
+        if day is not None and len(found) < len(event_ids):
+            _load_archived_events(conn, day, schema, event_ids, found)
+        if len(found) == len(event_ids):
+            break
+    return found
+
+
+def _load_archived_events(conn, day, schema, event_ids, found):
+    """Completa `found` desde el archivo de la partición: un bloque descomprimido por grupo de ids."""
+    events_archive = conn.partitions.archive(day, schema)
+    if events_archive is None:
+        return
+    sql = ARCHIVED_BLOCK_SQL.format(schema=schema)
+    blocks = set()
+    for event_id in event_ids:
+        if event_id not in found:
+            row = conn.execute(sql, (event_id,)).fetchone()
+            if row:
+                blocks.add(row[0])
+    wanted = set(event_ids)
+    for number in sorted(blocks):
+        for line in events_archive.read_block(number):
+            row = tuple(json.loads(line))
+            if row[0] in wanted and row[0] not in found:
+                found[row[0]] = row
+
+
+def _archived_run_events(run_id, region, start, end, after, limit):
+    """Filas de un archivo de eventos para events_by_run (solo los bloques que pueden coincidir)."""
+    def select(events_archive):
+        rows = []
+        for number in events_archive.select("timestamp", max(start, after[0]), end, region, run_id):
+            for line in events_archive.read_block(number):
+                row = tuple(json.loads(line))
+                if (row[6] == run_id and start <= row[1] <= end and (row[1], row[0]) > after
+                        and (region is None or row[2] == region)):
+                    rows.append(row)
+                    if len(rows) > limit:
+                        return rows  # Los bloques están ordenados por (timestamp, event_id)
+        return rows
+    return select
+
+
+def events_for_metric(conn, metric_id, cursor=None, limit=None):
+    """Eventos que produjeron la métrica, ordenados por event_id. Retorna (eventos, cursor siguiente)."""
+    limit = _page_limit(limit or settings.QUERY_PAGE_SIZE)
+    (after,) = decode_cursor(cursor, 1)
+    metric_day, schema = _metric_schema(conn, metric_id)
+
+    if conn.execute(HAS_COMPACT_LINEAGE_SQL.format(schema=schema), (metric_id,)).fetchone():
+        # El linaje compacto se expande en memoria (acotado por el tamaño de la ventana)
+        event_ids = sorted(lineage_store.expand_lineage(conn, metric_id, schema))
+        start = bisect.bisect_right(event_ids, after)
+        page_ids = event_ids[start:start + limit]
+        more = start + limit < len(event_ids)
+    else:
+        sql = TRACE_EVENTS_SQL.format(schema=schema)
+        page_ids = [row[0] for row in conn.execute(sql, (metric_id, after, limit + 1))]
+        more = len(page_ids) > limit
+        page_ids = page_ids[:limit]
+
+    rows = _load_events(conn, page_ids, metric_day)
+    # El linaje puede referenciar eventos que audit no guardó (p. ej. otra réplica o una partición vencida)
+    events = [
+        _event_dict(rows[event_id]) if event_id in rows else {"event_id": event_id, "stored": False}
+        for event_id in page_ids
+    ]
+    return events, encode_cursor(page_ids[-1]) if more else None
+
+
+def metrics_for_event(conn, event_id, cursor=None, limit=None):
+    """
+    Métricas que usaron el evento, por metric_id: las de `trace` y las de linaje
+    compacto (metric_lineage, el formato por defecto del aggregator), por su
+    índice inverso. Retorna (métricas, cursor siguiente).
+    """
+    limit = _page_limit(limit or settings.QUERY_PAGE_SIZE)
+    (after,) = decode_cursor(cursor, 1)
+    rows = {row[0]: row for row in _compact_event_metrics(conn, event_id, after, limit)}
+    # Una métrica con linaje en ambos formatos (materialize_trace) sale una vez
+    rows.update((row[0], row) for row in _merged_page(
+        conn, EVENT_METRICS_SQL, (event_id, after, limit + 1), lambda row: row[0], limit
+    ))
+    rows = sorted(rows.values(), key=lambda row: row[0])[:limit + 1]
+    metrics = [_metric_dict(row) for row in rows[:limit]]
+    return metrics, encode_cursor(metrics[-1]["metric_id"]) if len(rows) > limit else None
+
+
+def _compact_event_metrics(conn, event_id, after, limit):
+    """Hasta limit + 1 métricas de linaje compacto con el evento, por metric_id, sobre todos los esquemas."""
+    key = lineage_store.event_key(event_id)
+    rows = []
+    for _, schema in _sources(conn):
+        if conn.execute(HAS_LINEAGE_INDEX_SQL.format(schema=schema)).fetchone():
+            rows.extend(conn.execute(COMPACT_EVENT_METRICS_SQL.format(schema=schema), (key, after, limit + 1)))
+        else:
+            packed, extra = (None, json.dumps(event_id)) if isinstance(key, str) else (key, None)
+            rows.extend(conn.execute(
+                SCAN_EVENT_METRICS_SQL.format(schema=schema), (packed, extra, event_id, after, limit + 1)
+            ))
+    rows.sort(key=lambda row: row[0])
+    return rows[:limit + 1]
+
+
+def metrics_by_region_date(conn, region, date, run_id=None, cursor=None, limit=None):
+    """Métricas de una región en una fecha (YYYY-MM-DD). Retorna (métricas, cursor siguiente)."""
+    limit = _page_limit(limit or settings.QUERY_PAGE_SIZE)
+    day = partitions.day_of(date, "")  # Con particiones solo se lee la del día pedido
+    if run_id is None:
+        after_run, after_metric = decode_cursor(cursor, 2)
+        rows = _merged_page(
+            conn, REGION_DATE_METRICS_SQL, (region, date, after_run, after_metric, limit + 1),
+            lambda row: (row[3], row[0]), limit, first_day=day, last_day=day,
+        )
+    else:
+        (after_metric,) = decode_cursor(cursor, 1)
+        rows = _merged_page(
+            conn, REGION_DATE_RUN_METRICS_SQL, (region, date, run_id, after_metric, limit + 1),
+            lambda row: row[0], limit, first_day=day, last_day=day,
+        )
+
+    metrics = [_metric_dict(row) for row in rows[:limit]]
+    if len(rows) <= limit:
+        return metrics, None
+    last = metrics[-1]
+    key = (last["metric_id"],) if run_id is not None else (last["run_id"], last["metric_id"])
+    return metrics, encode_cursor(*key)
+
+
+def events_by_run(conn, run_id, start=None, end=None, cursor=None, limit=None, region=None):
+    """Eventos de un run_id (opcionalmente de una región) con timestamp en [start, end], por (timestamp, event_id)."""
+    limit = _page_limit(limit or settings.QUERY_PAGE_SIZE)
+    after_time, after_event = decode_cursor(cursor, 2)
+    start, end = start or "", end or _MAX_TEXT
+    if region is None:
+        sql, params = RUN_EVENTS_SQL, (run_id, start, end, after_time, after_event, limit + 1)
+    else:
+        sql, params = RUN_REGION_EVENTS_SQL, (run_id, region, start, end, after_time, after_event, limit + 1)
+    # Solo las particiones de los días del rango (y desde el día del cursor)
+    first_day = max(partitions.day_of(start, ""), partitions.day_of(after_time, "")) or None
+    rows = _merged_page(
+        conn, sql, params, lambda row: (row[1], row[0]), limit,
+        archived=_archived_run_events(run_id, region, start, end, (after_time, after_event), limit),
+        first_day=first_day, last_day=partitions.day_of(end),
+    )
+    events = [_event_dict(row) for row in rows[:limit]]
+    if len(rows) <= limit:
+        return events, None
+    return events, encode_cursor(events[-1]["timestamp"], events[-1]["event_id"])
+
+
+def _archived_payload_events(source, field, value, start, end, after, limit):
+    """Filas de un archivo de eventos para events_by_payload (el archivo no indexa el payload)."""
+    def select(events_archive):
+        rows = []
+        for number in events_archive.select("timestamp", max(start, after[0]), end):
+            for line in events_archive.read_block(number):
+                row = tuple(json.loads(line))
+                if row[3] != source or not (start <= row[1] <= end and (row[1], row[0]) > after):
+                    continue
+                found = json.loads(row[7]).get(field)
+                if isinstance(found, bool):
+                    found = int(found)  # Como json_extract: true/false -> 1/0
+                if found is not None and str(found) == value:
+                    rows.append(row)
+                    if len(rows) > limit:
+                        return rows
+        return rows
+    return select
+
+
+def events_by_payload(conn, source, field, value, start=None, end=None, cursor=None, limit=None):
+    """
+    Eventos de una fuente con payload[field] == value (comparado como texto), por
+    (timestamp, event_id). Usa la columna generada e indexada del campo (ver
+    storage.init_payload_columns); un campo no configurado da ValueError.
+    """
+    limit = _page_limit(limit or settings.QUERY_PAGE_SIZE)
+    after_time, after_event = decode_cursor(cursor, 2)
+    start, end = start or "", end or _MAX_TEXT
+    sql = PAYLOAD_EVENTS_SQL.format(column=storage.payload_column(field))
+    first_day = max(partitions.day_of(start, ""), partitions.day_of(after_time, "")) or None
+    try:
+        rows = _merged_page(
+            conn, sql, (source, str(value), start, end, after_time, after_event, limit + 1),
+            lambda row: (row[1], row[0]), limit,
+            archived=_archived_payload_events(source, field, str(value), start, end, (after_time, after_event), limit),
+            first_day=first_day, last_day=partitions.day_of(end),
+        )
+    except sqlite3.OperationalError as e:
+        if "no such column" in str(e) or "no such index" in str(e):
+            raise ValueError(f"El campo {field!r} no está indexado (PAYLOAD_INDEX_FIELDS)")
+        raise
+    events = [_event_dict(row) for row in rows[:limit]]
+    if len(rows) <= limit:
+        return events, None
+    return events, encode_cursor(events[-1]["timestamp"], events[-1]["event_id"])
+
+
+def _run_totals(conn, run_id, first_day, last_day, region):
+    """{(fecha, región): {métrica: suma}} de las métricas numéricas de un run en [first_day, last_day]."""
+    totals = {}
+    params = (run_id, first_day or "", last_day or _MAX_TEXT)
+    for _, schema in _sources(conn, first_day, last_day):
+        for date, metric_region, metrics_json in conn.execute(RUN_METRICS_SQL.format(schema=schema), params):
+            if region is not None and metric_region != region:
+                continue
+            bucket = totals.setdefault((date, metric_region), {})
+            for name, value in json.loads(metrics_json).items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    bucket[name] = bucket.get(name, 0) + value
+    return totals
+
+
+def compare_runs(conn, run_id, baseline="default", first_day=None, last_day=None, region=None):
+    """
+    Métricas de `run_id` frente a las de `baseline` (por defecto el run en vivo),
+    sumadas por fecha y región en [first_day, last_day] (YYYY-MM-DD). Cada fila
+    lleva los totales de ambos runs y `diff` = run - baseline por métrica; las
+    que coinciden no aparecen en `diff`. Ordenadas por (fecha, región).
+    """
+    for day in (first_day, last_day):
+        if day and partitions.day_of(day) is None:
+            raise ValueError(f"Fecha inválida: {day!r} (YYYY-MM-DD)")
+    run = _run_totals(conn, run_id, first_day, last_day, region)
+    base = _run_totals(conn, baseline, first_day, last_day, region)
+    rows = []
+    for date, metric_region in sorted(set(run) | set(base)):
+        run_metrics = run.get((date, metric_region), {})
+        base_metrics = base.get((date, metric_region), {})
+        diff = {}
+        for name in sorted(set(run_metrics) | set(base_metrics)):
+            delta = run_metrics.get(name, 0) - base_metrics.get(name, 0)
+            if delta:
+                diff[name] = delta
+        rows.append({"date": date, "region": metric_region, "run_id": run_id, "baseline": baseline,
+                     "run": run_metrics, "baseline_metrics": base_metrics, "diff": diff})
+    return rows
+
+
+def iter_all(query, conn, *args, **kwargs):
+    """Recorre todas las páginas de una consulta, generando los resultados de a uno (streaming)."""
+    cursor = kwargs.pop("cursor", None)
+    while True:
+        items, cursor = query(conn, *args, cursor=cursor, **kwargs)
+        yield from items
+        if cursor is None:
+            return
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """
+    GET /metrics/<metric_id>/events    linaje de una métrica
+    GET /events/<event_id>/metrics     métricas que usaron un evento
+    GET /metrics?region=&date=[&run_id=]
+    GET /events?run_id=[&from=&to=&region=]
+    GET /payload?source=&field=&value=[&from=&to=]
+    GET /runs/compare?run_id=[&baseline=&from=&to=&region=]
+    Todas aceptan `cursor` y `limit`; responden {"items": [...], "next": cursor|null}
+    (/runs/compare no pagina: una fila por fecha y región).
+    """
+
+    db_path = None
+    partition_dir = None
+    _local = threading.local()
+
+    def database(self):
+        # Una conexión por hilo del servidor (cada una con su caché de sentencias)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = connect(self.db_path, self.partition_dir)
+        return conn
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        parts = [unquote(part) for part in url.path.strip("/").split("/")]
+        paging = {"cursor": params.get("cursor")}
+        try:
+            paging["limit"] = int(params.get("limit", settings.QUERY_PAGE_SIZE))
+            conn = self.database()
+            if len(parts) == 3 and parts[0] == "metrics" and parts[2] == "events":
+                items, cursor = events_for_metric(conn, parts[1], **paging)
+            elif len(parts) == 3 and parts[0] == "events" and parts[2] == "metrics":
+                items, cursor = metrics_for_event(conn, parts[1], **paging)
+            elif parts == ["metrics"]:
+                items, cursor = metrics_by_region_date(
+                    conn, params["region"], params["date"], params.get("run_id"), **paging
+                )
+            elif parts == ["events"]:
+                items, cursor = events_by_run(
+                    conn, params["run_id"], params.get("from"), params.get("to"), region=params.get("region"), **paging
+                )
+            elif parts == ["payload"]:
+                items, cursor = events_by_payload(
+                    conn, params["source"], params["field"], params["value"], params.get("from"), params.get("to"),
+                    **paging
+                )
+            elif parts == ["runs", "compare"]:
+                items, cursor = compare_runs(
+                    conn, params["run_id"], params.get("baseline", "default"), params.get("from"), params.get("to"),
+                    params.get("region")
+                ), None
+            else:
+                return self._reply(404, {"error": "Ruta desconocida"})
+        except KeyError as e:
+            return self._reply(400, {"error": f"Falta el parámetro {e}"})
+        except ValueError as e:
+            return self._reply(400, {"error": str(e)})
+        self._reply(200, {"items": items, "next": cursor})
+
+    def _reply(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass  # Sin log por request
+
+
+def serve(db_path, host, port, partition_dir=None):
+    QueryHandler.db_path = db_path
+    QueryHandler.partition_dir = partition_dir
+    server = ThreadingHTTPServer((host, port), QueryHandler)
+    print(f"[*] API de consultas de audit en http://{host}:{port} (DB: {db_path})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Consultas de linaje sobre audit.db")
+    parser.add_argument("--db", default=settings.AUDIT_DB_PATH, help="Ruta de audit.db")
+    parser.add_argument("--partitions", default=None,
+                        help="Directorio de particiones diarias (por defecto según AUDIT_PARTITIONING)")
+    parser.add_argument("--page-size", type=int, default=settings.QUERY_PAGE_SIZE, help="Filas por consulta")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    lineage = commands.add_parser("lineage", help="Eventos que produjeron una métrica")
+    lineage.add_argument("metric_id")
+    metrics_of = commands.add_parser("metrics-of", help="Métricas que usaron un evento")
+    metrics_of.add_argument("event_id")
+    metrics = commands.add_parser("metrics", help="Métricas de una región en una fecha")
+    metrics.add_argument("--region", required=True)
+    metrics.add_argument("--date", required=True, help="YYYY-MM-DD")
+    metrics.add_argument("--run-id", default=None)
+    events = commands.add_parser("events", help="Eventos de un run_id en un rango de tiempo")
+    events.add_argument("--run-id", required=True)
+    events.add_argument("--from", dest="start", default=None, help="Timestamp ISO inicial (inclusive)")
+    events.add_argument("--to", dest="end", default=None, help="Timestamp ISO final (inclusive)")
+    events.add_argument("--region", default=None)
+    payload = commands.add_parser("payload", help="Eventos de una fuente por un campo indexado del payload")
+    payload.add_argument("--source", required=True)
+    payload.add_argument("--field", required=True)
+    payload.add_argument("--value", required=True)
+    payload.add_argument("--from", dest="start", default=None, help="Timestamp ISO inicial (inclusive)")
+    payload.add_argument("--to", dest="end", default=None, help="Timestamp ISO final (inclusive)")
+    compare = commands.add_parser("compare", help="Métricas de un run frente a otro (por defecto el en vivo)")
+    compare.add_argument("run_id")
+    compare.add_argument("--baseline", default="default", help="Run de referencia")
+    compare.add_argument("--from", dest="start", default=None, help="Fecha inicial YYYY-MM-DD (inclusive)")
+    compare.add_argument("--to", dest="end", default=None, help="Fecha final YYYY-MM-DD (inclusive)")
+    compare.add_argument("--region", default=None)
+    server = commands.add_parser("serve", help="Endpoint HTTP de solo lectura")
+    server.add_argument("--host", default=settings.QUERY_API_HOST)
+    server.add_argument("--port", type=int, default=settings.QUERY_API_PORT)
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        serve(args.db, args.host, args.port, args.partitions)
+        return
+
+    conn = connect(args.db, args.partitions)
+    if args.command == "lineage":
+        rows = iter_all(events_for_metric, conn, args.metric_id, limit=args.page_size)
+    elif args.command == "metrics-of":
+        rows = iter_all(metrics_for_event, conn, args.event_id, limit=args.page_size)
+    elif args.command == "metrics":
+        rows = iter_all(metrics_by_region_date, conn, args.region, args.date, args.run_id, limit=args.page_size)
+    elif args.command == "compare":
+        rows = compare_runs(conn, args.run_id, args.baseline, args.start, args.end, args.region)
+    elif args.command == "payload":
+        rows = iter_all(events_by_payload, conn, args.source, args.field, args.value, args.start, args.end,
+                        limit=args.page_size)
+    else:
+        rows = iter_all(events_by_run, conn, args.run_id, args.start, args.end, limit=args.page_size,
+                        region=args.region)
+
+    # Una línea JSON por resultado, a medida que llegan las páginas
+    try:
+        for row in rows:
+            print(json.dumps(row, ensure_ascii=False))
+    except BrokenPipeError:
+        pass  # p. ej. `| head`
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,58 @@
+"""
+Replay de eventos del log de auditoría.
+
+Lee el log (segmentado o archivo único) con los filtros de offset, tiempo y
+región y reinyecta el evento original en un exchange.  La publicación va con
+confirmaciones del broker en ventana (ConfirmedPublisher), a un ritmo máximo
+configurable o respetando los intervalos originales acelerados (Throttle),
+opcionalmente frenando cuando la cola de los consumidores se llena
+(BacklogGate), y con un reporte periódico de ritmo, ETA y bytes (Progress).
+Con `--parallel N` el rango se reparte entre N procesos, cada uno con su
+conexión, y sus contadores se suman en un único reporte.  Con `--input db`
+la fuente es events_in (audit.db y sus particiones): selecciona por tiempo,
+región, fuente y run_id con los índices y lee con un cursor.  La posición
+confirmada se guarda cada tanto en un checkpoint (`--resume` sigue desde
+ahí) y ante una caída del broker se reconecta con backoff.  Con
+`--backfill` los mensajes llevan un run_id propio: el aggregator los agrega
+aparte del tráfico en vivo y audit guarda sus métricas bajo ese run.
+"""
+
+import argparse
+import heapq
 import json
+import multiprocessing
+import os
 import time
+import zlib
+from collections import OrderedDict, deque
+from json.encoder import encode_basestring as _encode
+
 import pika
-import argparse
-import os
-from datetime import datetime
+
+import exporter
+import partitions
+import queries
+import segments
 import settings
 
+REPLAY_HEADERS = {"x-replay": "true"}  # audit ignora los mensajes marcados así
+UNKNOWN_ROUTING_KEY = "replay.unknown"
+PARTITION_MODES = ("range", "region")
+INPUTS = ("log", "db")
+# Errores tras los que se reconecta y se retoma desde la posición confirmada
+RECONNECT_ERRORS = (pika.exceptions.AMQPConnectionError, pika.exceptions.AMQPChannelError)
+
+# Mismas columnas que exporter.EVENT_COLUMNS (y que las filas de los archivos de eventos)
+DB_EVENTS_SQL = """
+    SELECT event_id, timestamp, region, source, schema_version, correlation_id, run_id, payload_json
+    FROM {schema}.events_in {where}
+    ORDER BY timestamp, event_id
+"""
+DB_COUNT_SQL = "SELECT COUNT(*) FROM {schema}.events_in {where}"
+
+_CONTENT_MARKER = b'"event_content": '
+
+
 def connect():
     """Conexión usando las variables de settings.py"""
     params = pika.ConnectionParameters(
@@ -16,111 +63,1174 @@ def connect():
     channel = connection.channel()
     return connection, channel
 
-def replay_events(start_line=0, start_time_iso=None, target_exchange=None):
-    # 1. Usamos la ruta definida en tu settings.py
-    log_path = settings.LOG_FILE_PATH
-    
+
+def read_log(log_path, start_line=0, start_time=None, end_time=None, time_field="event", region=None,
+             end_line=None, start_offset=None, end_offset=None):
+    """
+    Genera (línea, registro crudo) desde `start_line` hasta `end_line`
+    (exclusivo). Con el log segmentado hace seek directo por el índice de
+    offsets o, si hay rango de tiempo o región, lee solo los bloques que los
+    índices no descartan (en los segmentos archivados solo se descomprimen
+    esos). Con el archivo único lo recorre completo, salvo que se dé el byte
+    `start_offset` donde empieza la línea `start_line` (y `end_offset` donde cortar).
+    """
+    if os.path.isdir(log_path):
+        if start_time is None and end_time is None and region is None:
+            yield from segments.iter_records(log_path, start_line, end_line)
+            return
+        yield from segments.iter_time_range(log_path, start_time, end_time, time_field, region, start_line, end_line)
+        return
+    with open(log_path, 'rb') as f:
+        index = position = 0
+        if start_offset:
+            f.seek(start_offset)
+            index, position = start_line, start_offset
+        for line in f:
+            if (end_line is not None and index >= end_line) or (end_offset is not None and position >= end_offset):
+                return
+            if index >= start_line:
+                yield index, line
+            index += 1
+            position += len(line)
+
+
+def _line_offset(f, line_number, chunk_bytes):
+    """Byte donde empieza la línea `line_number` (el tamaño del archivo si tiene menos)."""
+    f.seek(0)
+    seen = position = 0
+    while seen < line_number:
+        chunk = f.read(chunk_bytes)
+        if not chunk:
+            return position
+        count = chunk.count(b"\n")
+        if seen + count < line_number:
+            seen += count
+            position += len(chunk)
+            continue
+        cut = -1
+        for _ in range(line_number - seen):
+            cut = chunk.index(b"\n", cut + 1)
+        return position + cut + 1
+    return position
+
+
+def line_cuts(log_path, start_line, parts, chunk_bytes=1 << 20):
+    """
+    [(línea, byte)] donde empieza cada uno de `parts` tramos de tamaño
+    parecido del archivo único desde la línea `start_line`, más (None, tamaño)
+    al final. Cuenta saltos de línea por bloques: una pasada a velocidad de disco.
+    """
+    size = os.path.getsize(log_path)
+    with open(log_path, "rb") as f:
+        start = _line_offset(f, start_line, chunk_bytes)
+        cuts = [(start_line, start)]
+        for part in range(1, parts):
+            target = start + (size - start) * part // parts
+            f.seek(max(target - 1, 0))
+            f.readline()  # Completa la línea cortada: el tramo empieza en la siguiente
+            previous_line, position = cuts[-1]
+            boundary = max(f.tell(), position)
+            f.seek(position)
+            lines = 0
+            while position < boundary:
+                chunk = f.read(min(chunk_bytes, boundary - position))
+                lines += chunk.count(b"\n")
+                position += len(chunk)
+            cuts.append((previous_line + lines, boundary))
+    cuts.append((None, size))
+    return cuts
+
+
+def record_time(entry, time_field="event"):
+    """Epoch del registro del log: audit_timestamp o el timestamp del evento (anidado en event_content)."""
+    if time_field == "audit":
+        return segments.parse_time(entry.get('audit_timestamp'))
+    content = entry.get('event_content')
+    return segments.parse_time(content.get('timestamp')) if isinstance(content, dict) else None
+
+
+def record_region(entry):
+    """Región del evento original del registro del log (None si no la tiene)."""
+    content = entry.get('event_content')
+    return content.get('region') if isinstance(content, dict) else None
+
+
+def record_routing_key(entry):
+    """
+    Routing key original del evento: el publisher publica con la fuente del
+    evento y el validator la conserva al reenviar a processing_exchange.
+    """
+    content = entry.get('event_content')
+    source = content.get('source') if isinstance(content, dict) else None
+    return source if isinstance(source, str) and source else UNKNOWN_ROUTING_KEY
+
+
+def record_body(line, entry):
+    """
+    Cuerpo original del evento: se recorta tal cual del registro (log_writer
+    lo escribe crudo al final de la línea) y solo si no tiene esa forma se
+    vuelve a serializar event_content.
+    """
+    start = line.find(_CONTENT_MARKER)
+    end = len(line.rstrip())
+    if start >= 0 and line[end - 1:end] == b"}":
+        return line[start + len(_CONTENT_MARKER):end - 1]
+    return json.dumps(entry.get('event_content')).encode("utf-8")
+
+
+class ReplayStats:
+    """Contadores compartidos entre la lectura del log, la publicación y el reporte."""
+
+    def __init__(self, total=None):
+        self.total = total  # Registros a leer, si se conocen (para el ETA)
+        self.read = 0
+        self.skipped = 0
+        self.corrupt = 0
+        self.published = 0
+        self.bytes = 0
+        self.paused = 0.0  # Segundos esperando a que baje la cola vigilada
+        self.reconnects = 0
+        # Dónde retomar tras el último mensaje entregado: argumentos de
+        # log_messages/db_messages ({"start_line", "start_offset"} o {"after"})
+        self.position = None
+
+
+def region_shard(region, shards):
+    """Proceso al que le toca la región (crc32: estable entre procesos, a diferencia de hash())."""
+    return zlib.crc32(region.encode("utf-8")) % shards if isinstance(region, str) else 0
+
+
+def log_messages(log_path, stats, start_line=0, start_time=None, end_time=None, time_field="event", region=None,
+                 end_line=None, start_offset=None, end_offset=None, shard=None):
+    """
+    Genera (routing_key, cuerpo, epoch del evento) de los registros del log que
+    pasan los filtros, contando en `stats` los leídos, omitidos y corruptos.
+    Con `shard` = (número, total) deja solo las regiones que le tocan a ese
+    proceso (las demás no cuentan como omitidas: las publica otro).
+    Antes de cada mensaje deja en stats.position la línea siguiente (en el log
+    segmentado el ordinal ubica segmento y byte por su índice, y sobrevive a
+    que el segmento se archive) y, en el archivo único, también su byte.
+    """
+    offset = None
+    if not os.path.isdir(log_path):
+        if start_offset is None:
+            with open(log_path, "rb") as f:
+                start_offset = _line_offset(f, start_line, 1 << 20) if start_line else 0
+        offset = start_offset
+    records = read_log(log_path, start_line, start_time, end_time, time_field, region,
+                       end_line, start_offset, end_offset)
+    for index, line in records:
+        stats.read += 1
+        if offset is not None:
+            offset += len(line)
+        try:
+            entry = json.loads(line)
+        except json.JSONDecodeError:
+            if shard is None or shard[0] == 0:  # Con shard todos la leen: la informa solo el primero
+                stats.corrupt += 1
+                print(f" [!] Línea {index} corrupta, ignorando.")
+            continue
+        if shard is not None and region_shard(record_region(entry), shard[1]) != shard[0]:
+            continue
+        # El índice solo acota los bloques leídos; acá se filtra cada registro
+        event_time = record_time(entry, time_field)
+        # Si no podemos parsear la fecha, lo enviamos igual por seguridad
+        if event_time is not None and (
+            (start_time is not None and event_time < start_time)
+            or (end_time is not None and event_time > end_time)
+        ):
+            stats.skipped += 1
+            continue
+        if region is not None and record_region(entry) != region:
+            stats.skipped += 1
+            continue
+        stats.position = {"start_line": index + 1} if offset is None else \
+            {"start_line": index + 1, "start_offset": offset}
+        yield record_routing_key(entry), record_body(line, entry), event_time
+
+
+def event_body(row):
+    """
+    Cuerpo del evento original desde su fila de events_in (columnas de
+    exporter.EVENT_COLUMNS). El payload se copia tal cual, sin re-serializarlo;
+    run_id va en el cuerpo (audit lo lee de ahí con get_run_id) solo si no es "default".
+    """
+    event_id, timestamp, region, source, schema_version, correlation_id, run_id, payload_json = row
+    parts = [f'{{"event_id": {_encode(event_id)}, "timestamp": {_encode(timestamp)}, '
+             f'"region": {_encode(region)}, "source": {_encode(source)}']
+    if schema_version is not None:
+        parts.append(f', "schema_version": {_encode(schema_version)}')
+    if correlation_id is not None:
+        parts.append(f', "correlation_id": {_encode(correlation_id)}')
+    if run_id and run_id != "default":
+        parts.append(f', "run_id": {_encode(run_id)}')
+    parts.append(f', "payload": {payload_json}}}')
+    return "".join(parts).encode("utf-8")
+
+
+def _db_where(filters, after=None):
+    """WHERE de los filtros y, al retomar, solo lo posterior a `after` = (timestamp, event_id)."""
+    clauses, params = filters.event_where()
+    if after is not None:
+        clauses = " AND ".join(filter(None, (clauses, "(timestamp, event_id) > (?, ?)")))
+        params = params + list(after)
+    return f"WHERE {clauses}" if clauses else "", params
+
+
+def _db_days(filters, after=None):
+    first, last = filters.days()
+    if after is not None:
+        first = max(first or "", partitions.day_of(after[0], ""))
+    return first or None, last
+
+
+def _db_source_rows(conn, day, schema, filters, chunk_rows, stats, after=None):
+    """Filas de un esquema (y de su archivo de eventos, si lo tiene) en orden de (timestamp, event_id)."""
+    where, params = _db_where(filters, after)
+    sql = DB_EVENTS_SQL.format(schema=schema, where=where)
+    cursor = conn.execute(sql, params)
+    fresh = (row for chunk in iter(lambda: cursor.fetchmany(chunk_rows), []) for row in chunk)
+    events_archive = conn.partitions.archive(day, schema) if day is not None else None
+    if events_archive is None:
+        yield from fresh
+        return
+
+    def archived():
+        blocks = events_archive.select("timestamp", filters.start, filters.end, filters.region, filters.run_id)
+        for _, line in events_archive.iter_lines(blocks):
+            row = tuple(json.loads(line))
+            if filters.matches_event(row) and (after is None or (row[1], row[0]) > after):
+                yield row
+            else:
+                stats.read += 1  # Leído del bloque candidato pero fuera del filtro
+    # El archivo también está ordenado por (timestamp, event_id) (partitions.archive_partition)
+    yield from heapq.merge(fresh, archived(), key=lambda row: (row[1], row[0]))
+
+
+def db_rows(conn, filters, stats, chunk_rows=None, after=None):
+    """
+    Filas de events_in que cumplen los filtros (exporter.Filters), en orden
+    global de (timestamp, event_id): cada esquema se lee con un cursor por
+    índice y de a `chunk_rows` filas, y audit.db se mezcla con las particiones
+    diarias, que se recorren de a una en orden de día. Con `after` =
+    (timestamp, event_id) solo las posteriores (para retomar).
+    """
+    chunk_rows = chunk_rows or settings.EXPORT_CHUNK_ROWS
+    after = tuple(after) if after is not None else None
+    main_rows = _db_source_rows(conn, None, "main", filters, chunk_rows, stats, after)
+    reader = getattr(conn, "partitions", None)
+    if reader is None:
+        yield from main_rows
+        return
+
+    def partition_rows():
+        for day, schema in reader.schemas(reader.days(*_db_days(filters, after))):
+            yield from _db_source_rows(conn, day, schema, filters, chunk_rows, stats, after)
+    yield from heapq.merge(main_rows, partition_rows(), key=lambda row: (row[1], row[0]))
+
+
+def db_count(conn, filters, after=None):
+    """
+    Registros a leer para el ETA: los que cumplen los filtros en las bases (por
+    índice) más los de los bloques candidatos de los archivos de eventos.
+    """
+    where, params = _db_where(filters, after)
+    total = 0
+    for day, schema in queries._sources(conn, *_db_days(filters, after)):
+        total += conn.execute(DB_COUNT_SQL.format(schema=schema, where=where), params).fetchone()[0]
+        events_archive = conn.partitions.archive(day, schema) if day is not None else None
+        if events_archive is not None:
+            blocks = events_archive.select("timestamp", filters.start, filters.end, filters.region, filters.run_id)
+            total += sum(events_archive.blocks[number]["count"] for number in blocks)
+    return total
+
+
+def db_messages(db_path, stats, filters, partition_dir=None, shard=None, chunk_rows=None, after=None):
+    """
+    Genera (routing_key, cuerpo, epoch del evento) desde events_in: la routing
+    key es la fuente original del evento y el cuerpo se rearma de la fila.
+    Con `shard` deja solo las regiones de ese proceso (ver region_shard); la
+    posición de cada mensaje es su (timestamp, event_id) para retomar con `after`.
+    """
+    conn = queries.connect(db_path, partition_dir)
+    try:
+        for row in db_rows(conn, filters, stats, chunk_rows, after):
+            stats.read += 1
+            if shard is not None and region_shard(row[2], shard[1]) != shard[0]:
+                continue
+            stats.position = {"after": [row[1], row[0]]}
+            yield row[3], event_body(row), segments.parse_time(row[1])
+    finally:
+        conn.close()
+
+
+def source_messages(source, stats, bounds=None):
+    """
+    Mensajes de la fuente del replay acotados por `bounds` (una parte de
+    plan_partitions). `source` es {"kind": "log", "path", "start_line",
+    "filters"} o {"kind": "db", "path", "partition_dir", "filters": exporter.Filters}.
+    """
+    bounds = dict(bounds or {})
+    bounds.pop("total", None)
+    if source["kind"] == "db":
+        return db_messages(source["path"], stats, source["filters"], source.get("partition_dir"), **bounds)
+    arguments = {"start_line": source.get("start_line", 0), **source["filters"], **bounds}
+    return log_messages(source["path"], stats, **arguments)
+
+
+def source_state(source):
+    """La fuente en JSON, para guardarla en el checkpoint (los filtros de la base como Filters.as_dict)."""
+    state = dict(source)
+    if source["kind"] == "db":
+        state["filters"] = source["filters"].as_dict()
+    return state
+
+
+def state_source(state):
+    """Inversa de source_state."""
+    source = dict(state)
+    if source["kind"] == "db":
+        source["filters"] = exporter.Filters(**source["filters"])
+    return source
+
+
+def read_checkpoint(path):
+    """Estado guardado por Checkpoint (None si no hay)."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_checkpoint(path, state):
+    """Reemplazo atómico (archivo temporal + os.replace): un corte a medio escribir deja el anterior."""
+    temporary = f"{path}.tmp"
+    with open(temporary, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+class Checkpoint:
+    """
+    Guarda cada `interval` segundos en `path` el estado del replay (`state`:
+    fuente, exchange, ...) con la posición confirmada del publicador, y al
+    terminar si se llegó al final (`done`). Mientras no haya posición nueva
+    se conserva la anterior (p. ej. la del checkpoint desde el que se retomó).
+    """
+
+    def __init__(self, path, state, interval=5.0, clock=time.monotonic):
+        self.path = path
+        self.state = dict(state)
+        self.interval = interval
+        self.clock = clock
+        self._last = clock()
+
+    def maybe_save(self, position):
+        if self.clock() - self._last >= self.interval:
+            self.save(position)
+
+    def save(self, position, done=False):
+        if position is not None:
+            self.state["position"] = position
+        self.state["done"] = done
+        self.state["updated"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        write_checkpoint(self.path, self.state)
+        self._last = self.clock()
+
+
+def replay_properties(backfill=None, part=None):
+    """
+    Propiedades de los mensajes reinyectados. Con `backfill` (un run_id) el
+    aggregator los agrega aparte del tráfico en vivo y sus métricas quedan en
+    audit bajo ese run (ver aggregator/run_windows.py). `part` es el proceso
+    del replay paralelo: el aggregator sigue el avance en el tiempo de cada uno
+    para saber cuándo cerrar las ventanas del backfill.
+    """
+    headers = REPLAY_HEADERS
+    if backfill:
+        headers = dict(REPLAY_HEADERS, run_id=backfill)
+        if part is not None:
+            headers["x-replay-part"] = part
+    return pika.BasicProperties(delivery_mode=2, headers=headers)
+
+
+def backfill_run_id():
+    """run_id por defecto de un backfill: único por arranque y legible."""
+    return f"backfill-{time.strftime('%Y%m%dT%H%M%S')}"
+
+
+class ConfirmedPublisher:
+    """
+    Publica con confirmaciones del broker manteniendo hasta `window` mensajes
+    sin confirmar en vuelo, y vacía el buffer de salida cada `batch` mensajes
+    (una escritura al socket por lote).
+
+    BlockingChannel.confirm_delivery espera el ack de cada mensaje (un viaje
+    de ida y vuelta por publicación), así que se usa el canal subyacente de
+    pika con un callback de ack/nack: los acks múltiples liberan la ventana de
+    una vez y los nacks se vuelven a publicar.
+
+    `position` es la posición de retomar (ver ReplayStats.position) del último
+    mensaje confirmado con todos los anteriores también confirmados: lo que
+    haya después, en vuelo o reenviado por nack, se vuelve a publicar al retomar.
+    """
+
+    def __init__(self, connection, channel, exchange, window=1000, batch=100, properties=None):
+        self.connection = connection
+        self.exchange = exchange
+        self.window = max(1, window)
+        self.batch = max(1, batch)
+        self.properties = properties or replay_properties()
+        self._impl = channel._impl
+        self._unconfirmed = OrderedDict()  # delivery_tag -> (routing_key, cuerpo, [posición, confirmado])
+        self._positions = deque()  # Los [posición, confirmado] en orden de publicación
+        self._next_tag = 1
+        self._unflushed = 0
+        self.confirmed = 0
+        self.nacked = 0
+        self.position = None
+        selected = []
+        self._impl.confirm_delivery(self._on_confirm, callback=selected.append)
+        while not selected:
+            connection.process_data_events(time_limit=0.1)
+
+    @property
+    def in_flight(self):
+        return len(self._unconfirmed)
+
+    def _on_confirm(self, frame):
+        method = frame.method
+        if method.multiple:
+            tags = []
+            for tag in self._unconfirmed:
+                if tag > method.delivery_tag:
+                    break
+                tags.append(tag)
+        else:
+            tags = [method.delivery_tag] if method.delivery_tag in self._unconfirmed else []
+        messages = [self._unconfirmed.pop(tag) for tag in tags]
+        if isinstance(method, pika.spec.Basic.Nack):
+            self.nacked += len(messages)
+            for message in messages:
+                self._send(*message)
+            return
+        self.confirmed += len(messages)
+        for _, _, entry in messages:
+            entry[1] = True
+        positions = self._positions
+        while positions and positions[0][1]:
+            position = positions.popleft()[0]
+            if position is not None:
+                self.position = position
+
+    def _send(self, routing_key, body, entry):
+        self._impl.basic_publish(self.exchange, routing_key, body, self.properties)
+        self._unconfirmed[self._next_tag] = (routing_key, body, entry)
+        self._next_tag += 1
+        self._unflushed += 1
+
+    def publish(self, routing_key, body, position=None):
+        """
+        Publica un mensaje; si la ventana está llena, espera confirmaciones antes.
+        `position` es dónde retomar una vez confirmado este mensaje.
+        """
+        while len(self._unconfirmed) >= self.window:
+            self._unflushed = 0
+            self.connection.process_data_events(time_limit=0.001)
+        entry = [position, False]
+        self._positions.append(entry)
+        self._send(routing_key, body, entry)
+        if self._unflushed >= self.batch:
+            self._unflushed = 0
+            self.connection.process_data_events(time_limit=0)
+
+    def sleep(self, seconds):
+        """Espera atendiendo la conexión (confirmaciones y heartbeats) en vez de time.sleep."""
+        deadline = time.monotonic() + seconds
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            self._unflushed = 0
+            self.connection.process_data_events(time_limit=min(remaining, 0.05))
+
+    def flush(self, timeout=None):
+        """Espera a que el broker confirme todo lo publicado; True si no queda nada en vuelo."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._unconfirmed and (deadline is None or time.monotonic() < deadline):
+            self._unflushed = 0
+            self.connection.process_data_events(time_limit=0.01)
+        return not self._unconfirmed
+
+
+class Throttle:
+    """
+    Ritmo de publicación: como máximo `max_rate` mensajes/s (None o 0 = sin
+    límite) y, con `speed`, los intervalos originales entre eventos divididos
+    por `speed` (1.0 = tiempo real, 10.0 = diez veces más rápido).
+
+    Ambos se llevan como un horario virtual desde el primer mensaje, así que
+    solo se duerme cuando el adelanto supera `min_sleep`: dormir por mensaje
+    no escala a miles de mensajes por segundo y el error no se acumula.
+    Los procesos de un replay paralelo comparten `started` y `first_event`
+    para seguir el mismo horario.
+    """
+
+    def __init__(self, max_rate=None, speed=None, sleep=time.sleep, clock=time.monotonic, min_sleep=0.002,
+                 started=None, first_event=None):
+        self.max_rate = max_rate or None
+        self.speed = speed or None
+        self.sleep = sleep
+        self.clock = clock
+        self.min_sleep = min_sleep
+        self.started = started
+        self.first_event = first_event
+        self.sent = 0
+
+    def shift(self, seconds):
+        """Corre el horario (p. ej. tras una pausa por la cola) para no recuperarla en ráfaga."""
+        if self.started is not None:
+            self.started += seconds
+
+    def wait(self, event_time=None):
+        """Espera hasta el turno del próximo mensaje; `event_time` es el epoch original del evento."""
+        now = self.clock()
+        if self.started is None:
+            self.started = now
+        target = now
+        if self.max_rate:
+            target = max(target, self.started + self.sent / self.max_rate)
+        if self.speed and event_time is not None:
+            if self.first_event is None:
+                self.first_event = event_time
+            # Los eventos desordenados (anteriores al primero) salen sin esperar
+            target = max(target, self.started + (event_time - self.first_event) / self.speed)
+        self.sent += 1
+        if target - now >= self.min_sleep:
+            self.sleep(target - now)
+
+
+class BacklogGate:
+    """
+    Publicación "tan rápido como los consumidores aguanten": cada
+    `check_interval` segundos consulta (declare pasivo) la profundidad de
+    `queue` y, mientras supere `max_backlog`, pausa la publicación.
+    """
+
+    def __init__(self, channel, queue, max_backlog, check_interval=0.5, sleep=time.sleep, clock=time.monotonic):
+        self.channel = channel
+        self.queue = queue
+        self.max_backlog = max_backlog
+        self.check_interval = check_interval
+        self.sleep = sleep
+        self.clock = clock
+        self._last_check = None
+
+    def depth(self):
+        return self.channel.queue_declare(queue=self.queue, passive=True).method.message_count
+
+    def wait(self):
+        """Segundos que se estuvo en pausa (0 si la cola está bajo el límite o no tocaba consultar)."""
+        if self._last_check is not None and self.clock() - self._last_check < self.check_interval:
+            return 0.0
+        paused = 0.0
+        while self.depth() > self.max_backlog:
+            self.sleep(self.check_interval)
+            paused += self.check_interval
+        self._last_check = self.clock()
+        return paused
+
+
+def format_duration(seconds):
+    """HH:MM:SS (o MM:SS si dura menos de una hora)."""
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    return f"{hours}:{rest // 60:02d}:{rest % 60:02d}" if hours else f"{rest // 60:02d}:{rest % 60:02d}"
+
+
+class Progress:
+    """Reporte cada `interval` segundos de ritmo, ETA y bytes, en vez de una línea por evento."""
+
+    def __init__(self, stats, interval=5.0, clock=time.monotonic, out=print):
+        self.stats = stats
+        self.interval = interval
+        self.clock = clock
+        self.out = out
+        self.started = clock()
+        self._last = (self.started, 0, 0)  # (instante, publicados, bytes) del reporte anterior
+
+    def maybe_report(self, in_flight=0):
+        if self.interval and self.clock() - self._last[0] >= self.interval:
+            self.report(in_flight)
+
+    def report(self, in_flight=0):
+        stats = self.stats
+        now = self.clock()
+        last_time, last_published, last_bytes = self._last
+        window = max(now - last_time, 1e-9)
+        rate = (stats.published - last_published) / window
+        byte_rate = (stats.bytes - last_bytes) / window
+        self._last = (now, stats.published, stats.bytes)
+
+        done = f"{stats.published:,}"
+        eta = ""
+        if stats.total:
+            done += f" ({min(stats.read / stats.total, 1.0):.1%} leído)"
+            elapsed = now - self.started
+            if stats.read and elapsed > 0:
+                eta = f" | ETA {format_duration((stats.total - stats.read) * elapsed / stats.read)}"
+        self.out(f" [Replay] {done} | {rate:,.0f} msg/s | {byte_rate / 1e6:,.2f} MB/s | "
+                 f"{stats.bytes / 1e6:,.1f} MB | en vuelo {in_flight}{eta}")
+
+
+def replay(messages, publisher, throttle=None, gate=None, progress=None, stats=None, checkpoint=None):
+    """
+    Publica los (routing_key, cuerpo, epoch) de `messages` con el ritmo de
+    `throttle`, la pausa de `gate` y el reporte de `progress`, y espera las
+    confirmaciones pendientes al terminar. Con `checkpoint` guarda cada tanto
+    la posición confirmada y, al salir (aunque sea por error), la última.
+    """
+    stats = stats if stats is not None else ReplayStats()
+    finished = False
+    try:
+        for routing_key, body, event_time in messages:
+            if gate is not None:
+                paused = gate.wait()
+                if paused:
+                    stats.paused += paused
+                    if throttle is not None:
+                        throttle.shift(paused)
+            if throttle is not None:
+                throttle.wait(event_time)
+            publisher.publish(routing_key, body, stats.position)
+            stats.published += 1
+            stats.bytes += len(body)
+            if progress is not None:
+                progress.maybe_report(publisher.in_flight)
+            if checkpoint is not None:
+                checkpoint.maybe_save(publisher.position)
+        finished = True
+    finally:
+        try:
+            publisher.flush()
+        finally:
+            if checkpoint is not None:
+                checkpoint.save(publisher.position, done=finished and not publisher.in_flight)
+    return stats
+
+
+class SharedProgress:
+    """
+    Progreso de un proceso de un replay paralelo: copia sus contadores a su
+    fila de un arreglo compartido cada `interval` segundos; el proceso padre
+    las suma en un único reporte.
+    """
+
+    FIELDS = ("total", "read", "skipped", "corrupt", "published", "bytes", "paused", "reconnects", "in_flight",
+              "confirmed", "nacked")
+
+    def __init__(self, stats, shared, worker, interval=0.2, clock=time.monotonic):
+        self.stats = stats
+        self.shared = shared
+        self.offset = worker * len(self.FIELDS)
+        self.interval = interval
+        self.clock = clock
+        self.publisher = None
+        self._last = clock()
+
+    def maybe_report(self, in_flight=0):
+        if self.clock() - self._last >= self.interval:
+            self.report(in_flight)
+
+    def report(self, in_flight=0):
+        stats, publisher = self.stats, self.publisher
+        self.shared[self.offset:self.offset + len(self.FIELDS)] = [
+            stats.total or 0, stats.read, stats.skipped, stats.corrupt, stats.published, stats.bytes, stats.paused,
+            stats.reconnects, in_flight, publisher.confirmed if publisher else 0, publisher.nacked if publisher else 0,
+        ]
+        self._last = self.clock()
+
+    @classmethod
+    def merge(cls, shared, workers, stats):
+        """Suma las filas de `workers` procesos en `stats`; retorna (en vuelo, confirmados, nacks)."""
+        width = len(cls.FIELDS)
+        values = {
+            name: sum(shared[worker * width + field] for worker in range(workers))
+            for field, name in enumerate(cls.FIELDS)
+        }
+        stats.total = int(values["total"]) or None
+        for name in ("read", "skipped", "corrupt", "published", "bytes", "reconnects"):
+            setattr(stats, name, int(values[name]))
+        stats.paused = values["paused"]
+        return int(values["in_flight"]), int(values["confirmed"]), int(values["nacked"])
+
+
+def plan_partitions(log_path, workers, partition="range", start_line=0, start_time=None, end_time=None,
+                    time_field="event"):
+    """
+    Reparte el replay entre `workers` procesos. Retorna, por proceso, los
+    argumentos de log_messages que acotan su parte más `total` (registros a
+    leer, None si no se conoce):
+
+      - "range":  tramos contiguos de ordinales (log segmentado, dentro de los
+                  segmentos que el índice de tiempo no descarta) o de bytes
+                  cortados en inicio de línea (archivo único). Entre tramos
+                  no se conserva el orden.
+      - "region": cada proceso lee todo el rango y publica solo sus regiones,
+                  así cada región sale de un único proceso y en orden.
+    """
+    if partition not in PARTITION_MODES:
+        raise ValueError(f"Partición desconocida: {partition}")
+    segmented = os.path.isdir(log_path)
+    if segmented:
+        low, high = _ordinal_range(log_path, start_line, start_time, end_time, time_field)
+    if partition == "region":
+        total = high - low if segmented else None
+        return [{"start_line": start_line, "shard": (worker, workers), "total": total} for worker in range(workers)]
+    if segmented:
+        cuts = [low + (high - low) * worker // workers for worker in range(workers + 1)]
+        # El último tramo queda abierto: también publica lo que se escriba mientras corre
+        return [{"start_line": cuts[worker], "end_line": cuts[worker + 1] if worker < workers - 1 else None,
+                 "total": cuts[worker + 1] - cuts[worker]} for worker in range(workers)]
+    cuts = line_cuts(log_path, start_line, workers)
+    return [{"start_line": cuts[worker][0], "start_offset": cuts[worker][1],
+             "end_offset": cuts[worker + 1][1] if worker < workers - 1 else None, "total": None}
+            for worker in range(workers)]
+
+
+def _ordinal_range(directory, start_line, start_time, end_time, time_field):
+    """[primer, último + 1) ordinal de los segmentos que pueden tener registros del rango de tiempo."""
+    high = segments.next_ordinal(directory)
+    if start_time is None and end_time is None:
+        return min(start_line, high), high
+    found = segments.list_segments(directory)
+    matching = []
+    for number, (_, path) in enumerate(found):
+        low_time, high_time = segments.segment_time_range(path, time_field)
+        if not ((start_time is not None and high_time < start_time) or (end_time is not None and low_time > end_time)):
+            matching.append(number)
+    if not matching:
+        return start_line, start_line
+    last = matching[-1] + 1
+    end = found[last][0] if last < len(found) else high
+    return min(max(start_line, found[matching[0]][0]), end), end
+
+
+def open_publisher(exchange, max_rate=None, speed=None, confirm_window=1000, watch_queue=None, max_backlog=0,
+                   started=None, first_event=None, backfill=None, part=None):
+    """Conexión propia con su publicador confirmado, su ritmo y (opcional) la cola vigilada."""
+    connection, channel = connect()
+    publisher = ConfirmedPublisher(connection, channel, exchange, window=confirm_window,
+                                   batch=settings.REPLAY_PUBLISH_BATCH, properties=replay_properties(backfill, part))
+    throttle = Throttle(max_rate, speed, sleep=publisher.sleep, started=started, first_event=first_event)
+    gate = BacklogGate(channel, watch_queue, max_backlog, sleep=publisher.sleep) if watch_queue else None
+    return connection, publisher, throttle, gate
+
+
+def replay_resilient(source, stats, bounds=None, options=None, progress=None, checkpoint=None, retries=None,
+                     backoff=None, max_backoff=None, sleep=time.sleep):
+    """
+    replay() de `source` acotada por `bounds` (ver source_messages) que
+    sobrevive a caídas del broker: ante un error de conexión o de canal
+    reconecta con backoff exponencial (`backoff`, el doble, ... hasta
+    `max_backoff`) y retoma desde la posición confirmada, así solo se reenvía
+    lo que estaba en vuelo. Tras `retries` fallos seguidos sin confirmar nada
+    se rinde (0 = sin límite). Retorna el último publicador; sus contadores
+    suman los de todas las conexiones.
+    """
+    bounds = dict(bounds or {})
+    retries = settings.REPLAY_RECONNECT_RETRIES if retries is None else retries
+    backoff = settings.REPLAY_RECONNECT_BACKOFF if backoff is None else backoff
+    max_backoff = settings.REPLAY_RECONNECT_MAX_BACKOFF if max_backoff is None else max_backoff
+    publisher = throttle = None
+    failures = 0
+    while True:
+        try:
+            connection, fresh, fresh_throttle, gate = open_publisher(**(options or {}))
+        except RECONNECT_ERRORS as e:
+            error = e
+        else:
+            if publisher is not None:
+                fresh.confirmed, fresh.nacked = publisher.confirmed, publisher.nacked
+            publisher = fresh
+            if throttle is None:
+                throttle = fresh_throttle
+            else:
+                throttle.sleep = publisher.sleep  # Conserva el horario (ritmo y --speed)
+            if isinstance(progress, SharedProgress):
+                progress.publisher = publisher
+            try:
+                replay(source_messages(source, stats, bounds), publisher, throttle, gate, progress, stats, checkpoint)
+                return publisher
+            except RECONNECT_ERRORS as e:
+                error = e
+            finally:
+                try:
+                    connection.close()
+                except Exception:
+                    pass
+            if publisher.position is not None:
+                bounds.update(publisher.position)
+                failures = 0  # Avanzó algo: el backoff vuelve a empezar
+        failures += 1
+        if retries and failures > retries:
+            raise error
+        wait = min(backoff * 2 ** (failures - 1), max_backoff)
+        stats.reconnects += 1
+        print(f" [!] Conexión con RabbitMQ perdida: {error}. Reintentando en {wait:.1f}s "
+              f"(intento {failures}{f'/{retries}' if retries else ''})...")
+        sleep(wait)
+        if throttle is not None:
+            throttle.shift(wait)
+
+
+def _replay_worker(worker, shared, source, bounds, options, checkpoint=None):
+    """Proceso de un replay paralelo: publica su parte con su propia conexión."""
+    stats = ReplayStats(bounds.get("total"))
+    progress = SharedProgress(stats, shared, worker)
+    try:
+        replay_resilient(source, stats, bounds, dict(options, part=worker), progress, checkpoint)
+    except KeyboardInterrupt:
+        pass  # replay ya esperó las confirmaciones y guardó el checkpoint; el padre informa
+    finally:
+        progress.report(progress.publisher.in_flight if progress.publisher else 0)
+
+
+def plan_source(source, workers, partition="range"):
+    """
+    Partes de plan_partitions para la fuente (ver source_messages). La base se
+    reparte siempre por región: cada proceso lee la selección por índice y
+    publica solo sus regiones, en orden.
+    """
+    if source["kind"] == "db":
+        conn = queries.connect(source["path"], source.get("partition_dir"))
+        try:
+            total = db_count(conn, source["filters"])
+        finally:
+            conn.close()
+        return [{"shard": (worker, workers), "total": total} for worker in range(workers)]
+    filters = source["filters"]
+    return plan_partitions(source["path"], workers, partition, source.get("start_line", 0),
+                           filters["start_time"], filters["end_time"], filters["time_field"])
+
+
+def part_path(checkpoint_path, worker):
+    """Checkpoint propio de cada proceso de un replay paralelo."""
+    return f"{checkpoint_path}.{worker}"
+
+
+def replay_parallel(source, workers, partition, options, progress_interval=5.0, checkpoint_path=None,
+                    resume=None):
+    """
+    Replay con `workers` procesos (uno por parte de plan_source), cada uno con
+    su conexión. El ritmo máximo se reparte entre ellos y `speed` usa un
+    horario común. Con `checkpoint_path` guarda el reparto y cada proceso su
+    posición en part_path(); con `resume` (el estado guardado) se repite el
+    mismo reparto y cada proceso sigue desde la suya, o no arranca si ya
+    terminó. Retorna (stats sumadas, confirmados, nacks, procesos con error).
+    """
+    if resume is not None:
+        plans = resume["plans"]
+        workers = len(plans)
+    else:
+        plans = plan_source(source, workers, partition)
+        if checkpoint_path:
+            write_checkpoint(checkpoint_path, {"source": source_state(source), "exchange": options["exchange"],
+                                               "backfill": options.get("backfill"), "partition": partition,
+                                               "plans": plans})
+    parts = []
+    for worker, plan in enumerate(plans):
+        part = {"worker": worker, "position": None, "done": False}
+        if resume is not None:
+            part = read_checkpoint(part_path(checkpoint_path, worker)) or part
+        elif checkpoint_path:
+            write_checkpoint(part_path(checkpoint_path, worker), part)  # Pisa las de un replay anterior
+        parts.append(part)
+    bounds = [dict(plan, **(part["position"] or {})) for plan, part in zip(plans, parts)]
+
+    options = dict(options)
+    if options.get("max_rate"):
+        options["max_rate"] = options["max_rate"] / workers
+    if options.get("speed"):
+        firsts = [next(source_messages(source, ReplayStats(), part_bounds), None) for part_bounds in bounds]
+        times = [first[2] for first in firsts if first and first[2] is not None]
+        options["first_event"] = min(times) if times else None
+        options["started"] = time.monotonic()  # CLOCK_MONOTONIC es común a todos los procesos
+
+    shared = multiprocessing.RawArray("d", workers * len(SharedProgress.FIELDS))
+    processes = [
+        multiprocessing.Process(target=_replay_worker, name=f"replay-{worker}", args=(
+            worker, shared, source, bounds[worker], options,
+            Checkpoint(part_path(checkpoint_path, worker), parts[worker], settings.REPLAY_CHECKPOINT_INTERVAL)
+            if checkpoint_path else None))
+        for worker in range(workers) if not parts[worker].get("done")
+    ]
+    for process in processes:
+        process.start()
+
+    stats = ReplayStats()
+    progress = Progress(stats, progress_interval)
+    try:
+        for process in processes:
+            while process.is_alive():
+                process.join(timeout=0.5)
+                in_flight, _, _ = SharedProgress.merge(shared, workers, stats)
+                progress.maybe_report(in_flight)
+    except KeyboardInterrupt:
+        print("\n[!] Replay detenido por el usuario; esperando a los procesos...")
+        for process in processes:
+            process.join()
+    in_flight, confirmed, nacked = SharedProgress.merge(shared, workers, stats)
+    progress.report(in_flight)
+    failed = [process.name for process in processes if process.exitcode != 0]
+    return stats, confirmed, nacked, failed
+
+
+def print_summary(stats, confirmed, nacked, elapsed):
+    print("-" * 50)
+    print(f"RESUMEN: Reinyectados: {stats.published} | Confirmados: {confirmed} | "
+          f"Reenviados por nack: {nacked} | Omitidos por filtro: {stats.skipped} | "
+          f"Corruptos: {stats.corrupt}{f' | Reconexiones: {stats.reconnects}' if stats.reconnects else ''}")
+    print(f"         {stats.bytes / 1e6:,.1f} MB en {format_duration(elapsed)} "
+          f"({stats.published / max(elapsed, 1e-9):,.0f} msg/s, en pausa {stats.paused:.1f} s)")
+
+
+def print_backfill_hint(backfill):
+    if backfill:
+        print(f"[*] Comparar con el run en vivo cuando el aggregator cierre sus ventanas: "
+              f"queries.py compare {backfill}")
+
+
+def source_total(source, bounds=None):
+    """Registros a leer para el ETA en un solo proceso (None si no se conoce barato)."""
+    bounds = bounds or {}
+    if source["kind"] == "db":
+        conn = queries.connect(source["path"], source.get("partition_dir"))
+        try:
+            return db_count(conn, source["filters"], bounds.get("after"))
+        finally:
+            conn.close()
+    # En el log solo se conoce barato con el log segmentado
+    if os.path.isdir(source["path"]):
+        return max(0, segments.next_ordinal(source["path"]) - bounds.get("start_line", source.get("start_line", 0)))
+    return None
+
+
+def checkpoint_done(checkpoint_path, state):
+    """True si el replay del checkpoint llegó al final (en paralelo, todos sus procesos)."""
+    if "plans" not in state:
+        return bool(state.get("done"))
+    return all((read_checkpoint(part_path(checkpoint_path, worker)) or {}).get("done")
+               for worker in range(len(state["plans"])))
+
+
+def replay_events(start_line=0, start_time_iso=None, target_exchange=None, end_time_iso=None, time_field="event",
+                  region=None, max_rate=None, speed=None, confirm_window=None, watch_queue=None, max_backlog=None,
+                  progress_interval=None, parallel=None, partition=None, input_kind="log", source=None, run_id=None,
+                  db_path=None, partition_dir=None, resume=False, checkpoint_path=None, backfill=None):
+    checkpoint_path = settings.REPLAY_CHECKPOINT_PATH if checkpoint_path is None else checkpoint_path
+    resumed = None
+    if resume:
+        # La fuente, los filtros, el exchange y el reparto salen del checkpoint
+        resumed = read_checkpoint(checkpoint_path) if checkpoint_path else None
+        if resumed is None:
+            print(f"[!] Error: No hay checkpoint para retomar en: {checkpoint_path or '(REPLAY_CHECKPOINT_PATH vacío)'}")
+            return
+        if checkpoint_done(checkpoint_path, resumed):
+            print(f"[*] El replay de {checkpoint_path} ya había terminado; nada que retomar.")
+            return
+        replay_source = state_source(resumed["source"])
+        log_path = replay_source["path"]
+        target_exchange = resumed["exchange"]
+        backfill = resumed.get("backfill")  # Sigue el mismo run
+        parallel = len(resumed["plans"]) if "plans" in resumed else 1
+        partition = resumed.get("partition")
+    elif input_kind == "db":
+        # Replay desde events_in: selección por índice, sin recorrer el log
+        log_path = db_path or settings.AUDIT_DB_PATH
+        if time_field != "event":
+            print("[!] Error: con --input db solo se filtra por el timestamp del evento (--time-field event)")
+            return
+        if start_line:
+            print("[!] Error: --offset es una línea del log; con --input db usa --timestamp/--until")
+            return
+    else:
+        # 1. Usamos la ruta definida en tu settings.py (el directorio de segmentos si existe)
+        log_path = settings.LOG_FILE_PATH
+        if segments.list_segments(settings.LOG_SEGMENT_DIR):
+            log_path = settings.LOG_SEGMENT_DIR
+        if source or run_id:
+            print("[!] Error: --source y --run-id requieren --input db (el log no los indexa)")
+            return
+
     if not os.path.exists(log_path):
-        print(f"[!] ERROR: No existe el archivo de log en: {log_path}")
+        kind = replay_source["kind"] if resumed else input_kind
+        print(f"[!] ERROR: No existe {'la base' if kind == 'db' else 'el archivo de log'} en: {log_path}")
         print("    ¿Has generado tráfico primero? (run_load.sh / run_burst.sh)")
         return
 
     # Si no nos dicen a dónde enviar, usamos el mismo exchange que auditamos
     # (Esto hará que el Aggregator vuelva a recibir los mensajes)
     exchange_to_publish = target_exchange if target_exchange else settings.TARGET_EXCHANGE
+    max_rate = settings.REPLAY_MAX_RATE if max_rate is None else max_rate
+    speed = settings.REPLAY_SPEED if speed is None else speed
+    confirm_window = settings.REPLAY_CONFIRM_WINDOW if confirm_window is None else confirm_window
+    watch_queue = settings.REPLAY_WATCH_QUEUE if watch_queue is None else watch_queue
+    max_backlog = settings.REPLAY_MAX_BACKLOG if max_backlog is None else max_backlog
+    progress_interval = settings.REPLAY_PROGRESS_INTERVAL if progress_interval is None else progress_interval
+    parallel = max(1, settings.REPLAY_PARALLEL if parallel is None else parallel)
+    partition = settings.REPLAY_PARTITION if partition is None else partition
 
-    connection, channel = connect()
-    
-    print(f"[*] INICIANDO REPLAY")
-    print(f"    -> Fuente: {log_path}")
-    print(f"    -> Destino (Exchange): {exchange_to_publish}")
-    print(f"    -> Offset (Línea): >= {start_line}")
-    print(f"    -> Filtro Tiempo: >= {start_time_iso if start_time_iso else 'Todo el historial'}")
-    print("-" * 50)
+    if backfill == "":
+        backfill = backfill_run_id()
 
-    replayed_count = 0
-    skipped_count = 0
-    
-    # Preparamos filtro de fecha
-    start_dt = None
-    if start_time_iso:
-        try:
-            start_dt = datetime.fromisoformat(start_time_iso)
-        except ValueError:
+    if resumed is None:
+        # Preparamos filtro de fecha (epoch; sin zona horaria = hora local)
+        start_time = segments.parse_time(start_time_iso) if start_time_iso else None
+        end_time = segments.parse_time(end_time_iso) if end_time_iso else None
+        if (start_time_iso and start_time is None) or (end_time_iso and end_time is None):
             print("[!] Error: Formato de fecha inválido. Usa formato ISO (ej: 2026-01-30T10:00:00)")
             return
+        if input_kind == "db":
+            # En la base el timestamp se compara como texto ISO, igual que en las consultas de la API
+            replay_source = {"kind": "db", "path": log_path, "partition_dir": partition_dir,
+                             "filters": exporter.Filters(start_time_iso, end_time_iso, region, source, run_id)}
+        else:
+            replay_source = {"kind": "log", "path": log_path, "start_line": start_line,
+                             "filters": {"start_time": start_time, "end_time": end_time, "time_field": time_field,
+                                         "region": region}}
 
-    try:
-        with open(log_path, 'r') as f:
-            for index, line in enumerate(f):
-                # --- LÓGICA DE REPLAY (Cumple Requisitos) ---
+    print(f"[*] {'RETOMANDO' if resumed else 'INICIANDO'} REPLAY")
+    print(f"    -> Fuente: {log_path}")
+    print(f"    -> Destino (Exchange): {exchange_to_publish}")
+    if backfill:
+        print(f"    -> Backfill: run {backfill} (ventanas y métricas aparte del tráfico en vivo)")
+    if resumed is not None:
+        filters = replay_source["filters"]
+        filters = filters.as_dict() if replay_source["kind"] == "db" else \
+            {key: value for key, value in filters.items() if value is not None}
+        print(f"    -> Checkpoint: {checkpoint_path} (guardado {resumed.get('updated', '-')})")
+        print(f"    -> Desde: {resumed.get('position') or 'el inicio de cada parte'} | Filtros: {filters or 'ninguno'}")
+    else:
+        if input_kind == "log":
+            print(f"    -> Offset (Línea): >= {start_line}")
+        print(f"    -> Filtro Tiempo ({time_field}): >= {start_time_iso if start_time_iso else 'Todo el historial'}")
+        if end_time_iso:
+            print(f"    -> Hasta: <= {end_time_iso}")
+        if region:
+            print(f"    -> Región: {region}")
+        if source:
+            print(f"    -> Fuente del evento: {source}")
+        if run_id:
+            print(f"    -> Run: {run_id}")
+    print(f"    -> Ritmo: {f'{max_rate:,.0f} msg/s máx.' if max_rate else 'sin límite'}"
+          f"{f', velocidad x{speed:g} del original' if speed else ''}"
+          f"{f', pausa si {watch_queue} supera {max_backlog:,}' if watch_queue else ''}")
+    if parallel > 1:
+        print(f"    -> Paralelo: {parallel} procesos, partición por "
+              f"{'region' if replay_source['kind'] == 'db' else partition}")
+    print("-" * 50)
 
-                # 1. Filtro por Offset (Posición/Línea)
-                if index < start_line:
-                    continue
+    options = {"exchange": exchange_to_publish, "max_rate": max_rate, "speed": speed,
+               "confirm_window": confirm_window, "watch_queue": watch_queue, "max_backlog": max_backlog,
+               "backfill": backfill}
+    started = time.monotonic()
+    if parallel > 1:
+        stats, confirmed, nacked, failed = replay_parallel(replay_source, parallel, partition, options,
+                                                           progress_interval, checkpoint_path or None, resumed)
+        if failed:
+            print(f"[!] Procesos con error: {', '.join(failed)} (su parte puede haber quedado incompleta)")
+        print_summary(stats, confirmed, nacked, time.monotonic() - started)
+        print_backfill_hint(backfill)
+        if checkpoint_path and not checkpoint_done(checkpoint_path, read_checkpoint(checkpoint_path)):
+            print(f"[*] Para seguir desde lo confirmado: replay.py --resume (checkpoint {checkpoint_path})")
+        return
 
-                try:
-                    event = json.loads(line)
-                    
-                    # 2. Filtro por Tiempo (Point-in-time recovery)
-                    if start_dt:
-                        # Buscamos el timestamp dentro del evento o del log
-                        # Asumimos que tu log tiene un campo "timestamp" o el evento lo tiene
-                        ts_str = event.get('timestamp') or event.get('original_event', {}).get('timestamp')
-                        
-                        if ts_str:
-                            try:
-                                # A veces vienen con milisegundos, cortamos lo extra si falla
-                                event_dt = datetime.fromisoformat(ts_str)
-                                if event_dt < start_dt:
-                                    skipped_count += 1
-                                    continue
-                            except ValueError:
-                                pass # Si no podemos parsear la fecha, lo enviamos igual por seguridad
-
-                    # 3. Re-inyección (Publicar)
-                    # Usamos el routing_key original para que llegue a la cola correcta (norte/sur/etc)
-                    routing_key = event.get('routing_key', 'replay.unknown')
-                    
-                    # Limpieza: Si el log tiene metadatos extra del audit, enviamos solo el evento original
-                    # Si tu log guarda el evento tal cual, enviamos 'event'.
-                    payload = event.get('original_event', event) 
-
-                    channel.basic_publish(
-                        exchange=settings.TARGET_EXCHANGE,
-                        routing_key=routing_key,
-                        body=json.dumps(payload),
-                        properties=pika.BasicProperties(
-                            delivery_mode=2, 
-                            headers={"x-replay": "true"} # Marcamos que es un replay (opcional pero pro)
-                        )
-                    )
-                    
-                    replayed_count += 1
-                    # Pequeño sleep para efecto visual en la demo
-                    time.sleep(0.05) 
-                    print(f" [Replay] Línea {index} -> Enviado a {routing_key}")
-
-                except json.JSONDecodeError:
-                    print(f" [!] Línea {index} corrupta, ignorando.")
+    bounds = (resumed or {}).get("position") or {}
+    stats = ReplayStats(source_total(replay_source, bounds))
+    checkpoint = None
+    if checkpoint_path:
+        state = resumed or {"source": source_state(replay_source), "exchange": exchange_to_publish,
+                            "backfill": backfill}
+        checkpoint = Checkpoint(checkpoint_path, state, settings.REPLAY_CHECKPOINT_INTERVAL)
+        if resumed is None:
+            checkpoint.save(None)  # Pisa el de un replay anterior antes de publicar
 
+    progress = Progress(stats, progress_interval)
+    publisher = None
+    try:
+        publisher = replay_resilient(replay_source, stats, bounds, options, progress, checkpoint)
     except KeyboardInterrupt:
         print("\n[!] Replay detenido por el usuario.")
+    except RECONNECT_ERRORS as e:
+        print(f"[!] RabbitMQ no volvió tras {settings.REPLAY_RECONNECT_RETRIES} intentos: {e}")
     finally:
-        connection.close()
-        print("-" * 50)
-        print(f"RESUMEN: Reinyectados: {replayed_count} | Omitidos por fecha: {skipped_count}")
+        progress.report(publisher.in_flight if publisher else 0)
+        print_summary(stats, publisher.confirmed if publisher else 0, publisher.nacked if publisher else 0,
+                      time.monotonic() - started)
+        print_backfill_hint(backfill)
+        if checkpoint is not None and not checkpoint.state.get("done"):
+            print(f"[*] Para seguir desde lo confirmado: replay.py --resume (checkpoint {checkpoint_path})")
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Herramienta de Replay de Eventos')
     parser.add_argument('--offset', type=int, default=0, help='Saltar las primeras N líneas (Offset)')
     parser.add_argument('--timestamp', type=str, default=None, help='Fecha ISO de inicio (YYYY-MM-DDTHH:MM:SS)')
+    parser.add_argument('--until', type=str, default=None, help='Fecha ISO de término, inclusive (Opcional)')
+    parser.add_argument('--time-field', choices=segments.TIME_FIELDS, default='event',
+                        help='Timestamp a filtrar: el del evento o el de auditoría')
+    parser.add_argument('--region', type=str, default=None, help='Solo eventos de esta región (Opcional)')
     parser.add_argument('--exchange', type=str, default=None, help='Exchange destino (Opcional)')
-    
+    parser.add_argument('--rate', type=float, default=None, help='Máximo de mensajes por segundo (0 = sin límite)')
+    parser.add_argument('--speed', type=float, default=None,
+                        help='Respeta los intervalos originales entre eventos, acelerados N veces (0 = no)')
+    parser.add_argument('--confirm-window', type=int, default=None, help='Mensajes sin confirmar en vuelo')
+    parser.add_argument('--watch-queue', type=str, default=None,
+                        help='Cola de los consumidores a vigilar (ej: aggregator_queue)')
+    parser.add_argument('--max-backlog', type=int, default=None,
+                        help='Pausa mientras la cola vigilada tenga más mensajes que esto')
+    parser.add_argument('--progress-interval', type=float, default=None, help='Segundos entre reportes de avance')
+    parser.add_argument('--parallel', type=int, default=None, help='Procesos publicadores, cada uno con su conexión')
+    parser.add_argument('--partition', choices=PARTITION_MODES, default=None,
+                        help='Reparto entre procesos: tramos del log (range) o regiones (region, conserva su orden)')
+    parser.add_argument('--input', choices=INPUTS, default='log',
+                        help='Fuente: el log de auditoría o events_in de la base (db, por índices)')
+    parser.add_argument('--source', type=str, default=None, help='Solo eventos de esta fuente (requiere --input db)')
+    parser.add_argument('--run-id', type=str, default=None, help='Solo eventos de este run (requiere --input db)')
+    parser.add_argument('--db', type=str, default=None, help='Base a leer con --input db (por defecto AUDIT_DB_PATH)')
+    parser.add_argument('--resume', action='store_true',
+                        help='Retoma el replay del checkpoint desde lo confirmado (misma fuente, filtros y reparto)')
+    parser.add_argument('--checkpoint', type=str, default=None,
+                        help='Archivo de checkpoint (por defecto REPLAY_CHECKPOINT_PATH; "" = no guardar)')
+    parser.add_argument('--backfill', nargs='?', const='', default=None, metavar='RUN_ID',
+                        help='Recálculo aislado: marca los mensajes con este run_id (sin valor, uno nuevo)')
+
     args = parser.parse_args()
-    
+
     replay_events(
-        start_line=args.offset, 
+        start_line=args.offset,
         start_time_iso=args.timestamp,
-        target_exchange=args.exchange
-    )
\ No newline at end of file
+        target_exchange=args.exchange,
+        end_time_iso=args.until,
+        time_field=args.time_field,
+        region=args.region,
+        max_rate=args.rate,
+        speed=args.speed,
+        confirm_window=args.confirm_window,
+        watch_queue=args.watch_queue,
+        max_backlog=args.max_backlog,
+        progress_interval=args.progress_interval,
+        parallel=args.parallel,
+        partition=args.partition,
+        input_kind=args.input,
+        source=args.source,
+        run_id=args.run_id,
+        db_path=args.db,
+        resume=args.resume,
+        checkpoint_path=args.checkpoint,
+        backfill=args.backfill,
+    )
@@ -0,0 +1,436 @@
+"""
+Segmentos del log de auditoría y su índice disperso de offsets.
+
+El log se divide en archivos `<primer_ordinal>.jsonl` dentro de un directorio
+(por defecto /data/audit_log.d). El ordinal es la posición global del registro
+(la "línea" que usa `replay.py --offset`), así que el segmento que contiene un
+offset se encuentra por nombre con búsqueda binaria.
+
+Cada segmento tiene al lado un `<primer_ordinal>.idx` con una entrada cada
+`index_interval` registros: (ordinal relativo, posición en bytes), ambos
+uint64 little-endian. Para leer desde un offset se hace seek a la entrada
+anterior y se saltan como máximo `index_interval - 1` líneas sin parsearlas.
+
+Índice de tiempo (para replay point-in-time):
+  - `<primer_ordinal>.tix`: un resumen por bloque de `index_interval` registros
+    (ordinal relativo, cantidad, byte inicial, byte final, min/max de
+    audit_timestamp y min/max del timestamp del evento, en epoch).
+  - `<primer_ordinal>.meta`: JSON con los min/max de todo el segmento, escrito
+    al sellarlo. El segmento activo no tiene .meta: se usa su .tix y la cola
+    sin resumir se lee siempre.
+Los timestamps de los eventos no vienen ordenados, así que la búsqueda binaria
+usa el máximo acumulado (primer bloque que puede contener >= inicio) y el
+mínimo acumulado desde el final (último bloque que puede contener <= fin).
+
+Archivo frío: `archive_segment` reemplaza un segmento sellado (y sus .idx/.tix/
+.meta) por `<primer_ordinal>.arc`, comprimido por bloques con su propio índice
+de tiempo y región (ver archive.py). list_segments, iter_records e
+iter_time_range leen ambos formatos de forma transparente.
+"""
+import bisect
+import json
+import math
+import os
+import struct
+from datetime import datetime
+
+import archive
+
+SEGMENT_SUFFIX = ".jsonl"
+INDEX_SUFFIX = ".idx"
+TIME_INDEX_SUFFIX = ".tix"
+META_SUFFIX = ".meta"
+ARCHIVE_SUFFIX = archive.SUFFIX
+INDEX_ENTRY = struct.Struct("<QQ")
+TIME_ENTRY = struct.Struct("<QQQQdddd")
+TIME_FIELDS = ("audit", "event")
+
+
+def segment_path(directory, first_ordinal):
+    return os.path.join(directory, f"{first_ordinal:020d}{SEGMENT_SUFFIX}")
+
+
+def index_path(segment_file):
+    return segment_file[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX
+
+
+def time_index_path(segment_file):
+    return segment_file[:-len(SEGMENT_SUFFIX)] + TIME_INDEX_SUFFIX
+
+
+def meta_path(segment_file):
+    return segment_file[:-len(SEGMENT_SUFFIX)] + META_SUFFIX
+
+
+def archive_path(segment_file):
+    return segment_file[:-len(SEGMENT_SUFFIX)] + ARCHIVE_SUFFIX
+
+
+def is_archived(path):
+    return path.endswith(ARCHIVE_SUFFIX)
+
+
+def segment_files(path):
+    """Archivos que componen un segmento (el .jsonl con sus índices, o el .arc)."""
+    if is_archived(path):
+        return [path]
+    return [path, index_path(path), time_index_path(path), meta_path(path)]
+
+
+def parse_time(value):
+    """Timestamp ISO (con o sin "Z") a epoch; None si no se puede interpretar. Sin zona = hora local."""
+    if not isinstance(value, str):
+        return None
+    if value.endswith("Z"):
+        value = value[:-1] + "+00:00"  # fromisoformat de Python 3.9 no acepta "Z"
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return None
+
+
+def list_segments(directory):
+    """
+    [(primer_ordinal, ruta)] ordenados, con la ruta del .jsonl o del .arc si el
+    segmento está archivado; lista vacía si el directorio no existe.
+    """
+    if not os.path.isdir(directory):
+        return []
+    found = {}
+    for name in os.listdir(directory):
+        for suffix in (SEGMENT_SUFFIX, ARCHIVE_SUFFIX):
+            stem = name[:-len(suffix)]
+            # Mientras se archiva pueden existir ambos: el .arc ya está completo (se renombra al final)
+            if name.endswith(suffix) and stem.isdigit() and (suffix == ARCHIVE_SUFFIX or int(stem) not in found):
+                found[int(stem)] = os.path.join(directory, name)
+    return sorted(found.items())
+
+
+def read_index(segment_file):
+    """[(ordinal relativo, posición)] del índice; ignora una entrada final incompleta."""
+    try:
+        with open(index_path(segment_file), "rb") as f:
+            raw = f.read()
+    except FileNotFoundError:
+        return []
+    usable = len(raw) - len(raw) % INDEX_ENTRY.size
+    size = os.path.getsize(segment_file)
+    # El índice puede ir por delante del segmento si el proceso murió con datos en el buffer
+    return [entry for entry in INDEX_ENTRY.iter_unpack(raw[:usable]) if entry[1] <= size]
+
+
+def seek_position(segment_file, relative_ordinal):
+    """(posición en bytes, ordinal relativo en esa posición) de la entrada del índice <= relative_ordinal."""
+    entries = read_index(segment_file)
+    position = bisect.bisect_right(entries, (relative_ordinal, float("inf"))) - 1
+    if position < 0:
+        return 0, 0
+    ordinal, offset = entries[position]
+    return offset, ordinal
+
+
+def count_records(segment_file):
+    """Cantidad de registros completos del segmento (usa el índice y cuenta solo el final)."""
+    if is_archived(segment_file):
+        return archive.Archive(segment_file).records
+    offset, ordinal = seek_position(segment_file, float("inf"))
+    with open(segment_file, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            if line.endswith(b"\n"):
+                ordinal += 1
+    return ordinal
+
+
+def next_ordinal(directory):
+    """Ordinal que le corresponde al próximo registro (continúa tras reiniciar)."""
+    segments = list_segments(directory)
+    if not segments:
+        return 0
+    first_ordinal, path = segments[-1]
+    return first_ordinal + count_records(path)
+
+
+def iter_records(directory, start_ordinal=0, end_ordinal=None):
+    """
+    Genera (ordinal, línea en bytes) desde `start_ordinal` hasta `end_ordinal`
+    (exclusivo; None = hasta el final).
+    Arranca con búsqueda binaria de segmento + seek por índice, sin leer lo anterior.
+    """
+    segments = list_segments(directory)
+    firsts = [first for first, _ in segments]
+    start = max(bisect.bisect_right(firsts, start_ordinal) - 1, 0)
+
+    for first_ordinal, path in segments[start:]:
+        if end_ordinal is not None and first_ordinal >= end_ordinal:
+            return
+        relative = max(start_ordinal - first_ordinal, 0)
+        path = _current_path(path)
+        if is_archived(path):
+            for ordinal, line in archive.Archive(path).iter_lines(start_ordinal=relative):
+                if end_ordinal is not None and first_ordinal + ordinal >= end_ordinal:
+                    return
+                yield first_ordinal + ordinal, line
+            continue
+        offset, ordinal = seek_position(path, relative)
+        with open(path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # Registro a medio escribir al final del segmento activo
+                if end_ordinal is not None and first_ordinal + ordinal >= end_ordinal:
+                    return
+                if ordinal >= relative:
+                    yield first_ordinal + ordinal, line
+                ordinal += 1
+
+
+def _current_path(path):
+    """El segmento pudo archivarse después de listarlo: en ese caso se lee el .arc."""
+    if not is_archived(path) and not os.path.exists(path) and os.path.exists(archive_path(path)):
+        return archive_path(path)
+    return path
+
+
+class TimeBlock:
+    """Resumen de un bloque de registros consecutivos (lo arma el escritor)."""
+
+    __slots__ = ("first", "count", "start", "end", "min_audit", "max_audit", "min_event", "max_event")
+
+    def __init__(self, first, start):
+        self.first = first
+        self.count = 0
+        self.start = start
+        self.end = start
+        self.min_audit = self.min_event = math.inf
+        self.max_audit = self.max_event = -math.inf
+
+    def add(self, size, audit_time, event_time=None):
+        self.count += 1
+        self.end += size
+        self.min_audit = min(self.min_audit, audit_time)
+        self.max_audit = max(self.max_audit, audit_time)
+        if event_time is not None:
+            self.min_event = min(self.min_event, event_time)
+            self.max_event = max(self.max_event, event_time)
+
+    def merge(self, other):
+        """Acumula los min/max de otro bloque (resumen del segmento completo)."""
+        self.count += other.count
+        self.end = other.end
+        self.min_audit = min(self.min_audit, other.min_audit)
+        self.max_audit = max(self.max_audit, other.max_audit)
+        self.min_event = min(self.min_event, other.min_event)
+        self.max_event = max(self.max_event, other.max_event)
+
+    def pack(self):
+        return TIME_ENTRY.pack(self.first, self.count, self.start, self.end,
+                               self.min_audit, self.max_audit, self.min_event, self.max_event)
+
+    def meta(self):
+        # JSON no admite infinito: un segmento sin timestamps de evento queda con None
+        def finite(value):
+            return value if math.isfinite(value) else None
+        return {
+            "records": self.count, "bytes": self.end,
+            "min_audit": finite(self.min_audit), "max_audit": finite(self.max_audit),
+            "min_event": finite(self.min_event), "max_event": finite(self.max_event),
+        }
+
+
+def read_time_index(segment_file):
+    """[(ordinal relativo, cantidad, byte inicial, byte final, min_audit, max_audit, min_event, max_event)]"""
+    try:
+        with open(time_index_path(segment_file), "rb") as f:
+            raw = f.read()
+    except FileNotFoundError:
+        return []
+    usable = len(raw) - len(raw) % TIME_ENTRY.size
+    size = os.path.getsize(segment_file)
+    return [entry for entry in TIME_ENTRY.iter_unpack(raw[:usable]) if entry[3] <= size]
+
+
+def read_meta(segment_file):
+    try:
+        with open(meta_path(segment_file), encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _field_bounds(field):
+    if field not in TIME_FIELDS:
+        raise ValueError(f"Campo de tiempo desconocido: {field}")
+    low = 4 if field == "audit" else 6
+    return low, low + 1
+
+
+def segment_time_range(segment_file, field="event"):
+    """
+    (mínimo, máximo) del campo en el segmento. Sin .meta (segmento activo o
+    interrumpido) la cola que no está en el índice deja el rango abierto.
+    """
+    if is_archived(segment_file):
+        low, high = archive.Archive(segment_file).time_range(field)
+        return (math.inf, -math.inf) if low is None else (low, high)
+    meta = read_meta(segment_file)
+    if meta is not None:
+        low, high = meta.get(f"min_{field}"), meta.get(f"max_{field}")
+        return (math.inf, -math.inf) if low is None else (low, high)
+
+    low_col, high_col = _field_bounds(field)
+    entries = read_time_index(segment_file)
+    low = min((entry[low_col] for entry in entries), default=math.inf)
+    high = max((entry[high_col] for entry in entries), default=-math.inf)
+    indexed_end = entries[-1][3] if entries else 0
+    if os.path.getsize(segment_file) > indexed_end:
+        return -math.inf, math.inf
+    return low, high
+
+
+def _read_spans(entries, size, field, start_time, end_time):
+    """
+    [(ordinal relativo, byte inicial, byte tope o None)] a leer del segmento.
+    La cola que todavía no está en el índice (segmento activo) se lee siempre.
+    """
+    low_col, high_col = _field_bounds(field)
+    first = 0
+    if start_time is not None:
+        running_max, prefix_max = -math.inf, []
+        for entry in entries:
+            running_max = max(running_max, entry[high_col])
+            prefix_max.append(running_max)
+        first = bisect.bisect_left(prefix_max, start_time)
+
+    stop = len(entries)
+    if end_time is not None:
+        # suffix_min es no decreciente: los bloques desde `stop` solo tienen tiempos > end_time
+        running_min, suffix_min = math.inf, []
+        for entry in reversed(entries):
+            running_min = min(running_min, entry[low_col])
+            suffix_min.append(running_min)
+        suffix_min.reverse()
+        stop = max(first, bisect.bisect_right(suffix_min, end_time))
+
+    indexed_end = entries[-1][3] if entries else 0
+    tail = (entries[-1][0] + entries[-1][1] if entries else 0, indexed_end, None)
+    if first == len(entries):
+        return [tail] if size > indexed_end else []
+    spans = [(entries[first][0], entries[first][2], entries[stop][2] if stop < len(entries) else None)]
+    if stop < len(entries) and size > indexed_end:
+        spans.append(tail)
+    return spans
+
+
+def iter_time_range(directory, start_time=None, end_time=None, field="event", region=None,
+                    start_ordinal=0, end_ordinal=None):
+    """
+    Genera (ordinal, línea) de los bloques que pueden contener registros con
+    `field` dentro de [start_time, end_time] (epoch; None = sin límite).
+    Descarta segmentos y bloques por índice sin leerlos; el filtro exacto por
+    registro lo hace quien consume (el índice solo acota el rango de bytes).
+    `region` solo descarta bloques de segmentos archivados (los .jsonl no la indexan).
+    Con [start_ordinal, end_ordinal) se saltean los segmentos fuera de ese rango
+    de ordinales y se cortan los registros de los bordes.
+    """
+    _field_bounds(field)
+    found = [(first, _current_path(path)) for first, path in list_segments(directory)]
+    if start_ordinal or end_ordinal is not None:
+        nexts = [first for first, _ in found[1:]] + [math.inf]
+        found = [
+            (first, path) for (first, path), following in zip(found, nexts)
+            if following > start_ordinal and (end_ordinal is None or first < end_ordinal)
+        ]
+    yield from (
+        (ordinal, line) for ordinal, line in _iter_time_range(found, start_time, end_time, field, region)
+        if ordinal >= start_ordinal and (end_ordinal is None or ordinal < end_ordinal)
+    )
+
+
+def _iter_time_range(found, start_time, end_time, field, region):
+    ranges = [segment_time_range(path, field) for _, path in found]
+
+    first_segment = 0
+    if start_time is not None:
+        running_max, prefix_max = -math.inf, []
+        for _, high in ranges:
+            running_max = max(running_max, high)
+            prefix_max.append(running_max)
+        first_segment = bisect.bisect_left(prefix_max, start_time)
+
+    for (first_ordinal, path), (low, high) in zip(found[first_segment:], ranges[first_segment:]):
+        if (start_time is not None and high < start_time) or (end_time is not None and low > end_time):
+            continue
+        if is_archived(path):
+            segment_archive = archive.Archive(path)
+            blocks = segment_archive.select(field, start_time, end_time, region)
+            for ordinal, line in segment_archive.iter_lines(blocks):
+                yield first_ordinal + ordinal, line
+            continue
+        spans = _read_spans(read_time_index(path), os.path.getsize(path), field, start_time, end_time)
+        with open(path, "rb") as f:
+            for ordinal, offset, limit in spans:
+                f.seek(offset)
+                for line in f:
+                    if limit is not None and offset >= limit:
+                        break
+                    if not line.endswith(b"\n"):
+                        break  # Registro a medio escribir al final del segmento activo
+                    yield first_ordinal + ordinal, line
+                    ordinal += 1
+                    offset += len(line)
+
+
+def _record_summary(line):
+    """Tiempos (epoch) y región de un registro del log, para el índice del archivo."""
+    try:
+        entry = json.loads(line)
+    except ValueError:
+        return {}, None
+    content = entry.get("event_content") if isinstance(entry, dict) else None
+    if not isinstance(content, dict):
+        content = {}
+    region = content.get("region")
+    times = {"audit": parse_time(entry.get("audit_timestamp")), "event": parse_time(content.get("timestamp"))}
+    return times, region if isinstance(region, str) else None
+
+
+def archive_segment(segment_file, codec="zlib", block_bytes=256 << 10):
+    """
+    Comprime un segmento sellado en `<primer_ordinal>.arc` y borra el .jsonl y
+    sus índices. Retorna la ruta del archivo.
+    """
+    target = archive_path(segment_file)
+    writer = archive.ArchiveWriter(target, codec, block_bytes, meta=read_meta(segment_file))
+    try:
+        with open(segment_file, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                times, region = _record_summary(line)
+                writer.add(line, times, region)
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
+    for stale in segment_files(segment_file):
+        try:
+            os.remove(stale)
+        except FileNotFoundError:
+            pass
+    return target
+
+
+def archive_segments(directory, keep_raw=1, codec="zlib", block_bytes=256 << 10):
+    """
+    Archiva los segmentos sellados (con .meta) salvo los `keep_raw` más
+    recientes. El segmento activo nunca tiene .meta. Retorna cuántos archivó.
+    """
+    sealed = [
+        path for _, path in list_segments(directory)
+        if not is_archived(path) and os.path.exists(meta_path(path))
+    ]
+    candidates = sealed[:-keep_raw] if keep_raw > 0 else sealed
+    for path in candidates:
+        archive_segment(path, codec, block_bytes)
+    return len(candidates)
@@ -10,6 +10,8 @@ RABBIT_PORT = int(os.getenv('RABBITMQ_PORT', 5672))
 TARGET_EXCHANGE = os.getenv('TARGET_EXCHANGE', 'processing_exchange')
 METRICS_EXCHANGE = os.getenv('METRICS_EXCHANGE', 'analytics_exchange')
 METRICS_ROUTING_KEY = os.getenv('METRICS_ROUTING_KEY', 'metrics.daily')
+# Rollups minuto/hora/día publicados por el Aggregator (metrics.rollup.<nivel>)
+ROLLUP_ROUTING_KEY = os.getenv('ROLLUP_ROUTING_KEY', 'metrics.rollup.*')
 
 # Cola específica (Durable para no perder logs si el servicio se cae)
 QUEUE_NAME = 'audit_queue'
@@ -17,6 +19,90 @@ METRICS_QUEUE_NAME = 'audit_metrics_queue'
 
 # Archivo de salida
 LOG_FILE_PATH = os.getenv('LOG_FILE_PATH', '/data/audit_log.jsonl')
+# fsync del log: "never", "interval" (cada N ms), "records" (cada N registros) o "commit" (antes de cada COMMIT)
+LOG_FSYNC_POLICY = os.getenv('LOG_FSYNC_POLICY', 'interval')
+LOG_FSYNC_INTERVAL_MS = float(os.getenv('LOG_FSYNC_INTERVAL_MS', 1000.0))
+LOG_FSYNC_EVERY_RECORDS = int(os.getenv('LOG_FSYNC_EVERY_RECORDS', 1000))
+LOG_BUFFER_BYTES = int(os.getenv('LOG_BUFFER_BYTES', 1 << 20))
+# Log segmentado: archivos <primer_ordinal>.jsonl + índice disperso .idx (ver segments.py)
+# Con "false" se escribe el archivo único LOG_FILE_PATH como antes
+LOG_SEGMENTS_ENABLED = os.getenv('LOG_SEGMENTS_ENABLED', 'true').lower() == 'true'
+LOG_SEGMENT_DIR = os.getenv('LOG_SEGMENT_DIR', '/data/audit_log.d')
+LOG_SEGMENT_MAX_BYTES = int(os.getenv('LOG_SEGMENT_MAX_BYTES', 64 << 20))
+LOG_SEGMENT_MAX_SECONDS = float(os.getenv('LOG_SEGMENT_MAX_SECONDS', 3600.0))
+LOG_INDEX_INTERVAL = int(os.getenv('LOG_INDEX_INTERVAL', 256))  # Una entrada del índice cada N registros
+LOG_SEGMENT_RETENTION = int(os.getenv('LOG_SEGMENT_RETENTION', 0))  # Segmentos cerrados a conservar (0 = todos)
+# Archivo frío comprimido por bloques (ver archive.py): segmentos sellados del log y particiones viejas
+ARCHIVE_CODEC = os.getenv('ARCHIVE_CODEC', 'zlib')  # "zlib" o "lzma"
+ARCHIVE_BLOCK_BYTES = int(os.getenv('ARCHIVE_BLOCK_BYTES', 256 << 10))  # Tamaño sin comprimir de cada bloque
+LOG_ARCHIVE_KEEP_RAW = int(os.getenv('LOG_ARCHIVE_KEEP_RAW', 0))  # Segmentos sellados sin comprimir (0 = no archivar)
 
 # SQLite
 AUDIT_DB_PATH = os.getenv('AUDIT_DB_PATH', '/data/audit.db')
+# Linaje de métricas con input_event_ids: "rows" (filas de trace con executemany) o
+# "compact" (una fila BLOB en metric_lineage más su índice inverso, ~3x más rápido en ventanas grandes)
+TRACE_INGEST_MODE = os.getenv('TRACE_INGEST_MODE', 'rows')
+TRACE_DEFER_FOREIGN_KEYS = os.getenv('TRACE_DEFER_FOREIGN_KEYS', 'false').lower() == 'true'  # FK al COMMIT
+# Campos del payload indexados por fuente (columnas generadas + índice): "fuente:campo,campo;fuente:campo"
+PAYLOAD_INDEX_FIELDS = os.getenv(
+    'PAYLOAD_INDEX_FIELDS',
+    'security.incident:crime_type,severity;migration.case:case_type,status;survey.victimization:victimization_type',
+)
+# Particiones diarias (ver partitions.py): "none" = todo en AUDIT_DB_PATH, "day" = un archivo por día
+AUDIT_PARTITIONING = os.getenv('AUDIT_PARTITIONING', 'none')
+AUDIT_PARTITION_DIR = os.getenv('AUDIT_PARTITION_DIR', '/data/audit_partitions')
+AUDIT_RETENTION_DAYS = int(os.getenv('AUDIT_RETENTION_DAYS', 0))  # Días a conservar (0 = todos)
+AUDIT_COLD_AFTER_DAYS = int(os.getenv('AUDIT_COLD_AFTER_DAYS', 2))  # Edad desde la que se compacta (0 = nunca)
+AUDIT_ARCHIVE_AFTER_DAYS = int(os.getenv('AUDIT_ARCHIVE_AFTER_DAYS', 0))  # Edad desde la que se archiva events_in (0 = nunca)
+AUDIT_MAX_ATTACHED = int(os.getenv('AUDIT_MAX_ATTACHED', 8))  # SQLite admite 10 bases adjuntas por defecto
+AUDIT_MAINTENANCE_INTERVAL = float(os.getenv('AUDIT_MAINTENANCE_INTERVAL', 300.0))  # Segundos entre mantenimientos
+# Consultas de linaje (queries.py): tamaño de página y endpoint HTTP de solo lectura
+QUERY_PAGE_SIZE = int(os.getenv('QUERY_PAGE_SIZE', 100))
+QUERY_MAX_PAGE_SIZE = int(os.getenv('QUERY_MAX_PAGE_SIZE', 1000))
+QUERY_API_HOST = os.getenv('QUERY_API_HOST', '0.0.0.0')
+QUERY_API_PORT = int(os.getenv('QUERY_API_PORT', 8081))
+EXPORT_CHUNK_ROWS = int(os.getenv('EXPORT_CHUNK_ROWS', 10000))  # Filas por bloque de exporter.py
+# Replay (replay.py): confirmaciones en ventana, lotes por escritura y ritmo
+REPLAY_CONFIRM_WINDOW = int(os.getenv('REPLAY_CONFIRM_WINDOW', 1000))  # Mensajes sin confirmar en vuelo
+REPLAY_PUBLISH_BATCH = int(os.getenv('REPLAY_PUBLISH_BATCH', 100))  # Mensajes por escritura al socket
+REPLAY_MAX_RATE = float(os.getenv('REPLAY_MAX_RATE', 0))  # Mensajes/s (0 = sin límite)
+REPLAY_SPEED = float(os.getenv('REPLAY_SPEED', 0))  # Intervalos originales acelerados N veces (0 = no)
+REPLAY_WATCH_QUEUE = os.getenv('REPLAY_WATCH_QUEUE', '')  # Cola a vigilar, ej. aggregator_queue (vacío = no)
+REPLAY_MAX_BACKLOG = int(os.getenv('REPLAY_MAX_BACKLOG', 10000))  # Pausa mientras la cola vigilada supere esto
+REPLAY_PROGRESS_INTERVAL = float(os.getenv('REPLAY_PROGRESS_INTERVAL', 5.0))  # Segundos entre reportes
+REPLAY_PARALLEL = int(os.getenv('REPLAY_PARALLEL', 1))  # Procesos publicadores, cada uno con su conexión
+REPLAY_PARTITION = os.getenv('REPLAY_PARTITION', 'range')  # "range" (tramos del log) o "region" (orden por región)
+# Checkpoint de la posición confirmada (replay.py --resume) y reconexión con backoff exponencial
+REPLAY_CHECKPOINT_PATH = os.getenv('REPLAY_CHECKPOINT_PATH', '/data/replay_checkpoint.json')  # Vacío = no guardar
+REPLAY_CHECKPOINT_INTERVAL = float(os.getenv('REPLAY_CHECKPOINT_INTERVAL', 5.0))  # Segundos entre escrituras
+REPLAY_RECONNECT_BACKOFF = float(os.getenv('REPLAY_RECONNECT_BACKOFF', 1.0))  # Primera espera; se duplica
+REPLAY_RECONNECT_MAX_BACKOFF = float(os.getenv('REPLAY_RECONNECT_MAX_BACKOFF', 30.0))
+REPLAY_RECONNECT_RETRIES = int(os.getenv('REPLAY_RECONNECT_RETRIES', 20))  # Fallos seguidos sin avanzar (0 = sin límite)
+# Group commit: una transacción (y un ack múltiple) cada N mensajes o T ms, lo que ocurra primero.
+# Con prefetch adaptativo el lote se acota a PREFETCH_MAX (mantener <= PREFETCH_MAX): nunca hay más
+# entregas sin ack que eso, y un lote mayor solo se cerraría por tiempo
+GROUP_COMMIT_MAX_ROWS = int(os.getenv('GROUP_COMMIT_MAX_ROWS', 200))
+GROUP_COMMIT_MAX_DELAY_MS = float(os.getenv('GROUP_COMMIT_MAX_DELAY_MS', 50.0))
+# Hilo escritor: cola acotada entre el hilo de pika y el de SQLite (mantener >= PREFETCH_MAX)
+WRITER_QUEUE_SIZE = int(os.getenv('WRITER_QUEUE_SIZE', 1000))
+WRITER_STATUS_INTERVAL = float(os.getenv('WRITER_STATUS_INTERVAL', 30.0))  # Segundos entre reportes de cola/retraso
+
+# Prefetch adaptativo (AIMD) según latencia de escritura y profundidad de las colas; ver flow_control.py
+ENABLE_ADAPTIVE_PREFETCH = os.getenv('ENABLE_ADAPTIVE_PREFETCH', 'true').lower() == 'true'
+PREFETCH_INITIAL = int(os.getenv('PREFETCH_INITIAL', 50))
+PREFETCH_MIN = int(os.getenv('PREFETCH_MIN', 1))
+PREFETCH_MAX = int(os.getenv('PREFETCH_MAX', 200))
+PREFETCH_TARGET_LATENCY_MS = float(os.getenv('PREFETCH_TARGET_LATENCY_MS', 50.0))  # Latencia media por mensaje
+PREFETCH_MAX_BUFFERED_SECONDS = float(os.getenv('PREFETCH_MAX_BUFFERED_SECONDS', 2.0))  # Trabajo máximo sin ack
+PREFETCH_ADJUST_INTERVAL = float(os.getenv('PREFETCH_ADJUST_INTERVAL', 2.0))  # Segundos entre ajustes
+PREFETCH_INCREASE_STEP = int(os.getenv('PREFETCH_INCREASE_STEP', 5))  # Incremento aditivo por ajuste
+
+# Flujo de métricas (audit_metrics_queue): canal, prefetch y lote propios, independientes de los
+# de eventos (GROUP_COMMIT_*, WRITER_QUEUE_SIZE y PREFETCH_*). Un lote de métricas chico acota lo que
+# puede esperar un evento detrás de una transacción con miles de filas de linaje.
+METRICS_GROUP_COMMIT_MAX_ROWS = int(os.getenv('METRICS_GROUP_COMMIT_MAX_ROWS', 20))  # Mantener <= METRICS_PREFETCH_MAX
+METRICS_GROUP_COMMIT_MAX_DELAY_MS = float(os.getenv('METRICS_GROUP_COMMIT_MAX_DELAY_MS', 200.0))
+METRICS_WRITER_QUEUE_SIZE = int(os.getenv('METRICS_WRITER_QUEUE_SIZE', 200))  # Mantener >= METRICS_PREFETCH_MAX
+METRICS_PREFETCH_INITIAL = int(os.getenv('METRICS_PREFETCH_INITIAL', 10))
+METRICS_PREFETCH_MIN = int(os.getenv('METRICS_PREFETCH_MIN', 1))
+METRICS_PREFETCH_MAX = int(os.getenv('METRICS_PREFETCH_MAX', 50))
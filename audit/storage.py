@@ -0,0 +1,314 @@
+"""
+Persistencia SQLite del servicio de auditoría (sin dependencias de RabbitMQ).
+
+Las funciones store_* solo ejecutan los INSERT: el COMMIT lo hace el caller
+(una transacción por mensaje o por lote, ver group_commit.py).
+"""
+import json
+import re
+import sqlite3
+import uuid
+
+import lineage_store
+
+
+def init_db(db_path: str, payload_fields: dict = None) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path, check_same_thread=False, timeout=5)
+
+    # Pragmas: concurrencia y consistencia
+    conn.execute("PRAGMA journal_mode=WAL;")
+    conn.execute("PRAGMA synchronous=NORMAL;")
+    conn.execute("PRAGMA foreign_keys=ON;")
+    conn.execute("PRAGMA busy_timeout=5000;")  # ms
+
+    # Schema
+    create_schema(conn, payload_fields=payload_fields)
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS metrics_rollup (
+          rollup_id TEXT PRIMARY KEY,
+          level TEXT NOT NULL,
+          bucket_start TEXT NOT NULL,
+          region TEXT NOT NULL,
+          run_id TEXT DEFAULT 'default',
+          version INTEGER NOT NULL,
+          window_count INTEGER NOT NULL,
+          metrics_json TEXT NOT NULL,
+          sketches_json TEXT,
+          updated_at TEXT DEFAULT (datetime('now'))
+        );
+        """
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_rollup_level_bucket ON metrics_rollup(level, bucket_start, region, run_id);"
+    )
+    conn.commit()
+    return conn
+
+
+def create_schema(conn: sqlite3.Connection, schema: str = "main", event_foreign_key: bool = True,
+                  payload_fields: dict = None) -> None:
+    """
+    Tablas de eventos, métricas y linaje (con sus índices de consulta) en `schema`:
+    "main" o una partición diaria adjuntada con ATTACH (ver partitions.py). En las
+    particiones `trace` no declara FK hacia events_in: el evento puede estar en la
+    partición de otro día y SQLite no verifica FK entre bases adjuntadas.
+    `payload_fields` ({source: campos}) define las columnas indexadas del payload.
+    """
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {schema}.events_in (
+          event_id TEXT PRIMARY KEY,
+          timestamp TEXT NOT NULL,
+          region TEXT NOT NULL,
+          source TEXT NOT NULL,
+          schema_version TEXT,
+          correlation_id TEXT,
+          payload_json TEXT NOT NULL,
+          run_id TEXT DEFAULT 'default',
+          inserted_at TEXT DEFAULT (datetime('now'))
+        );
+        """
+    )
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {schema}.metrics_out (
+          metric_id TEXT PRIMARY KEY,
+          date TEXT NOT NULL,
+          region TEXT NOT NULL,
+          run_id TEXT DEFAULT 'default',
+          metrics_json TEXT NOT NULL,
+          created_at TEXT DEFAULT (datetime('now'))
+        );
+        """
+    )
+    event_fk = "FOREIGN KEY (event_id) REFERENCES events_in(event_id)," if event_foreign_key else ""
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {schema}.trace (
+          event_id TEXT NOT NULL,
+          metric_id TEXT NOT NULL,
+          contribution_type TEXT DEFAULT 'window_member',
+          PRIMARY KEY (event_id, metric_id),
+          {event_fk}
+          FOREIGN KEY (metric_id) REFERENCES metrics_out(metric_id)
+        );
+        """
+    )
+    lineage_store.init_lineage_schema(conn, schema)
+    init_query_indexes(conn, schema)
+    if payload_fields is not None:
+        init_payload_columns(conn, payload_fields, schema)
+
+
+# Índices secundarios para las consultas de queries.py (linaje, región/fecha, run_id/tiempo)
+# y para el replay desde la base (replay.py --input db: fuente/tiempo y solo tiempo).
+# La PK de trace (event_id, metric_id) ya resuelve evento -> métricas; falta el sentido inverso.
+QUERY_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_trace_metric ON trace(metric_id, event_id);",
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_events_run_time ON events_in(run_id, timestamp, event_id);",
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_events_region_time ON events_in(region, timestamp, event_id);",
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_events_source_time ON events_in(source, timestamp, event_id);",
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_events_time ON events_in(timestamp, event_id);",
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_metrics_region_date ON metrics_out(region, date, run_id, metric_id);",
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_metrics_run_date ON metrics_out(run_id, date, metric_id);",
+)
+
+
+def init_query_indexes(conn: sqlite3.Connection, schema: str = "main") -> None:
+    """Crea los índices de consulta (en una base existente la primera vez tarda lo que tarde el CREATE INDEX)."""
+    for statement in QUERY_INDEXES:
+        conn.execute(statement.format(schema=schema))
+
+
+# Campos del payload indexados: una columna generada VIRTUAL por campo con json_extract,
+# solo para las fuentes que lo configuran, y un índice parcial que guarda el valor
+# calculado al insertar. Filtrar por campo deja de parsear el JSON de cada fila.
+_FIELD_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+_SOURCE_PATTERN = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+
+def parse_payload_fields(spec: str) -> dict:
+    """
+    "security.incident:crime_type,severity;migration.case:case_type,status"
+    -> {"security.incident": ("crime_type", "severity"), ...}
+    """
+    fields = {}
+    for entry in filter(None, (part.strip() for part in spec.split(";"))):
+        source, _, names = entry.partition(":")
+        source = source.strip()
+        names = tuple(name.strip() for name in names.split(",") if name.strip())
+        if not _SOURCE_PATTERN.match(source) or not all(_FIELD_PATTERN.match(name) for name in names):
+            raise ValueError(f"Campo de payload inválido en la configuración: {entry!r}")
+        fields[source] = names
+    return fields
+
+
+def payload_column(field: str) -> str:
+    if not _FIELD_PATTERN.match(field):
+        raise ValueError(f"Campo de payload inválido: {field!r}")
+    return f"payload_{field.lower()}"
+
+
+def _payload_definitions(payload_fields: dict) -> dict:
+    """{columna: expresión} con las fuentes de cada campo (el texto sirve para detectar cambios)."""
+    sources_by_field = {}
+    for source, names in payload_fields.items():
+        for name in names:
+            sources_by_field.setdefault(name, []).append(source)
+    return {
+        payload_column(name): "CASE WHEN source IN ({}) THEN json_extract(payload_json, '$.{}') END".format(
+            ", ".join(f"'{source}'" for source in sorted(sources)), name
+        )
+        for name, sources in sorted(sources_by_field.items())
+    }
+
+
+def init_payload_columns(conn: sqlite3.Connection, payload_fields: dict, schema: str = "main") -> None:
+    """
+    Sincroniza las columnas generadas del payload con la configuración: agrega
+    las nuevas, recrea las que cambiaron de fuentes y borra las que ya no están.
+    Sobre una base existente el CREATE INDEX recorre events_in una sola vez.
+    """
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {schema}.payload_columns (column_name TEXT PRIMARY KEY, definition TEXT NOT NULL)"
+    )
+    current = dict(conn.execute(f"SELECT column_name, definition FROM {schema}.payload_columns"))
+    wanted = _payload_definitions(payload_fields)
+    for column, definition in current.items():
+        if wanted.get(column) != definition:
+            conn.execute(f"DROP INDEX IF EXISTS {schema}.idx_{column}")
+            conn.execute(f"ALTER TABLE {schema}.events_in DROP COLUMN {column}")
+            conn.execute(f"DELETE FROM {schema}.payload_columns WHERE column_name = ?", (column,))
+    for column, definition in wanted.items():
+        if current.get(column) != definition:
+            conn.execute(
+                f"ALTER TABLE {schema}.events_in ADD COLUMN {column} TEXT GENERATED ALWAYS AS ({definition}) VIRTUAL"
+            )
+            conn.execute(
+                f"CREATE INDEX {schema}.idx_{column} ON events_in(source, {column}, timestamp, event_id) "
+                f"WHERE {column} IS NOT NULL"
+            )
+            conn.execute(
+                f"INSERT INTO {schema}.payload_columns(column_name, definition) VALUES (?, ?)", (column, definition)
+            )
+
+
+def get_run_id(properties, payload: dict) -> str:
+    headers = getattr(properties, "headers", None) or {}
+    return headers.get("run_id") or payload.get("run_id") or "default"
+
+
+INSERT_EVENT_SQL = """
+    INSERT OR IGNORE INTO {schema}.events_in
+    (event_id, timestamp, region, source, schema_version, correlation_id, payload_json, run_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def event_row(event: dict, run_id: str) -> tuple:
+    """Valida el evento y arma la fila de events_in."""
+    if not event.get("event_id") or not event.get("timestamp") or not event.get("region") or not event.get("source"):
+        raise ValueError("Evento inválido: faltan campos requeridos (event_id, timestamp, region, source)")
+
+    return (
+        event.get("event_id"),
+        event.get("timestamp"),
+        event.get("region"),
+        event.get("source"),
+        event.get("schema_version"),
+        event.get("correlation_id"),
+        json.dumps(event.get("payload", {}), ensure_ascii=False),
+        run_id,
+    )
+
+
+def store_event(conn: sqlite3.Connection, event: dict, run_id: str) -> None:
+    """
+    Solo ejecuta INSERT. El COMMIT lo hace el caller.
+    """
+    conn.execute(INSERT_EVENT_SQL.format(schema="main"), event_row(event, run_id))
+
+
+def store_event_rows(conn: sqlite3.Connection, rows: list, schema: str = "main") -> None:
+    """INSERT de varias filas de events_in con executemany (mismo caller-commit)."""
+    conn.executemany(INSERT_EVENT_SQL.format(schema=schema), rows)
+
+
+TRACE_MODES = ("rows", "compact")
+
+
+def store_metric_and_trace(conn: sqlite3.Connection, metric_msg: dict, trace_mode: str = "rows",
+                           defer_foreign_keys: bool = False, schema: str = "main") -> None:
+    """
+    Inserta metrics_out + trace en UNA sola transacción (caller).
+    Si falla un trace por FK, se revierte TODO (métrica incluida).
+    El linaje compacto (`input_lineage`) se guarda como una sola fila en metric_lineage.
+
+    `input_event_ids` se ingiere según `trace_mode`:
+      - "rows":    una fila de `trace` por evento, con un executemany ordenado por event_id
+      - "compact": una sola fila en metric_lineage (como `input_lineage`, sin chequeo de FK);
+                   `lineage_store.materialize_trace` la expande a `trace` si hace falta
+    `defer_foreign_keys` posterga el chequeo de FK de `trace` al COMMIT de la transacción.
+    """
+    if trace_mode not in TRACE_MODES:
+        raise ValueError(f"Modo de trace desconocido: {trace_mode}")
+    if defer_foreign_keys:
+        conn.execute("PRAGMA defer_foreign_keys=ON;")  # Se apaga solo al terminar la transacción
+
+    metric_id = metric_msg.get("metric_id") or str(uuid.uuid4())
+    date = metric_msg["date"]
+    region = metric_msg["region"]
+    run_id = metric_msg.get("run_id", "default")
+    metrics_json = json.dumps(metric_msg["metrics"], ensure_ascii=False)
+
+    conn.execute(
+        f"""
+        INSERT OR REPLACE INTO {schema}.metrics_out(metric_id, date, region, run_id, metrics_json)
+        VALUES (?, ?, ?, ?, ?)
+        """,
+        (metric_id, date, region, run_id, metrics_json),
+    )
+
+    if metric_msg.get("input_lineage") is not None:
+        lineage_store.store_lineage(conn, metric_id, metric_msg["input_lineage"], schema)
+
+    event_ids = metric_msg.get("input_event_ids")
+    if not event_ids:
+        return
+    if trace_mode == "compact":
+        lineage_store.store_event_ids(conn, metric_id, event_ids, schema)
+    else:
+        lineage_store.insert_trace_rows(conn, metric_id, sorted(set(event_ids)), schema)
+
+
+def store_rollup(conn: sqlite3.Connection, rollup_msg: dict) -> None:
+    """
+    Upsert idempotente de un rollup minuto/hora/día: solo se reemplaza la fila
+    si la versión recibida es mayor (reentregas y versiones viejas se ignoran).
+    """
+    conn.execute(
+        """
+        INSERT INTO metrics_rollup
+        (rollup_id, level, bucket_start, region, run_id, version, window_count, metrics_json, sketches_json)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(rollup_id) DO UPDATE SET
+          version = excluded.version,
+          window_count = excluded.window_count,
+          metrics_json = excluded.metrics_json,
+          sketches_json = excluded.sketches_json,
+          updated_at = datetime('now')
+        WHERE excluded.version > metrics_rollup.version
+        """,
+        (
+            rollup_msg["rollup_id"],
+            rollup_msg["level"],
+            rollup_msg["bucket_start"],
+            rollup_msg["region"],
+            rollup_msg.get("run_id", "default"),
+            rollup_msg["version"],
+            rollup_msg.get("window_count", 0),
+            json.dumps(rollup_msg["metrics"], ensure_ascii=False),
+            json.dumps(rollup_msg.get("sketches") or {}, ensure_ascii=False),
+        ),
+    )
@@ -0,0 +1,257 @@
+"""
+Hilo escritor del servicio de auditoría.
+
+El hilo de pika solo decodifica los mensajes y los encola (cola acotada); este
+hilo es dueño de la conexión SQLite y del GroupCommitWriter, arma los lotes y
+hace los COMMIT. Así un fsync lento o una espera por `busy_timeout` no bloquea
+los heartbeats ni el consumo de las colas.
+
+Los ack/nack no se pueden llamar desde otro hilo en pika: `ThreadsafeChannel`
+los envía al hilo de la conexión con `add_callback_threadsafe`. Mientras el
+prefetch de cada canal sea menor que el tamaño de la cola de su carril,
+`submit()` nunca bloquea (cada mensaje encolado es un mensaje sin ack), y un
+carril lleno no frena al hilo de pika para los demás.
+
+Cada flujo de mensajes (una cola de RabbitMQ con su propio canal) es un
+`Lane`: cola interna acotada, GroupCommitWriter con su tamaño de lote y su
+demora, y sus contadores. El hilo toma los mensajes de los carriles por turno
+y, cuando hay que confirmar, lo hace en orden de prioridad (el primer carril
+es el de eventos): antes del lote de un carril confirma el lote pendiente de
+los carriles anteriores, así los eventos nunca esperan detrás de una métrica
+con miles de filas de linaje. SQLite admite un solo escritor por base, así que
+lo máximo que puede esperar un evento es UNA transacción de métricas, acotada
+por el tamaño de su lote.
+
+Cada `maintenance_interval` segundos, entre dos lotes, llama a
+`writer.maintain()` del primer carril (retención y compactación de particiones
+diarias; los carriles comparten la conexión y las particiones).
+
+`status()` expone, por carril, la profundidad de la cola, el retraso del
+escritor (cuánto espera el mensaje más antiguo antes de su COMMIT) y los
+mensajes por segundo confirmados desde el reporte anterior.
+"""
+import functools
+import queue
+import threading
+import time
+
+
+class ThreadsafeChannel:
+    """Proxy de un canal de pika que ejecuta basic_ack/basic_nack en el hilo de la conexión."""
+
+    def __init__(self, connection, channel):
+        self.connection = connection
+        self.channel = channel
+        self.closed = False
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        self._call(self.channel.basic_ack, delivery_tag=delivery_tag, multiple=multiple)
+
+    def basic_nack(self, delivery_tag, requeue=True):
+        self._call(self.channel.basic_nack, delivery_tag=delivery_tag, requeue=requeue)
+
+    def close(self):
+        """Marca el canal como cerrado: los delivery_tags ya no sirven y los ack se omiten."""
+        self.closed = True
+
+    def _call(self, method, **kwargs):
+        if self.closed:
+            return  # RabbitMQ reentregará el mensaje; las escrituras son idempotentes
+        try:
+            self.connection.add_callback_threadsafe(functools.partial(method, **kwargs))
+        except Exception as e:
+            print(f"[!] No se pudo enviar ack/nack al hilo de la conexión: {e}")
+
+
+class Lane:
+    """Un flujo de escrituras (una cola de RabbitMQ): cola interna, lote propio y contadores."""
+
+    def __init__(self, name, writer, max_queue=1000, before_commit=None):
+        self.name = name
+        self.writer = writer
+        self.before_commit = before_commit  # p. ej. fsync del log JSONL antes del COMMIT/ack
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.doorbell = None  # threading.Event del hilo escritor (lo asigna WriterThread)
+
+        self.committed = 0
+        self.requeued = 0
+        self.oldest_pending = None  # monotonic() del mensaje más antiguo sin COMMIT
+        self.last_commit_lag = 0.0
+        self.write_cost = 0.0  # Segundos de COMMIT por mensaje en el último lote
+        self.rate = 0.0  # Mensajes confirmados por segundo desde el reporte anterior
+        self._rate_mark = (time.monotonic(), 0)
+
+    def submit(self, kind, record, channel, delivery_tag, routing_key=""):
+        """Encola una escritura (llamado desde el hilo de pika)."""
+        self.queue.put((time.monotonic(), kind, record, channel, delivery_tag, routing_key))
+        if self.doorbell is not None:
+            self.doorbell.set()
+
+    def take(self, item) -> bool:
+        """Agrega al lote un mensaje sacado de la cola. Retorna True si el lote se llenó."""
+        enqueued_at, kind, record, channel, delivery_tag, routing_key = item
+        if self.oldest_pending is None:
+            self.oldest_pending = enqueued_at
+        return self.writer.add(kind, record, channel, delivery_tag, routing_key)
+
+    def deadline(self):
+        """monotonic() en el que vence el lote pendiente (None si no hay)."""
+        return None if self.oldest_pending is None else self.oldest_pending + self.writer.max_delay
+
+    def flush(self):
+        if not len(self.writer):
+            return
+        batch_size = len(self.writer)
+        started = time.monotonic()
+        if self.before_commit is not None:
+            try:
+                self.before_commit()
+            except Exception as e:
+                # Igual que el log en disco: best-effort, no frena la auditoría en DB
+                print(f"[!] Error en el hook previo al COMMIT: {e}")
+        acked, requeued = self.writer.flush()
+        finished = time.monotonic()
+
+        self.committed += acked
+        self.requeued += requeued
+        self.write_cost = (finished - started) / batch_size
+        self.last_commit_lag = finished - self.oldest_pending
+        self.oldest_pending = None
+
+    def update_rate(self, now):
+        since, committed = self._rate_mark
+        if now > since:
+            self.rate = (self.committed - committed) / (now - since)
+        self._rate_mark = (now, self.committed)
+
+    def status(self):
+        oldest = self.oldest_pending
+        return {
+            "queue_depth": self.queue.qsize(),
+            "pending_in_batch": len(self.writer),
+            "writer_lag_ms": round((time.monotonic() - oldest) * 1000, 1) if oldest is not None else 0.0,
+            "last_commit_lag_ms": round(self.last_commit_lag * 1000, 1),
+            "write_cost_us": round(self.write_cost * 1e6, 1),
+            "committed": self.committed,
+            "requeued": self.requeued,
+            "batches": self.writer.batches,
+            "msgs_per_s": round(self.rate, 1),
+        }
+
+
+class WriterThread(threading.Thread):
+    """
+    Consume las colas de escritura de los carriles y confirma sus lotes. El
+    carril principal ("events") se arma con `writer`; `add_lane()` suma otros
+    de menor prioridad antes de start(). `submit()` y los contadores del hilo
+    son los del carril principal.
+    """
+
+    def __init__(self, writer, max_queue=1000, status_interval=30.0, before_commit=None, maintenance_interval=300.0,
+                 name="events"):
+        super().__init__(name="audit-writer", daemon=True)
+        self.status_interval = status_interval
+        self.maintenance_interval = maintenance_interval
+        self.lanes = []
+        self._doorbell = threading.Event()  # Algún carril recibió un mensaje
+        self._stopping = threading.Event()
+        self._turn = 0
+        self._last_status = time.monotonic()
+        self._last_maintenance = time.monotonic()
+        self.main_lane = self.add_lane(name, writer, max_queue, before_commit)
+
+    def add_lane(self, name, writer, max_queue=1000, before_commit=None) -> Lane:
+        """Agrega un carril con menor prioridad que los anteriores (llamar antes de start())."""
+        lane = Lane(name, writer, max_queue, before_commit)
+        lane.doorbell = self._doorbell
+        self.lanes.append(lane)
+        return lane
+
+    def lane(self, name) -> Lane:
+        return next(lane for lane in self.lanes if lane.name == name)
+
+    def submit(self, kind, record, channel, delivery_tag, routing_key=""):
+        """Encola una escritura en el carril principal (llamado desde el hilo de pika)."""
+        self.main_lane.submit(kind, record, channel, delivery_tag, routing_key)
+
+    @property
+    def committed(self):
+        return self.main_lane.committed
+
+    @property
+    def write_cost(self):
+        return self.main_lane.write_cost
+
+    def stop(self, timeout=10.0):
+        """Escribe lo que quede en las colas y termina el hilo."""
+        self._stopping.set()
+        self._doorbell.set()
+        self.join(timeout)
+
+    def _idle(self):
+        return all(lane.queue.empty() for lane in self.lanes)
+
+    def _next(self, timeout):
+        """(carril, mensaje) tomando los carriles por turno; (None, None) si no llega nada en `timeout`."""
+        deadline = time.monotonic() + timeout
+        while True:
+            for offset in range(len(self.lanes)):
+                lane = self.lanes[(self._turn + offset) % len(self.lanes)]
+                try:
+                    item = lane.queue.get_nowait()
+                except queue.Empty:
+                    continue
+                self._turn = (self._turn + offset + 1) % len(self.lanes)
+                return lane, item
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stopping.is_set():
+                return None, None
+            self._doorbell.wait(remaining)
+            self._doorbell.clear()  # Antes de volver a mirar las colas: no se pierde un aviso
+
+    def run(self):
+        while not (self._stopping.is_set() and self._idle()):
+            deadlines = [due for due in (lane.deadline() for lane in self.lanes) if due is not None]
+            timeout = 0.1 if not deadlines else max(0.0, min(deadlines) - time.monotonic())
+            lane, item = self._next(timeout)
+            full = lane.take(item) if lane is not None else False
+
+            now = time.monotonic()
+            for index, candidate in enumerate(self.lanes):
+                due = candidate.deadline()
+                if (candidate is lane and full) or (due is not None and now >= due):
+                    self._flush(index)
+            self._maybe_maintain()
+            self._maybe_print_status()
+        for index in range(len(self.lanes)):
+            self._flush(index)
+
+    def _flush(self, index):
+        """Confirma el lote del carril, antes el de los carriles de mayor prioridad que tengan pendientes."""
+        for lane in self.lanes[:index + 1]:
+            lane.flush()
+
+    def _maybe_maintain(self):
+        now = time.monotonic()
+        if any(len(lane.writer) for lane in self.lanes) or now - self._last_maintenance < self.maintenance_interval:
+            return  # Solo entre lotes: ATTACH/DETACH no se pueden dentro de una transacción
+        self._last_maintenance = now
+        maintain = getattr(self.main_lane.writer, "maintain", None)
+        if maintain is None:
+            return
+        try:
+            maintain()
+        except Exception as e:
+            print(f"[!] Error en el mantenimiento de audit: {e}")
+
+    def _maybe_print_status(self):
+        now = time.monotonic()
+        if now - self._last_status >= self.status_interval:
+            self._last_status = now
+            for lane in self.lanes:
+                lane.update_rate(now)
+                print(f" [W] Escritor audit ({lane.name}): {lane.status()}")
+
+    def status(self):
+        """Estado del carril principal, con el de todos los carriles en "lanes"."""
+        return dict(self.main_lane.status(), lanes={lane.name: lane.status() for lane in self.lanes})
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Benchmark del archivo comprimido del log de auditoría (segments.archive_segments).
+
+Escribe N registros con el SegmentedLogWriter, mide el tamaño en disco antes
+y después de archivar con cada codec, y el tiempo de una lectura filtrada por
+una hora y por región sobre los segmentos crudos y sobre los archivados.
+
+Uso: python3 benchmarks/bench_audit_archive.py [--events 500000] [--block-bytes 262144]
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "audit"))
+
+import log_writer  # noqa: E402
+import segments  # noqa: E402
+
+REGIONS = ("norte", "sur", "este", "oeste", "centro")
+
+
+def build(directory, count, rng):
+    writer = log_writer.SegmentedLogWriter(directory, segment_max_bytes=16 << 20, fsync_policy="never")
+    for number in range(count):
+        seconds = number * 86400 // count  # Un día de eventos
+        timestamp = f"2026-01-30T{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}Z"
+        writer.append(json.dumps({
+            "event_id": f"{rng.getrandbits(128):032x}", "timestamp": timestamp,
+            "region": REGIONS[number // 1000 % len(REGIONS)], "source": "security.incident",
+            "payload": {"severity": rng.choice(("low", "medium", "high")), "host": f"srv-{rng.randrange(500)}"},
+        }).encode("utf-8"), timestamp)
+    writer.close()
+
+
+def size(directory):
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+
+def filtered_read(directory):
+    start = segments.parse_time("2026-01-30T12:00:00Z")
+    end = segments.parse_time("2026-01-30T12:59:59Z")
+    started = time.perf_counter()
+    hour = sum(1 for _ in segments.iter_time_range(directory, start, end))
+    hour_ms = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    region = sum(1 for _ in segments.iter_time_range(directory, region="sur"))
+    region_ms = (time.perf_counter() - started) * 1000
+    return hour, hour_ms, region, region_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del archivo comprimido de audit")
+    parser.add_argument("--events", type=int, default=500_000)
+    parser.add_argument("--block-bytes", type=int, default=256 << 10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        raw = os.path.join(tmp, "raw")
+        build(raw, args.events, random.Random(5))
+        records, hour_ms, region_records, region_ms = filtered_read(raw)
+        print(f"{args.events:,} registros, crudo: {size(raw) / 1e6:,.1f} MB")
+        print(f"  crudo   una hora: {records:>8,} registros en {hour_ms:7.1f} ms   "
+              f"región: {region_records:>8,} en {region_ms:7.1f} ms")
+        for codec in ("zlib", "lzma"):
+            directory = os.path.join(tmp, codec)
+            shutil.copytree(raw, directory)
+            started = time.perf_counter()
+            segments.archive_segments(directory, keep_raw=0, codec=codec, block_bytes=args.block_bytes)
+            elapsed = time.perf_counter() - started
+            records, hour_ms, region_records, region_ms = filtered_read(directory)
+            print(f"  {codec:<7} {size(directory) / 1e6:8,.1f} MB ({size(raw) / size(directory):4.1f}x, "
+                  f"archivado en {elapsed:5.1f} s)")
+            print(f"          una hora: {records:>8,} registros en {hour_ms:7.1f} ms   "
+                  f"región: {region_records:>8,} en {region_ms:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la exportación masiva de audit (exporter.py).
+
+Arma una audit.db temporal con N eventos y exporta events_in en cada formato,
+midiendo filas/s, el tamaño del archivo y la memoria máxima del proceso (RSS)
+tras cada exportación: debe quedar casi fija aunque N crezca.
+
+Uso: python3 benchmarks/bench_audit_export.py [--events 1000000] [--chunk 10000] [--formats jsonl.gz,csv,columnar]
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "audit"))
+
+import exporter  # noqa: E402
+import storage  # noqa: E402
+
+REGIONS = ("norte", "sur", "este", "oeste", "centro")
+SOURCES = ("security.incident", "migration.case", "survey.victimization")
+CHUNK = 100_000
+
+
+def build(db_path, count, rng):
+    conn = storage.init_db(db_path)
+    conn.execute("PRAGMA synchronous=OFF;")
+    for chunk_start in range(0, count, CHUNK):
+        rows = []
+        for number in range(chunk_start, min(chunk_start + CHUNK, count)):
+            seconds = number * 864 // 1000
+            day, rest = divmod(seconds, 86400)
+            rows.append((
+                str(uuid.UUID(int=rng.getrandbits(128))),
+                f"2026-01-{day % 28 + 1:02d}T{rest // 3600:02d}:{rest // 60 % 60:02d}:{rest % 60:02d}Z",
+                rng.choice(REGIONS), rng.choice(SOURCES), "1.0", None,
+                json.dumps({"severity": rng.choice(("low", "medium", "high")), "victims": rng.randrange(4)}),
+                "default",
+            ))
+        with conn:
+            storage.store_event_rows(conn, rows)
+    conn.close()
+
+
+def size(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+    return os.path.getsize(path)
+
+
+def max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB en Linux
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la exportación masiva de audit")
+    parser.add_argument("--events", type=int, default=1_000_000)
+    parser.add_argument("--chunk", type=int, default=10_000)
+    parser.add_argument("--formats", default="jsonl.gz,csv,columnar")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "audit.db")
+        print(f"Generando {args.events:,} eventos...")
+        build(db_path, args.events, random.Random(3))
+        print(f"Tamaño de la base: {os.path.getsize(db_path) / 1e6:,.0f} MB   RSS tras cargar: {max_rss_mb():,.0f} MB")
+        for fmt in args.formats.split(","):
+            out = os.path.join(tmp, "export." + fmt)
+            rows, seconds = exporter.export(db_path, "events", fmt, out, chunk_rows=args.chunk)
+            print(f"  {fmt:<9} {rows:>11,} filas en {seconds:6.1f} s ({rows / seconds:>9,.0f} filas/s)   "
+                  f"{size(out) / 1e6:8,.1f} MB   RSS máx {max_rss_mb():6,.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Benchmark del log JSONL de auditoría.
+
+  - original:    json.loads + dict + json.dumps + open/write/close por evento
+  - never/interval/records/commit:
+                 AuditLogWriter (archivo abierto, cuerpo crudo, buffer) con cada
+                 política de fsync; "commit" simula un COMMIT cada --batch eventos
+
+Para cada variante se reporta el máximo de eventos/s sostenible y cuánto del
+presupuesto de CPU consumiría una carga de 10k eventos/s.
+
+Uso: python3 benchmarks/bench_audit_log.py [--count 50000] [--batch 500]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "audit"))
+
+import log_writer  # noqa: E402
+
+
+def make_bodies(count):
+    return [
+        json.dumps({
+            "event_id": str(uuid.uuid4()),
+            "timestamp": "2026-01-30T16:00:00Z",
+            "region": "norte",
+            "source": "security.incident",
+            "payload": {"crime_type": "theft", "severity": "low"},
+        }).encode()
+        for _ in range(count)
+    ]
+
+
+def original(path, bodies, batch):
+    for body in bodies:
+        data = json.loads(body)
+        audit_entry = {"audit_timestamp": datetime.now().isoformat(), "event_content": data}
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(audit_entry, ensure_ascii=False) + "\n")
+
+
+def buffered(policy):
+    def run(path, bodies, batch):
+        writer = log_writer.AuditLogWriter(path, fsync_policy=policy, fsync_interval_ms=100, fsync_every_records=batch)
+        for index, body in enumerate(bodies, start=1):
+            writer.append(body)
+            if index % batch == 0:
+                writer.on_commit()
+        writer.close()
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=50000)
+    parser.add_argument("--batch", type=int, default=500)
+    args = parser.parse_args()
+
+    bodies = make_bodies(args.count)
+    variants = [("original", original)] + [(policy, buffered(policy)) for policy in log_writer.FSYNC_POLICIES]
+    print(f"{'variante':<10} {'eventos/s':>12} {'CPU a 10k ev/s':>16}")
+    for name, fn in variants:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "audit_log.jsonl")
+            started = time.perf_counter()
+            fn(path, bodies, args.batch)
+            elapsed = time.perf_counter() - started
+        rate = args.count / elapsed
+        print(f"{name:<10} {rate:>12.0f} {10000 / rate * 100:>15.1f}%")
+
+
+if __name__ == "__main__":
+    main()
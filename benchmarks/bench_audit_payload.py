@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Benchmark de las consultas por campo del payload en audit (queries.events_by_payload).
+
+Arma una audit.db temporal con N eventos de varias fuentes con las columnas
+generadas de PAYLOAD_INDEX_FIELDS y mide la primera página de eventos de
+una fuente con un valor de campo dado:
+
+  - columna indexada: events_by_payload (índice parcial sobre la columna generada)
+  - json_extract:     la misma consulta filtrando con json_extract(payload_json, ...),
+                      que recorre y parsea el JSON de cada evento de la fuente
+
+Uso: python3 benchmarks/bench_audit_payload.py [--events 1000000] [--queries 100]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "audit"))
+
+import queries  # noqa: E402
+import settings  # noqa: E402
+import storage  # noqa: E402
+
+SOURCES = ("security.incident", "migration.case", "survey.victimization")
+CRIME_TYPES = ("robo", "hurto", "estafa", "lesiones", "homicidio", "vandalismo", "amenazas", "otro")
+SEVERITIES = ("low", "medium", "high", "critical")
+CHUNK = 100_000
+
+JSON_SQL = """
+SELECT event_id, timestamp, region, source, schema_version, correlation_id, run_id, payload_json
+FROM main.events_in
+WHERE source = ? AND json_extract(payload_json, '$.' || ?) = ?
+ORDER BY timestamp, event_id
+LIMIT ?
+"""
+
+
+def payload(source, rng):
+    if source == "security.incident":
+        return {"crime_type": rng.choice(CRIME_TYPES), "severity": rng.choice(SEVERITIES), "victims": rng.randrange(4)}
+    if source == "migration.case":
+        return {"case_type": rng.choice(("asilo", "residencia", "visa")), "status": rng.choice(("open", "closed"))}
+    return {"victimization_type": rng.choice(CRIME_TYPES), "reported": rng.random() < 0.3}
+
+
+def build(db_path, count, fields, rng):
+    conn = storage.init_db(db_path, fields)
+    conn.execute("PRAGMA synchronous=OFF;")
+    started = time.perf_counter()
+    for chunk_start in range(0, count, CHUNK):
+        numbers = range(chunk_start, min(chunk_start + CHUNK, count))
+        rows = []
+        for number in numbers:
+            seconds = number * 864 // 1000
+            day, rest = divmod(seconds, 86400)
+            source = SOURCES[number % len(SOURCES)]
+            rows.append((
+                str(uuid.UUID(int=rng.getrandbits(128))),
+                f"2026-01-{day % 28 + 1:02d}T{rest // 3600:02d}:{rest // 60 % 60:02d}:{rest % 60:02d}Z",
+                "sur", source, "1.0", None, json.dumps(payload(source, rng)), "default",
+            ))
+        with conn:
+            storage.store_event_rows(conn, rows)
+        print(f"\r  cargados {numbers.stop:,} eventos ({time.perf_counter() - started:.0f} s)", end="", flush=True)
+    print()
+    conn.execute("ANALYZE;")
+    conn.close()
+
+
+def timed(label, function, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    p50 = samples[len(samples) // 2]
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(f"  {label:<18} p50 {p50:9.3f} ms   p99 {p99:9.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de consultas por campo del payload en audit")
+    parser.add_argument("--events", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=100)
+    args = parser.parse_args()
+
+    fields = storage.parse_payload_fields(settings.PAYLOAD_INDEX_FIELDS)
+    rng = random.Random(7)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "audit.db")
+        print(f"Generando {args.events:,} eventos en {db_path}...")
+        build(db_path, args.events, fields, rng)
+        print(f"Tamaño de la base: {os.path.getsize(db_path) / 1e6:,.0f} MB")
+
+        conn = queries.connect(db_path)
+        cases = [("security.incident", "crime_type", CRIME_TYPES), ("security.incident", "severity", SEVERITIES)]
+        for source, field, values in cases:
+            print(f"{source}.{field} (primera página de 100):")
+            timed("columna indexada", lambda: queries.events_by_payload(
+                conn, source, field, rng.choice(values)), args.queries)
+            timed("json_extract", lambda: conn.execute(
+                JSON_SQL, (source, field, rng.choice(values), 101)).fetchall(), max(3, args.queries // 20))
+            # Un valor raro obliga al recorrido completo sin índice
+            timed("raro, indexada", lambda: queries.events_by_payload(conn, source, field, "inexistente"), args.queries)
+            timed("raro, json", lambda: conn.execute(
+                JSON_SQL, (source, field, "inexistente", 101)).fetchall(), 3)
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
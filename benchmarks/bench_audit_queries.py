@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Benchmark de las consultas de linaje de audit (queries.py) sobre una base grande.
+
+Arma una audit.db temporal con N eventos (run_ids, regiones y fechas variadas),
+una métrica cada 100 eventos, la mitad con su linaje en `trace` y la otra mitad
+con linaje compacto (metric_lineage + su índice inverso), y mide la latencia de:
+
+  - linaje:          eventos de una métrica (primera página)
+  - evento->métrica: métricas que usaron un evento, con linaje en `trace` y compacto
+  - región/fecha:    primera página de métricas de una región en un día
+  - run_id/tiempo:   primera página de eventos de un run en una hora
+
+Al final borra los índices de consulta y el índice inverso del linaje compacto,
+y repite algunas consultas para comparar contra el recorrido completo de la tabla.
+
+Uso: python3 benchmarks/bench_audit_queries.py [--events 10000000] [--queries 200] [--db ruta]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "audit"))
+
+import lineage_store  # noqa: E402
+import queries  # noqa: E402
+import storage  # noqa: E402
+
+REGIONS = ("norte", "sur", "este", "oeste", "centro")
+RUN_IDS = ("default", "backfill-1", "backfill-2")
+EVENTS_PER_METRIC = 100
+CHUNK = 100_000
+
+
+def event_id(number):
+    return str(uuid.UUID(int=number * 2654435761 % (1 << 128)))
+
+
+def build(db_path, count):
+    conn = storage.init_db(db_path)
+    conn.execute("PRAGMA synchronous=OFF;")
+    conn.execute("PRAGMA foreign_keys=OFF;")  # Carga masiva: las FK se cumplen por construcción
+    started = time.perf_counter()
+    for chunk_start in range(0, count, CHUNK):
+        numbers = range(chunk_start, min(chunk_start + CHUNK, count))
+        events, metrics, trace, compact = [], [], [], {}
+        for number in numbers:
+            seconds = number * 864 // 1000  # ~10 días de eventos
+            day, rest = divmod(seconds, 86400)
+            metric_number = number // EVENTS_PER_METRIC
+            region = REGIONS[metric_number % len(REGIONS)]
+            run_id = RUN_IDS[metric_number % len(RUN_IDS)]
+            events.append((
+                event_id(number), f"2026-01-{day + 1:02d}T{rest // 3600:02d}:{rest // 60 % 60:02d}:{rest % 60:02d}Z",
+                region, "security.incident", "1.0", None, '{"severity": "low"}', run_id,
+            ))
+            metric_id = f"metric-{metric_number:08d}"
+            if number % EVENTS_PER_METRIC == 0:
+                metrics.append((metric_id, f"2026-01-{day + 1:02d}", region, run_id, '{"count": 100}'))
+            if metric_number % 2:
+                compact.setdefault(metric_id, []).append(event_id(number))
+            else:
+                trace.append((event_id(number), metric_id))
+        with conn:
+            storage.store_event_rows(conn, events)
+            conn.executemany(
+                "INSERT OR REPLACE INTO metrics_out(metric_id, date, region, run_id, metrics_json) VALUES (?, ?, ?, ?, ?)",
+                metrics,
+            )
+            conn.executemany("INSERT OR IGNORE INTO trace(event_id, metric_id) VALUES (?, ?)", trace)
+            for metric_id, event_ids in compact.items():
+                lineage_store.store_event_ids(conn, metric_id, event_ids)
+        print(f"\r  cargados {numbers.stop:,} eventos ({time.perf_counter() - started:.0f} s)", end="", flush=True)
+    print()
+    conn.execute("ANALYZE;")
+    conn.close()
+
+
+def timed(label, function, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    p50 = samples[len(samples) // 2]
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(f"  {label:<18} p50 {p50:8.3f} ms   p99 {p99:8.3f} ms")
+
+
+def run_queries(conn, count, repeat, rng):
+    metrics = count // EVENTS_PER_METRIC
+    days = max(1, count * 864 // 1000 // 86400)
+    timed("linaje", lambda: queries.events_for_metric(
+        conn, f"metric-{rng.randrange(metrics):08d}"), repeat)
+    # Las métricas pares tienen el linaje en `trace` y las impares compacto
+    timed("evento->métrica", lambda: queries.metrics_for_event(
+        conn, event_id(rng.randrange(0, count, 2 * EVENTS_PER_METRIC))), repeat)
+    timed("evento->compacto", lambda: queries.metrics_for_event(
+        conn, event_id(rng.randrange(EVENTS_PER_METRIC, count, 2 * EVENTS_PER_METRIC))), repeat)
+    timed("región/fecha", lambda: queries.metrics_by_region_date(
+        conn, rng.choice(REGIONS), f"2026-01-{rng.randrange(days) + 1:02d}"), repeat)
+
+    def run_hour():
+        day, hour = rng.randrange(days) + 1, rng.randrange(24)
+        queries.events_by_run(conn, rng.choice(RUN_IDS), f"2026-01-{day:02d}T{hour:02d}:00:00",
+                              f"2026-01-{day:02d}T{hour:02d}:59:59Z")
+    timed("run_id/tiempo", run_hour, repeat)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de consultas de linaje de audit")
+    parser.add_argument("--events", type=int, default=10_000_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--db", default=None, help="Reutiliza/crea la base en esta ruta (si no, una temporal)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = args.db or os.path.join(tmp, "audit.db")
+        if not os.path.exists(db_path):
+            print(f"Generando {args.events:,} eventos en {db_path}...")
+            build(db_path, args.events)
+        print(f"Tamaño de la base: {os.path.getsize(db_path) / 1e6:,.0f} MB")
+
+        rng = random.Random(42)
+        conn = queries.connect(db_path)
+        print(f"Con índices ({args.queries} consultas por tipo):")
+        run_queries(conn, args.events, args.queries, rng)
+        conn.close()
+
+        if args.db:
+            return  # No se tocan los índices de una base provista
+        conn = sqlite3.connect(db_path)  # init_db volvería a crear los índices
+        for statement in storage.QUERY_INDEXES:
+            conn.execute("DROP INDEX IF EXISTS " + statement.format(schema="main").split("EXISTS ")[1].split(" ON")[0])
+        conn.execute("DROP TABLE IF EXISTS metric_lineage_events")  # metrics-of vuelve a recorrer los BLOB
+        conn.commit()
+        conn.close()
+        conn = queries.connect(db_path)
+        print("Sin índices de consulta (3 consultas por tipo):")
+        run_queries(conn, args.events, 3, rng)
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Benchmark del motor de replay de audit (replay.py).
+
+Escribe un log segmentado temporal con N eventos y lo reinyecta con 1..P
+procesos. Por defecto publica contra un broker nulo (confirma todo al vaciar
+el buffer), así mide el techo del lado del cliente: lectura del log, recorte
+del cuerpo y ventana de confirmaciones. Con --broker publica de verdad en el
+RabbitMQ de settings (RABBITMQ_HOST/PORT) al exchange --exchange.
+
+Uso: python3 benchmarks/bench_audit_replay.py [--events 500000] [--parallel 1,2,4] [--broker --exchange replay_bench]
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "audit"))
+
+import log_writer  # noqa: E402
+import replay  # noqa: E402
+
+REGIONS = ("norte", "sur", "este", "oeste", "centro")
+
+
+class NullImpl:
+    def __init__(self):
+        self.published = 0
+        self.on_confirm = None
+
+    def confirm_delivery(self, ack_nack_callback, callback=None):
+        self.on_confirm = ack_nack_callback
+        callback(None)
+
+    def basic_publish(self, exchange, routing_key, body, properties=None, mandatory=False):
+        self.published += 1
+
+
+class NullChannel:
+    def __init__(self):
+        self._impl = NullImpl()
+
+
+class NullConnection:
+    """Confirma con un ack múltiple todo lo publicado cada vez que se procesan eventos"""
+
+    def __init__(self, channel):
+        self.channel = channel
+
+    def process_data_events(self, time_limit=0):
+        impl = self.channel._impl
+        if impl.published:
+            impl.on_confirm(replay.pika.frame.Method(1, replay.pika.spec.Basic.Ack(impl.published, multiple=True)))
+
+    def close(self):
+        pass
+
+
+def null_connect():
+    channel = NullChannel()
+    return NullConnection(channel), channel
+
+
+def build(directory, count):
+    writer = log_writer.SegmentedLogWriter(directory, segment_max_bytes=16 << 20, fsync_policy="never")
+    for number in range(count):
+        seconds = number % 86400
+        timestamp = f"2026-01-30T{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}Z"
+        body = json.dumps({
+            "event_id": f"{number:032x}", "timestamp": timestamp, "region": REGIONS[number % len(REGIONS)],
+            "source": "security.incident", "payload": {"crime_type": "robo", "severity": "high", "victims": 1},
+        }).encode("utf-8")
+        writer.append(body, timestamp)
+    writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del motor de replay de audit")
+    parser.add_argument("--events", type=int, default=500_000)
+    parser.add_argument("--parallel", default="1,2,4")
+    parser.add_argument("--partition", choices=replay.PARTITION_MODES, default="range")
+    parser.add_argument("--broker", action="store_true", help="Publica en el RabbitMQ real en vez del nulo")
+    parser.add_argument("--exchange", default="replay_bench")
+    args = parser.parse_args()
+
+    filters = {"start_time": None, "end_time": None, "time_field": "event", "region": None}
+    options = {"exchange": args.exchange, "confirm_window": replay.settings.REPLAY_CONFIRM_WINDOW}
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = os.path.join(tmp, "audit_log.d")
+        print(f"Generando {args.events:,} registros...")
+        build(directory, args.events)
+        size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+        print(f"Tamaño del log: {size / 1e6:,.0f} MB ({'RabbitMQ' if args.broker else 'broker nulo'})")
+        source = {"kind": "log", "path": directory, "start_line": 0, "filters": filters}
+        patch = contextlib.nullcontext() if args.broker else mock.patch.object(replay, "connect", null_connect)
+        with patch:
+            for workers in map(int, args.parallel.split(",")):
+                started = time.perf_counter()
+                stats, confirmed, _, failed = replay.replay_parallel(
+                    source, workers, args.partition, options, progress_interval=0)
+                elapsed = time.perf_counter() - started
+                print(f"  {workers} proceso(s): {stats.published:>10,} mensajes en {elapsed:6.1f} s "
+                      f"({stats.published / elapsed:>9,.0f} msg/s, {stats.bytes / elapsed / 1e6:6.1f} MB/s)"
+                      f"{'  con errores: ' + ', '.join(failed) if failed else ''}")
+
+
+if __name__ == "__main__":
+    main()
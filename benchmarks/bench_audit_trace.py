@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Benchmark de ingesta de métricas con ventanas grandes de `input_event_ids`.
+
+  - por fila:     un conn.execute por event_id (camino anterior)
+  - rows:         executemany ordenado por event_id (TRACE_INGEST_MODE=rows)
+  - rows + defer: lo mismo con las FK diferidas al COMMIT
+  - compact:      una fila BLOB en metric_lineage y su índice inverso (TRACE_INGEST_MODE=compact)
+
+Cada métrica se escribe en su propia transacción sobre un archivo SQLite en WAL
+que ya tiene los eventos cargados.
+
+Uso: python3 benchmarks/bench_audit_trace.py [--events 300000] [--window 50000] [--metrics 4]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "audit"))
+
+import storage  # noqa: E402
+
+
+def per_row(conn, metric_msg):
+    """Camino anterior de store_metric_and_trace: un INSERT por evento."""
+    storage.store_metric_and_trace(conn, dict(metric_msg, input_event_ids=[]))
+    for event_id in metric_msg["input_event_ids"]:
+        conn.execute(
+            "INSERT OR IGNORE INTO trace(event_id, metric_id, contribution_type) VALUES (?, ?, 'window_member')",
+            (event_id, metric_msg["metric_id"]),
+        )
+
+
+VARIANTS = {
+    "por fila": per_row,
+    "rows": lambda conn, msg: storage.store_metric_and_trace(conn, msg, "rows"),
+    "rows + defer": lambda conn, msg: storage.store_metric_and_trace(conn, msg, "rows", defer_foreign_keys=True),
+    "compact": lambda conn, msg: storage.store_metric_and_trace(conn, msg, "compact"),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de ingesta de linaje en audit")
+    parser.add_argument("--events", type=int, default=300_000)
+    parser.add_argument("--window", type=int, default=50_000, help="Eventos por métrica")
+    parser.add_argument("--metrics", type=int, default=4, help="Métricas por variante")
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = storage.init_db(os.path.join(tmp, "audit.db"))
+        event_ids = [str(uuid.UUID(int=rng.getrandbits(128), version=4)) for _ in range(args.events)]
+        with conn:
+            storage.store_event_rows(conn, [
+                (event_id, "2026-01-30T16:00:00Z", "norte", "security.incident", None, None, "{}", "default")
+                for event_id in event_ids
+            ])
+
+        print(f"{args.metrics} métricas de {args.window:,} eventos sobre {args.events:,} eventos cargados")
+        baseline = None
+        for name, store in VARIANTS.items():
+            elapsed = 0.0
+            for number in range(args.metrics):
+                metric_msg = {
+                    "metric_id": f"{name}-{number}", "date": "2026-01-30", "region": "norte", "metrics": {},
+                    "input_event_ids": rng.sample(event_ids, args.window),
+                }
+                started = time.perf_counter()
+                with conn:
+                    store(conn, metric_msg)
+                elapsed += time.perf_counter() - started
+            per_metric = elapsed / args.metrics * 1000
+            baseline = baseline or per_metric
+            print(f"  {name:<14} {per_metric:9.1f} ms por métrica   ({baseline / per_metric:5.1f}x)")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Benchmark de escrituras del servicio de auditoría sobre un archivo SQLite en WAL.
+
+  - por mensaje:   una transacción (INSERT + COMMIT) y un ack por evento
+  - group commit:  GroupCommitWriter con executemany y ack múltiple por lote
+
+Uso: python3 benchmarks/bench_audit_writes.py [--count 20000] [--batch 500]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "audit"))
+
+import group_commit  # noqa: E402
+import storage  # noqa: E402
+
+
+class NullChannel:
+    def __init__(self):
+        self.acks = 0
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        self.acks += 1
+
+    def basic_nack(self, delivery_tag, requeue=True):
+        pass
+
+
+def make_events(count):
+    return [
+        {
+            "event_id": str(uuid.uuid4()),
+            "timestamp": "2026-01-30T16:00:00Z",
+            "region": "norte",
+            "source": "security.incident",
+            "payload": {"crime_type": "theft", "severity": "low"},
+        }
+        for _ in range(count)
+    ]
+
+
+def per_message(conn, events, channel):
+    for tag, event in enumerate(events, start=1):
+        with conn:
+            storage.store_event(conn, event, "default")
+        channel.basic_ack(delivery_tag=tag)
+
+
+def batched(conn, events, channel, batch):
+    writer = group_commit.GroupCommitWriter(conn, max_rows=batch)
+    for tag, event in enumerate(events, start=1):
+        if writer.add(group_commit.KIND_EVENT, storage.event_row(event, "default"), channel, tag):
+            writer.flush()
+    writer.flush()
+
+
+def run(name, fn, events, *args):
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = storage.init_db(os.path.join(tmp, "audit.db"))
+        channel = NullChannel()
+        started = time.perf_counter()
+        fn(conn, events, channel, *args)
+        elapsed = time.perf_counter() - started
+        stored = conn.execute("SELECT COUNT(*) FROM events_in").fetchone()[0]
+        conn.close()
+    print(f"{name:<14} {len(events) / elapsed:>10.0f} eventos/s {channel.acks:>8} acks  ({stored} filas)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=20000)
+    parser.add_argument("--batch", type=int, default=500)
+    args = parser.parse_args()
+
+    events = make_events(args.count)
+    run("por mensaje", per_message, events)
+    run("group commit", batched, events, args.batch)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Benchmark del buffer columnar por micro-lotes frente al camino por defecto del
+aggregator (AGGREGATION_MODE=dict), con ventanas de 1k, 10k y 100k eventos.
+
+Los dos modos pasan por main.process_event sobre una RunWindow, y al final se
+leen los resultados que publica flush_window:
+
+  - dict:      stats[region][source] += 1 y una IdTable de IDs por región
+  - columnar:  columnas de tipo fijo + reducciones group-by por lote
+               (recuentos, IDs en IdTable y estadísticas numéricas)
+
+Se mide con los sketches y el binning espacial apagados (son iguales en los dos
+modos) y con la configuración completa por defecto. También la memoria que la
+ventana retiene antes de cerrarse, con cada evento decodificado de JSON y
+soltado tras procesarlo, como en el callback.
+
+Uso: python3 benchmarks/bench_columnar.py [--sizes 1000,10000,100000]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "aggregator"))
+
+import columnar  # noqa: E402
+import main  # noqa: E402
+import run_windows  # noqa: E402
+import settings  # noqa: E402
+
+REGIONS = ["norte", "sur", "centro", "este", "oeste"]
+
+
+def make_events(count):
+    rng = random.Random(42)
+    events = []
+    for _ in range(count):
+        source = rng.choice(["security.incident", "survey.victimization", "migration.case"])
+        event = {
+            "event_id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+            "timestamp": "2026-01-30T16:00:00Z",
+            "region": rng.choice(REGIONS),
+            "source": source,
+            "payload": {},
+        }
+        if source == "security.incident":
+            event["payload"] = {"location": {"latitude": rng.uniform(-55, -17), "longitude": rng.uniform(-75, -66)}}
+        elif source == "survey.victimization":
+            event["payload"] = {"respondent_age": rng.randint(18, 90)}
+        events.append(event)
+    return events
+
+
+def run_window(events, columnar_buffer=None):
+    window = run_windows.RunWindow("default", 0.0, 0.0, geo_grid=main.new_geo_grid(), columnar_buffer=columnar_buffer)
+    for event in events:
+        main.process_event(event, window)
+    if columnar_buffer is None:
+        return window.stats, window.event_ids
+    return columnar_buffer.stats_by_region(), columnar_buffer.ids_by_region(), columnar_buffer.numeric_stats_by_region()
+
+
+def columnar_window(events):
+    return run_window(events, columnar.ColumnarBuffer(batch_size=settings.COLUMNAR_BATCH_SIZE))
+
+
+def retained_mb(events, columnar_buffer=None):
+    """MB que retiene la ventana (sin sketches ni geo) tras procesar los eventos."""
+    bodies = [json.dumps(event) for event in events]
+    tracemalloc.start()
+    window = run_windows.RunWindow("default", 0.0, 0.0, columnar_buffer=columnar_buffer)
+    for body in bodies:
+        main.process_event(json.loads(body), window)
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return retained / 1e6
+
+
+def timed(func, *args, repeat=3):
+    """Mejor de `repeat` corridas, en ms."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, (time.perf_counter() - start) * 1000)
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark columnar vs diccionarios")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Eventos por ventana (separados por coma)")
+    args = parser.parse_args()
+
+    print(f"[*] Backend columnar: {'NumPy' if columnar.np is not None else 'Python puro'}")
+    sizes = [int(value) for value in args.sizes.split(",")]
+    events_by_size = {size: make_events(size) for size in sizes}
+    defaults = (settings.ENABLE_SKETCHES, settings.ENABLE_GEO_BINNING)
+    for label, extras in (("sin sketches ni geo", (False, False)), ("configuración por defecto", defaults)):
+        settings.ENABLE_SKETCHES, settings.ENABLE_GEO_BINNING = extras
+        print(f"  {label}")
+        print(f"  {'eventos':>8} {'dict':>10} {'columnar':>10}")
+        for size in sizes:
+            dict_ms = timed(run_window, events_by_size[size])
+            columnar_ms = timed(columnar_window, events_by_size[size])
+            print(f"  {size:>8} {dict_ms:>8.1f}ms {columnar_ms:>8.1f}ms")
+
+    settings.ENABLE_SKETCHES = settings.ENABLE_GEO_BINNING = False
+    size = sizes[-1]
+    print(f"  memoria retenida con {size} eventos: dict {retained_mb(events_by_size[size]):.1f} MB, "
+          f"columnar {retained_mb(events_by_size[size], columnar.ColumnarBuffer()):.1f} MB")
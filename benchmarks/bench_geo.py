@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Benchmark del binning espacial de incidentes (aggregator/geo.py).
+Mide cuánto tarda en agrupar una ventana de N incidentes en celdas.
+
+Uso: python3 benchmarks/bench_geo.py [--events 100000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "aggregator"))
+
+import geo  # noqa: E402
+
+
+def run(events, mode):
+    rng = random.Random(42)
+    grid = geo.GeoGrid(mode=mode, cell_deg=0.5, geohash_precision=4)
+    for severity in ("low", "medium", "high"):
+        lats = [rng.uniform(-55.0, -17.0) for _ in range(events // 3)]
+        lons = [rng.uniform(-75.0, -66.0) for _ in range(events // 3)]
+        grid.add_many(lats, lons, severity)
+
+    start = time.perf_counter()
+    message = grid.to_message()
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    print(f"  modo={mode:<8} eventos={len(grid):>8} celdas={len(message['cells']):>6} binning={elapsed_ms:8.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de binning espacial")
+    parser.add_argument("--events", type=int, default=100000, help="Incidentes por ventana")
+    args = parser.parse_args()
+
+    print(f"[*] Backend: {'NumPy' if geo.np is not None else 'Python puro'}")
+    for mode in ("grid", "geohash"):
+        run(args.events, mode)
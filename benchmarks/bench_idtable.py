@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Benchmark de memoria de la tabla de deduplicación del aggregator.
+
+  - dict:     {event_id (str): timestamp (float)} como el processed_ids original
+  - set:      set de event_ids (str) como el linaje por región original
+  - idtable:  IdTable con IDs de 128 bits en arreglos compactos (+ timestamps)
+
+La memoria se cuenta con sys.getsizeof (contenedor + cada str/float guardado)
+y IdTable.memory_bytes(); también se mide el tiempo de inserción y búsqueda.
+Con --count 10000000 se necesitan ~2 GB de RAM para el caso dict.
+
+Uso: python3 benchmarks/bench_idtable.py [--count 10000000]
+"""
+
+import argparse
+import gc
+import os
+import random
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "aggregator"))
+
+import idtable  # noqa: E402
+
+
+def generate_ids(count, seed):
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def build_dict(count, now):
+    table = {}
+    for index, event_id in enumerate(generate_ids(count, 7)):
+        table[event_id] = now + index * 1e-6  # Cada evento tiene su propio float
+    return table
+
+
+def build_set(count, now):
+    table = set()
+    for event_id in generate_ids(count, 7):
+        table.add(event_id)
+    return table
+
+
+def build_idtable(count, now):
+    table = idtable.IdTable(with_timestamps=True)
+    for index, event_id in enumerate(generate_ids(count, 7)):
+        table[event_id] = now + index * 1e-6
+    return table
+
+
+def size_of(table):
+    if isinstance(table, idtable.IdTable):
+        return table.memory_bytes()
+    total = sys.getsizeof(table) + sum(sys.getsizeof(event_id) for event_id in table)
+    if isinstance(table, dict):
+        total += sum(sys.getsizeof(timestamp) for timestamp in table.values())
+    return total
+
+
+def measure(name, builder, count):
+    gc.collect()
+    started = time.perf_counter()
+    table = builder(count, time.time())
+    build_seconds = time.perf_counter() - started
+    current = size_of(table)
+
+    lookups = list(generate_ids(min(count, 100000), 7))
+    started = time.perf_counter()
+    hits = sum(1 for event_id in lookups if event_id in table)
+    lookup_seconds = time.perf_counter() - started
+    assert hits == len(lookups)
+
+    print(f"{name:<10} {current / 1e6:>10.1f} MB {current / count:>8.1f} B/id "
+          f"{build_seconds:>8.2f}s {lookup_seconds / len(lookups) * 1e9:>8.0f} ns/lookup")
+    del table
+    return current
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=10_000_000)
+    args = parser.parse_args()
+
+    print(f"IDs: {args.count}")
+    print(f"{'estructura':<10} {'memoria':>13} {'por id':>13} {'inserción':>9} {'búsqueda':>16}")
+    dict_bytes = measure("dict", build_dict, args.count)
+    set_bytes = measure("set", build_set, args.count)
+    table_bytes = measure("idtable", build_idtable, args.count)
+    print(f"\nReducción vs dict: {dict_bytes / table_bytes:.1f}x | vs set: {set_bytes / table_bytes:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,7 @@ import time
 import pika
 from flask import Flask, render_template, jsonify
 import settings
+from window_state import WindowState
 
 app = Flask(__name__)
 
@@ -14,6 +15,16 @@ current_state = {
     "stats_by_region": {}
 }
 
+# Último mapa de calor (celdas dispersas por severidad) publicado por el Aggregator
+latest_heatmap = {
+    "mode": None,
+    "total": 0,
+    "cells": []
+}
+
+# Reconstruye el estado completo cuando el Aggregator publica solo deltas
+window_state = WindowState()
+
 # --- RABBITMQ CONSUMER (Background Thread) ---
 def start_consumer():
     """Función que corre en un hilo separado para escuchar RabbitMQ"""
@@ -34,11 +45,19 @@ def start_consumer():
             print("[*] Dashboard escuchando actualizaciones...")
 
             def callback(ch, method, properties, body):
-                global current_state
+                global current_state, latest_heatmap
+                # Solo los resúmenes de ventana alimentan la vista (métricas y rollups van a audit)
+                if method.routing_key != "analytics.window":
+                    return
                 try:
-                    data = json.loads(body)
+                    data = window_state.apply(json.loads(body))
+                    if data is None:
+                        print(" [D] Delta sin base, esperando el próximo keyframe...")
+                        return
                     # Actualizamos el estado global que lee Flask
                     current_state = data
+                    if "geo_grid" in data:
+                        latest_heatmap = data["geo_grid"]
                     print(" [D] Dashboard actualizado con nueva ventana.")
                 except Exception as e:
                     print(f"Error parseando dashboard data: {e}")
@@ -59,6 +78,10 @@ def index():
 def get_data():
     return jsonify(current_state)
 
+@app.route('/heatmap')
+def get_heatmap():
+    return jsonify(latest_heatmap)
+
 def main():
     # 1. Iniciar Consumer en un hilo aparte (Daemon muere cuando muere el main)
     consumer_thread = threading.Thread(target=start_consumer, daemon=True)
@@ -0,0 +1,59 @@
+"""
+Reconstrucción del estado completo a partir de resúmenes `analytics.window`.
+
+El Aggregator puede publicar en modo delta (WINDOW_PUBLISH_MODE=delta): solo
+las celdas que cambiaron más un keyframe completo cada N ventanas. Esta clase
+aplica los deltas sobre el último keyframe y descarta los deltas que llegan
+sin base (p. ej. al conectarse a mitad de secuencia) hasta el próximo keyframe.
+Los mensajes sin bloque "delta" (modo full) se aceptan tal cual.
+"""
+import copy
+
+
+def apply_delta(state, changes, removed=()):
+    """
+    Aplica un diff recursivo sobre `state` in place: primero borra las rutas de
+    `removed` y luego escribe `changes` (un null es un valor, no un borrado).
+    """
+    for path in removed:
+        parent = state
+        for key in path[:-1]:
+            parent = parent.get(key) if isinstance(parent, dict) else None
+        if isinstance(parent, dict):
+            parent.pop(path[-1], None)
+    for key, value in changes.items():
+        if isinstance(value, dict) and isinstance(state.get(key), dict):
+            apply_delta(state[key], value)
+        else:
+            state[key] = copy.deepcopy(value)
+    return state
+
+
+class WindowState:
+    """Mantiene el último resumen completo visto por el consumidor."""
+
+    def __init__(self):
+        self.state = None
+        self.sequence = None
+        self.skipped = 0  # Deltas descartados por falta de base
+
+    def apply(self, message):
+        """Retorna una copia del resumen completo tras aplicar `message`, o None si hay que esperar un keyframe."""
+        info = message.get("delta")
+        if info is None or info.get("mode") == "keyframe":
+            self.state = copy.deepcopy(message)
+            self.state.pop("delta", None)
+            self.sequence = info.get("sequence") if info else None
+            return copy.deepcopy(self.state)
+
+        if self.state is None or self.sequence is None or info.get("base_sequence") != self.sequence:
+            self.skipped += 1
+            return None
+
+        # Metadatos de la ventana (inicio, fin, total) vienen completos en cada delta
+        for key, value in message.items():
+            if key not in ("delta", "changes", "removed"):
+                self.state[key] = value
+        apply_delta(self.state, message.get("changes", {}), message.get("removed", ()))
+        self.sequence = info["sequence"]
+        return copy.deepcopy(self.state)
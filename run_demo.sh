@@ -47,7 +47,10 @@ sleep 10
 
 print_header "FASE 4: VERIFICACIÓN DE AUDITORÍA"
 echo "Verificando logs guardados..."
-if [ -f "data/audit_log.jsonl" ]; then
+if ls data/audit_log.d/*.jsonl >/dev/null 2>&1; then
+    lines=$(cat data/audit_log.d/*.jsonl | wc -l)
+    echo "[OK] Log de auditoría segmentado encontrado con $lines eventos procesados."
+elif [ -f "data/audit_log.jsonl" ]; then
     lines=$(wc -l < data/audit_log.jsonl)
     echo "[OK] Archivo de auditoría encontrado con $lines eventos procesados."
 else
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Tests para el archivo comprimido por bloques de audit (formato, log segmentado y particiones)
+No requieren RabbitMQ ni dependencias externas
+"""
+
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+import uuid
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "audit"))
+
+import archive  # noqa: E402
+import group_commit  # noqa: E402
+import log_writer  # noqa: E402
+import partitions  # noqa: E402
+import queries  # noqa: E402
+import segments  # noqa: E402
+import storage  # noqa: E402
+
+REGIONS = ("norte", "sur")
+
+
+def body(number):
+    return json.dumps({
+        "event_id": f"e{number}", "n": number, "region": REGIONS[number // 50 % 2],
+        "timestamp": f"2026-01-30T16:{number // 60:02d}:{number % 60:02d}Z",
+    }).encode("utf-8")
+
+
+class FakeChannel:
+    """Ignora los ack/nack"""
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        pass
+
+    def basic_nack(self, delivery_tag, requeue=True):
+        pass
+
+
+class CountingArchive(archive.Archive):
+    """Cuenta los bloques descomprimidos"""
+
+    reads = 0
+
+    def read_block(self, number):
+        if number not in self._cache:
+            CountingArchive.reads += 1
+        return super().read_block(number)
+
+
+class TestArchiveFormat(unittest.TestCase):
+    """Tests para la escritura por bloques y la selección por índice"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "data.arc")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, codec="zlib"):
+        writer = archive.ArchiveWriter(self.path, codec, block_bytes=200, meta={"kind": "test"})
+        for number in range(100):
+            writer.add(b'{"n": %d}\r\n' % number, {"t": number}, REGIONS[number // 50], "default")
+        writer.close()
+
+    def test_roundtrip_and_select(self):
+        """Test que los registros vuelven intactos y select() descarta bloques por tiempo y región"""
+        for codec in archive.CODECS:
+            self.write(codec)
+            data = archive.Archive(self.path)
+            self.assertEqual((data.codec, data.records, data.meta), (codec, 100, {"kind": "test"}))
+            self.assertGreater(len(data.blocks), 5)
+            lines = [line for _, line in data.iter_lines()]
+            self.assertEqual(lines, [b'{"n": %d}\r\n' % number for number in range(100)])
+
+            chosen = data.select("t", 20, 30)
+            numbers = [json.loads(line)["n"] for _, line in data.iter_lines(chosen)]
+            self.assertTrue(set(range(20, 31)) <= set(numbers))
+            self.assertLess(len(chosen), len(data.blocks) // 2)
+            south = data.select("t", region="sur")
+            self.assertTrue(0 < len(south) < len(data.blocks))
+            self.assertTrue(all("sur" in data.blocks[n]["regions"] for n in south))
+            self.assertEqual(data.time_range("t"), (0, 99))
+        self.assertFalse(os.path.exists(self.path + ".tmp"))
+
+    def test_start_ordinal(self):
+        """Test que iter_lines arranca en el ordinal pedido sin leer bloques anteriores"""
+        self.write()
+        data = archive.Archive(self.path)
+        self.assertEqual(next(data.iter_lines(start_ordinal=57)), (57, b'{"n": 57}\r\n'))
+
+
+class TestArchivedLog(unittest.TestCase):
+    """Tests para los segmentos del log archivados y su lectura transparente"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self.tmp.name, "audit_log.d")
+        writer = log_writer.SegmentedLogWriter(
+            self.directory, segment_max_bytes=2000, index_interval=4, fsync_policy="never"
+        )
+        for number in range(200):
+            writer.append(body(number), json.loads(body(number))["timestamp"])
+        writer.close()
+        self.raw = [(ordinal, line) for ordinal, line in segments.iter_records(self.directory)]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_archive_keeps_records_and_offsets(self):
+        """Test que archivar no cambia los registros ni los ordinales que ve replay"""
+        before = sum(os.path.getsize(path) for _, path in segments.list_segments(self.directory))
+        archived = segments.archive_segments(self.directory, keep_raw=1, block_bytes=1000)
+
+        found = segments.list_segments(self.directory)
+        self.assertEqual(archived, len(found) - 1)
+        self.assertTrue(all(segments.is_archived(path) for _, path in found[:-1]))
+        self.assertEqual(sorted(os.listdir(self.directory))[0], os.path.basename(found[0][1]))
+        self.assertEqual(list(segments.iter_records(self.directory)), self.raw)
+        self.assertEqual(list(segments.iter_records(self.directory, 123)), self.raw[123:])
+        self.assertEqual(segments.next_ordinal(self.directory), 200)
+        self.assertLess(sum(os.path.getsize(path) for _, path in found), before)
+
+    def test_time_and_region_filters_skip_blocks(self):
+        """Test que el filtro de tiempo o región solo descomprime los bloques que pueden coincidir"""
+        segments.archive_segments(self.directory, keep_raw=0, block_bytes=500)
+        original = archive.Archive
+        archive.Archive = CountingArchive
+        try:
+            CountingArchive.reads = 0
+            start = segments.parse_time("2026-01-30T16:01:00Z")
+            end = segments.parse_time("2026-01-30T16:01:09Z")
+            lines = [line for _, line in segments.iter_time_range(self.directory, start, end)]
+            event_ids = {json.loads(line)["event_content"]["event_id"] for line in lines}
+            self.assertTrue({f"e{n}" for n in range(60, 70)} <= event_ids)
+            time_reads = CountingArchive.reads
+
+            CountingArchive.reads = 0
+            lines = [line for _, line in segments.iter_time_range(self.directory, region="sur")]
+            regions = {json.loads(line)["event_content"]["region"] for line in lines}
+            region_reads = CountingArchive.reads
+        finally:
+            archive.Archive = original
+
+        total = sum(len(archive.Archive(path).blocks) for _, path in segments.list_segments(self.directory))
+        self.assertLess(time_reads, total // 4)
+        self.assertLess(region_reads, total)
+        self.assertIn("sur", regions)
+        self.assertEqual(len([line for line in lines if b'"sur"' in line]), 100)
+
+
+class TestArchivedPartitions(unittest.TestCase):
+    """Tests para el archivado de events_in de particiones viejas y las consultas sobre ellas"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "audit.db")
+        self.partition_dir = os.path.join(self.tmp.name, "partitions")
+        fields = {"security.incident": ("n",)}
+        self.conn = storage.init_db(self.db_path, fields)
+        self.partitions = partitions.DayPartitions(
+            self.conn, self.partition_dir, cold_after_days=0, archive_after_days=3, archive_block_bytes=600,
+            payload_fields=fields,
+        )
+        self.writer = group_commit.GroupCommitWriter(self.conn, max_rows=1000, partitions=self.partitions)
+        self.events = [self.event(number) for number in range(60)]
+        for tag, event in enumerate(self.events, 1):
+            self.writer.add(group_commit.KIND_EVENT, storage.event_row(event, event["run_id"]), FakeChannel(), tag)
+        self.writer.add(group_commit.KIND_METRIC, {
+            "metric_id": "m1", "date": "2026-01-20", "region": "sur", "metrics": {},
+            "input_event_ids": [event["event_id"] for event in self.events[10:20]],
+        }, FakeChannel(), 100)
+        self.writer.flush()
+
+    def tearDown(self):
+        self.partitions.wait_for_compaction()
+        self.conn.close()
+        self.tmp.cleanup()
+
+    @staticmethod
+    def event(number):
+        return {
+            "event_id": str(uuid.UUID(int=number)), "timestamp": f"2026-01-20T10:{number:02d}:00Z",
+            "region": REGIONS[number % 2], "source": "security.incident", "payload": {"n": number},
+            "run_id": "backfill" if number >= 40 else "default",
+        }
+
+    def archive(self):
+        self.partitions.maintain("2026-01-30")
+        self.partitions.wait_for_compaction()
+
+    def test_events_move_to_archive(self):
+        """Test que events_in se vacía, el archivo guarda todo y métricas/linaje quedan en la base"""
+        self.archive()
+        self.assertEqual(self.partitions.archived, 1)
+        path = partitions.partition_path(self.partition_dir, "2026-01-20")
+        conn = sqlite3.connect(path)
+        try:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM events_in").fetchone()[0], 0)
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM events_archived").fetchone()[0], 60)
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM trace").fetchone()[0], 10)
+            self.assertEqual(partitions.archive_generation(conn), 1)
+        finally:
+            conn.close()
+        data = archive.Archive(partitions.events_archive_path(self.partition_dir, "2026-01-20", 1))
+        self.assertEqual(data.records, 60)
+        self.assertGreater(len(data.blocks), 3)
+
+    def test_late_events_get_a_new_generation(self):
+        """Test que un evento tardío se suma al archivo en una generación nueva, sin duplicados"""
+        self.archive()
+        late = self.event(60)
+        self.writer.add(group_commit.KIND_EVENT, storage.event_row(late, "default"), FakeChannel(), 1)
+        self.writer.add(group_commit.KIND_EVENT, storage.event_row(self.events[0], "default"), FakeChannel(), 2)
+        self.writer.flush()
+        self.archive()
+
+        files = [name for name in os.listdir(self.partition_dir) if name.endswith(archive.SUFFIX)]
+        self.assertEqual(files, ["audit-2026-01-20.events.2.arc"])
+        data = archive.Archive(os.path.join(self.partition_dir, files[0]))
+        self.assertEqual(data.records, 61)
+
+    def test_rows_inserted_while_archiving_are_kept(self):
+        """Test que un evento insertado mientras se arma el archivo queda en events_in y no se pierde"""
+        path = partitions.partition_path(self.partition_dir, "2026-01-20")
+        late = self.event(60)
+        close = archive.ArchiveWriter.close
+
+        def close_after_late_insert(writer):
+            # El escritor readjunta el día entre la lectura de events_in y el borrado
+            conn = sqlite3.connect(path)
+            with conn:
+                storage.store_event_rows(conn, [storage.event_row(late, "default")])
+            conn.close()
+            close(writer)
+
+        with mock.patch.object(archive.ArchiveWriter, "close", close_after_late_insert):
+            self.assertEqual(partitions.archive_partition(path), 60)
+        conn = sqlite3.connect(path)
+        try:
+            self.assertEqual(conn.execute("SELECT event_id FROM events_in").fetchall(), [(late["event_id"],)])
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM events_archived").fetchone()[0], 60)
+        finally:
+            conn.close()
+
+        self.assertEqual(partitions.archive_partition(path), 61)  # La siguiente generación lo incluye
+
+    def test_queries_read_archived_events(self):
+        """Test que las consultas leen el archivo de forma transparente y filtran por región"""
+        self.archive()
+        conn = queries.connect(self.db_path, self.partition_dir)
+        try:
+            lineage = list(queries.iter_all(queries.events_for_metric, conn, "m1", limit=4))
+            self.assertEqual(sorted(event["payload"]["n"] for event in lineage), list(range(10, 20)))
+
+            streamed = list(queries.iter_all(queries.events_by_run, conn, "default", limit=7))
+            self.assertEqual([event["payload"]["n"] for event in streamed], list(range(40)))
+            ranged = list(queries.iter_all(
+                queries.events_by_run, conn, "backfill", "2026-01-20T10:45:00", "2026-01-20T10:50:00Z", region="sur"
+            ))
+            self.assertEqual([event["payload"]["n"] for event in ranged], [45, 47, 49])
+
+            found, _ = queries.events_by_payload(conn, "security.incident", "n", "15")
+            self.assertEqual([event["event_id"] for event in found], [self.events[15]["event_id"]])
+        finally:
+            conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Tests para el buffer columnar por micro-lotes del aggregator
+No requieren RabbitMQ ni dependencias externas
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "aggregator"))
+
+import columnar  # noqa: E402
+import idtable  # noqa: E402
+
+EVENTS = [
+    {"event_id": "e1", "region": "norte", "source": "security.incident", "timestamp": "2026-01-30T16:00:00Z",
+     "payload": {"location": {"latitude": -33.0, "longitude": -70.0}}},
+    {"event_id": "e2", "region": "norte", "source": "survey.victimization", "timestamp": "2026-01-30T16:00:05Z",
+     "payload": {"respondent_age": 30}},
+    {"event_id": "e3", "region": "sur", "source": "survey.victimization", "timestamp": "2026-01-30T16:00:10Z",
+     "payload": {"respondent_age": 50}},
+    {"event_id": "e4", "region": "norte", "source": "survey.victimization", "timestamp": "no-es-fecha",
+     "payload": {"respondent_age": "treinta"}},
+    {"event_id": "e5"},
+]
+
+
+class TestColumnarBuffer(unittest.TestCase):
+    """Tests para las reducciones group-by por micro-lote"""
+
+    def fill(self, batch_size):
+        buffer = columnar.ColumnarBuffer(batch_size=batch_size)
+        for event in EVENTS:
+            buffer.append(event)
+        return buffer
+
+    def test_counts_match_dict_path(self):
+        """Test que los recuentos coinciden con el formato de stats_buffer"""
+        buffer = self.fill(batch_size=4096)
+
+        self.assertEqual(len(buffer), 5)
+        self.assertEqual(buffer.stats_by_region(), {
+            "norte": {"security.incident": 1, "survey.victimization": 2},
+            "sur": {"survey.victimization": 1},
+            "unknown": {"unknown": 1},
+        })
+        ids = {region: set(table) for region, table in buffer.ids_by_region().items()}
+        self.assertEqual(ids, {"norte": {"e1", "e2", "e4"}, "sur": {"e3"}, "unknown": {"e5"}})
+
+    def test_events_are_decoded_on_append(self):
+        """Test que cada evento va a las columnas al llegar y su ID a la IdTable de su región"""
+        buffer = columnar.ColumnarBuffer(batch_size=4096)
+        buffer.append(EVENTS[1])
+        buffer.append(dict(EVENTS[2]))
+
+        self.assertEqual(list(buffer.region_col), [0, 1])
+        self.assertEqual(list(buffer.numeric_cols["payload.respondent_age"]), [30.0, 50.0])
+        self.assertEqual(list(buffer.timestamp_col), [1769788805.0, 1769788810.0])
+        ids = buffer.ids_by_region()
+        self.assertIsInstance(ids["sur"], idtable.IdTable)
+        self.assertIn("e2", ids["norte"])
+
+    def test_results_independent_of_batch_size(self):
+        """Test que partir la ventana en micro-lotes no cambia el resultado"""
+        whole = self.fill(batch_size=4096)
+        split = self.fill(batch_size=2)
+
+        self.assertEqual(whole.stats_by_region(), split.stats_by_region())
+        self.assertEqual(whole.numeric_stats_by_region(), split.numeric_stats_by_region())
+
+    def test_numeric_stats_skip_missing_values(self):
+        """Test que los campos ausentes o no numéricos no cuentan"""
+        stats = self.fill(batch_size=3).numeric_stats_by_region()
+
+        ages = stats["norte"]["payload.respondent_age"]
+        self.assertEqual((ages["count"], ages["min"], ages["max"], ages["mean"]), (1, 30.0, 30.0, 30.0))
+        self.assertEqual(stats["sur"]["payload.respondent_age"]["sum"], 50.0)
+        self.assertEqual(stats["norte"]["payload.location.latitude"]["count"], 1)
+        # El timestamp inválido de e4 no cuenta
+        self.assertEqual(stats["norte"]["timestamp"]["count"], 2)
+        self.assertNotIn("unknown", stats)
+
+    def test_parse_timestamp(self):
+        """Test de conversión de timestamps ISO con 'Z'"""
+        self.assertEqual(columnar.parse_timestamp("1970-01-01T00:01:00Z"), 60.0)
+        self.assertNotEqual(columnar.parse_timestamp(None), columnar.parse_timestamp(None))  # NaN
+
+
+if __name__ == '__main__':
+    unittest.main()
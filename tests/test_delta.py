@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Tests para la publicación incremental de analytics.window (aggregator) y la
+reconstrucción del estado completo en el dashboard
+No requieren RabbitMQ ni dependencias externas
+"""
+
+import json
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "aggregator"))
+sys.path.insert(0, os.path.join(ROOT, "dashboard"))
+
+import delta  # noqa: E402
+from window_state import WindowState  # noqa: E402
+
+
+def make_summary(stats, total=1):
+    return {
+        "type": "window_summary",
+        "window_start_iso": "2026-01-30T16:00:00",
+        "window_end_iso": "2026-01-30T16:00:05",
+        "total_processed": total,
+        "stats_by_region": stats,
+    }
+
+
+WINDOWS = [
+    {"norte": {"security.incident": 3}, "sur": {"migration.case": 1}},
+    {"norte": {"security.incident": 3}, "sur": {"migration.case": 2}},
+    {"norte": {"security.incident": 4, "survey.victimization": 1}},
+    {"norte": {"survey.victimization": 1}, "este": {"security.incident": 9}},
+    {"norte": {"survey.victimization": 1}, "este": {"security.incident": 9}},
+]
+
+
+class TestDeltaEncoder(unittest.TestCase):
+    """Tests para el diff y los keyframes"""
+
+    def test_diff_marks_changes_and_removals(self):
+        """Test que el diff solo incluye celdas cambiadas y eliminadas"""
+        changes, removed = delta.diff(
+            {"norte": {"a": 1, "b": 2}, "sur": {"a": 1}},
+            {"norte": {"a": 1, "b": 3}, "este": {"a": 5}},
+        )
+        self.assertEqual(changes, {"norte": {"b": 3}, "este": {"a": 5}})
+        self.assertEqual(removed, [["sur"]])
+
+    def test_keyframe_interval(self):
+        """Test que se emite un keyframe completo cada N ventanas"""
+        encoder = delta.DeltaEncoder(keyframe_interval=3)
+        modes = [encoder.encode(make_summary(stats))["delta"]["mode"] for stats in WINDOWS]
+        self.assertEqual(modes, ["keyframe", "delta", "delta", "keyframe", "delta"])
+
+    def test_unchanged_window_has_empty_changes(self):
+        """Test que una ventana idéntica a la anterior no lleva celdas"""
+        encoder = delta.DeltaEncoder(keyframe_interval=10)
+        encoder.encode(make_summary(WINDOWS[3]))
+        message = encoder.encode(make_summary(WINDOWS[4]))
+        self.assertEqual(message["changes"], {})
+        self.assertNotIn("stats_by_region", message)
+
+    def test_invalid_interval(self):
+        with self.assertRaises(ValueError):
+            delta.DeltaEncoder(keyframe_interval=0)
+
+
+class TestWindowState(unittest.TestCase):
+    """Tests para la reconstrucción del estado en el consumidor"""
+
+    def test_roundtrip_matches_full_snapshots(self):
+        """Test que aplicar los deltas reproduce cada snapshot completo"""
+        encoder = delta.DeltaEncoder(keyframe_interval=3)
+        state = WindowState()
+        for index, stats in enumerate(WINDOWS):
+            message = json.loads(json.dumps(encoder.encode(make_summary(stats, total=index))))
+            rebuilt = state.apply(message)
+            self.assertEqual(rebuilt, make_summary(stats, total=index))
+
+    def test_null_values_are_not_removals(self):
+        """Test que un valor null (p. ej. un cuantil vacío) llega como null y las claves borradas se borran"""
+        encoder = delta.DeltaEncoder(keyframe_interval=10)
+        state = WindowState()
+        first = make_summary(WINDOWS[0])
+        first["aggregates_by_region"] = {"norte": {"p95": 3.0, "p50": 1.0}, "sur": {"p95": 2.0}}
+        second = make_summary(WINDOWS[1])
+        second["aggregates_by_region"] = {"norte": {"p95": None, "p50": 1.0}}
+        state.apply(json.loads(json.dumps(encoder.encode(first))))
+        message = json.loads(json.dumps(encoder.encode(second)))
+
+        self.assertEqual(message["removed"], [["aggregates_by_region", "sur"]])
+        self.assertEqual(state.apply(message), second)
+
+    def test_late_consumer_waits_for_keyframe(self):
+        """Test que un consumidor que se conecta a mitad de secuencia espera el keyframe"""
+        encoder = delta.DeltaEncoder(keyframe_interval=3)
+        messages = [encoder.encode(make_summary(stats)) for stats in WINDOWS]
+        state = WindowState()
+
+        self.assertIsNone(state.apply(messages[1]))
+        self.assertIsNone(state.apply(messages[2]))
+        self.assertEqual(state.apply(messages[3])["stats_by_region"], WINDOWS[3])
+        self.assertEqual(state.skipped, 2)
+
+    def test_gap_requires_new_keyframe(self):
+        """Test que un delta perdido invalida los siguientes hasta el keyframe"""
+        encoder = delta.DeltaEncoder(keyframe_interval=10)
+        messages = [encoder.encode(make_summary(stats)) for stats in WINDOWS]
+        state = WindowState()
+        state.apply(messages[0])
+
+        self.assertIsNone(state.apply(messages[2]))  # Falta messages[1]
+
+    def test_full_mode_messages_pass_through(self):
+        """Test que los mensajes sin bloque delta (modo full) se aceptan tal cual"""
+        state = WindowState()
+        summary = make_summary(WINDOWS[0])
+        self.assertEqual(state.apply(summary), summary)
+
+    def test_delta_is_smaller_for_sparse_changes(self):
+        """Test que con pocas celdas cambiadas el delta ocupa menos bytes"""
+        stats = {f"region-{r}": {f"source-{s}": r * s for s in range(20)} for r in range(20)}
+        encoder = delta.DeltaEncoder(keyframe_interval=10)
+        full_bytes = len(json.dumps(encoder.encode(make_summary(stats))))
+        stats = {region: dict(counts) for region, counts in stats.items()}
+        stats["region-3"]["source-4"] += 1
+        delta_bytes = len(json.dumps(encoder.encode(make_summary(stats))))
+
+        self.assertLess(delta_bytes * 10, full_bytes)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Tests para la exportación masiva de audit (formatos, filtros, linaje y particiones)
+No requieren RabbitMQ ni dependencias externas
+"""
+
+import csv
+import gzip
+import json
+import os
+import sys
+import tempfile
+import unittest
+import uuid
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, "aggregator"))
+sys.path.insert(0, os.path.join(ROOT_DIR, "audit"))
+
+import exporter  # noqa: E402
+import group_commit  # noqa: E402
+import lineage  # noqa: E402
+import partitions  # noqa: E402
+import storage  # noqa: E402
+
+
+def make_event(number):
+    return {
+        "event_id": str(uuid.UUID(int=number)),
+        "timestamp": f"2026-01-{29 + number // 50}T16:{number % 50:02d}:00Z",
+        "region": ("norte", "sur")[number % 2],
+        "source": ("security.incident", "migration.case")[number // 10 % 2],
+        "payload": {"n": number, "texto": "ñandú, \"comillas\"\n"},
+        "run_id": "backfill" if number >= 80 else "default",
+    }
+
+
+class FakeChannel:
+    """Ignora los ack/nack"""
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        pass
+
+    def basic_nack(self, delivery_tag, requeue=True):
+        pass
+
+
+class TestExporter(unittest.TestCase):
+    """Tests para los formatos y filtros sobre una audit.db sin particiones"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.db_path = os.path.join(cls.tmp.name, "audit.db")
+        cls.events = [make_event(number) for number in range(100)]
+        conn = storage.init_db(cls.db_path)
+        with conn:
+            storage.store_event_rows(conn, [storage.event_row(event, event["run_id"]) for event in cls.events])
+            storage.store_metric_and_trace(conn, {
+                "metric_id": "m-trace", "date": "2026-01-29", "region": "sur", "metrics": {"count": 5},
+                "input_event_ids": [event["event_id"] for event in cls.events[:5]],
+            })
+            storage.store_metric_and_trace(conn, {
+                "metric_id": "m-compact", "date": "2026-01-30", "region": "norte", "run_id": "backfill",
+                "metrics": {"count": 3},
+                "input_lineage": lineage.encode_event_ids([event["event_id"] for event in cls.events[80:82]] + ["legacy-1"]),
+            })
+        conn.close()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def out(self, name):
+        return os.path.join(self.tmp.name, name)
+
+    def test_jsonl_roundtrip_in_chunks(self):
+        """Test que jsonl.gz exporta todos los eventos con el payload como JSON anidado, de a bloques"""
+        path = self.out("events.jsonl.gz")
+        rows, _ = exporter.export(self.db_path, "events", "jsonl.gz", path, chunk_rows=7)
+        self.assertEqual(rows, 100)
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            exported = {item["event_id"]: item for item in map(json.loads, f)}
+        self.assertEqual(len(exported), 100)
+        for event in self.events:
+            item = exported[event["event_id"]]
+            self.assertEqual(item["payload"], event["payload"])
+            self.assertEqual((item["timestamp"], item["run_id"]), (event["timestamp"], event["run_id"]))
+        self.assertFalse(os.path.exists(path + ".tmp"))
+
+    def test_filters_and_csv(self):
+        """Test que los filtros de fecha, región, fuente y run_id se combinan y --to con fecha incluye el día"""
+        path = self.out("events.csv")
+        filters = exporter.Filters("2026-01-29", "2026-01-29", region="sur", source="migration.case")
+        rows, _ = exporter.export(self.db_path, "events", "csv", path, filters)
+        with open(path, encoding="utf-8", newline="") as f:
+            exported = list(csv.DictReader(f))
+        expected = [event for event in self.events[:50] if event["region"] == "sur" and event["source"] == "migration.case"]
+        self.assertEqual(rows, len(expected))
+        self.assertEqual(sorted(row["event_id"] for row in exported), sorted(e["event_id"] for e in expected))
+        self.assertEqual(json.loads(exported[0]["payload_json"])["texto"], "ñandú, \"comillas\"\n")
+
+        rows, _ = exporter.export(self.db_path, "events", "csv", path, exporter.Filters(run_id="backfill"))
+        self.assertEqual(rows, 20)
+        with self.assertRaises(ValueError):
+            exporter.export(self.db_path, "metrics", "csv", path, exporter.Filters(source="x"))
+        self.assertTrue(os.path.exists(path))  # El error no borra la exportación anterior
+
+    def test_columnar_dump(self):
+        """Test que el volcado columnar guarda texto, diccionarios y tiempos por columna"""
+        path = self.out("events.d")
+        rows, _ = exporter.export(self.db_path, "events", "columnar", path, chunk_rows=30)
+        manifest, columns = exporter.read_columnar(path)
+        self.assertEqual((rows, manifest["rows"], manifest["table"]), (100, 100, "events"))
+        self.assertEqual(os.path.getsize(os.path.join(path, "timestamp.f8")), 800)
+        by_id = {event["event_id"]: event for event in self.events}
+        for index, event_id in enumerate(columns["event_id"]):
+            event = by_id[event_id]
+            self.assertEqual(columns["region"][index], event["region"])
+            self.assertEqual(json.loads(columns["payload_json"][index]), event["payload"])
+            self.assertIsNone(columns["correlation_id"][index])
+        self.assertEqual(columns["timestamp"][0], 1769702400.0)  # 2026-01-29T16:00:00Z
+        self.assertEqual(sorted(manifest["columns"][2]["dictionary"]), ["norte", "sur"])
+
+    def test_metrics_and_lineage(self):
+        """Test que lineage une trace y el linaje compacto con el evento, y marca los que audit no guardó"""
+        path = self.out("metrics.jsonl")
+        rows, _ = exporter.export(self.db_path, "metrics", "jsonl", path)
+        with open(path, encoding="utf-8") as f:
+            metrics = {item["metric_id"]: item for item in map(json.loads, f)}
+        self.assertEqual(rows, 2)
+        self.assertEqual(metrics["m-compact"]["metrics"], {"count": 3})
+
+        path = self.out("lineage.csv")
+        rows, _ = exporter.export(self.db_path, "lineage", "csv", path, chunk_rows=2)
+        with open(path, encoding="utf-8", newline="") as f:
+            exported = list(csv.DictReader(f))
+        self.assertEqual(rows, 8)
+        compact = {row["event_id"]: row for row in exported if row["metric_id"] == "m-compact"}
+        self.assertEqual(compact[self.events[80]["event_id"]]["timestamp"], self.events[80]["timestamp"])
+        self.assertEqual(compact["legacy-1"]["timestamp"], "")
+
+        rows, _ = exporter.export(self.db_path, "lineage", "csv", path, exporter.Filters(source="security.incident"))
+        self.assertEqual(rows, 7)  # legacy-1 no tiene fuente
+
+    def test_stdout_only_uncompressed(self):
+        """Test que a stdout no se exporta comprimido ni columnar"""
+        with self.assertRaises(ValueError):
+            exporter.export(self.db_path, "events", "jsonl.gz", "-")
+
+
+class TestPartitionedExport(unittest.TestCase):
+    """Tests para la exportación desde particiones diarias, incluso archivadas"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "audit.db")
+        self.partition_dir = os.path.join(self.tmp.name, "partitions")
+        conn = storage.init_db(self.db_path)
+        days = partitions.DayPartitions(conn, self.partition_dir, cold_after_days=0, archive_after_days=3,
+                                        archive_block_bytes=500)
+        writer = group_commit.GroupCommitWriter(conn, max_rows=1000, partitions=days)
+        self.events = [make_event(number) for number in range(100)]
+        for tag, event in enumerate(self.events, 1):
+            writer.add(group_commit.KIND_EVENT, storage.event_row(event, event["run_id"]), FakeChannel(), tag)
+        # La métrica del 30 usa eventos del 29 (otra partición, archivada)
+        writer.add(group_commit.KIND_METRIC, {
+            "metric_id": "m1", "date": "2026-01-30", "region": "sur", "metrics": {},
+            "input_event_ids": [event["event_id"] for event in self.events[45:55]],
+        }, FakeChannel(), 200)
+        writer.flush()
+        days.maintain("2026-02-01")  # Archiva el 29; el 30 queda en events_in
+        days.wait_for_compaction()
+        conn.close()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_events_and_lineage_span_partitions(self):
+        """Test que se exportan los eventos archivados y el linaje resuelve eventos de otra partición"""
+        path = os.path.join(self.tmp.name, "events.jsonl")
+        rows, _ = exporter.export(self.db_path, "events", "jsonl", path, chunk_rows=9,
+                                  partition_dir=self.partition_dir)
+        with open(path, encoding="utf-8") as f:
+            exported = sorted(item["payload"]["n"] for item in map(json.loads, f))
+        self.assertEqual((rows, exported), (100, list(range(100))))
+
+        rows, _ = exporter.export(self.db_path, "events", "jsonl", path, exporter.Filters(
+            "2026-01-29T16:40:00Z", "2026-01-30T16:05:00Z", region="sur"), partition_dir=self.partition_dir)
+        with open(path, encoding="utf-8") as f:
+            exported = sorted(item["payload"]["n"] for item in map(json.loads, f))
+        self.assertEqual(exported, [n for n in range(40, 56) if n % 2])
+
+        path = os.path.join(self.tmp.name, "lineage.d")
+        rows, _ = exporter.export(self.db_path, "lineage", "columnar", path, partition_dir=self.partition_dir)
+        _, columns = exporter.read_columnar(path)
+        self.assertEqual(rows, 10)
+        self.assertFalse(any(value != value for value in columns["timestamp"]))  # Sin NaN: todos resueltos
+
+
+if __name__ == '__main__':
+    unittest.main()
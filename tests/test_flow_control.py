@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Tests para el prefetch adaptativo (AIMD) de aggregator y audit
+No requieren RabbitMQ ni dependencias externas
+"""
+
+import filecmp
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "aggregator"))
+
+import flow_control  # noqa: E402
+
+
+def run_period(control, latency, queue_depth, messages=10):
+    for _ in range(messages):
+        control.record(latency)
+    return control.adjust(queue_depth)
+
+
+class TestAdaptivePrefetch(unittest.TestCase):
+    """Tests para el ajuste de prefetch según latencia y profundidad de la cola"""
+
+    def make_control(self, **overrides):
+        params = dict(initial=10, minimum=1, maximum=100, target_latency=0.05,
+                      max_buffered_seconds=100.0, increase_step=5)
+        params.update(overrides)
+        return flow_control.AdaptivePrefetch(**params)
+
+    def test_additive_increase_with_backlog(self):
+        """Test que con latencia baja y cola llena el prefetch sube de a un paso"""
+        control = self.make_control()
+        self.assertEqual(run_period(control, 0.001, queue_depth=1000), 15)
+        self.assertEqual(run_period(control, 0.001, queue_depth=1000), 20)
+
+    def test_hold_without_backlog(self):
+        """Test que sin mensajes esperando el prefetch no cambia"""
+        control = self.make_control()
+        self.assertIsNone(run_period(control, 0.001, queue_depth=3))
+        self.assertEqual(control.prefetch, 10)
+
+    def test_multiplicative_decrease_on_slow_processing(self):
+        """Test que con latencia sobre el objetivo el prefetch se reduce a la mitad"""
+        control = self.make_control(initial=80)
+        self.assertEqual(run_period(control, 0.2, queue_depth=1000), 40)
+        self.assertEqual(run_period(control, 0.2, queue_depth=1000), 20)
+
+    def test_bounds(self):
+        """Test que el prefetch se mantiene entre mínimo y máximo"""
+        control = self.make_control(initial=98, maximum=100)
+        run_period(control, 0.001, queue_depth=10000)
+        self.assertEqual(control.prefetch, 100)
+        self.assertIsNone(run_period(control, 0.001, queue_depth=10000))
+
+        control = self.make_control(initial=2, minimum=2)
+        self.assertIsNone(run_period(control, 1.0, queue_depth=10000))
+        self.assertEqual(control.prefetch, 2)
+
+    def test_backlog_cap_by_processing_time(self):
+        """Test que los mensajes sin ack no superan max_buffered_seconds de trabajo"""
+        control = self.make_control(initial=50, target_latency=1.0, max_buffered_seconds=1.0)
+        # 40 ms por mensaje -> como máximo 25 mensajes en vuelo
+        self.assertEqual(run_period(control, 0.04, queue_depth=1000), 25)
+
+    def test_due_and_status(self):
+        """Test del intervalo de ajuste y del reporte del valor actual"""
+        control = self.make_control(adjust_interval=5.0)
+        control.adjust(now=100.0)
+        control.record(0.002)
+        self.assertFalse(control.due(now=103.0))
+        self.assertTrue(control.due(now=105.0))
+
+        run_period(control, 0.002, queue_depth=500)
+        status = control.status()
+        self.assertEqual(status["prefetch"], 15)
+        self.assertEqual(status["queue_depth"], 500)
+        self.assertEqual(status["adjustments"], 1)
+
+    def test_invalid_bounds(self):
+        with self.assertRaises(ValueError):
+            flow_control.AdaptivePrefetch(minimum=10, maximum=5)
+
+    def test_audit_copy_is_identical(self):
+        """Test que aggregator y audit usan la misma implementación"""
+        self.assertTrue(filecmp.cmp(
+            os.path.join(ROOT, "aggregator", "flow_control.py"),
+            os.path.join(ROOT, "audit", "flow_control.py"),
+            shallow=False,
+        ))
+
+
+if __name__ == '__main__':
+    unittest.main()
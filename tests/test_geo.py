@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Tests para el binning espacial de incidentes del aggregator
+No requieren RabbitMQ ni dependencias externas
+"""
+
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "aggregator"))
+
+import geo  # noqa: E402
+
+
+class TestGeoGrid(unittest.TestCase):
+    """Tests para la grilla de celdas por severidad"""
+
+    def test_grid_cells_and_centers(self):
+        """Test que puntos cercanos caen en la misma celda con su centro"""
+        grid = geo.GeoGrid(mode="grid", cell_deg=0.5)
+        grid.add(-33.45, -70.66, "high")
+        grid.add(-33.30, -70.90, "high")
+        grid.add(-33.45, -70.66, "low")
+
+        message = grid.to_message()
+        self.assertEqual(message["total"], 3)
+        self.assertEqual(message["cell_deg"], 0.5)
+        high_cells = [cell for cell in message["cells"] if cell["severity"] == "high"]
+        self.assertEqual(len(high_cells), 1)
+        self.assertEqual(high_cells[0]["count"], 2)
+        self.assertEqual(high_cells[0]["cell"], "-67:-142")
+        self.assertEqual((high_cells[0]["lat"], high_cells[0]["lon"]), (-33.25, -70.75))
+
+    def test_geohash_matches_reference(self):
+        """Test que el modo geohash coincide con el geohash estándar"""
+        grid = geo.GeoGrid(mode="geohash", geohash_precision=11)
+        grid.add(57.64911, 10.40744, "medium")
+
+        self.assertEqual(grid.bin(), {"medium": {"u4pruydqqvj": 1}})
+
+    def test_geohash_edges_are_clamped(self):
+        """Test que los bordes del mundo no generan celdas inválidas"""
+        grid = geo.GeoGrid(mode="geohash", geohash_precision=2)
+        grid.add(90.0, 180.0, "low")
+
+        self.assertEqual(grid.bin(), {"low": {"zz": 1}})
+
+    def test_invalid_coordinates(self):
+        """Test que coordenadas fuera de rango se rechazan"""
+        grid = geo.GeoGrid()
+        with self.assertRaises(ValueError):
+            grid.add(120.0, 0.0)
+        with self.assertRaises(ValueError):
+            geo.GeoGrid(mode="hexagonos")
+        self.assertEqual(len(grid), 0)
+
+    def test_batch_counts_are_sparse_and_complete(self):
+        """Test que un lote grande conserva el total y solo publica celdas ocupadas"""
+        grid = geo.GeoGrid(mode="grid", cell_deg=1.0)
+        rng = random.Random(7)
+        lats = [rng.uniform(-55.0, -17.0) for _ in range(5000)]
+        lons = [rng.uniform(-75.0, -66.0) for _ in range(5000)]
+        grid.add_many(lats, lons, "high")
+
+        cells = grid.to_message()["cells"]
+        self.assertEqual(sum(cell["count"] for cell in cells), 5000)
+        self.assertLessEqual(len(cells), 39 * 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Tests para el group commit de escrituras del servicio de auditoría
+No requieren RabbitMQ ni dependencias externas (SQLite en memoria)
+"""
+
+import os
+import sqlite3
+import sys
+import unittest
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "audit"))
+
+import group_commit  # noqa: E402
+import lineage_store  # noqa: E402
+import storage  # noqa: E402
+
+
+class FakeChannel:
+    """Registra los ack/nack como lo haría un canal de pika"""
+
+    def __init__(self):
+        self.acks = []
+        self.nacks = []
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        self.acks.append((delivery_tag, multiple))
+
+    def basic_nack(self, delivery_tag, requeue=True):
+        self.nacks.append((delivery_tag, requeue))
+
+
+def make_event(event_id):
+    return {"event_id": event_id, "timestamp": "2026-01-30T16:00:00Z", "region": "norte", "source": "security.incident"}
+
+
+class TestGroupCommitWriter(unittest.TestCase):
+    """Tests para los lotes, el ack múltiple y el requeue ante errores"""
+
+    def setUp(self):
+        self.conn = storage.init_db(":memory:")
+        self.channel = FakeChannel()
+        self.writer = group_commit.GroupCommitWriter(self.conn, max_rows=3)
+
+    def add_event(self, tag, event_id):
+        row = storage.event_row(make_event(event_id), "default")
+        return self.writer.add(group_commit.KIND_EVENT, row, self.channel, tag, "security.incident")
+
+    def count(self, table):
+        return self.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def test_batch_is_full_at_max_rows(self):
+        """Test que add() avisa cuando el lote alcanza max_rows"""
+        self.assertFalse(self.add_event(1, "e1"))
+        self.assertFalse(self.add_event(2, "e2"))
+        self.assertTrue(self.add_event(3, "e3"))
+
+    def test_flush_writes_and_multi_acks(self):
+        """Test que el lote se escribe en una transacción y se confirma con un ack múltiple"""
+        self.add_event(1, "e1")
+        self.add_event(2, "e2")
+        self.add_event(3, "e2")  # Duplicado: INSERT OR IGNORE
+
+        self.assertEqual(self.writer.flush(), (3, 0))
+        self.assertEqual(self.count("events_in"), 2)
+        self.assertEqual(self.channel.acks, [(3, True)])
+        self.assertEqual(len(self.writer), 0)
+
+    def test_metrics_after_events_in_same_batch(self):
+        """Test que una métrica con trazas a eventos del mismo lote respeta las FK"""
+        metric = {"metric_id": "m1", "date": "2026-01-30", "region": "norte",
+                  "metrics": {"security.incident": 1}, "input_event_ids": ["e1"]}
+        self.writer.add(group_commit.KIND_METRIC, metric, self.channel, 1, "metrics.daily")
+        self.add_event(2, "e1")
+
+        self.assertEqual(self.writer.flush(), (2, 0))
+        self.assertEqual(self.count("trace"), 1)
+
+    def test_failed_batch_falls_back_to_per_message(self):
+        """Test que un mensaje inválido solo devuelve a la cola ese mensaje"""
+        self.add_event(1, "e1")
+        bad_metric = {"metric_id": "m1", "date": "2026-01-30", "region": "norte",
+                      "metrics": {}, "input_event_ids": ["no-existe"]}
+        self.writer.add(group_commit.KIND_METRIC, bad_metric, self.channel, 2, "metrics.daily")
+        self.add_event(3, "e3")
+
+        self.assertEqual(self.writer.flush(), (2, 1))
+        self.assertEqual(self.count("events_in"), 2)
+        self.assertEqual(self.count("metrics_out"), 0)  # La métrica y sus trazas se revierten juntas
+        self.assertEqual(self.channel.acks, [(1, False), (3, False)])
+        self.assertEqual(self.channel.nacks, [(2, True)])
+        self.assertEqual(self.writer.fallbacks, 1)
+
+    def test_acks_per_channel(self):
+        """Test que cada canal recibe su propio ack múltiple"""
+        other = FakeChannel()
+        self.add_event(5, "e1")
+        self.writer.add(group_commit.KIND_EVENT, storage.event_row(make_event("e2"), "default"), other, 2)
+
+        self.writer.flush()
+        self.assertEqual(self.channel.acks, [(5, True)])
+        self.assertEqual(other.acks, [(2, True)])
+
+    def test_discard_and_empty_flush(self):
+        """Test que discard() olvida el lote sin confirmar nada"""
+        self.add_event(1, "e1")
+        self.assertEqual(self.writer.discard(), 1)
+        self.assertEqual(self.writer.flush(), (0, 0))
+        self.assertEqual(self.channel.acks, [])
+        self.assertEqual(self.count("events_in"), 0)
+
+    def test_invalid_event_row(self):
+        """Test que la validación de campos requeridos se mantiene"""
+        with self.assertRaises(ValueError):
+            storage.event_row({"event_id": "e1"}, "default")
+
+
+class TestTraceIngest(unittest.TestCase):
+    """Tests para la ingesta masiva del linaje de métricas con input_event_ids"""
+
+    def setUp(self):
+        self.conn = storage.init_db(":memory:")
+        self.event_ids = [str(uuid.UUID(int=n)) for n in range(200, 0, -1)]
+        with self.conn:
+            storage.store_event_rows(self.conn, [storage.event_row(make_event(e), "default") for e in self.event_ids])
+
+    def metric(self, event_ids, metric_id="m1"):
+        return {"metric_id": metric_id, "date": "2026-01-30", "region": "norte", "metrics": {},
+                "input_event_ids": event_ids}
+
+    def count(self, table):
+        return self.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def test_rows_mode_bulk_insert(self):
+        """Test que el modo "rows" escribe una fila de trace por evento (sin duplicados)"""
+        with self.conn:
+            storage.store_metric_and_trace(self.conn, self.metric(self.event_ids + self.event_ids[:5]))
+        self.assertEqual(self.count("trace"), 200)
+        self.assertEqual(self.count("metric_lineage"), 0)
+
+    def test_compact_mode_single_row(self):
+        """Test que el modo "compact" guarda la ventana como una fila y se puede materializar"""
+        event_ids = self.event_ids + ["legacy-1"]
+        with self.conn:
+            storage.store_metric_and_trace(self.conn, self.metric(event_ids), trace_mode="compact")
+        self.assertEqual((self.count("trace"), self.count("metric_lineage")), (0, 1))
+        self.assertEqual(sorted(lineage_store.expand_lineage(self.conn, "m1")), sorted(event_ids))
+
+        with self.conn:
+            storage.store_metric_and_trace(self.conn, self.metric(self.event_ids, "m2"), trace_mode="compact")
+            self.assertEqual(lineage_store.materialize_trace(self.conn, "m2"), 200)
+        self.assertEqual(self.count("trace"), 200)
+
+    def test_deferred_foreign_keys(self):
+        """Test que con FK diferidas el evento puede llegar después en la misma transacción"""
+        late = make_event(str(uuid.UUID(int=999)))
+        with self.assertRaises(sqlite3.IntegrityError):
+            with self.conn:
+                storage.store_metric_and_trace(self.conn, self.metric([late["event_id"]]))
+
+        with self.conn:
+            storage.store_metric_and_trace(self.conn, self.metric([late["event_id"]]), defer_foreign_keys=True)
+            storage.store_event_rows(self.conn, [storage.event_row(late, "default")])
+        self.assertEqual(self.count("trace"), 1)
+
+        with self.assertRaises(sqlite3.IntegrityError):
+            with self.conn:  # Sin el evento, falla recién en el COMMIT
+                storage.store_metric_and_trace(self.conn, self.metric(["no-existe"], "m2"), defer_foreign_keys=True)
+        self.assertEqual(self.count("metrics_out"), 1)
+
+    def test_invalid_trace_mode(self):
+        """Test que un modo desconocido se rechaza al crear el writer"""
+        with self.assertRaises(ValueError):
+            group_commit.GroupCommitWriter(self.conn, trace_mode="otro")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Tests para las tablas compactas de event_ids del aggregator
+No requieren RabbitMQ ni dependencias externas
+"""
+
+import os
+import random
+import sys
+import time
+import unittest
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "aggregator"))
+
+import idtable  # noqa: E402
+import lineage  # noqa: E402
+
+
+def random_ids(count, seed=1):
+    rng = random.Random(seed)
+    return [str(uuid.UUID(int=rng.getrandbits(128), version=4)) for _ in range(count)]
+
+
+class TestIdTable(unittest.TestCase):
+    """Tests para el comportamiento tipo set/dict de IdTable"""
+
+    def test_set_semantics_with_growth(self):
+        """Test que la tabla crece y mantiene todas las claves"""
+        ids = random_ids(5000)
+        table = idtable.IdTable(capacity=8)
+        for event_id in ids:
+            table.add(event_id)
+            table.add(event_id)  # Duplicado
+
+        self.assertEqual(len(table), 5000)
+        self.assertTrue(all(event_id in table for event_id in ids))
+        self.assertNotIn(str(uuid.uuid4()), table)
+        self.assertEqual(sorted(table), sorted(ids))
+
+    def test_non_uuid_keys_use_fallback(self):
+        """Test que IDs no UUID (o no canónicos) también se aceptan"""
+        table = idtable.IdTable(with_timestamps=True)
+        upper = str(uuid.uuid4()).upper()
+        table["event-1"] = 10.0
+        table[upper] = 20.0
+        table[None] = 30.0
+
+        self.assertEqual(table["event-1"], 10.0)
+        self.assertIn(upper, table)
+        self.assertIn(None, table)
+        self.assertEqual(len(table), 3)
+
+    def test_timestamps_roundtrip(self):
+        """Test que el timestamp se conserva con resolución de décimas"""
+        table = idtable.IdTable(with_timestamps=True)
+        event_id = str(uuid.uuid4())
+        now = time.time()
+        table[event_id] = now
+
+        self.assertAlmostEqual(table[event_id], now, delta=0.11)
+        with self.assertRaises(KeyError):
+            table[str(uuid.uuid4())]
+
+    def test_remove_older_than(self):
+        """Test que la expiración borra solo IDs antiguos y no rompe el sondeo"""
+        table = idtable.IdTable(capacity=16, with_timestamps=True)
+        now = time.time()
+        old_ids = random_ids(300, seed=2)
+        new_ids = random_ids(300, seed=3)
+        for event_id in old_ids:
+            table[event_id] = now - 7200
+        for event_id in new_ids:
+            table[event_id] = now
+        table["legacy-id"] = now - 7200
+
+        removed = table.remove_older_than(now - 3600)
+
+        self.assertEqual(removed, 301)
+        self.assertEqual(len(table), 300)
+        self.assertTrue(all(event_id in table for event_id in new_ids))
+        self.assertFalse(any(event_id in table for event_id in old_ids))
+
+    def test_discard(self):
+        """Test de borrado individual con desplazamiento hacia atrás"""
+        ids = random_ids(200, seed=4)
+        table = idtable.IdTable(capacity=16)
+        for event_id in ids:
+            table.add(event_id)
+        for event_id in ids[::2]:
+            table.discard(event_id)
+
+        self.assertEqual(sorted(table), sorted(ids[1::2]))
+
+    def test_packed_sorted_feeds_lineage(self):
+        """Test que los IDs empaquetados generan el mismo linaje que la lista"""
+        ids = random_ids(100, seed=5) + ["event-1"]
+        table = idtable.IdTable()
+        for event_id in ids:
+            table.add(event_id)
+
+        encoded = lineage.encode_packed(*table.packed_sorted())
+        self.assertEqual(encoded, lineage.encode_event_ids(ids))
+
+    def test_memory_per_entry(self):
+        """Test que cada entrada ocupa bastante menos que un str en un dict"""
+        table = idtable.IdTable(with_timestamps=True)
+        for event_id in random_ids(20000, seed=6):
+            table[event_id] = 0.0
+
+        self.assertLess(table.memory_bytes() / len(table), 50)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Tests para la codificación compacta del linaje (aggregator) y su
+almacenamiento/expansión en SQLite (audit).
+No requieren RabbitMQ ni dependencias externas
+"""
+
+import json
+import os
+import sqlite3
+import sys
+import unittest
+import uuid
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, "aggregator"))
+sys.path.insert(0, os.path.join(ROOT_DIR, "audit"))
+
+import lineage  # noqa: E402
+import lineage_store  # noqa: E402
+
+
+def create_audit_tables(conn):
+    """Schema mínimo de audit necesario para el linaje"""
+    conn.execute("PRAGMA foreign_keys=ON;")
+    conn.execute("CREATE TABLE events_in (event_id TEXT PRIMARY KEY)")
+    conn.execute(
+        "CREATE TABLE metrics_out (metric_id TEXT PRIMARY KEY, date TEXT, region TEXT, run_id TEXT, metrics_json TEXT)"
+    )
+    conn.execute(
+        """
+        CREATE TABLE trace (
+          event_id TEXT NOT NULL,
+          metric_id TEXT NOT NULL,
+          contribution_type TEXT DEFAULT 'window_member',
+          PRIMARY KEY (event_id, metric_id),
+          FOREIGN KEY (event_id) REFERENCES events_in(event_id),
+          FOREIGN KEY (metric_id) REFERENCES metrics_out(metric_id)
+        )
+        """
+    )
+    lineage_store.init_lineage_schema(conn)
+
+
+class TestLineageEncoding(unittest.TestCase):
+    """Tests para la codificación del linaje en el aggregator"""
+
+    def test_roundtrip_uuid_ids(self):
+        """Test que los UUIDs se recuperan ordenados tras codificar/decodificar"""
+        ids = [str(uuid.uuid4()) for _ in range(50)]
+        encoded = lineage.encode_event_ids(ids)
+
+        self.assertEqual(encoded["encoding"], lineage.ENCODING_UUID16)
+        self.assertEqual(encoded["count"], 50)
+        self.assertEqual(list(lineage.iter_event_ids(encoded)), sorted(ids))
+
+    def test_non_uuid_ids_are_kept(self):
+        """Test que IDs no canónicos viajan en extra_ids sin alterarse"""
+        ids = ["test-event-1", str(uuid.uuid4()).upper(), str(uuid.uuid4())]
+        encoded = lineage.encode_event_ids(ids)
+
+        self.assertEqual(sorted(encoded["extra_ids"]), sorted(ids[:2]))
+        self.assertEqual(sorted(lineage.iter_event_ids(encoded)), sorted(ids))
+
+    def test_encoding_is_smaller_than_json_list(self):
+        """Test que el linaje compacto ocupa bastante menos que la lista JSON"""
+        ids = [str(uuid.uuid4()) for _ in range(1000)]
+        compact = len(json.dumps(lineage.encode_event_ids(ids)))
+        classic = len(json.dumps(sorted(ids)))
+
+        self.assertLess(compact, classic * 0.6)
+
+
+class TestLineageStore(unittest.TestCase):
+    """Tests para el almacenamiento del linaje en audit"""
+
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        create_audit_tables(self.conn)
+        self.conn.execute("INSERT INTO metrics_out VALUES ('m1', '2026-01-30', 'norte', 'default', '{}')")
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_store_and_expand(self):
+        """Test que el linaje se guarda en una fila y se expande al consultar"""
+        ids = [str(uuid.uuid4()) for _ in range(20)] + ["legacy-id"]
+        with self.conn:
+            lineage_store.store_lineage(self.conn, "m1", lineage.encode_event_ids(ids))
+
+        rows = self.conn.execute("SELECT event_count FROM metric_lineage").fetchall()
+        self.assertEqual(rows, [(21,)])
+        self.assertEqual(sorted(lineage_store.expand_lineage(self.conn, "m1")), sorted(ids))
+
+    def test_expand_falls_back_to_trace(self):
+        """Test que métricas con linaje clásico se leen desde trace"""
+        with self.conn:
+            self.conn.execute("INSERT INTO events_in VALUES ('e1')")
+            self.conn.execute("INSERT INTO trace(event_id, metric_id) VALUES ('e1', 'm1')")
+
+        self.assertEqual(list(lineage_store.expand_lineage(self.conn, "m1")), ["e1"])
+
+    def test_materialize_trace(self):
+        """Test que el linaje compacto se puede volcar a trace"""
+        ids = [str(uuid.uuid4()) for _ in range(5)]
+        with self.conn:
+            for event_id in ids:
+                self.conn.execute("INSERT INTO events_in VALUES (?)", (event_id,))
+            lineage_store.store_lineage(self.conn, "m1", lineage.encode_event_ids(ids))
+            count = lineage_store.materialize_trace(self.conn, "m1")
+
+        self.assertEqual(count, 5)
+        trace_rows = self.conn.execute("SELECT COUNT(*) FROM trace WHERE metric_id = 'm1'").fetchone()[0]
+        self.assertEqual(trace_rows, 5)
+
+    def test_corrupt_lineage_is_rejected(self):
+        """Test que un BLOB de tamaño inválido se rechaza"""
+        with self.assertRaises(ValueError):
+            lineage_store.store_lineage(self.conn, "m1", {"encoding": "uuid16-b64", "data": "AAAA"})
+
+
+if __name__ == '__main__':
+    unittest.main()
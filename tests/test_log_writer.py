@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Tests para el escritor con buffer del log JSONL de auditoría
+No requieren RabbitMQ ni dependencias externas
+"""
+
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "audit"))
+
+import log_writer  # noqa: E402
+
+
+class TestAuditLogWriter(unittest.TestCase):
+    """Tests para el formato del log y las políticas de fsync"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "audit_log.jsonl")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def read_lines(self):
+        with open(self.path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f]
+
+    def test_raw_body_keeps_log_format(self):
+        """Test que cada línea mantiene audit_timestamp + event_content (formato que lee replay.py)"""
+        writer = log_writer.AuditLogWriter(self.path, fsync_policy="never")
+        body = json.dumps({"event_id": "e1", "payload": {"texto": "ñandú"}}, ensure_ascii=False).encode("utf-8")
+        writer.append(body)
+        writer.append(b'{\n  "event_id": "e2"\n}')  # JSON con saltos de línea
+        writer.close()
+
+        lines = self.read_lines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[0]["event_content"], {"event_id": "e1", "payload": {"texto": "ñandú"}})
+        self.assertEqual(lines[1]["event_content"], {"event_id": "e2"})
+        self.assertIn("T", lines[0]["audit_timestamp"])
+
+    def test_appends_to_existing_file(self):
+        """Test que reabrir el log agrega al final sin truncar"""
+        for event_id in ("e1", "e2"):
+            writer = log_writer.AuditLogWriter(self.path, fsync_policy="never")
+            writer.append(json.dumps({"event_id": event_id}).encode())
+            writer.close()
+
+        self.assertEqual([line["event_content"]["event_id"] for line in self.read_lines()], ["e1", "e2"])
+
+    def test_records_policy(self):
+        """Test de fsync cada N registros"""
+        writer = log_writer.AuditLogWriter(self.path, fsync_policy="records", fsync_every_records=3)
+        for index in range(7):
+            writer.append(b'{"n": %d}' % index)
+        self.assertEqual(writer.syncs, 2)
+        self.assertEqual(len(self.read_lines()), 6)  # El séptimo sigue en el buffer
+        writer.close()
+        self.assertEqual(len(self.read_lines()), 7)
+
+    def test_commit_policy(self):
+        """Test que con la política commit solo se sincroniza en on_commit()"""
+        writer = log_writer.AuditLogWriter(self.path, fsync_policy="commit")
+        writer.append(b'{"n": 1}')
+        self.assertEqual(writer.syncs, 0)
+        writer.on_commit()
+        writer.on_commit()  # Sin registros nuevos no hay fsync
+        self.assertEqual(writer.syncs, 1)
+        self.assertEqual(len(self.read_lines()), 1)
+        writer.close()
+
+    def test_interval_policy(self):
+        """Test de fsync por intervalo (0 ms: cada registro)"""
+        writer = log_writer.AuditLogWriter(self.path, fsync_policy="interval", fsync_interval_ms=0)
+        writer.append(b'{"n": 1}')
+        writer.append(b'{"n": 2}')
+        self.assertEqual(writer.syncs, 2)
+        writer.close()
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            log_writer.AuditLogWriter(self.path, fsync_policy="always")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Tests para las particiones diarias de audit (escritura, retención, compactación y consultas)
+No requieren RabbitMQ ni dependencias externas
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import unittest
+import uuid
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "audit"))
+
+import group_commit  # noqa: E402
+import partitions  # noqa: E402
+import queries  # noqa: E402
+import storage  # noqa: E402
+
+
+class FakeChannel:
+    """Registra los ack/nack como lo haría un canal de pika"""
+
+    def __init__(self):
+        self.acks = []
+        self.nacks = []
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        self.acks.append((delivery_tag, multiple))
+
+    def basic_nack(self, delivery_tag, requeue=True):
+        self.nacks.append((delivery_tag, requeue))
+
+
+def make_event(number, day, run_id="default"):
+    return {
+        "event_id": str(uuid.UUID(int=number)),
+        "timestamp": f"{day}T23:{number // 60 % 60:02d}:{number % 60:02d}Z",
+        "region": "sur",
+        "source": "security.incident",
+        "payload": {"n": number},
+        "run_id": run_id,
+    }
+
+
+class TestDayPartitions(unittest.TestCase):
+    """Tests para el ruteo por día, la retención O(1) y la compactación de particiones frías"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "audit.db")
+        self.partition_dir = os.path.join(self.tmp.name, "partitions")
+        self.conn = storage.init_db(self.db_path)
+        self.partitions = partitions.DayPartitions(self.conn, self.partition_dir, max_attached=2)
+        self.writer = group_commit.GroupCommitWriter(self.conn, max_rows=100, partitions=self.partitions)
+        self.channel = FakeChannel()
+        self.tag = 0
+
+    def tearDown(self):
+        self.partitions.wait_for_compaction()
+        self.conn.close()
+        self.tmp.cleanup()
+
+    def add(self, kind, record):
+        self.tag += 1
+        self.writer.add(kind, record, self.channel, self.tag)
+
+    def add_events(self, numbers, day):
+        events = [make_event(number, day) for number in numbers]
+        for event in events:
+            self.add(group_commit.KIND_EVENT, storage.event_row(event, event["run_id"]))
+        return events
+
+    def count(self, day, table):
+        conn = sqlite3.connect(partitions.partition_path(self.partition_dir, day))
+        try:
+            return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_batch_is_routed_by_day(self):
+        """Test que eventos y métricas van a la partición de su día y los rollups a audit.db"""
+        self.add_events(range(3), "2026-01-29")
+        late = self.add_events(range(3, 5), "2026-01-30")
+        self.add(group_commit.KIND_METRIC, {
+            "metric_id": "m1", "date": "2026-01-30", "region": "sur", "metrics": {},
+            "input_event_ids": [event["event_id"] for event in late],
+        })
+        self.add(group_commit.KIND_ROLLUP, {
+            "rollup_id": "r1", "level": "day", "bucket_start": "2026-01-30", "region": "sur",
+            "version": 1, "metrics": {},
+        })
+
+        self.assertEqual(self.writer.flush(), (7, 0))
+        self.assertEqual([day for day, _ in partitions.list_partitions(self.partition_dir)],
+                         ["2026-01-29", "2026-01-30"])
+        self.assertEqual(self.count("2026-01-29", "events_in"), 3)
+        self.assertEqual((self.count("2026-01-30", "events_in"), self.count("2026-01-30", "trace")), (2, 2))
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM main.events_in").fetchone()[0], 0)
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM main.metrics_rollup").fetchone()[0], 1)
+
+    def test_attached_partitions_are_bounded(self):
+        """Test que se adjuntan a lo sumo max_attached particiones y un lote con más días cae al fallback"""
+        for day in ("2026-01-27", "2026-01-28", "2026-01-29"):
+            self.add_events([int(day[-2:])], day)
+            self.writer.flush()
+        self.assertEqual(list(self.partitions.attached), ["2026-01-28", "2026-01-29"])
+
+        for number, day in enumerate(("2026-01-24", "2026-01-25", "2026-01-26")):
+            self.add_events([100 + number], day)
+        self.assertEqual(self.writer.flush(), (3, 0))  # Uno por uno: un día por transacción
+        self.assertEqual(self.writer.fallbacks, 1)
+        self.assertEqual(len(partitions.list_partitions(self.partition_dir)), 6)
+
+    def test_retention_drops_whole_partitions(self):
+        """Test que la retención borra los archivos de los días vencidos sin tocar los demás"""
+        for day in ("2026-01-20", "2026-01-29", "2026-01-30"):
+            self.add_events([int(day[-2:])], day)
+        self.writer.flush()
+        self.partitions.retention_days = 5
+        self.partitions.cold_after_days = 0
+
+        self.partitions.maintain("2026-01-30")
+        self.assertEqual([day for day, _ in partitions.list_partitions(self.partition_dir)],
+                         ["2026-01-29", "2026-01-30"])
+        self.assertFalse(any(name.startswith("audit-2026-01-20") for name in os.listdir(self.partition_dir)))
+        self.assertEqual(self.partitions.dropped, 1)
+
+    def test_cold_partitions_are_compacted(self):
+        """Test que las particiones frías se compactan en segundo plano y se reabren si llega un evento tardío"""
+        self.add_events(range(3), "2026-01-27")
+        self.add_events(range(3, 6), "2026-01-30")
+        self.writer.flush()
+
+        self.partitions.maintain("2026-01-30")
+        self.partitions.wait_for_compaction()
+        self.assertEqual(self.partitions.compacted, 1)
+        self.assertNotIn("2026-01-27", self.partitions.attached)
+        conn = sqlite3.connect(partitions.partition_path(self.partition_dir, "2026-01-27"))
+        self.assertEqual(conn.execute("PRAGMA user_version").fetchone()[0], partitions.COMPACTED_VERSION)
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "delete")
+        conn.close()
+
+        self.add_events([6], "2026-01-27")
+        self.assertEqual(self.writer.flush(), (1, 0))
+        self.assertEqual(self.count("2026-01-27", "events_in"), 4)
+        conn = sqlite3.connect(partitions.partition_path(self.partition_dir, "2026-01-27"))
+        self.assertEqual(conn.execute("PRAGMA user_version").fetchone()[0], 0)
+        conn.close()
+
+    def test_partition_reopened_during_compaction_is_retried(self):
+        """Test que si el escritor readjunta el día mientras se compacta, no queda marcado como compactado"""
+        self.add_events(range(3), "2026-01-27")
+        self.writer.flush()
+        compacted, written = threading.Event(), threading.Event()
+        compact = partitions.compact_partition
+
+        def compact_then_wait(*args):
+            records = compact(*args)
+            compacted.set()
+            written.wait(5)  # El escritor llega antes de que el compactador registre el resultado
+            return records
+
+        with mock.patch.object(partitions, "compact_partition", compact_then_wait):
+            self.partitions.maintain("2026-01-30")
+            self.assertTrue(compacted.wait(5))
+            self.add_events([3], "2026-01-27")
+            self.writer.flush()
+            written.set()
+            self.partitions.wait_for_compaction()
+        self.assertNotIn("2026-01-27", self.partitions._done)
+
+        self.partitions.maintain("2026-01-30")
+        self.partitions.wait_for_compaction()
+        self.assertEqual(self.partitions._done["2026-01-27"], partitions.COMPACTED_VERSION)
+        self.assertEqual(self.count("2026-01-27", "events_in"), 4)
+        conn = sqlite3.connect(partitions.partition_path(self.partition_dir, "2026-01-27"))
+        self.assertEqual(conn.execute("PRAGMA user_version").fetchone()[0], partitions.COMPACTED_VERSION)
+        conn.close()
+
+    def test_queries_span_partitions(self):
+        """Test que las consultas adjuntan las particiones y paginan de una a otra"""
+        first = self.add_events(range(4), "2026-01-29")
+        second = self.add_events(range(4, 8), "2026-01-30")
+        self.add(group_commit.KIND_METRIC, {
+            "metric_id": "m1", "date": "2026-01-30", "region": "sur", "metrics": {},
+            "input_event_ids": [event["event_id"] for event in first[2:] + second],
+        })
+        self.writer.flush()
+
+        conn = queries.connect(self.db_path, self.partition_dir)
+        conn.partitions.max_attached = 1  # Obliga a desadjuntar entre particiones
+        try:
+            streamed = list(queries.iter_all(queries.events_by_run, conn, "default", limit=3))
+            self.assertEqual([event["payload"]["n"] for event in streamed], list(range(8)))
+            ranged = list(queries.iter_all(
+                queries.events_by_run, conn, "default", "2026-01-30T00:00:00", None, limit=3
+            ))
+            self.assertEqual([event["payload"]["n"] for event in ranged], list(range(4, 8)))
+
+            lineage = list(queries.iter_all(queries.events_for_metric, conn, "m1", limit=2))
+            self.assertEqual([event["payload"]["n"] for event in lineage], list(range(2, 8)))
+            metrics, _ = queries.metrics_for_event(conn, first[3]["event_id"])
+            self.assertEqual([metric["metric_id"] for metric in metrics], ["m1"])
+            metrics, _ = queries.metrics_by_region_date(conn, "sur", "2026-01-30")
+            self.assertEqual([metric["metric_id"] for metric in metrics], ["m1"])
+        finally:
+            conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
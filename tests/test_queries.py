@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Tests para las consultas de linaje sobre audit.db (módulo, paginación y endpoint HTTP)
+No requieren RabbitMQ ni dependencias externas
+"""
+
+import base64
+import json
+import os
+import sys
+import tempfile
+import threading
+import unittest
+import urllib.error
+import urllib.request
+import uuid
+from http.server import ThreadingHTTPServer
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, "aggregator"))
+sys.path.insert(0, os.path.join(ROOT_DIR, "audit"))
+
+import lineage  # noqa: E402
+import queries  # noqa: E402
+import storage  # noqa: E402
+
+
+def make_event(number, run_id="default", region="sur"):
+    return {
+        "event_id": str(uuid.UUID(int=number)),
+        "timestamp": f"2026-01-30T16:{number // 60:02d}:{number % 60:02d}Z",
+        "region": region,
+        "source": "security.incident",
+        "payload": {"n": number},
+        "run_id": run_id,
+    }
+
+
+class TestQueries(unittest.TestCase):
+    """Tests para linaje, búsquedas por región/fecha y por run_id/tiempo"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.db_path = os.path.join(cls.tmp.name, "audit.db")
+        conn = storage.init_db(cls.db_path)
+        with conn:
+            events = [make_event(n, run_id="backfill" if n >= 40 else "default") for n in range(50)]
+            storage.store_event_rows(conn, [storage.event_row(e, e["run_id"]) for e in events])
+            # m-trace: linaje clásico en `trace`; m-compact: linaje compacto (BLOB)
+            storage.store_metric_and_trace(conn, {
+                "metric_id": "m-trace", "date": "2026-01-30", "region": "sur",
+                "metrics": {"count": 25}, "input_event_ids": [e["event_id"] for e in events[:25]],
+            })
+            storage.store_metric_and_trace(conn, {
+                "metric_id": "m-compact", "date": "2026-01-30", "region": "sur", "run_id": "backfill",
+                "metrics": {"count": 10},
+                "input_lineage": lineage.encode_event_ids([e["event_id"] for e in events[40:]] + ["legacy-1"]),
+            })
+            for number in range(7):
+                storage.store_metric_and_trace(conn, {
+                    "metric_id": f"m-{number}", "date": "2026-01-29", "region": "norte", "metrics": {},
+                })
+        conn.close()
+        cls.events = events
+        cls.conn = queries.connect(cls.db_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.conn.close()
+        cls.tmp.cleanup()
+
+    def test_lineage_from_trace_is_paginated(self):
+        """Test que el linaje desde `trace` se pagina por event_id sin repetir ni perder filas"""
+        page, cursor = queries.events_for_metric(self.conn, "m-trace", limit=10)
+        self.assertEqual(len(page), 10)
+        self.assertIsNotNone(cursor)
+
+        streamed = list(queries.iter_all(queries.events_for_metric, self.conn, "m-trace", limit=10))
+        self.assertEqual([e["event_id"] for e in streamed], sorted(e["event_id"] for e in self.events[:25]))
+        self.assertEqual(streamed[0]["payload"], {"n": 0})
+
+    def test_lineage_from_compact_blob(self):
+        """Test que el linaje compacto se expande, pagina y marca ids que audit no guardó"""
+        streamed = list(queries.iter_all(queries.events_for_metric, self.conn, "m-compact", limit=3))
+        self.assertEqual(len(streamed), 11)
+        self.assertEqual(streamed[-1], {"event_id": "legacy-1", "stored": False})
+        self.assertEqual(streamed[0]["run_id"], "backfill")
+
+    def test_metrics_for_event(self):
+        """Test que desde un evento se llega a las métricas que lo usaron"""
+        metrics, cursor = queries.metrics_for_event(self.conn, self.events[3]["event_id"])
+        self.assertEqual([m["metric_id"] for m in metrics], ["m-trace"])
+        self.assertIsNone(cursor)
+
+    def test_metrics_for_event_with_compact_lineage(self):
+        """Test que desde un evento se llega a las métricas ingeridas con `input_lineage` (BLOB)"""
+        metrics, _ = queries.metrics_for_event(self.conn, self.events[45]["event_id"])
+        self.assertEqual([m["metric_id"] for m in metrics], ["m-compact"])
+        metrics, _ = queries.metrics_for_event(self.conn, "legacy-1")
+        self.assertEqual([m["metric_id"] for m in metrics], ["m-compact"])
+        self.assertEqual(queries.metrics_for_event(self.conn, self.events[30]["event_id"]), ([], None))
+
+    def test_compact_lineage_needs_an_aligned_match(self):
+        """Test que un calce de bytes entre dos UUID del BLOB no cuenta como el evento"""
+        first, second = uuid.UUID(int=1).bytes, uuid.UUID(int=2).bytes
+        straddling = str(uuid.UUID(bytes=(first + second)[8:24]))
+        self.assertFalse(queries.lineage_store.lineage_contains(first + second, None, straddling))
+        self.assertTrue(queries.lineage_store.lineage_contains(first + second, None, str(uuid.UUID(int=2))))
+
+    def test_metrics_for_event_pages_skip_unaligned_matches(self):
+        """Test que los calces entre dos UUID no acortan la página y que la fila de `trace` no se pierde"""
+        first, second = uuid.UUID(int=1).bytes, uuid.UUID(int=2).bytes
+        straddling = str(uuid.UUID(bytes=(first + second)[8:24]))
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "audit.db")
+            conn = storage.init_db(db_path)
+            with conn:
+                for number in range(6):
+                    # Las primeras 3 solo calzan a caballo de dos UUID; las otras 3 incluyen el evento
+                    members = [first + second] if number < 3 else [first + second, uuid.UUID(straddling).bytes]
+                    storage.store_metric_and_trace(conn, {
+                        "metric_id": f"m-{number}", "date": "2026-01-30", "region": "sur", "metrics": {},
+                        "input_lineage": {"encoding": "uuid16-b64", "data": base64.b64encode(b"".join(members)).decode()},
+                    })
+                # m-0 además tiene el evento en `trace` (su BLOB no lo incluye)
+                event = dict(make_event(0), event_id=straddling)
+                storage.store_event_rows(conn, [storage.event_row(event, "default")])
+                storage.store_metric_and_trace(conn, {
+                    "metric_id": "m-0", "date": "2026-01-30", "region": "sur", "metrics": {},
+                    "input_event_ids": [straddling],
+                })
+            conn.close()
+            conn = queries.connect(db_path)
+            try:
+                page, cursor = queries.metrics_for_event(conn, straddling, limit=2)
+                self.assertEqual([m["metric_id"] for m in page], ["m-0", "m-3"])
+                page, cursor = queries.metrics_for_event(conn, straddling, cursor=cursor, limit=2)
+                self.assertEqual(([m["metric_id"] for m in page], cursor), (["m-4", "m-5"], None))
+            finally:
+                conn.close()
+
+    def test_lineage_index_of_an_older_base(self):
+        """Test que una base sin índice inverso se sigue consultando y init_db lo llena con el linaje guardado"""
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "audit.db")
+            conn = storage.init_db(db_path)
+            with conn:
+                storage.store_metric_and_trace(conn, {
+                    "metric_id": "m-old", "date": "2026-01-30", "region": "sur", "metrics": {},
+                    "input_lineage": lineage.encode_event_ids([e["event_id"] for e in self.events[:3]] + ["legacy-1"]),
+                })
+                conn.execute("DROP TABLE metric_lineage_events")
+            conn.close()
+
+            for migrated in (False, True):
+                if migrated:
+                    storage.init_db(db_path).close()
+                conn = queries.connect(db_path)
+                try:
+                    for event_id in (self.events[2]["event_id"], "legacy-1"):
+                        metrics, _ = queries.metrics_for_event(conn, event_id)
+                        self.assertEqual([m["metric_id"] for m in metrics], ["m-old"])
+                    self.assertEqual(queries.metrics_for_event(conn, self.events[3]["event_id"]), ([], None))
+                    indexed = conn.execute(queries.HAS_LINEAGE_INDEX_SQL.format(schema="main")).fetchone()
+                    self.assertEqual(bool(indexed), migrated)
+                finally:
+                    conn.close()
+
+    def test_metrics_by_region_date(self):
+        """Test que la búsqueda por región y fecha pagina con cursor compuesto (run_id, metric_id)"""
+        streamed = list(queries.iter_all(queries.metrics_by_region_date, self.conn, "norte", "2026-01-29", limit=2))
+        self.assertEqual([m["metric_id"] for m in streamed], [f"m-{n}" for n in range(7)])
+
+        metrics, _ = queries.metrics_by_region_date(self.conn, "sur", "2026-01-30", run_id="backfill")
+        self.assertEqual([m["metric_id"] for m in metrics], ["m-compact"])
+
+    def test_events_by_run_and_time(self):
+        """Test que los eventos de un run_id se filtran por rango de tiempo en orden"""
+        streamed = list(queries.iter_all(
+            queries.events_by_run, self.conn, "default", "2026-01-30T16:00:10", "2026-01-30T16:00:20Z", limit=4
+        ))
+        self.assertEqual([e["payload"]["n"] for e in streamed], list(range(10, 21)))
+        self.assertEqual(len(list(queries.iter_all(queries.events_by_run, self.conn, "backfill"))), 10)
+
+    def test_compare_runs(self):
+        """Test que un backfill se compara con el run en vivo por fecha y región"""
+        rows = queries.compare_runs(self.conn, "backfill")
+        self.assertEqual([(r["date"], r["region"]) for r in rows], [("2026-01-29", "norte"), ("2026-01-30", "sur")])
+        self.assertEqual(rows[0]["diff"], {})
+        self.assertEqual((rows[1]["run"], rows[1]["baseline_metrics"], rows[1]["diff"]),
+                         ({"count": 10}, {"count": 25}, {"count": -15}))
+
+        self.assertEqual(queries.compare_runs(self.conn, "backfill", first_day="2026-01-30", region="norte"), [])
+        with self.assertRaises(ValueError):
+            queries.compare_runs(self.conn, "backfill", first_day="ayer")
+
+    def test_queries_use_indexes(self):
+        """Test que las consultas principales no recorren la tabla completa"""
+        cases = [
+            (queries.TRACE_EVENTS_SQL.format(schema="main"), ("m", "", 10)),
+            (queries.COMPACT_EVENT_METRICS_SQL.format(schema="main"), (uuid.UUID(int=1).bytes, "", 10)),
+            (queries.REGION_DATE_METRICS_SQL.format(schema="main"), ("sur", "d", "", "", 10)),
+            (queries.RUN_EVENTS_SQL.format(schema="main"), ("r", "", queries._MAX_TEXT, "", "", 10)),
+            (queries.RUN_METRICS_SQL.format(schema="main"), ("r", "", queries._MAX_TEXT)),
+        ]
+        for sql, params in cases:
+            plan = " ".join(row[-1] for row in self.conn.execute("EXPLAIN QUERY PLAN " + sql, params))
+            self.assertIn("USING", plan)
+            self.assertNotIn("USE TEMP B-TREE", plan)
+
+    def test_invalid_cursor(self):
+        """Test que un cursor corrupto se rechaza con ValueError"""
+        with self.assertRaises(ValueError):
+            queries.events_by_run(self.conn, "default", cursor="no-es-un-cursor")
+
+    def test_http_endpoint(self):
+        """Test que el endpoint HTTP responde páginas JSON con cursor"""
+        queries.QueryHandler.db_path = self.db_path
+        server = ThreadingHTTPServer(("127.0.0.1", 0), queries.QueryHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        try:
+            with urllib.request.urlopen(f"{base}/metrics/m-trace/events?limit=20") as response:
+                body = json.loads(response.read())
+            self.assertEqual(len(body["items"]), 20)
+            with urllib.request.urlopen(f"{base}/metrics/m-trace/events?limit=20&cursor={body['next']}") as response:
+                body = json.loads(response.read())
+            self.assertEqual((len(body["items"]), body["next"]), (5, None))
+
+            with urllib.request.urlopen(f"{base}/runs/compare?run_id=backfill&from=2026-01-30") as response:
+                body = json.loads(response.read())
+            self.assertEqual([item["diff"] for item in body["items"]], [{"count": -15}])
+
+            with self.assertRaises(urllib.error.HTTPError) as error:
+                urllib.request.urlopen(f"{base}/metrics?region=sur")
+            self.assertEqual(error.exception.code, 400)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+class TestPayloadQueries(unittest.TestCase):
+    """Tests para las columnas generadas del payload y su consulta"""
+
+    FIELDS = {"security.incident": ("crime_type", "severity"), "migration.case": ("status",)}
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "audit.db")
+        conn = storage.init_db(self.db_path, self.FIELDS)
+        with conn:
+            events = []
+            for number in range(60):
+                event = make_event(number)
+                if number % 3 == 2:
+                    event["source"] = "migration.case"
+                    event["payload"] = {"status": "pending" if number % 2 else "approved", "severity": "high"}
+                else:
+                    event["payload"] = {"severity": ("low", "high")[number % 2], "crime_type": "theft", "n": number}
+                events.append(storage.event_row(event, "default"))
+            storage.store_event_rows(conn, events)
+        conn.close()
+        self.conn = queries.connect(self.db_path)
+
+    def tearDown(self):
+        self.conn.close()
+        self.tmp.cleanup()
+
+    def test_payload_field_query(self):
+        """Test que el filtro por campo del payload respeta la fuente y pagina por tiempo"""
+        streamed = list(queries.iter_all(
+            queries.events_by_payload, self.conn, "security.incident", "severity", "high", limit=4
+        ))
+        self.assertEqual([event["payload"]["n"] for event in streamed], [n for n in range(60) if n % 6 in (1, 3)])
+        # "severity" no está configurado para migration.case: su columna queda NULL
+        self.assertEqual(queries.events_by_payload(self.conn, "migration.case", "severity", "high"), ([], None))
+        pending, _ = queries.events_by_payload(self.conn, "migration.case", "status", "pending", limit=100)
+        self.assertEqual(len(pending), 10)
+
+        with self.assertRaises(ValueError):
+            queries.events_by_payload(self.conn, "security.incident", "location", "x")
+        with self.assertRaises(ValueError):
+            queries.events_by_payload(self.conn, "security.incident", "severity) OR (1", "x")
+
+    def test_payload_query_uses_index(self):
+        """Test que la consulta por payload usa el índice parcial, sin json_extract por fila ni ordenar"""
+        sql = queries.PAYLOAD_EVENTS_SQL.format(column="payload_severity").format(schema="main")
+        plan = " ".join(row[-1] for row in self.conn.execute(
+            "EXPLAIN QUERY PLAN " + sql, ("security.incident", "high", "", queries._MAX_TEXT, "", "", 10)
+        ))
+        self.assertIn("idx_payload_severity", plan)
+        self.assertNotIn("USE TEMP B-TREE", plan)
+
+    def test_configuration_changes(self):
+        """Test que cambiar la configuración agrega, recrea y borra columnas sin perder eventos"""
+        conn = storage.init_db(self.db_path, {"security.incident": ("severity",), "migration.case": ("severity",)})
+        try:
+            columns = [row[1] for row in conn.execute("PRAGMA table_xinfo(events_in)")]
+            self.assertIn("payload_severity", columns)
+            self.assertNotIn("payload_status", columns)
+            count = conn.execute(
+                "SELECT COUNT(*) FROM events_in WHERE source = 'migration.case' AND payload_severity = 'high'"
+            ).fetchone()[0]
+            self.assertEqual(count, 20)
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM events_in").fetchone()[0], 60)
+        finally:
+            conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,586 @@
+#!/usr/bin/env python3
+"""
+Tests para el motor de replay de audit (lectura del log y de la base, confirmaciones en ventana, ritmo, reporte,
+checkpoints y reconexión)
+No requieren RabbitMQ: la conexión y el canal de pika se reemplazan por dobles
+"""
+
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "audit"))
+
+import pika  # noqa: E402
+
+import exporter  # noqa: E402
+import group_commit  # noqa: E402
+import log_writer  # noqa: E402
+import partitions  # noqa: E402
+import replay  # noqa: E402
+import storage  # noqa: E402
+
+REGIONS = ("norte", "sur", "este", "oeste", "centro")
+
+
+class FakeClock:
+    """Reloj manual: sleep() solo avanza el tiempo"""
+
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeImpl:
+    """Canal subyacente de pika: guarda lo publicado y las confirmaciones pendientes de entregar"""
+
+    def __init__(self):
+        self.published = []
+        self.on_confirm = None
+
+    def confirm_delivery(self, ack_nack_callback, callback=None):
+        self.on_confirm = ack_nack_callback
+        callback(pika.frame.Method(1, pika.spec.Confirm.SelectOk()))
+
+    def basic_publish(self, exchange, routing_key, body, properties=None, mandatory=False):
+        self.published.append((exchange, routing_key, body, properties))
+
+
+class FakeChannel:
+    def __init__(self, depths=()):
+        self._impl = FakeImpl()
+        self.depths = list(depths)
+
+    def queue_declare(self, queue, passive=False):
+        depth = self.depths.pop(0) if self.depths else 0
+        return pika.frame.Method(1, pika.spec.Queue.DeclareOk(queue, depth, 1))
+
+
+class FakeConnection:
+    """Al procesar eventos confirma con un ack múltiple todo lo publicado, salvo los tags en `nack`"""
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.nack = set()
+        self.acked = 0
+        self.pumps = 0
+
+    def process_data_events(self, time_limit=0):
+        self.pumps += 1
+        impl = self.channel._impl
+        last = len(impl.published)
+        for tag in range(self.acked + 1, last + 1):
+            if tag in self.nack:
+                self.nack.discard(tag)
+                if tag > self.acked + 1:
+                    impl.on_confirm(pika.frame.Method(1, pika.spec.Basic.Ack(tag - 1, multiple=True)))
+                impl.on_confirm(pika.frame.Method(1, pika.spec.Basic.Nack(tag)))
+                self.acked = tag
+        if last > self.acked:
+            impl.on_confirm(pika.frame.Method(1, pika.spec.Basic.Ack(last, multiple=True)))
+            self.acked = last
+
+    def close(self):
+        pass
+
+
+class FlakyConnection(FakeConnection):
+    """Se cae como en un reinicio del broker cuando ya se publicaron `fail_after` mensajes"""
+
+    def __init__(self, channel, fail_after=None):
+        super().__init__(channel)
+        self.fail_after = fail_after
+
+    def process_data_events(self, time_limit=0):
+        if self.fail_after is not None and len(self.channel._impl.published) >= self.fail_after:
+            raise pika.exceptions.StreamLostError("Transport indicated EOF")
+        super().process_data_events(time_limit)
+
+
+class TestLogMessages(unittest.TestCase):
+    """Tests para la lectura del log y el mensaje que se reinyecta"""
+
+    def test_routing_key_and_raw_body(self):
+        """Test que se reinyecta el cuerpo crudo con la fuente como routing key y se aplican los filtros"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "audit_log.jsonl")
+            writer = log_writer.AuditLogWriter(path, fsync_policy="never")
+            bodies = []
+            for number in range(6):
+                event = {"event_id": f"e{number}", "timestamp": f"2026-01-30T16:0{number}:00Z",
+                         "region": ("norte", "sur")[number % 2], "source": "security.incident",
+                         "payload": {"texto": "ñandú"}}
+                bodies.append(json.dumps(event, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+                writer.append(bodies[-1])
+            writer.append(b'{"event_id": "sin-fuente"}')
+            writer.close()
+            with open(path, "ab") as f:
+                f.write(b'{"audit_timestamp": "2026-01-30T16:00:00", "event_co\n')
+
+            stats = replay.ReplayStats()
+            messages = list(replay.log_messages(path, stats))
+            self.assertEqual([body for _, body, _ in messages[:6]], bodies)  # Byte a byte, sin re-serializar
+            self.assertEqual({key for key, _, _ in messages}, {"security.incident", replay.UNKNOWN_ROUTING_KEY})
+            self.assertEqual((stats.read, stats.corrupt), (8, 1))
+
+            stats = replay.ReplayStats()
+            start, end = (replay.segments.parse_time(t) for t in ("2026-01-30T16:01:00Z", "2026-01-30T16:04:00Z"))
+            messages = list(replay.log_messages(path, stats, 1, start, end, region="sur"))
+            self.assertEqual([json.loads(body)["event_id"] for _, body, _ in messages], ["e1", "e3"])
+            self.assertEqual(stats.skipped, 4)
+
+
+class TestConfirmedPublisher(unittest.TestCase):
+    """Tests para las confirmaciones en ventana"""
+
+    def setUp(self):
+        self.channel = FakeChannel()
+        self.connection = FakeConnection(self.channel)
+
+    def test_window_bounds_in_flight(self):
+        """Test que nunca hay más de `window` mensajes sin confirmar y que el lote vacía el buffer"""
+        publisher = replay.ConfirmedPublisher(self.connection, self.channel, "processing_exchange", window=8, batch=4)
+        self.assertEqual(self.connection.pumps, 0)  # SelectOk llegó en el mismo llamado
+        peak = 0
+        for number in range(50):
+            publisher.publish("security.incident", str(number).encode())
+            peak = max(peak, publisher.in_flight)
+        self.assertTrue(publisher.flush())
+        self.assertEqual(peak, 3)  # El cuarto vacía el buffer y el lote se confirma antes de volver
+        self.assertEqual((publisher.confirmed, publisher.nacked), (50, 0))
+        exchanges = {exchange for exchange, _, _, _ in self.channel._impl.published}
+        self.assertEqual(exchanges, {"processing_exchange"})
+        headers = self.channel._impl.published[0][3].headers
+        self.assertEqual(headers, replay.REPLAY_HEADERS)
+
+        # Sin vaciados intermedios la ventana es la que frena
+        channel = FakeChannel()
+        publisher = replay.ConfirmedPublisher(FakeConnection(channel), channel, "x", window=8, batch=1000)
+        peak = 0
+        for number in range(30):
+            publisher.publish("k", b"m")
+            peak = max(peak, publisher.in_flight)
+        self.assertEqual(peak, 8)
+        self.assertTrue(publisher.flush())
+
+    def test_nack_is_republished(self):
+        """Test que un nack vuelve a publicar el mensaje y todos terminan confirmados"""
+        self.connection.nack = {3, 5}
+        publisher = replay.ConfirmedPublisher(self.connection, self.channel, "x", window=100, batch=10)
+        for number in range(10):
+            publisher.publish("k", str(number).encode())
+        self.assertTrue(publisher.flush())
+        bodies = [body for _, _, body, _ in self.channel._impl.published]
+        self.assertEqual(len(bodies), 12)
+        self.assertEqual(sorted(bodies[10:]), [b"2", b"4"])
+        self.assertEqual((publisher.confirmed, publisher.nacked), (10, 2))
+
+    def test_position_follows_confirmed_prefix(self):
+        """Test que la posición confirmada no pasa de un mensaje reenviado por nack hasta que se confirma"""
+        self.connection.nack = {3}
+        publisher = replay.ConfirmedPublisher(self.connection, self.channel, "x", window=100, batch=1000)
+        for number in range(5):
+            publisher.publish("k", b"m", {"start_line": number + 1})
+        self.assertIsNone(publisher.position)
+        self.connection.process_data_events()
+        self.assertEqual((publisher.position, publisher.in_flight), ({"start_line": 2}, 1))
+        self.assertTrue(publisher.flush())
+        self.assertEqual(publisher.position, {"start_line": 5})
+
+
+class TestThrottle(unittest.TestCase):
+    """Tests para el ritmo máximo y la velocidad relativa al original"""
+
+    def test_max_rate(self):
+        """Test que con max_rate los mensajes salen a ese ritmo sin dormir por cada uno"""
+        clock = FakeClock()
+        throttle = replay.Throttle(max_rate=1000, sleep=clock.sleep, clock=clock, min_sleep=0.002)
+        for _ in range(1001):
+            throttle.wait()
+        self.assertAlmostEqual(clock.now - 100.0, 1.0, delta=0.002)  # Adelanto menor a min_sleep
+        self.assertLessEqual(len(clock.sleeps), 500)
+
+    def test_speed_keeps_inter_arrival(self):
+        """Test que la velocidad divide los intervalos originales y los eventos desordenados no esperan"""
+        clock = FakeClock()
+        throttle = replay.Throttle(speed=10, sleep=clock.sleep, clock=clock)
+        for event_time in (1000.0, 1010.0, 1005.0, 1060.0, None):
+            throttle.wait(event_time)
+        self.assertEqual([round(s, 6) for s in clock.sleeps], [1.0, 5.0])
+
+        throttle.shift(2.0)  # Tras una pausa de 2 s el horario se corre
+        throttle.wait(1070.0)
+        self.assertAlmostEqual(clock.sleeps[-1], 3.0)
+
+
+class TestReplayLoop(unittest.TestCase):
+    """Tests para el lazo completo con la cola vigilada y el reporte de avance"""
+
+    def test_backlog_gate_and_progress(self):
+        """Test que se pausa mientras la cola supera el límite y que el reporte trae ritmo, bytes y ETA"""
+        clock = FakeClock()
+        channel = FakeChannel(depths=[50, 20, 5])
+        connection = FakeConnection(channel)
+        publisher = replay.ConfirmedPublisher(connection, channel, "x", window=10, batch=5)
+        gate = replay.BacklogGate(channel, "aggregator_queue", 10, check_interval=0.5, sleep=clock.sleep, clock=clock)
+        throttle = replay.Throttle(max_rate=100, sleep=clock.sleep, clock=clock)
+        stats = replay.ReplayStats(total=40)
+        lines = []
+        progress = replay.Progress(stats, interval=0.1, clock=clock, out=lines.append)
+
+        def messages():
+            for number in range(20):
+                stats.read += 2
+                yield "k", b"0123456789", None
+
+        replay.replay(messages(), publisher, throttle, gate, progress, stats)
+        self.assertEqual((stats.published, stats.bytes, publisher.confirmed), (20, 200, 20))
+        self.assertEqual(stats.paused, 1.0)  # Dos esperas de 0.5 s hasta que la cola bajó a 5
+        self.assertTrue(lines)
+        self.assertIn("msg/s", lines[-1])
+        self.assertIn("MB", lines[-1])
+        self.assertIn("ETA", lines[-1])
+        self.assertEqual(replay.format_duration(3725), "1:02:05")
+
+
+def event_body(number):
+    return json.dumps({
+        "event_id": f"e{number}", "timestamp": f"2026-01-30T{number // 60:02d}:{number % 60:02d}:00Z",
+        "region": REGIONS[number % len(REGIONS)], "source": "security.incident", "payload": {"n": number},
+    }).encode("utf-8")
+
+
+class TestParallelReplay(unittest.TestCase):
+    """Tests para el reparto del replay entre procesos"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self.tmp.name, "audit_log.d")
+        self.single = os.path.join(self.tmp.name, "audit_log.jsonl")
+        writers = [
+            log_writer.SegmentedLogWriter(self.directory, segment_max_bytes=3000, index_interval=4,
+                                          fsync_policy="never"),
+            log_writer.AuditLogWriter(self.single, fsync_policy="never"),
+        ]
+        for number in range(300):
+            for writer in writers:
+                writer.append(event_body(number), json.loads(event_body(number))["timestamp"])
+        for writer in writers:
+            writer.close()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def numbers(self, log_path, start_line=0, filters=None, bounds=None):
+        bounds = dict(bounds or {})
+        bounds.pop("total", None)
+        arguments = {"start_line": start_line, **(filters or {}), **bounds}
+        messages = replay.log_messages(log_path, replay.ReplayStats(), **arguments)
+        return [json.loads(body)["payload"]["n"] for _, body, _ in messages]
+
+    def test_range_partitions_cover_the_log(self):
+        """Test que los tramos (ordinales o bytes) cubren el rango una sola vez y en orden"""
+        start, end = (replay.segments.parse_time(t) for t in ("2026-01-30T01:10:00Z", "2026-01-30T03:20:00Z"))
+        time_filters = {"start_time": start, "end_time": end, "time_field": "event", "region": None}
+        cases = [(self.directory, 0, None), (self.single, 0, None), (self.single, 37, None),
+                 (self.directory, 37, None), (self.directory, 0, time_filters)]
+        for log_path, start_line, filters in cases:
+            plans = replay.plan_partitions(log_path, 3, "range", start_line, **{
+                key: value for key, value in (filters or {}).items() if key != "region"})
+            parts = [self.numbers(log_path, filters=filters, bounds=plan) for plan in plans]
+            self.assertTrue(all(parts), (log_path, start_line, filters))
+            self.assertEqual(sum(parts, []), self.numbers(log_path, start_line, filters))
+        self.assertEqual(self.numbers(self.directory, 0, time_filters), list(range(70, 201)))
+        # Con filtro de tiempo los tramos se acotan a los segmentos candidatos, no a todo el log
+        plans = replay.plan_partitions(self.directory, 3, "range", 0, start, end)
+        self.assertGreater(plans[0]["start_line"], 0)
+        self.assertLess(sum(plan["total"] for plan in plans), 300)
+
+    def test_region_partitions_keep_order(self):
+        """Test que con partición por región cada región sale de un solo proceso y en orden"""
+        plans = replay.plan_partitions(self.directory, 3, "region")
+        owners = {}
+        published = []
+        for worker, plan in enumerate(plans):
+            numbers = self.numbers(self.directory, bounds=plan)
+            self.assertEqual(numbers, sorted(numbers))
+            published += numbers
+            for number in numbers:
+                self.assertEqual(owners.setdefault(REGIONS[number % len(REGIONS)], worker), worker)
+        self.assertEqual(sorted(published), list(range(300)))
+        self.assertGreater(len(set(owners.values())), 1)
+
+    def test_positions_resume_after_each_message(self):
+        """Test que retomar desde la posición de un mensaje sigue exactamente con el siguiente"""
+        filters = {"start_time": None, "end_time": None, "time_field": "event", "region": "sur"}
+        for log_path in (self.directory, self.single):
+            stats = replay.ReplayStats()
+            numbers, positions = [], []
+            for _, body, _ in replay.log_messages(log_path, stats, 5, **filters):
+                numbers.append(json.loads(body)["payload"]["n"])
+                positions.append(stats.position)
+            for number in (0, 7, len(numbers) - 1):
+                self.assertEqual(self.numbers(log_path, 5, filters, positions[number]), numbers[number + 1:])
+        self.assertEqual(set(positions[0]), {"start_line", "start_offset"})  # El archivo único guarda el byte
+
+    @unittest.skipUnless(multiprocessing.get_start_method() == "fork", "El doble de la conexión se hereda con fork")
+    def test_workers_merge_progress(self):
+        """Test que los procesos publican su parte con su conexión y el padre suma sus contadores"""
+        def fake_connect():
+            channel = FakeChannel()
+            return FakeConnection(channel), channel
+
+        source = {"kind": "log", "path": self.directory, "start_line": 10,
+                  "filters": {"start_time": None, "end_time": None, "time_field": "event", "region": None}}
+        options = {"exchange": "x", "confirm_window": 50}
+        with mock.patch.object(replay, "connect", fake_connect):
+            stats, confirmed, nacked, failed = replay.replay_parallel(source, 3, "range", options,
+                                                                      progress_interval=0)
+        self.assertEqual((stats.published, confirmed, nacked, failed), (290, 290, 0, []))
+        self.assertEqual((stats.read, stats.total), (290, 290))
+        self.assertEqual(stats.bytes, sum(len(event_body(number)) for number in range(10, 300)))
+
+        # Con checkpoint cada proceso guarda su parte; retomar un replay terminado no publica nada
+        path = os.path.join(self.tmp.name, "replay.checkpoint")
+        with mock.patch.object(replay, "connect", fake_connect):
+            replay.replay_parallel(source, 2, "region", options, progress_interval=0, checkpoint_path=path)
+            state = replay.read_checkpoint(path)
+            self.assertEqual(len(state["plans"]), 2)
+            self.assertTrue(replay.checkpoint_done(path, state))
+            stats, confirmed, _, failed = replay.replay_parallel(
+                replay.state_source(state["source"]), 2, "region", options, progress_interval=0,
+                checkpoint_path=path, resume=state)
+        self.assertEqual((stats.published, confirmed, failed), (0, 0, []))
+
+
+def db_event(number):
+    return {
+        "event_id": f"{number:032x}",
+        "timestamp": f"2026-01-{29 + number // 50}T16:{number % 50:02d}:00Z",
+        "region": REGIONS[number % len(REGIONS)],
+        "source": ("security.incident", "migration.case")[number // 10 % 2],
+        "payload": {"n": number, "texto": "ñandú, \"comillas\"\n"},
+        "run_id": "backfill" if number >= 80 else "default",
+    }
+
+
+class IgnoreChannel:
+    """Ignora los ack/nack del GroupCommitWriter"""
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        pass
+
+    def basic_nack(self, delivery_tag, requeue=True):
+        pass
+
+
+class TestDbReplay(unittest.TestCase):
+    """Tests para el replay desde events_in (audit.db y particiones diarias, incluso archivadas)"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "audit.db")
+        self.partition_dir = os.path.join(self.tmp.name, "partitions")
+        conn = storage.init_db(self.db_path)
+        days = partitions.DayPartitions(conn, self.partition_dir, cold_after_days=0, archive_after_days=3,
+                                        archive_block_bytes=500)
+        writer = group_commit.GroupCommitWriter(conn, max_rows=1000, partitions=days)
+        for tag, number in enumerate(range(100), 1):
+            event = db_event(number)
+            writer.add(group_commit.KIND_EVENT, storage.event_row(event, event["run_id"]), IgnoreChannel(), tag)
+        writer.flush()
+        days.maintain("2026-02-01")  # Archiva el 29; el 30 queda en events_in
+        days.wait_for_compaction()
+        # Filas previas al particionado que quedaron en audit.db, intercaladas en el tiempo
+        with conn:
+            storage.store_event_rows(conn, [storage.event_row(dict(db_event(number), timestamp=timestamp), "default")
+                                            for number, timestamp in ((100, "2026-01-29T16:05:30Z"),
+                                                                      (101, "2026-01-30T16:20:30Z"))])
+        conn.close()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def messages(self, filters=None, shard=None, stats=None):
+        stats = stats or replay.ReplayStats()
+        return list(replay.db_messages(self.db_path, stats, filters or exporter.Filters(), self.partition_dir,
+                                       shard=shard, chunk_rows=7))
+
+    def numbers(self, filters=None, shard=None):
+        return [json.loads(body)["payload"]["n"] for _, body, _ in self.messages(filters, shard)]
+
+    def test_event_body_roundtrip(self):
+        """Test que el cuerpo rearmado de la fila vuelve a dar la misma fila en audit"""
+        event = dict(db_event(90), schema_version="v2", correlation_id="c-1")
+        stored = storage.event_row(event, event["run_id"])
+        row = stored[:6] + (stored[7], stored[6])  # Orden de exporter.EVENT_COLUMNS (run_id antes del payload)
+        body = replay.event_body(row)
+        self.assertEqual(json.loads(body), event)
+        self.assertEqual(storage.event_row(json.loads(body), event["run_id"]), stored)
+        self.assertNotIn("run_id", json.loads(replay.event_body(row[:6] + ("default",) + row[7:])))
+
+    def test_global_order_across_partitions_and_archives(self):
+        """Test que audit.db, la partición archivada y la viva salen en un solo orden por (timestamp, event_id)"""
+        stats = replay.ReplayStats()
+        messages = self.messages(stats=stats)
+        numbers = [json.loads(body)["payload"]["n"] for _, body, _ in messages]
+        self.assertEqual(numbers, list(range(6)) + [100] + list(range(6, 71)) + [101] + list(range(71, 100)))
+        self.assertEqual([key for key, _, _ in messages[:12]], ["security.incident"] * 11 + ["migration.case"])
+        times = [event_time for _, _, event_time in messages]
+        self.assertEqual(times, sorted(times))
+        self.assertEqual((stats.read, stats.skipped, stats.corrupt), (102, 0, 0))
+
+    def test_filters_use_time_region_source_and_run(self):
+        """Test que la selección por tiempo, región, fuente y run_id coincide con filtrar todo a mano"""
+        stored = {json.loads(body)["payload"]["n"]: json.loads(body) for _, body, _ in self.messages()}
+        cases = [
+            (exporter.Filters("2026-01-29T16:40:00Z", "2026-01-30T16:05:00Z"),
+             lambda e: "2026-01-29T16:40:00Z" <= e["timestamp"] <= "2026-01-30T16:05:00Z"),
+            (exporter.Filters(region="sur"), lambda e: e["region"] == "sur"),
+            (exporter.Filters(source="migration.case"), lambda e: e["source"] == "migration.case"),
+            (exporter.Filters(run_id="backfill", region="norte"),
+             lambda e: e.get("run_id") == "backfill" and e["region"] == "norte"),
+            (exporter.Filters("2026-01-29", "2026-01-29", source="security.incident"),
+             lambda e: e["timestamp"].startswith("2026-01-29") and e["source"] == "security.incident"),
+        ]
+        conn = replay.queries.connect(self.db_path, self.partition_dir)
+        for filters, wanted in cases:
+            numbers = self.numbers(filters)
+            self.assertEqual(numbers, [n for n, event in stored.items() if wanted(event)], filters.as_dict())
+            self.assertTrue(numbers, filters.as_dict())
+            self.assertGreaterEqual(replay.db_count(conn, filters), len(numbers))
+        conn.close()
+
+    def test_resume_after_position(self):
+        """Test que retomar con `after` sigue tras la última fila entregada, también entre bases"""
+        stats = replay.ReplayStats()
+        numbers, positions = [], []
+        for _, body, _ in replay.db_messages(self.db_path, stats, exporter.Filters(), self.partition_dir):
+            numbers.append(json.loads(body)["payload"]["n"])
+            positions.append(stats.position)
+        for index in (0, 5, 6, 50, len(numbers) - 1):
+            messages = replay.db_messages(self.db_path, replay.ReplayStats(), exporter.Filters(),
+                                          self.partition_dir, **positions[index])
+            self.assertEqual([json.loads(body)["payload"]["n"] for _, body, _ in messages], numbers[index + 1:])
+        conn = replay.queries.connect(self.db_path, self.partition_dir)
+        self.assertGreaterEqual(replay.db_count(conn, exporter.Filters(), positions[50]["after"]), 50)
+        conn.close()
+
+    def test_region_shards_cover_the_selection(self):
+        """Test que los procesos por región se reparten la selección sin repetir y en orden"""
+        filters = exporter.Filters(source="security.incident")
+        published, owners = [], {}
+        for worker in range(3):
+            numbers = self.numbers(filters, shard=(worker, 3))
+            published += numbers
+            for number in numbers:
+                self.assertEqual(owners.setdefault(db_event(number)["region"], worker), worker)
+        self.assertEqual(sorted(published), sorted(self.numbers(filters)))
+        plans = replay.plan_source({"kind": "db", "path": self.db_path, "partition_dir": self.partition_dir,
+                                    "filters": filters}, 3)
+        self.assertEqual([plan["shard"] for plan in plans], [(0, 3), (1, 3), (2, 3)])
+
+
+
+class TestResumableReplay(unittest.TestCase):
+    """Tests para la reconexión con backoff y el checkpoint de la posición confirmada"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self.tmp.name, "audit_log.d")
+        self.path = os.path.join(self.tmp.name, "replay.checkpoint")
+        writer = log_writer.SegmentedLogWriter(self.directory, segment_max_bytes=3000, fsync_policy="never")
+        for number in range(300):
+            writer.append(event_body(number), json.loads(event_body(number))["timestamp"])
+        writer.close()
+        self.source = {"kind": "log", "path": self.directory, "start_line": 0,
+                       "filters": {"start_time": None, "end_time": None, "time_field": "event", "region": None}}
+        self.options = {"exchange": "x", "confirm_window": 10}
+        self.channels = []
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def connector(self, *plan):
+        """connect() que en cada intento falla (None), se cae tras N publicados (N) o anda (0)"""
+        attempts = list(plan)
+
+        def connect():
+            fail_after = attempts.pop(0) if attempts else 0
+            if fail_after is None:
+                raise pika.exceptions.AMQPConnectionError("Connection refused")
+            channel = FakeChannel()
+            self.channels.append(channel)
+            return FlakyConnection(channel, fail_after or None), channel
+        return connect
+
+    def published(self):
+        return [json.loads(body)["payload"]["n"] for channel in self.channels
+                for _, _, body, _ in channel._impl.published]
+
+    def test_reconnects_and_resends_only_in_flight(self):
+        """Test que tras caerse el broker se reconecta con backoff y retoma desde lo confirmado"""
+        sleeps = []
+        stats = replay.ReplayStats()
+        checkpoint = replay.Checkpoint(self.path, {"source": replay.source_state(self.source)}, interval=0)
+        with mock.patch.object(replay, "connect", self.connector(23, None, 0)):
+            publisher = replay.replay_resilient(self.source, stats, options=self.options, checkpoint=checkpoint,
+                                                retries=3, backoff=0.5, max_backoff=30, sleep=sleeps.append)
+        published = self.published()
+        self.assertEqual(sorted(set(published)), list(range(300)))
+        self.assertEqual(len(published), 310)  # Solo se reenvía la ventana que estaba en vuelo
+        self.assertEqual(sleeps, [0.5, 1.0])
+        self.assertEqual((stats.reconnects, publisher.confirmed), (2, 300))
+        state = replay.read_checkpoint(self.path)
+        self.assertEqual((state["position"], state["done"]), ({"start_line": 300}, True))
+
+    def test_backfill_tags_every_message(self):
+        """Test que un backfill marca con su run_id todo lo publicado, también tras reconectar"""
+        options = dict(self.options, backfill="backfill-1")
+        with mock.patch.object(replay, "connect", self.connector(23, 0)):
+            replay.replay_resilient(self.source, replay.ReplayStats(), options=options, sleep=lambda seconds: None)
+        headers = [properties.headers for channel in self.channels for _, _, _, properties in channel._impl.published]
+        self.assertEqual(len(self.channels), 2)
+        self.assertTrue(all(h == {"x-replay": "true", "run_id": "backfill-1"} for h in headers))
+        self.assertEqual(replay.REPLAY_HEADERS, {"x-replay": "true"})
+        # En paralelo cada proceso se identifica, para la marca de agua del aggregator
+        self.assertEqual(replay.replay_properties("backfill-1", 2).headers,
+                         {"x-replay": "true", "run_id": "backfill-1", "x-replay-part": 2})
+        self.assertEqual(replay.replay_properties(None, 2).headers, replay.REPLAY_HEADERS)
+
+    def test_resume_from_checkpoint_after_giving_up(self):
+        """Test que si el broker no vuelve queda el checkpoint y --resume sigue desde ahí"""
+        sleeps = []
+        checkpoint = replay.Checkpoint(self.path, {"source": replay.source_state(self.source)}, interval=0)
+        with mock.patch.object(replay, "connect", self.connector(50, None, None)):
+            with self.assertRaises(pika.exceptions.AMQPConnectionError):
+                replay.replay_resilient(self.source, replay.ReplayStats(), options=self.options,
+                                        checkpoint=checkpoint, retries=2, backoff=1, max_backoff=1.5,
+                                        sleep=sleeps.append)
+        self.assertEqual(sleeps, [1, 1.5])
+        state = replay.read_checkpoint(self.path)
+        self.assertEqual((state["position"], state["done"]), ({"start_line": 40}, False))
+        self.assertFalse(replay.checkpoint_done(self.path, state))
+
+        self.channels = []
+        checkpoint = replay.Checkpoint(self.path, state, interval=0)
+        with mock.patch.object(replay, "connect", self.connector(0)):
+            replay.replay_resilient(replay.state_source(state["source"]), replay.ReplayStats(), state["position"],
+                                    self.options, checkpoint=checkpoint)
+        self.assertEqual(self.published(), list(range(40, 300)))
+        self.assertTrue(replay.read_checkpoint(self.path)["done"])
+
+
+if __name__ == '__main__':
+    unittest.main()
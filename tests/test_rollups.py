@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Tests para los rollups jerárquicos (minuto/hora/día) del aggregator
+No requieren RabbitMQ ni dependencias externas
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "aggregator"))
+
+import aggregates  # noqa: E402
+import rollups  # noqa: E402
+
+DAY = 1769731200  # 2026-01-30T00:00:00Z
+
+
+class TestRollupManager(unittest.TestCase):
+    """Tests para la combinación incremental de ventanas"""
+
+    def setUp(self):
+        self.manager = rollups.RollupManager(levels=("minute", "hour", "day"), grace_seconds=10)
+
+    def test_windows_merge_into_all_levels(self):
+        """Test que cada ventana suma en minuto, hora y día"""
+        self.manager.add_window("w1", DAY + 5, "norte", {"security.incident": 2})
+        self.manager.add_window("w2", DAY + 65, "norte", {"security.incident": 1, "migration.case": 4})
+
+        messages = self.manager.collect(DAY + 2 * 86400)
+        by_level = {}
+        for message in messages:
+            by_level.setdefault(message["level"], []).append(message)
+
+        self.assertEqual(len(by_level["minute"]), 2)
+        self.assertEqual(by_level["hour"][0]["metrics"], {"security.incident": 3, "migration.case": 4})
+        self.assertEqual(by_level["day"][0]["total_events"], 7)
+        self.assertEqual(by_level["day"][0]["window_count"], 2)
+        self.assertEqual(by_level["day"][0]["bucket_start"], "2026-01-30T00:00:00+00:00")
+
+    def test_bucket_is_emitted_only_after_close(self):
+        """Test que un bucket abierto no se publica hasta pasar la gracia"""
+        self.manager.add_window("w1", DAY + 5, "norte", {"security.incident": 1})
+
+        self.assertEqual(self.manager.collect(DAY + 30), [])
+        minute_messages = [m for m in self.manager.collect(DAY + 75) if m["level"] == "minute"]
+        self.assertEqual(len(minute_messages), 1)
+        self.assertEqual(minute_messages[0]["version"], 1)
+        # Sin cambios no se vuelve a publicar
+        self.assertEqual([m for m in self.manager.collect(DAY + 80) if m["level"] == "minute"], [])
+
+    def test_same_window_is_idempotent(self):
+        """Test que reaplicar la misma ventana no duplica recuentos"""
+        self.manager.add_window("w1", DAY + 5, "sur", {"security.incident": 1})
+        self.assertEqual(self.manager.add_window("w1", DAY + 5, "sur", {"security.incident": 1}), [])
+
+        minute = [m for m in self.manager.collect(DAY + 75) if m["level"] == "minute"][0]
+        self.assertEqual(minute["metrics"], {"security.incident": 1})
+
+    def test_late_window_republishes_with_higher_version(self):
+        """Test que datos tardíos actualizan el mismo rollup_id con versión mayor"""
+        self.manager.add_window("w1", DAY + 5, "sur", {"security.incident": 1})
+        first = [m for m in self.manager.collect(DAY + 75) if m["level"] == "minute"][0]
+
+        self.manager.add_window("w-late", DAY + 50, "sur", {"security.incident": 2})
+        second = [m for m in self.manager.collect(DAY + 90) if m["level"] == "minute"][0]
+
+        self.assertEqual(second["rollup_id"], first["rollup_id"])
+        self.assertEqual(second["version"], 2)
+        self.assertEqual(second["metrics"], {"security.incident": 3})
+
+    def test_evicted_bucket_drops_late_window(self):
+        """Test que ventanas demasiado tardías no sobreescriben un rollup ya liberado"""
+        self.manager.add_window("w1", DAY + 5, "sur", {"security.incident": 1})
+        self.manager.collect(DAY + 3600)
+
+        self.assertNotIn("minute", self.manager.add_window("w-late", DAY + 6, "sur", {"security.incident": 1}))
+        self.assertEqual(self.manager.dropped_windows, 1)
+
+    def test_sketches_are_merged(self):
+        """Test que los sketches de cada ventana se combinan en el rollup"""
+        for window_id, status in (("w1", "pending"), ("w2", "approved")):
+            agg = aggregates.AggregateSet(aggregates.DEFAULT_AGGREGATES)
+            agg.update({"source": "migration.case", "payload": {"status": status}})
+            self.manager.add_window(window_id, DAY + 5, "este", {"migration.case": 1}, aggregates=agg)
+
+        day = [m for m in self.manager.collect(DAY + 3 * 86400) if m["level"] == "day"][0]
+        self.assertEqual(day["aggregates"]["migration_status_mix"], {"pending": 1, "approved": 1})
+        self.assertIn("migration_status_mix", day["sketches"])
+
+    def test_run_ids_are_separate(self):
+        """Test que cada run_id tiene sus propios buckets e IDs"""
+        self.manager.add_window("w1", DAY + 5, "norte", {"a": 1}, run_id="default")
+        self.manager.add_window("w2", DAY + 5, "norte", {"a": 1}, run_id="backfill-1")
+
+        minute_ids = {m["rollup_id"] for m in self.manager.collect(DAY + 75) if m["level"] == "minute"}
+        self.assertEqual(len(minute_ids), 2)
+
+    def test_unknown_level(self):
+        """Test que niveles desconocidos se rechazan"""
+        with self.assertRaises(ValueError):
+            rollups.RollupManager(levels=("week",))
+
+
+if __name__ == '__main__':
+    unittest.main()
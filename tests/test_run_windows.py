@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Tests para las ventanas por run_id del aggregator (tráfico en vivo y backfills)
+No requieren RabbitMQ ni dependencias externas
+"""
+
+import os
+import sys
+import unittest
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "aggregator"))
+
+import idtable  # noqa: E402
+import run_windows  # noqa: E402
+
+DAY = 1769731200  # 2026-01-30T00:00:00Z
+NOW = 1800000000.0  # Reloj de procesamiento, lejos del tiempo de los eventos
+
+
+def event_at(seconds, number=0):
+    return {"event_id": f"{number:032x}", "timestamp": f"2026-01-30T00:{seconds // 60:02d}:{seconds % 60:02d}Z"}
+
+
+class TestRunId(unittest.TestCase):
+    """Tests para el run_id de un mensaje"""
+
+    def test_header_event_and_default(self):
+        """Test que el header manda sobre el evento y sin ninguno es el run en vivo"""
+        tagged = SimpleNamespace(headers={"x-replay": "true", "run_id": "bf-1"})
+        self.assertEqual(run_windows.run_id_of(tagged, {"run_id": "otro"}), "bf-1")
+        self.assertEqual(run_windows.run_id_of(SimpleNamespace(headers=None), {"run_id": "bf-2"}), "bf-2")
+        self.assertEqual(run_windows.run_id_of(None, {}), run_windows.LIVE_RUN_ID)
+
+    def test_event_epoch(self):
+        """Test que el timestamp ISO se lee como UTC (con o sin zona)"""
+        self.assertEqual(run_windows.event_epoch(event_at(65)), DAY + 65)
+        self.assertEqual(run_windows.event_epoch({"timestamp": "2026-01-30T00:01:05"}), DAY + 65)
+        self.assertIsNone(run_windows.event_epoch({"timestamp": "ayer"}))
+
+    def test_replay_part(self):
+        """Test que el proceso del replay sale del header y sin él es 0"""
+        self.assertEqual(run_windows.part_of(SimpleNamespace(headers={"x-replay-part": 3})), 3)
+        self.assertEqual(run_windows.part_of(None), 0)
+
+
+class TestRunWindows(unittest.TestCase):
+    """Tests para la separación y el cierre de ventanas por run"""
+
+    def setUp(self):
+        self.windows = run_windows.RunWindows(
+            60, run_windows.RunWindow, lambda: idtable.IdTable(with_timestamps=True), clock_start=NOW,
+            allowed_lateness=30,
+        )
+
+    def test_backfill_does_not_touch_live_window(self):
+        """Test que un backfill acumula en su propia ventana, alineada al tiempo del evento"""
+        live = self.windows.window_for("default", event_at(5), NOW + 1)
+        backfill = self.windows.window_for("bf", event_at(75), NOW + 1)
+
+        self.assertIsNot(live, backfill)
+        self.assertEqual(live.start, NOW)
+        self.assertEqual(backfill.start, DAY + 60)
+        self.assertTrue(live.live)
+        self.assertFalse(backfill.live)
+
+    def test_out_of_order_events_keep_their_windows(self):
+        """Test que un replay paralelo que intercala días deja cada evento en la ventana de su fecha"""
+        day_five = 4 * 86400
+        for number in range(5):
+            # La parte 0 recorre el 30/01 y la 1 el 03/02, intercaladas como las publica el replay
+            self.windows.window_for("bf", event_at(number), NOW, part=0).stats[number] = 1
+            later = {"timestamp": f"2026-02-03T00:00:0{number}Z"}
+            self.windows.window_for("bf", later, NOW, part=1).stats[number] = 1
+        self.assertEqual(self.windows.due(NOW), [])  # La parte 0 no pasó del primer minuto
+
+        self.assertEqual(sorted(self.windows.backfills["bf"]), [DAY, DAY + day_five])
+        self.assertEqual(len(self.windows.backfills["bf"][DAY].stats), 5)
+        self.assertEqual(self.windows.watermark("bf"), DAY + 4)
+
+    def test_backfill_windows_close_on_watermark(self):
+        """Test que una ventana cierra cuando el run la deja atrás por más de la tolerancia, y uno tardío va a la suya"""
+        first = self.windows.window_for("bf", event_at(10), NOW)
+        second = self.windows.window_for("bf", event_at(70), NOW)
+        self.assertEqual(self.windows.due(NOW), [])  # 70 < 60 + 30 de tolerancia
+
+        late = self.windows.window_for("bf", event_at(20), NOW)
+        self.assertIs(late, first)
+        self.windows.window_for("bf", event_at(95), NOW)
+        self.assertEqual(self.windows.due(NOW), [first])
+        self.assertEqual(list(self.windows.backfills["bf"].values()), [second])
+
+        reopened = self.windows.window_for("bf", event_at(30), NOW)  # Más tarde que la tolerancia
+        self.assertIsNot(reopened, first)
+        self.assertEqual(reopened.start, DAY)
+        self.assertEqual(self.windows.due(NOW), [reopened])
+
+    def test_due_windows(self):
+        """Test que la ventana en vivo cierra por reloj y la de un backfill por inactividad"""
+        self.windows.window_for("bf", event_at(10), NOW + 30)
+        self.assertEqual(self.windows.due(NOW + 59), [])
+
+        closing = self.windows.due(NOW + 60)
+        self.assertEqual([window.run_id for window in closing], ["default"])
+        self.assertEqual(self.windows.live.start, NOW + 60)
+
+        closing = self.windows.due(NOW + 90)
+        self.assertEqual([window.run_id for window in closing], ["bf"])
+        self.assertNotIn("bf", self.windows.backfills)
+
+    def test_processed_ids_per_run(self):
+        """Test que cada run deduplica por separado y las tablas de backfills terminados se sueltan"""
+        event_id = event_at(0)["event_id"]
+        self.windows.processed_ids("default")[event_id] = NOW
+        self.assertNotIn(event_id, self.windows.processed_ids("bf"))
+        self.windows.processed_ids("bf")[event_id] = NOW
+
+        self.assertEqual(self.windows.cleanup(NOW + 1), 2)
+        self.assertEqual(set(self.windows.processed), {"default"})
+
+
+if __name__ == "__main__":
+    unittest.main()
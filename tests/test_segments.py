@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Tests para el log de auditoría segmentado y su índice disperso de offsets
+No requieren RabbitMQ ni dependencias externas
+"""
+
+import json
+import math
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "audit"))
+
+import log_writer  # noqa: E402
+import segments  # noqa: E402
+
+
+def body(number):
+    return json.dumps({"event_id": f"e{number}", "n": number}).encode("utf-8")
+
+
+class TestSegmentedLog(unittest.TestCase):
+    """Tests para rotación, índice y lectura desde un offset"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self.tmp.name, "audit_log.d")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, count, start=0, **kwargs):
+        options = dict(segment_max_bytes=1000, index_interval=4, fsync_policy="never")
+        options.update(kwargs)
+        writer = log_writer.SegmentedLogWriter(self.directory, **options)
+        for number in range(start, start + count):
+            writer.append(body(number))
+        writer.close()
+        return writer
+
+    def numbers(self, start_ordinal=0):
+        return [
+            (ordinal, json.loads(line)["event_content"]["n"])
+            for ordinal, line in segments.iter_records(self.directory, start_ordinal)
+        ]
+
+    def test_rotates_by_size(self):
+        """Test que el log se divide en varios segmentos nombrados por su primer ordinal"""
+        self.write(100)
+        found = segments.list_segments(self.directory)
+
+        self.assertGreater(len(found), 3)
+        self.assertEqual(found[0][0], 0)
+        for (first, path), (next_first, _) in zip(found, found[1:]):
+            self.assertEqual(first + segments.count_records(path), next_first)
+        self.assertEqual(self.numbers(), [(n, n) for n in range(100)])
+
+    def test_seek_from_any_offset(self):
+        """Test que leer desde un offset arranca justo en ese registro, en cualquier segmento"""
+        self.write(100)
+        for start in (0, 3, 4, 37, 99):
+            records = self.numbers(start)
+            self.assertEqual(records[0], (start, start))
+            self.assertEqual(len(records), 100 - start)
+        self.assertEqual(self.numbers(500), [])
+
+    def test_index_points_to_line_starts(self):
+        """Test que cada entrada del índice apunta al inicio del registro indicado"""
+        self.write(30, segment_max_bytes=1 << 20)
+        (_, path), = segments.list_segments(self.directory)
+        entries = segments.read_index(path)
+
+        self.assertEqual([ordinal for ordinal, _ in entries], [0, 4, 8, 12, 16, 20, 24, 28])
+        with open(path, "rb") as f:
+            for ordinal, offset in entries:
+                f.seek(offset)
+                self.assertEqual(json.loads(f.readline())["event_content"]["n"], ordinal)
+
+    def test_restart_continues_ordinals(self):
+        """Test que al reiniciar el escritor abre un segmento nuevo y sigue la numeración"""
+        self.write(10, segment_max_bytes=1 << 20)
+        writer = self.write(5, start=10, segment_max_bytes=1 << 20)
+
+        self.assertEqual([first for first, _ in segments.list_segments(self.directory)], [0, 10])
+        self.assertEqual(writer.next_ordinal, 15)
+        self.assertEqual(self.numbers(12), [(n, n) for n in range(12, 15)])
+
+    def test_partial_tail_and_stale_index(self):
+        """Test que una línea a medio escribir y un índice adelantado no rompen la lectura"""
+        self.write(10, segment_max_bytes=1 << 20)
+        (_, path), = segments.list_segments(self.directory)
+        with open(path, "ab") as f:
+            f.write(b'{"audit_timestamp": "2026')
+        with open(segments.index_path(path), "ab") as f:
+            f.write(segments.INDEX_ENTRY.pack(12, 1 << 30) + b"\x01\x02")
+
+        self.assertEqual(len(segments.read_index(path)), 3)
+        self.assertEqual(self.numbers(9), [(9, 9)])
+        self.assertEqual(segments.next_ordinal(self.directory), 10)
+
+    def test_retention_removes_old_segments(self):
+        """Test que la retención borra los segmentos cerrados más antiguos (y su índice)"""
+        self.write(100, retention_segments=2)
+        found = segments.list_segments(self.directory)
+
+        self.assertLessEqual(len(found), 3)  # 2 cerrados + el activo
+        self.assertGreater(found[0][0], 0)
+        for _, path in found:
+            self.assertTrue(os.path.exists(segments.index_path(path)))
+        first = found[0][0]
+        self.assertEqual(self.numbers()[0], (first, first))
+
+
+def event_time(number):
+    # Eventos en orden casi creciente, con algunos atrasados (llegan tarde)
+    second = number - 30 if number % 10 == 7 and number >= 30 else number
+    return f"2026-01-30T16:{second // 60:02d}:{second % 60:02d}Z"
+
+
+class TestTimeIndex(unittest.TestCase):
+    """Tests para el índice de tiempo por segmento y por bloque"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self.tmp.name, "audit_log.d")
+        self.writer = log_writer.SegmentedLogWriter(
+            self.directory, segment_max_bytes=2000, index_interval=8, fsync_policy="never"
+        )
+        for number in range(300):
+            self.writer.append(body(number), event_time(number))
+        self.writer._sync()  # Vacía el buffer del segmento activo (política "never")
+
+    def tearDown(self):
+        self.writer.close()
+        self.tmp.cleanup()
+
+    def read_range(self, start=None, end=None):
+        start_time = segments.parse_time(start) if start else None
+        end_time = segments.parse_time(end) if end else None
+        lines = list(segments.iter_time_range(self.directory, start_time, end_time))
+        selected = []
+        for ordinal, line in lines:
+            timestamp = segments.parse_time(event_time(json.loads(line)["event_content"]["n"]))
+            if (start_time is None or timestamp >= start_time) and (end_time is None or timestamp <= end_time):
+                selected.append(ordinal)
+        return selected, len(lines)
+
+    def expected(self, start, end):
+        start_time, end_time = segments.parse_time(start), segments.parse_time(end)
+        return [n for n in range(300) if start_time <= segments.parse_time(event_time(n)) <= end_time]
+
+    def test_sealed_segments_have_meta(self):
+        """Test que cada segmento sellado guarda min/max de ambos timestamps"""
+        found = segments.list_segments(self.directory)
+        first, path = found[0]
+        meta = segments.read_meta(path)
+
+        self.assertEqual(first, 0)
+        self.assertEqual(meta["min_event"], segments.parse_time(event_time(0)))
+        self.assertLessEqual(meta["min_audit"], meta["max_audit"])
+        self.assertIsNone(segments.read_meta(found[-1][1]))  # Segmento activo
+        self.assertEqual(segments.segment_time_range(found[-1][1]), (-math.inf, math.inf))
+
+    def test_range_reads_only_candidate_blocks(self):
+        """Test que el rango de tiempo encuentra todos los registros y lee una fracción del log"""
+        start, end = "2026-01-30T16:02:00Z", "2026-01-30T16:02:30Z"
+        selected, read = self.read_range(start, end)
+
+        self.assertEqual(selected, self.expected(start, end))
+        self.assertLess(read, 100)
+
+    def test_end_only_includes_late_events(self):
+        """Test que un evento atrasado en un bloque posterior no se pierde (mínimo acumulado)"""
+        end = "2026-01-30T16:00:20Z"
+        selected, _ = self.read_range(end=end)
+
+        self.assertEqual(selected, self.expected("2026-01-30T00:00:00Z", end))
+        self.assertIn(47, selected)  # n=47 llegó tarde con timestamp 16:00:17
+
+    def test_active_tail_is_read(self):
+        """Test que los registros del segmento activo aún sin índice se consideran"""
+        self.writer.append(body(999), "2026-01-30T15:00:00Z")
+        self.writer._sync()
+
+        ordinals = [ordinal for ordinal, _ in segments.iter_time_range(
+            self.directory, None, segments.parse_time("2026-01-30T15:30:00Z"))]
+        self.assertIn(300, ordinals)
+
+
+if __name__ == '__main__':
+    unittest.main()
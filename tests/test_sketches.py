@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Tests para los sketches combinables y el framework de agregaciones del aggregator
+No requieren RabbitMQ ni dependencias externas
+"""
+
+import json
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "aggregator"))
+
+import aggregates  # noqa: E402
+from sketches import FrequencyCounter, HyperLogLog, KLLSketch, SpaceSaving  # noqa: E402
+
+
+class TestHyperLogLog(unittest.TestCase):
+    """Tests para el conteo aproximado de distintos"""
+
+    def test_estimate_within_error(self):
+        """Test que la estimación queda cerca del valor real"""
+        hll = HyperLogLog(precision=12)
+        for i in range(20000):
+            hll.add(f"corr-{i}")
+            hll.add(f"corr-{i}")  # Duplicados no deben contar
+
+        self.assertAlmostEqual(hll.estimate(), 20000, delta=20000 * 0.05)
+
+    def test_merge_equals_union(self):
+        """Test que combinar dos sketches equivale a la unión"""
+        a, b = HyperLogLog(), HyperLogLog()
+        for i in range(3000):
+            a.add(i)
+        for i in range(2000, 5000):
+            b.add(i)
+        a.merge(b)
+
+        self.assertAlmostEqual(a.estimate(), 5000, delta=5000 * 0.05)
+
+    def test_serialization_roundtrip(self):
+        """Test que el estado serializado reproduce la estimación"""
+        hll = HyperLogLog(precision=10)
+        for i in range(500):
+            hll.add(i)
+        restored = HyperLogLog.from_dict(json.loads(json.dumps(hll.to_dict())))
+
+        self.assertEqual(restored.estimate(), hll.estimate())
+
+
+class TestKLLSketch(unittest.TestCase):
+    """Tests para cuantiles aproximados"""
+
+    def test_quantiles_are_close(self):
+        """Test que la mediana aproximada está cerca de la real"""
+        kll = KLLSketch(k=200)
+        values = list(range(1, 10001))
+        random.shuffle(values)
+        for value in values:
+            kll.add(value)
+
+        self.assertAlmostEqual(kll.quantile(0.5), 5000, delta=300)
+        self.assertEqual(kll.result()["min"], 1)
+        self.assertEqual(kll.result()["max"], 10000)
+        # Memoria acotada: muchos menos elementos que los insertados
+        self.assertLess(sum(len(level) for level in kll.levels), 1000)
+
+    def test_merge_keeps_count(self):
+        """Test que la combinación conserva el conteo total"""
+        a, b = KLLSketch(), KLLSketch()
+        for value in range(1000):
+            a.add(value)
+            b.add(value + 1000)
+        a.merge(KLLSketch.from_dict(b.to_dict()))
+
+        self.assertEqual(a.count, 2000)
+        self.assertAlmostEqual(a.quantile(0.5), 1000, delta=100)
+
+
+class TestSpaceSaving(unittest.TestCase):
+    """Tests para top-K"""
+
+    def test_heavy_hitters_are_found(self):
+        """Test que los valores más frecuentes aparecen en el top"""
+        topk = SpaceSaving(k=3)
+        stream = ["theft"] * 50 + ["assault"] * 30 + [f"rare-{i}" for i in range(20)]
+        random.shuffle(stream)
+        for value in stream:
+            topk.add(value)
+
+        top_items = [item for item, _, _ in topk.top(2)]
+        self.assertEqual(top_items, ["theft", "assault"])
+
+    def test_merge(self):
+        """Test que la combinación suma conteos"""
+        a, b = SpaceSaving(k=5), SpaceSaving(k=5)
+        for _ in range(10):
+            a.add("theft")
+            b.add("theft")
+        a.merge(b)
+
+        self.assertEqual(a.top(1), [["theft", 20, 0]])
+
+
+class TestAggregateSet(unittest.TestCase):
+    """Tests para el framework de agregaciones"""
+
+    def test_update_respects_source_and_field(self):
+        """Test que cada agregación solo lee su source y campo"""
+        agg = aggregates.AggregateSet(aggregates.DEFAULT_AGGREGATES)
+        agg.update({"source": "migration.case", "correlation_id": "c1", "payload": {"status": "pending"}})
+        agg.update({"source": "security.incident", "correlation_id": "c2", "payload": {"crime_type": "theft"}})
+        agg.update({"source": "survey.victimization", "correlation_id": "c1", "payload": {"respondent_age": 30}})
+
+        results = agg.results()
+        self.assertEqual(results["migration_status_mix"], {"pending": 1})
+        self.assertEqual(results["top_crime_types"], [["theft", 1, 0]])
+        self.assertEqual(results["respondent_age_quantiles"]["p50"], 30.0)
+        self.assertEqual(results["distinct_correlation_ids"], 2)
+
+    def test_invalid_values_are_skipped(self):
+        """Test que valores incompatibles no rompen la agregación"""
+        agg = aggregates.AggregateSet(aggregates.DEFAULT_AGGREGATES)
+        agg.update({"source": "survey.victimization", "payload": {"respondent_age": "n/a"}})
+
+        self.assertEqual(agg.results()["respondent_age_quantiles"]["count"], 0)
+
+    def test_serialized_sets_merge(self):
+        """Test que dos ventanas serializadas se combinan (shards/rollups)"""
+        a = aggregates.AggregateSet(aggregates.DEFAULT_AGGREGATES)
+        b = aggregates.AggregateSet(aggregates.DEFAULT_AGGREGATES)
+        a.update({"source": "migration.case", "payload": {"status": "pending"}})
+        b.update({"source": "migration.case", "payload": {"status": "pending"}})
+        b.update({"source": "migration.case", "payload": {"status": "approved"}})
+
+        merged = aggregates.AggregateSet.from_dict(json.loads(json.dumps(a.to_dict())))
+        merged.merge(aggregates.AggregateSet.from_dict(b.to_dict()))
+
+        self.assertEqual(merged.results()["migration_status_mix"], {"pending": 2, "approved": 1})
+
+    def test_parse_specs_from_json(self):
+        """Test que las agregaciones se configuran desde JSON"""
+        specs = aggregates.parse_specs(
+            '[{"name": "top_case_types", "kind": "topk", "field": "payload.case_type", "params": {"k": 2}}]'
+        )
+        self.assertEqual(len(specs), 1)
+        self.assertIsInstance(specs[0].new_state(), SpaceSaving)
+        self.assertEqual(specs[0].new_state().k, 2)
+
+        with self.assertRaises(ValueError):
+            aggregates.AggregateSpec("x", "desconocido", "payload.x")
+
+    def test_register_custom_sketch(self):
+        """Test que se pueden registrar nuevos tipos de sketch"""
+        aggregates.register_sketch("exact_counter", FrequencyCounter)
+        spec = aggregates.AggregateSpec("exact", "exact_counter", "region")
+        self.assertIsInstance(spec.new_state(), FrequencyCounter)
+        del aggregates.SKETCH_TYPES["exact_counter"]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Tests para el hilo escritor de audit (cola acotada + acks vía add_callback_threadsafe)
+No requieren RabbitMQ ni dependencias externas (SQLite en memoria)
+"""
+
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "audit"))
+
+import group_commit  # noqa: E402
+import storage  # noqa: E402
+import writer_thread  # noqa: E402
+
+
+class FakeConnection:
+    """Acumula los callbacks como haría BlockingConnection hasta procesar eventos"""
+
+    def __init__(self):
+        self.callbacks = []
+        self.threads = set()
+
+    def add_callback_threadsafe(self, callback):
+        self.threads.add(threading.current_thread().name)
+        self.callbacks.append(callback)
+
+    def process_data_events(self):
+        callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback()
+
+
+class FakeChannel:
+    def __init__(self, name="events", log=None):
+        self.name = name
+        self.log = log if log is not None else []
+        self.acks = []
+        self.nacks = []
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        self.acks.append((delivery_tag, multiple))
+        self.log.append((self.name, delivery_tag))
+
+    def basic_nack(self, delivery_tag, requeue=True):
+        self.nacks.append((delivery_tag, requeue))
+
+
+def event_row(event_id):
+    event = {"event_id": event_id, "timestamp": "2026-01-30T16:00:00Z", "region": "norte", "source": "s"}
+    return storage.event_row(event, "default")
+
+
+class TestWriterThread(unittest.TestCase):
+    """Tests para el pipeline consumidor -> cola -> hilo escritor"""
+
+    def setUp(self):
+        self.conn = storage.init_db(":memory:")
+        self.connection = FakeConnection()
+        self.channel = FakeChannel()
+        self.proxy = writer_thread.ThreadsafeChannel(self.connection, self.channel)
+
+    def make_pipeline(self, max_rows=2, max_delay=0.02):
+        writer = group_commit.GroupCommitWriter(self.conn, max_rows=max_rows, max_delay=max_delay)
+        pipeline = writer_thread.WriterThread(writer, max_queue=100, status_interval=3600)
+        pipeline.start()
+        return pipeline
+
+    def test_batches_commit_in_writer_thread(self):
+        """Test que el hilo escritor hace los COMMIT y los ack pasan por add_callback_threadsafe"""
+        pipeline = self.make_pipeline(max_rows=2)
+        for tag in range(1, 6):
+            pipeline.submit(group_commit.KIND_EVENT, event_row(f"e{tag}"), self.proxy, tag)
+        pipeline.stop()
+
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM events_in").fetchone()[0], 5)
+        self.assertEqual(self.connection.threads, {"audit-writer"})
+        self.assertEqual(self.channel.acks, [])  # Aún no corre el hilo de la conexión
+
+        self.connection.process_data_events()
+        self.assertEqual(self.channel.acks, [(2, True), (4, True), (5, True)])
+        self.assertEqual(pipeline.status()["committed"], 5)
+
+    def test_max_delay_flushes_partial_batch(self):
+        """Test que un lote incompleto se confirma al vencer max_delay"""
+        pipeline = self.make_pipeline(max_rows=100, max_delay=0.02)
+        pipeline.submit(group_commit.KIND_EVENT, event_row("e1"), self.proxy, 1)
+
+        deadline = time.monotonic() + 2.0
+        while pipeline.committed == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        pipeline.stop()
+
+        self.assertEqual(pipeline.committed, 1)
+        self.assertGreaterEqual(pipeline.status()["last_commit_lag_ms"], 15)
+
+    def test_closed_channel_skips_acks(self):
+        """Test que tras perder la conexión los delivery_tags viejos no se confirman"""
+        pipeline = self.make_pipeline(max_rows=1)
+        self.proxy.close()
+        pipeline.submit(group_commit.KIND_EVENT, event_row("e1"), self.proxy, 1)
+        pipeline.stop()
+
+        self.assertEqual(self.connection.callbacks, [])
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM events_in").fetchone()[0], 1)
+
+    def test_status_reports_queue_and_lag(self):
+        """Test que status() expone profundidad de cola y retraso del escritor"""
+        writer = group_commit.GroupCommitWriter(self.conn, max_rows=10, max_delay=10)
+        pipeline = writer_thread.WriterThread(writer, max_queue=100)
+        pipeline.submit(group_commit.KIND_EVENT, event_row("e1"), self.proxy, 1)  # Hilo sin iniciar
+
+        status = pipeline.status()
+        self.assertEqual(status["queue_depth"], 1)
+        self.assertEqual(status["writer_lag_ms"], 0.0)
+        self.assertEqual(status["committed"], 0)
+
+
+class TestWriterLanes(unittest.TestCase):
+    """Tests para los carriles por flujo: lote propio, prioridad de eventos y tasa por carril"""
+
+    def setUp(self):
+        self.conn = storage.init_db(":memory:")
+        self.connection = FakeConnection()
+        self.log = []
+        self.events = FakeChannel("events", self.log)
+        self.metrics = FakeChannel("metrics", self.log)
+        writer = group_commit.GroupCommitWriter(self.conn, max_rows=100, max_delay=10)
+        self.pipeline = writer_thread.WriterThread(writer, max_queue=100, status_interval=3600)
+        self.lane = self.pipeline.add_lane(
+            "metrics", group_commit.GroupCommitWriter(self.conn, max_rows=1, max_delay=10), max_queue=10
+        )
+
+    def wait_for(self, condition):
+        deadline = time.monotonic() + 2.0
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.005)
+        self.assertTrue(condition())
+
+    def test_metric_batch_commits_pending_events_first(self):
+        """Test que cada carril arma su lote y antes de uno de métricas se confirman los eventos pendientes"""
+        self.pipeline.start()
+        self.pipeline.submit(group_commit.KIND_EVENT, event_row("e1"),
+                             writer_thread.ThreadsafeChannel(self.connection, self.events), 1)
+        self.wait_for(lambda: self.pipeline.status()["pending_in_batch"] == 1)
+        self.lane.submit(group_commit.KIND_ROLLUP, {
+            "rollup_id": "r1", "level": "day", "bucket_start": "2026-01-30", "region": "sur",
+            "version": 1, "metrics": {},
+        }, writer_thread.ThreadsafeChannel(self.connection, self.metrics), 1)
+        self.wait_for(lambda: self.lane.committed == 1)
+
+        self.connection.process_data_events()
+        self.assertEqual(self.log, [("events", 1), ("metrics", 1)])
+        status = self.pipeline.status()
+        self.assertEqual((status["committed"], status["lanes"]["metrics"]["committed"]), (1, 1))
+        self.assertEqual((status["batches"], status["lanes"]["metrics"]["batches"]), (1, 1))
+        self.pipeline.stop()
+
+    def test_rate_per_lane(self):
+        """Test que cada carril reporta sus mensajes confirmados por segundo"""
+        self.pipeline.start()
+        proxy = writer_thread.ThreadsafeChannel(self.connection, self.events)
+        for tag in range(1, 11):
+            self.pipeline.submit(group_commit.KIND_EVENT, event_row(f"e{tag}"), proxy, tag)
+        self.pipeline.stop()
+        self.pipeline.main_lane.update_rate(time.monotonic())
+        self.assertEqual(self.pipeline.committed, 10)
+        self.assertGreater(self.pipeline.status()["msgs_per_s"], 0)
+        self.assertEqual(self.pipeline.status()["lanes"]["metrics"]["msgs_per_s"], 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -98,12 +98,12 @@ def callback(ch, method, properties, body):
             is_valid, error_msg = validate_event(event_data)
 
             if is_valid:
-                # Éxito: Enviar al exchange de procesamiento
+                # Éxito: Enviar al exchange de procesamiento (con los headers: run_id y x-replay de un replay)
                 ch.basic_publish(
                     exchange=settings.OUTPUT_EXCHANGE,
                     routing_key=method.routing_key, 
                     body=body,
-                    properties=pika.BasicProperties(delivery_mode=2)
+                    properties=pika.BasicProperties(delivery_mode=2, headers=properties.headers)
                 )
                 print(f" [V] Válido. Reenviado a {settings.OUTPUT_EXCHANGE}")
             else: